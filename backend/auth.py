@@ -1,4 +1,16 @@
-"""Аутентификация: хэш паролей, JWT, проверка Google ID-токена и Telegram WebApp initData."""
+"""Аутентификация: хэш паролей, JWT, проверка Google ID-токена и Telegram WebApp initData.
+
+Bearer-токен декодируется один раз на запрос (``token_user_id`` кладёт
+результат в ``request.state``) — им пользуются и зависимости
+``get_current_user*``, и ключ лимитера ``rate_limit.user_or_ip_key``. Строка
+пользователя берётся из короткоживущего кэша процесса (``user_cache``), а не
+из БД на каждый запрос; код, меняющий пользователя, зовёт ``invalidate_user``.
+
+Успешно проверенные Google ID-токены и Telegram initData запоминаются по
+хэшу до своего ``exp``/``auth_date`` (``verified_cache``): повторные входы с
+тем же токеном не пересчитывают подпись. Сертификаты Google — из
+``services.google_certs``, а не скачиваются на каждый вход.
+"""
 from __future__ import annotations
 
 import bcrypt
@@ -6,20 +18,24 @@ import hashlib
 import hmac
 import json
 import time
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 from urllib.parse import parse_qsl
 
 import jwt
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
-from google.auth.transport import requests as google_requests
-from google.oauth2 import id_token as google_id_token
+from google.auth import jwt as google_jwt
 
 from backend import database as db
 from backend.config import (
+    AUTH_USER_CACHE_SIZE,
+    AUTH_USER_CACHE_TTL,
+    AUTH_VERIFY_CACHE_SIZE,
+    BCRYPT_ROUNDS,
     JWT_SECRET,
     JWT_EXPIRES_DAYS,
     JWT_ALGORITHM,
@@ -27,27 +43,53 @@ from backend.config import (
     TELEGRAM_BOT_TOKEN,
 )
 from backend.models import User
+from backend.services import google_certs
+from backend.services.password_pool import PasswordPoolFull, pool as password_pool
 
 
 # initData считается «свежим» 24 часа — достаточно, чтобы пережить
 # короткую офлайн-сессию, но мало для серьёзного replay-attack.
 TELEGRAM_INITDATA_MAX_AGE_SECONDS = 24 * 60 * 60
 
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+
 
 _bearer = HTTPBearer(auto_error=False)
 
 
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+def _hash_password_sync(password: str) -> str:
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
+    return bcrypt.hashpw(password.encode("utf-8"), salt).decode("utf-8")
 
 
-def verify_password(password: str, password_hash: str) -> bool:
+def _verify_password_sync(password: str, password_hash: str) -> bool:
     try:
         return bcrypt.checkpw(password.encode("utf-8"), password_hash.encode("utf-8"))
     except ValueError:
         return False
 
 
+async def _in_password_pool(func, *args):
+    try:
+        return await password_pool.submit(func, *args)
+    except PasswordPoolFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Слишком много входов одновременно, попробуй через минуту",
+            headers={"Retry-After": "5"},
+        )
+
+
+async def hash_password(password: str) -> str:
+    """bcrypt-хэш пароля; считается в ``password_pool``, loop не блокирует."""
+    return await _in_password_pool(_hash_password_sync, password)
+
+
+async def verify_password(password: str, password_hash: str) -> bool:
+    """Проверка пароля против bcrypt-хэша в ``password_pool``."""
+    return await _in_password_pool(_verify_password_sync, password, password_hash)
+
+
 def create_access_token(user_id: int) -> str:
     now = datetime.now(timezone.utc)
     payload = {
@@ -72,7 +114,54 @@ def decode_access_token(token: str) -> Optional[int]:
         return None
 
 
-def verify_google_id_token(token: str) -> dict:
+class VerifiedCache:
+    """Результаты успешной проверки токенов по sha256 токена до их истечения.
+
+    Хранит не больше ``max_entries`` записей (LRU). Неудачные проверки не
+    кэшируются. Возвращаемые словари общие — их нельзя менять.
+    """
+
+    def __init__(self, max_entries: int = AUTH_VERIFY_CACHE_SIZE) -> None:
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0}
+
+    @staticmethod
+    def key(kind: str, token: str) -> str:
+        return f"{kind}:{hashlib.sha256(token.encode('utf-8')).hexdigest()}"
+
+    def get(self, key: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.time():
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[1]
+        if entry is not None:
+            del self._entries[key]
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, key: str, value: dict, expires_at: float) -> None:
+        """``expires_at`` — unix time, после которого токен уже не принимается."""
+        if expires_at <= time.time():
+            return
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def snapshot(self) -> dict[str, int]:
+        return {"entries": len(self._entries), **self.stats}
+
+
+# Синглтон для использования в приложении
+verified_cache = VerifiedCache()
+
+
+async def verify_google_id_token(token: str) -> dict:
     """Проверяет подпись Google ID-токена и возвращает claims.
 
     Бросает HTTPException 401 при любой ошибке проверки.
@@ -82,20 +171,31 @@ def verify_google_id_token(token: str) -> dict:
             status_code=status.HTTP_501_NOT_IMPLEMENTED,
             detail="Google вход не настроен (GOOGLE_CLIENT_ID не задан на сервере)",
         )
+    key = VerifiedCache.key("google", token)
+    cached = verified_cache.get(key)
+    if cached is not None:
+        return cached
+
     try:
-        claims = google_id_token.verify_oauth2_token(
-            token, google_requests.Request(), GOOGLE_CLIENT_ID
-        )
-    except ValueError as exc:
+        kid = jwt.get_unverified_header(token).get("kid")
+        certs = await google_certs.certs.get(kid)
+        claims = google_jwt.decode(token, certs=certs, audience=GOOGLE_CLIENT_ID)
+    except (jwt.PyJWTError, ValueError) as exc:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=f"Некорректный Google-токен: {exc}",
         )
+    if claims.get("iss") not in GOOGLE_ISSUERS:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Некорректный Google-токен: чужой issuer",
+        )
     if not claims.get("email_verified"):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Email в Google-аккаунте не подтверждён",
         )
+    verified_cache.put(key, claims, float(claims["exp"]))
     return claims
 
 
@@ -113,7 +213,9 @@ def verify_telegram_init_data(init_data: str) -> dict:
     переиспользовать (replay).
 
     Бросает HTTPException 401 при любой ошибке. На успех возвращает словарь
-    распарсенных полей с user-объектом в ``"user"``.
+    распарсенных полей с user-объектом в ``"user"``. Успешный результат
+    кэшируется до истечения ``auth_date`` — повтор того же initData не
+    пересчитывает HMAC.
     """
     if not TELEGRAM_BOT_TOKEN:
         raise HTTPException(
@@ -125,7 +227,23 @@ def verify_telegram_init_data(init_data: str) -> dict:
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Пустой initData",
         )
+    key = VerifiedCache.key("tg-init", init_data)
+    cached = verified_cache.get(key)
+    if cached is not None:
+        return cached
+    data = _check_telegram_init_data(init_data)
+    # Без auth_date initData принимается без проверки возраста — в кэше такой
+    # живёт столько же, сколько свежий.
+    try:
+        issued = int(data.get("auth_date", "0")) or time.time()
+    except ValueError:
+        issued = time.time()
+    verified_cache.put(key, data, issued + TELEGRAM_INITDATA_MAX_AGE_SECONDS)
+    return data
+
 
+def _check_telegram_init_data(init_data: str) -> dict:
+    """Сама проверка подписи и полей initData (см. ``verify_telegram_init_data``)."""
     # parse_qsl сам сделает URL-decode для значений (включая `user` с %7B и т.п.)
     pairs = parse_qsl(init_data, keep_blank_values=True, strict_parsing=False)
     data = dict(pairs)
@@ -266,7 +384,87 @@ def _user_dict_to_model(row: dict) -> User:
     )
 
 
+class UserCache:
+    """Пользователи по id на ``ttl`` секунд, не больше ``max_entries`` записей.
+
+    Отсутствующих пользователей не кэширует: свежезарегистрированный должен
+    находиться сразу.
+    """
+
+    def __init__(
+        self, ttl: float = AUTH_USER_CACHE_TTL, max_entries: int = AUTH_USER_CACHE_SIZE,
+    ) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[int, tuple[float, User]] = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0}
+
+    async def get(self, user_id: int) -> Optional[User]:
+        entry = self._entries.get(user_id)
+        if entry is not None and time.monotonic() - entry[0] < self.ttl:
+            self.stats["hits"] += 1
+            return entry[1]
+        self.stats["misses"] += 1
+        row = await db.get_user_by_id(user_id)
+        if not row:
+            self._entries.pop(user_id, None)
+            return None
+        user = _user_dict_to_model(row)
+        self._entries[user_id] = (time.monotonic(), user)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return user
+
+    def invalidate(self, user_id: Optional[int] = None) -> None:
+        if user_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(user_id, None)
+
+    def snapshot(self) -> dict[str, int]:
+        return {"entries": len(self._entries), **self.stats}
+
+
+# Синглтон для использования в приложении
+user_cache = UserCache()
+
+
+def invalidate_user(*user_ids: int) -> None:
+    """Сбросить кэш после изменения пользователя (merge, привязка Google, настройки)."""
+    for user_id in user_ids:
+        user_cache.invalidate(user_id)
+
+
+_UNSET = object()
+
+
+def token_user_id(request: Request) -> Optional[int]:
+    """user_id из Bearer-токена запроса или None; JWT декодируется один раз."""
+    cached = getattr(request.state, "token_user_id", _UNSET)
+    if cached is not _UNSET:
+        return cached
+    user_id: Optional[int] = None
+    auth = request.headers.get("authorization") or ""
+    if auth.lower().startswith("bearer "):
+        user_id = decode_access_token(auth.split(None, 1)[1].strip())
+    request.state.token_user_id = user_id
+    return user_id
+
+
+async def _request_user(request: Request) -> Optional[User]:
+    """Пользователь запроса (``request.state.user``); None — нет или не найден."""
+    cached = getattr(request.state, "user", _UNSET)
+    if cached is not _UNSET:
+        return cached
+    user_id = token_user_id(request)
+    user = await user_cache.get(user_id) if user_id is not None else None
+    request.state.user = user
+    return user
+
+
 async def get_current_user(
+    request: Request,
     creds: Optional[HTTPAuthorizationCredentials] = Depends(_bearer),
 ) -> User:
     if not creds or creds.scheme.lower() != "bearer":
@@ -275,23 +473,23 @@ async def get_current_user(
             detail="Требуется авторизация",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    user_id = decode_access_token(creds.credentials)
-    if user_id is None:
+    if token_user_id(request) is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Некорректный или истёкший токен",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    row = await db.get_user_by_id(user_id)
-    if not row:
+    user = await _request_user(request)
+    if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Пользователь не найден",
         )
-    return _user_dict_to_model(row)
+    return user
 
 
 async def get_current_user_optional(
+    request: Request,
     creds: Optional[HTTPAuthorizationCredentials] = Depends(_bearer),
 ) -> Optional[User]:
     """Like get_current_user, but returns None instead of raising for guest requests.
@@ -303,10 +501,4 @@ async def get_current_user_optional(
     """
     if not creds or creds.scheme.lower() != "bearer":
         return None
-    user_id = decode_access_token(creds.credentials)
-    if user_id is None:
-        return None
-    row = await db.get_user_by_id(user_id)
-    if not row:
-        return None
-    return _user_dict_to_model(row)
+    return await _request_user(request)
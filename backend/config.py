@@ -21,6 +21,13 @@ MINI_APP_URL = os.getenv("MINI_APP_URL", "").strip()
 PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "").strip().rstrip("/")
 # Secret path segment for the webhook so randoms can't POST fake updates.
 TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET", "").strip()
+# Очередь апдейтов webhook-бота (services.update_queue): сколько апдейтов
+# обрабатывается параллельно (апдейты одного чата — всегда по одному), сколько
+# может ждать (сверх — 503, Telegram повторит) и сколько секунд на остановке
+# даётся дообработать очередь.
+TELEGRAM_UPDATE_WORKERS = int(os.getenv("TELEGRAM_UPDATE_WORKERS", "8"))
+TELEGRAM_UPDATE_QUEUE_MAX = int(os.getenv("TELEGRAM_UPDATE_QUEUE_MAX", "1000"))
+TELEGRAM_UPDATE_DRAIN_SECONDS = float(os.getenv("TELEGRAM_UPDATE_DRAIN_SECONDS", "10"))
 
 JWT_SECRET = os.getenv("JWT_SECRET", "")
 if not JWT_SECRET:
@@ -32,7 +39,26 @@ if not JWT_SECRET:
     )
 JWT_EXPIRES_DAYS = int(os.getenv("JWT_EXPIRES_DAYS", "30"))
 JWT_ALGORITHM = "HS256"
+# Кэш пользователей для авторизованных запросов (backend.auth): сколько секунд
+# держать строку пользователя и сколько записей максимум. Изменения профиля
+# сбрасывают запись сразу; TTL страхует правки из других процессов (скрипты).
+AUTH_USER_CACHE_TTL = float(os.getenv("AUTH_USER_CACHE_TTL", "30"))
+AUTH_USER_CACHE_SIZE = int(os.getenv("AUTH_USER_CACHE_SIZE", "10000"))
+# bcrypt (services.password_pool): стоимость новых хэшей (старые проверяются
+# со своей, она записана в хэше), сколько потоков считают хэши и сколько задач
+# может ждать в очереди — сверх этого /auth/login и /auth/register отвечают 503.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", "32"))
+
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID", "")
+# Сертификаты Google для ID-токенов (services.google_certs): как часто
+# перекачивать их заранее (секунды; 0 — только лениво, по max-age). Проверенные
+# Google-токены и Telegram initData кэшируются до их exp/auth_date — не больше
+# AUTH_VERIFY_CACHE_SIZE записей.
+GOOGLE_CERTS_REFRESH_INTERVAL = float(os.getenv("GOOGLE_CERTS_REFRESH_INTERVAL", "3600"))
+AUTH_VERIFY_CACHE_SIZE = int(os.getenv("AUTH_VERIFY_CACHE_SIZE", "10000"))
+
 DATABASE_URL = os.getenv("DATABASE_URL", "")   # Set on Railway for PostgreSQL
 USE_POSTGRES = bool(DATABASE_URL)
 
@@ -48,6 +74,74 @@ DATABASE_PATH = os.getenv(
 )
 os.makedirs(os.path.dirname(DATABASE_PATH), exist_ok=True)
 OMDB_BASE_URL = "http://www.omdbapi.com/"
+# Общий лимит частоты запросов к OMDB (token bucket в omdb_service) — делят его
+# синк наград, бэкфиллы и пользовательские запросы. 0 — без ограничения.
+OMDB_RATE_PER_SECOND = float(os.getenv("OMDB_RATE_PER_SECOND", "5"))
+# Доля общего лимита, которую могут занять фоновые задачи (синк, бэкфиллы):
+# остаток всегда достаётся пользовательским поискам. 0 — без своего лимита.
+OMDB_BACKGROUND_RATE_PER_SECOND = float(os.getenv("OMDB_BACKGROUND_RATE_PER_SECOND", "2"))
+# Сколько фильмов синк наград тянет из OMDB параллельно и сколько переводов
+# сюжета гонит в LLM одновременно.
+AWARDS_SEED_CONCURRENCY = int(os.getenv("AWARDS_SEED_CONCURRENCY", "8"))
+LLM_TRANSLATE_CONCURRENCY = int(os.getenv("LLM_TRANSLATE_CONCURRENCY", "4"))
+# OMDB-бэкфиллы (media_type, runtime, ...): параллельность и суточный бюджет
+# запросов на все бэкфиллы вместе (бесплатный ключ OMDB — 1000/сутки, часть
+# оставляем пользовательским запросам). 0 — без ограничения.
+BACKFILL_CONCURRENCY = int(os.getenv("BACKFILL_CONCURRENCY", "4"))
+OMDB_BACKFILL_DAILY_BUDGET = int(os.getenv("OMDB_BACKFILL_DAILY_BUDGET", "500"))
+
+# Доступность (watch-providers): сколько запросов в TMDb батч-чтение
+# (``/api/availability/batch``) делает параллельно.
+AVAILABILITY_FETCH_CONCURRENCY = int(os.getenv("AVAILABILITY_FETCH_CONCURRENCY", "4"))
+# Фоновое обновление кэша доступности (availability.refresh_due): период
+# (секунды; 0 — выключено), за сколько часов до истечения TTL обновлять, сколько
+# записей максимум за прогон и частота запросов к TMDb из фона — остальная
+# квота TMDb остаётся пользовательским запросам.
+AVAILABILITY_REFRESH_INTERVAL = float(os.getenv("AVAILABILITY_REFRESH_INTERVAL", "900"))
+AVAILABILITY_REFRESH_AHEAD_HOURS = float(os.getenv("AVAILABILITY_REFRESH_AHEAD_HOURS", "3"))
+AVAILABILITY_REFRESH_BATCH = int(os.getenv("AVAILABILITY_REFRESH_BATCH", "500"))
+AVAILABILITY_REFRESH_RATE_PER_SECOND = float(
+    os.getenv("AVAILABILITY_REFRESH_RATE_PER_SECOND", "2")
+)
+# Офлайн-индекс доступности (services.availability_index): период перестройки
+# (секунды; 0 — только скриптом scripts/build_availability_index.py), предел
+# страниц /discover на пару провайдер+вид (TMDb отдаёт не больше 500 по 20
+# тайтлов) и частота запросов к TMDb при обходе.
+AVAILABILITY_INDEX_INTERVAL = float(os.getenv("AVAILABILITY_INDEX_INTERVAL", "86400"))
+AVAILABILITY_INDEX_MAX_PAGES = int(os.getenv("AVAILABILITY_INDEX_MAX_PAGES", "500"))
+AVAILABILITY_INDEX_RATE_PER_SECOND = float(
+    os.getenv("AVAILABILITY_INDEX_RATE_PER_SECOND", "4")
+)
+
+# Буфер аналитических событий (services.event_buffer): сброс в БД пачкой по
+# размеру или по таймеру (секунды); больше EVENT_BUFFER_MAX ждущих — новые
+# события отбрасываются.
+EVENT_FLUSH_BATCH = int(os.getenv("EVENT_FLUSH_BATCH", "200"))
+EVENT_FLUSH_INTERVAL = float(os.getenv("EVENT_FLUSH_INTERVAL", "2"))
+EVENT_BUFFER_MAX = int(os.getenv("EVENT_BUFFER_MAX", "10000"))
+
+# Публичные шэры (services.share_cache): сколько готовых ответов держать в
+# памяти и сколько секунд (имя владельца может смениться), max-age для
+# браузеров/CDN и период сброса накопленных просмотров в БД (секунды).
+SHARE_CACHE_SIZE = int(os.getenv("SHARE_CACHE_SIZE", "512"))
+SHARE_CACHE_TTL = float(os.getenv("SHARE_CACHE_TTL", "3600"))
+SHARE_HTTP_MAX_AGE = int(os.getenv("SHARE_HTTP_MAX_AGE", "300"))
+SHARE_VIEWS_FLUSH_INTERVAL = float(os.getenv("SHARE_VIEWS_FLUSH_INTERVAL", "60"))
+# Сборка мусора шэров (services.share_snapshot.collect_garbage): удаление
+# истёкших гостевых шэров и перевод старых снимков в компактный формат
+# (секунды; 0 — выключено).
+SHARE_GC_INTERVAL = float(os.getenv("SHARE_GC_INTERVAL", "3600"))
+
+# Агрегаты аналитики (services.analytics_rollup): период сворачивания сырых
+# events в дневные счётчики и сессии воронки (секунды; 0 — выключено), разрыв,
+# после которого начинается новая сессия (минуты), и сколько дней хранить
+# сырые события (0 — не удалять). Агрегаты хранятся бессрочно.
+EVENTS_ROLLUP_INTERVAL = float(os.getenv("EVENTS_ROLLUP_INTERVAL", "300"))
+EVENTS_SESSION_GAP_MINUTES = int(os.getenv("EVENTS_SESSION_GAP_MINUTES", "30"))
+EVENTS_RETENTION_DAYS = int(os.getenv("EVENTS_RETENTION_DAYS", "90"))
+# Токен для GET /api/metrics/* (заголовок X-Metrics-Token). Пусто — эндпоинты
+# выключены (404).
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "").strip()
 
 # TMDB используется как русскоязычный поисковик: OMDB кириллицу не понимает.
 # Ключ бесплатный, выдаётся в настройках профиля на themoviedb.org → API.
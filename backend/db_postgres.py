@@ -12,11 +12,15 @@
 import asyncpg
 import json
 import os
-from datetime import datetime
+import re
+import time
+from datetime import date, datetime
 from typing import Optional
 
+from backend.migrations import SCHEMA_VERSION_DDL, MigrationSet
 from backend.models.movie import Movie, MovieBase
 from backend.models.book import Book, BookBase
+from backend.models.event import FUNNEL_EVENTS
 
 SELECT_COLUMNS = (
     "id, imdb_id, title, original_title, year, genres, description, plot, "
@@ -33,6 +37,10 @@ BOOK_SELECT_COLUMNS = (
 
 _pool: Optional[asyncpg.Pool] = None
 
+MIGRATIONS = MigrationSet()
+# Ключ pg_advisory_xact_lock для накатки миграций (произвольная константа).
+_MIGRATION_LOCK_ID = 7_302_415
+
 
 def _get_url() -> str:
     url = os.environ.get("DATABASE_URL", "")
@@ -42,199 +50,479 @@ def _get_url() -> str:
     return url
 
 
-async def init_db() -> None:
-    global _pool
-    url = _get_url()
-    _pool = await asyncpg.create_pool(url, min_size=1, max_size=5, ssl="require")
-    async with _pool.acquire() as conn:
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id SERIAL PRIMARY KEY,
-                email TEXT UNIQUE NOT NULL,
-                password_hash TEXT,
-                google_sub TEXT UNIQUE,
-                telegram_id BIGINT UNIQUE,
-                name TEXT,
-                avatar_url TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        # Миграция для существующих БД без telegram_id (Railway уже задеплоен).
-        # BIGINT — у телеграма user_id может быть > 2^31.
-        await conn.execute(
-            "ALTER TABLE users ADD COLUMN IF NOT EXISTS telegram_id BIGINT"
+@MIGRATIONS.register(1, "baseline")
+async def _m001_baseline(conn) -> None:
+    """Схема до появления schema_version — прежний идемпотентный init_db.
+
+    На пустой БД создаёт всё с нуля, на уже задеплоенной — доводит до текущей
+    схемы (``IF NOT EXISTS`` везде). Отрабатывает один раз.
+    """
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT,
+            google_sub TEXT UNIQUE,
+            telegram_id BIGINT UNIQUE,
+            name TEXT,
+            avatar_url TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
-        await conn.execute(
-            "CREATE UNIQUE INDEX IF NOT EXISTS idx_users_telegram_id "
-            "ON users(telegram_id) WHERE telegram_id IS NOT NULL"
+    """)
+    # Миграция для существующих БД без telegram_id (Railway уже задеплоен).
+    # BIGINT — у телеграма user_id может быть > 2^31.
+    await conn.execute(
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS telegram_id BIGINT"
+    )
+    await conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_users_telegram_id "
+        "ON users(telegram_id) WHERE telegram_id IS NOT NULL"
+    )
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_users_email ON users(email)")
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_users_google_sub ON users(google_sub)"
+    )
+    # Настройки доступности: регион (TMDb country code) и id стриминговых
+    # сервисов. NULL region → читаем как 'RU'; '[]' → фильтра нет.
+    await conn.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS region TEXT")
+    await conn.execute(
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS streaming_services TEXT DEFAULT '[]'"
+    )
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS movies (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+            imdb_id TEXT NOT NULL,
+            title TEXT NOT NULL,
+            original_title TEXT,
+            year INTEGER,
+            genres TEXT DEFAULT '[]',
+            description TEXT,
+            plot TEXT,
+            "cast" TEXT DEFAULT '[]',
+            director TEXT,
+            poster_url TEXT,
+            imdb_rating REAL,
+            awards TEXT,
+            is_watched BOOLEAN DEFAULT FALSE,
+            source TEXT DEFAULT 'personal',
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            rec_source TEXT,
+            rec_note TEXT,
+            in_library BOOLEAN DEFAULT TRUE,
+            award TEXT,
+            award_year INTEGER,
+            plot_ru TEXT
         )
-        await conn.execute("CREATE INDEX IF NOT EXISTS idx_users_email ON users(email)")
-        await conn.execute(
-            "CREATE INDEX IF NOT EXISTS idx_users_google_sub ON users(google_sub)"
+    """)
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_imdb_id ON movies(imdb_id)"
+    )
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_source ON movies(source)")
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_user_id ON movies(user_id)")
+    await conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_user_imdb "
+        "ON movies(user_id, imdb_id) WHERE user_id IS NOT NULL"
+    )
+    # Дневник для фильмов: личная оценка/заметка/дата просмотра.
+    await conn.execute("ALTER TABLE movies ADD COLUMN IF NOT EXISTS user_rating REAL")
+    await conn.execute("ALTER TABLE movies ADD COLUMN IF NOT EXISTS user_note TEXT")
+    await conn.execute("ALTER TABLE movies ADD COLUMN IF NOT EXISTS watched_at TIMESTAMP")
+    # movie / series — для разбивки библиотеки на «Фильмы» и «Сериалы».
+    await conn.execute(
+        "ALTER TABLE movies ADD COLUMN IF NOT EXISTS media_type TEXT DEFAULT 'movie'"
+    )
+    # Ссылка на оригинал рекомендации (Reel / пост в канале).
+    await conn.execute(
+        "ALTER TABLE movies ADD COLUMN IF NOT EXISTS source_url TEXT"
+    )
+    # Длительность в минутах из OMDB (0 — OMDB не знает, NULL — не проверяли).
+    await conn.execute(
+        "ALTER TABLE movies ADD COLUMN IF NOT EXISTS runtime INTEGER"
+    )
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS shared_lists (
+            id SERIAL PRIMARY KEY,
+            slug TEXT UNIQUE NOT NULL,
+            owner_user_id INTEGER REFERENCES users(id) ON DELETE SET NULL,
+            name TEXT NOT NULL,
+            snapshot TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP,
+            view_count INTEGER DEFAULT 0
         )
-        # Настройки доступности: регион (TMDb country code) и id стриминговых
-        # сервисов. NULL region → читаем как 'RU'; '[]' → фильтра нет.
-        await conn.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS region TEXT")
-        await conn.execute(
-            "ALTER TABLE users ADD COLUMN IF NOT EXISTS streaming_services TEXT DEFAULT '[]'"
-        )
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS movies (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-                imdb_id TEXT NOT NULL,
-                title TEXT NOT NULL,
-                original_title TEXT,
-                year INTEGER,
-                genres TEXT DEFAULT '[]',
-                description TEXT,
-                plot TEXT,
-                "cast" TEXT DEFAULT '[]',
-                director TEXT,
-                poster_url TEXT,
-                imdb_rating REAL,
-                awards TEXT,
-                is_watched BOOLEAN DEFAULT FALSE,
-                source TEXT DEFAULT 'personal',
-                added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                rec_source TEXT,
-                rec_note TEXT,
-                in_library BOOLEAN DEFAULT TRUE,
-                award TEXT,
-                award_year INTEGER,
-                plot_ru TEXT
-            )
-        """)
-        await conn.execute(
-            "CREATE INDEX IF NOT EXISTS idx_imdb_id ON movies(imdb_id)"
+    """)
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_shared_lists_slug ON shared_lists(slug)"
+    )
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_shared_lists_expires "
+        "ON shared_lists(expires_at)"
+    )
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS books (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+            work_key TEXT NOT NULL,
+            title TEXT NOT NULL,
+            authors TEXT DEFAULT '[]',
+            year INTEGER,
+            subjects TEXT DEFAULT '[]',
+            description TEXT,
+            cover_url TEXT,
+            rating REAL,
+            is_read BOOLEAN DEFAULT FALSE,
+            source TEXT DEFAULT 'personal',
+            rec_source TEXT,
+            rec_note TEXT,
+            in_library BOOLEAN DEFAULT TRUE,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
-        await conn.execute("CREATE INDEX IF NOT EXISTS idx_source ON movies(source)")
-        await conn.execute("CREATE INDEX IF NOT EXISTS idx_user_id ON movies(user_id)")
-        await conn.execute(
-            "CREATE UNIQUE INDEX IF NOT EXISTS idx_user_imdb "
-            "ON movies(user_id, imdb_id) WHERE user_id IS NOT NULL"
-        )
-        # Дневник для фильмов: личная оценка/заметка/дата просмотра.
-        await conn.execute("ALTER TABLE movies ADD COLUMN IF NOT EXISTS user_rating REAL")
-        await conn.execute("ALTER TABLE movies ADD COLUMN IF NOT EXISTS user_note TEXT")
-        await conn.execute("ALTER TABLE movies ADD COLUMN IF NOT EXISTS watched_at TIMESTAMP")
-        # movie / series — для разбивки библиотеки на «Фильмы» и «Сериалы».
-        await conn.execute(
-            "ALTER TABLE movies ADD COLUMN IF NOT EXISTS media_type TEXT DEFAULT 'movie'"
+    """)
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_books_user_id ON books(user_id)")
+    await conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_books_user_work "
+        "ON books(user_id, work_key) WHERE user_id IS NOT NULL"
+    )
+    # Дневник для книг: личная оценка/заметка/дата прочтения.
+    await conn.execute("ALTER TABLE books ADD COLUMN IF NOT EXISTS user_rating REAL")
+    await conn.execute("ALTER TABLE books ADD COLUMN IF NOT EXISTS user_note TEXT")
+    await conn.execute("ALTER TABLE books ADD COLUMN IF NOT EXISTS read_at TIMESTAMP")
+
+    # Маркеры разовых миграций/бэкфиллов (key → value), чтобы они отрабатывали
+    # на старте один раз и не гоняли OMDB/LLM при каждом деплое.
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS app_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
         )
-        # Ссылка на оригинал рекомендации (Reel / пост в канале).
-        await conn.execute(
-            "ALTER TABLE movies ADD COLUMN IF NOT EXISTS source_url TEXT"
+    """)
+
+    # Кэш доступности (watch-providers TMDb/JustWatch) — per-тайтл+регион,
+    # НЕ per-user. fetched_at — для TTL: протухшие перезапрашиваем.
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS watch_providers (
+            imdb_id    TEXT NOT NULL,
+            region     TEXT NOT NULL,
+            payload    TEXT NOT NULL,
+            fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (imdb_id, region)
         )
-        # Длительность в минутах из OMDB (0 — OMDB не знает, NULL — не проверяли).
-        await conn.execute(
-            "ALTER TABLE movies ADD COLUMN IF NOT EXISTS runtime INTEGER"
-        )
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS shared_lists (
-                id SERIAL PRIMARY KEY,
-                slug TEXT UNIQUE NOT NULL,
-                owner_user_id INTEGER REFERENCES users(id) ON DELETE SET NULL,
-                name TEXT NOT NULL,
-                snapshot TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                expires_at TIMESTAMP,
-                view_count INTEGER DEFAULT 0
-            )
-        """)
-        await conn.execute(
-            "CREATE INDEX IF NOT EXISTS idx_shared_lists_slug ON shared_lists(slug)"
+    """)
+
+    # Событийная аналитика (лёгкий self-hosted трекинг для kill-метрик).
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS events (
+            id      SERIAL PRIMARY KEY,
+            user_id INTEGER,
+            anon_id TEXT,
+            name    TEXT NOT NULL,
+            props   TEXT DEFAULT '{}',
+            source  TEXT DEFAULT 'web',
+            ts      TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
+    """)
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_events_name_ts ON events(name, ts)"
+    )
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_events_user ON events(user_id)")
+
+    # Разовый бэкфилл: бот раньше писал source='telegram' всему подряд.
+    # source — тип записи (personal/top100/awards), канал рекомендации живёт
+    # в rec_source. Реальный источник старых строк неизвестен → personal.
+    done = await conn.fetchval(
+        "SELECT value FROM app_meta WHERE key = 'bot_source_backfill_v1'"
+    )
+    if not done:
         await conn.execute(
-            "CREATE INDEX IF NOT EXISTS idx_shared_lists_expires "
-            "ON shared_lists(expires_at)"
-        )
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS books (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-                work_key TEXT NOT NULL,
-                title TEXT NOT NULL,
-                authors TEXT DEFAULT '[]',
-                year INTEGER,
-                subjects TEXT DEFAULT '[]',
-                description TEXT,
-                cover_url TEXT,
-                rating REAL,
-                is_read BOOLEAN DEFAULT FALSE,
-                source TEXT DEFAULT 'personal',
-                rec_source TEXT,
-                rec_note TEXT,
-                in_library BOOLEAN DEFAULT TRUE,
-                added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        await conn.execute("CREATE INDEX IF NOT EXISTS idx_books_user_id ON books(user_id)")
+            "UPDATE movies SET source = 'personal' WHERE source = 'telegram'"
+        )
         await conn.execute(
-            "CREATE UNIQUE INDEX IF NOT EXISTS idx_books_user_work "
-            "ON books(user_id, work_key) WHERE user_id IS NOT NULL"
-        )
-        # Дневник для книг: личная оценка/заметка/дата прочтения.
-        await conn.execute("ALTER TABLE books ADD COLUMN IF NOT EXISTS user_rating REAL")
-        await conn.execute("ALTER TABLE books ADD COLUMN IF NOT EXISTS user_note TEXT")
-        await conn.execute("ALTER TABLE books ADD COLUMN IF NOT EXISTS read_at TIMESTAMP")
-
-        # Маркеры разовых миграций/бэкфиллов (key → value), чтобы они отрабатывали
-        # на старте один раз и не гоняли OMDB/LLM при каждом деплое.
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS app_meta (
-                key TEXT PRIMARY KEY,
-                value TEXT
-            )
-        """)
-
-        # Кэш доступности (watch-providers TMDb/JustWatch) — per-тайтл+регион,
-        # НЕ per-user. fetched_at — для TTL: протухшие перезапрашиваем.
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS watch_providers (
-                imdb_id    TEXT NOT NULL,
-                region     TEXT NOT NULL,
-                payload    TEXT NOT NULL,
-                fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                PRIMARY KEY (imdb_id, region)
-            )
-        """)
-
-        # Событийная аналитика (лёгкий self-hosted трекинг для kill-метрик).
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS events (
-                id      SERIAL PRIMARY KEY,
-                user_id INTEGER,
-                anon_id TEXT,
-                name    TEXT NOT NULL,
-                props   TEXT DEFAULT '{}',
-                source  TEXT DEFAULT 'web',
-                ts      TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
+            "UPDATE books SET source = 'personal' WHERE source = 'telegram'"
+        )
         await conn.execute(
-            "CREATE INDEX IF NOT EXISTS idx_events_name_ts ON events(name, ts)"
+            "INSERT INTO app_meta (key, value) "
+            "VALUES ('bot_source_backfill_v1', 'done') "
+            "ON CONFLICT (key) DO NOTHING"
         )
-        await conn.execute("CREATE INDEX IF NOT EXISTS idx_events_user ON events(user_id)")
 
-        # Разовый бэкфилл: бот раньше писал source='telegram' всему подряд.
-        # source — тип записи (personal/top100/awards), канал рекомендации живёт
-        # в rec_source. Реальный источник старых строк неизвестен → personal.
-        done = await conn.fetchval(
-            "SELECT value FROM app_meta WHERE key = 'bot_source_backfill_v1'"
+
+@MIGRATIONS.register(2, "movies_listing_index")
+async def _m002_movies_listing_index(conn) -> None:
+    """Составной индекс под листинг библиотеки (фильтры + keyset по added_at)."""
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_movies_user_lib "
+        "ON movies(user_id, in_library, is_watched, added_at)"
+    )
+
+
+@MIGRATIONS.register(3, "library_revisions")
+async def _m003_library_revisions(conn) -> None:
+    """Ревизия библиотеки для ETag и дельта-синка ``/api/movies/changes``.
+
+    ``library_revisions`` — счётчик на пользователя, ``movies.revision`` —
+    ревизия последнего изменения строки, ``movie_tombstones`` — удалённые id.
+    """
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS library_revisions (
+            user_id  INTEGER PRIMARY KEY,
+            revision BIGINT NOT NULL DEFAULT 0
         )
-        if not done:
-            await conn.execute(
-                "UPDATE movies SET source = 'personal' WHERE source = 'telegram'"
-            )
-            await conn.execute(
-                "UPDATE books SET source = 'personal' WHERE source = 'telegram'"
-            )
-            await conn.execute(
-                "INSERT INTO app_meta (key, value) "
-                "VALUES ('bot_source_backfill_v1', 'done') "
-                "ON CONFLICT (key) DO NOTHING"
-            )
+    """)
+    await conn.execute(
+        "ALTER TABLE movies ADD COLUMN IF NOT EXISTS revision BIGINT NOT NULL DEFAULT 0"
+    )
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_movies_user_revision ON movies(user_id, revision)"
+    )
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS movie_tombstones (
+            user_id  INTEGER NOT NULL,
+            movie_id INTEGER NOT NULL,
+            revision BIGINT NOT NULL
+        )
+    """)
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_movie_tombstones_user_revision "
+        "ON movie_tombstones(user_id, revision)"
+    )
+
+
+@MIGRATIONS.register(4, "movie_arrays")
+async def _m004_movie_arrays(conn) -> None:
+    """``genres`` → ``text[]``, ``cast`` → ``jsonb`` с GIN-индексами.
+
+    Раньше оба поля были TEXT с JSON-строкой: фильтр по жанру или актёру в SQL
+    не выразить. Подзапрос в ``ALTER ... USING`` Postgres не принимает, поэтому
+    через новые колонки: заполнить, старые удалить, новые переименовать.
+    """
+    await conn.execute("""
+        ALTER TABLE movies
+            ADD COLUMN genres_arr TEXT[] NOT NULL DEFAULT '{}',
+            ADD COLUMN cast_json  JSONB  NOT NULL DEFAULT '[]'
+    """)
+    await conn.execute("""
+        UPDATE movies SET
+            genres_arr = ARRAY(
+                SELECT jsonb_array_elements_text(COALESCE(NULLIF(genres, ''), '[]')::jsonb)
+            ),
+            cast_json = COALESCE(NULLIF("cast", ''), '[]')::jsonb
+    """)
+    await conn.execute('ALTER TABLE movies DROP COLUMN genres, DROP COLUMN "cast"')
+    await conn.execute("ALTER TABLE movies RENAME COLUMN genres_arr TO genres")
+    await conn.execute('ALTER TABLE movies RENAME COLUMN cast_json TO "cast"')
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_movies_genres ON movies USING GIN (genres)")
+    await conn.execute(
+        'CREATE INDEX IF NOT EXISTS idx_movies_cast ON movies USING GIN ("cast" jsonb_path_ops)'
+    )
+
+
+MAX_SEARCH_TERMS = 8
+
+
+@MIGRATIONS.register(5, "movies_search")
+async def _m005_movies_search(conn) -> None:
+    """Генерируемый ``search_tsv`` + GIN-индекс для ``/api/movies/search``.
+
+    Тексты на русском идут через конфиг ``russian`` (стемминг: «матрицы» →
+    «матриц»), названия и имена — ещё и через ``simple`` (латиница и имена
+    без искажений). Веса: названия A, режиссёр/актёры/заметка B, сюжеты C.
+    """
+    await conn.execute("""
+        ALTER TABLE movies ADD COLUMN IF NOT EXISTS search_tsv tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('russian', coalesce(title, '') || ' ' || coalesce(original_title, '')), 'A')
+            || setweight(to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(original_title, '')), 'A')
+            || setweight(to_tsvector('simple', coalesce(director, '')), 'B')
+            || setweight(jsonb_to_tsvector('simple', "cast", '["string"]'), 'B')
+            || setweight(to_tsvector('russian', coalesce(user_note, '')), 'B')
+            || setweight(to_tsvector('russian', coalesce(description, '') || ' ' || coalesce(plot_ru, '')), 'C')
+        ) STORED
+    """)
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_movies_search ON movies USING GIN (search_tsv)"
+    )
+
+
+@MIGRATIONS.register(6, "event_rollups")
+async def _m006_event_rollups(conn) -> None:
+    """Агрегаты аналитики (``services.analytics_rollup``) поверх сырых events.
+
+    ``event_daily`` — счётчик событий на (день, актор, имя); ``funnel_sessions``
+    — сессии актора со стадией воронки. Актор — ``u:<user_id>`` или
+    ``a:<anon_id>``.
+    """
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS event_daily (
+            day     DATE NOT NULL,
+            actor   TEXT NOT NULL,
+            user_id INTEGER,
+            name    TEXT NOT NULL,
+            count   INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, actor, name)
+        )
+    """)
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_event_daily_user_day ON event_daily(user_id, day)"
+    )
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS funnel_sessions (
+            actor          TEXT NOT NULL,
+            started_at     TIMESTAMP NOT NULL,
+            user_id        INTEGER,
+            day            DATE NOT NULL,
+            last_at        TIMESTAMP NOT NULL,
+            stage          INTEGER NOT NULL DEFAULT 0,
+            only_available BOOLEAN NOT NULL DEFAULT FALSE,
+            PRIMARY KEY (actor, started_at)
+        )
+    """)
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_funnel_sessions_day ON funnel_sessions(day, user_id)"
+    )
+
+
+@MIGRATIONS.register(7, "watch_providers_refresh")
+async def _m007_watch_providers_refresh(conn) -> None:
+    """Индекс по ``fetched_at``: фоновое обновление выбирает записи, которым
+    скоро истекать (``availability.refresh_due``)."""
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_watch_providers_fetched "
+        "ON watch_providers(fetched_at)"
+    )
+
+
+@MIGRATIONS.register(8, "title_refs")
+async def _m008_title_refs(conn) -> None:
+    """Постоянные связки IMDb id ↔ TMDb (вид, id): ``/find`` и детальные ручки
+    TMDb для уже известного тайтла больше не нужны (``services.tmdb``)."""
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS title_refs (
+            imdb_id    TEXT PRIMARY KEY,
+            kind       TEXT NOT NULL,
+            tmdb_id    TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_title_refs_tmdb ON title_refs(kind, tmdb_id)"
+    )
+
+
+@MIGRATIONS.register(9, "availability_index")
+async def _m009_availability_index(conn) -> None:
+    """Офлайн-индекс доступности (``services.availability_index``): для каждой
+    пары регион+провайдер и вида тайтла — битсет TMDb id, доступных по подписке.
+    ``complete`` = false, если обход ``/discover`` упёрся в лимит страниц."""
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS availability_index (
+            region      TEXT NOT NULL,
+            provider_id INTEGER NOT NULL,
+            kind        TEXT NOT NULL,
+            bitmap      BYTEA NOT NULL,
+            titles      INTEGER NOT NULL DEFAULT 0,
+            complete    BOOLEAN NOT NULL DEFAULT TRUE,
+            built_at    TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (region, provider_id, kind)
+        )
+    """)
+
+
+@MIGRATIONS.register(10, "share_snapshot_refs")
+async def _m010_share_snapshot_refs(conn) -> None:
+    """Снимки шэров ссылками (``services.share_snapshot``): общие метаданные
+    фильма — одна сжатая запись на хэш содержимого в ``share_movies``, в
+    ``share_items`` — ссылка и личные поля. ``last_used_at`` защищает свежие
+    метаданные от сборки мусора, пока создающий шэр ещё не закоммитился."""
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS share_movies (
+            hash         TEXT PRIMARY KEY,
+            data         BYTEA NOT NULL,
+            last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS share_items (
+            share_id   INTEGER NOT NULL REFERENCES shared_lists(id) ON DELETE CASCADE,
+            position   INTEGER NOT NULL,
+            movie_hash TEXT NOT NULL,
+            overrides  TEXT NOT NULL,
+            PRIMARY KEY (share_id, position)
+        )
+    """)
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_share_items_movie ON share_items(movie_hash)"
+    )
+
+
+@MIGRATIONS.register(11, "watch_providers_retry")
+async def _m011_watch_providers_retry(conn) -> None:
+    """``retry_after``: не раньше какого момента плановое обновление снова берёт
+    запись после неудачного запроса в TMDb (``availability.refresh_due``) —
+    иначе упавшие записи выбирались бы первыми на каждом прогоне."""
+    await conn.execute(
+        "ALTER TABLE watch_providers ADD COLUMN IF NOT EXISTS retry_after TIMESTAMP"
+    )
+
+
+async def _schema_version(conn) -> int:
+    """Текущая версия схемы; 0 — schema_version ещё нет (пустая/старая БД)."""
+    try:
+        return await conn.fetchval("SELECT MAX(version) FROM schema_version") or 0
+    except asyncpg.UndefinedTableError:
+        return 0
+
+
+async def _init_connection(conn) -> None:
+    """Кодек jsonb на каждом соединении пула: ``cast`` приходит и уходит списком.
+
+    ``text[]`` (``genres``) asyncpg и так отдаёт списком — кодек не нужен.
+    """
+    await conn.set_type_codec(
+        "jsonb", encoder=json.dumps, decoder=json.loads, schema="pg_catalog",
+    )
+
+
+async def init_db() -> None:
+    """Пул соединений + недостающие миграции.
+
+    В обычном случае (схема актуальна) — одно чтение версии. Иначе каждая
+    миграция идёт своей транзакцией: берём advisory-lock и перечитываем версию
+    под ним — веб и бот могут стартовать одновременно, миграция должна
+    применяться ровно раз. Упавшая миграция откатывается целиком, а уже
+    накатившиеся до неё остаются.
+    """
+    global _pool
+    started = time.monotonic()
+    url = _get_url()
+    _pool = await asyncpg.create_pool(
+        url, min_size=1, max_size=5, ssl="require", init=_init_connection,
+    )
+    pool_ms = (time.monotonic() - started) * 1000
+    async with _pool.acquire() as conn:
+        if MIGRATIONS.pending(await _schema_version(conn)):
+            await conn.execute(SCHEMA_VERSION_DDL)
+            while True:
+                async with conn.transaction():
+                    await conn.execute("SELECT pg_advisory_xact_lock($1)", _MIGRATION_LOCK_ID)
+                    pending = MIGRATIONS.pending(await _schema_version(conn))
+                    if not pending:
+                        break
+                    migration = pending[0]
+                    await migration.apply(conn)
+                    await conn.execute(
+                        "INSERT INTO schema_version (version, name) VALUES ($1, $2)",
+                        migration.version, migration.name,
+                    )
+                print(
+                    f"[db] migration {migration.version} ({migration.name}) applied",
+                    flush=True,
+                )
+    print(
+        f"[db] schema v{MIGRATIONS.latest}, init_db "
+        f"{(time.monotonic() - started) * 1000:.1f}ms (pool {pool_ms:.1f}ms)",
+        flush=True,
+    )
 
 
 async def meta_get(key: str) -> Optional[str]:
@@ -324,16 +612,169 @@ async def upsert_watch_providers_cache(
             "INSERT INTO watch_providers (imdb_id, region, payload, fetched_at) "
             "VALUES ($1, $2, $3, $4) "
             "ON CONFLICT (imdb_id, region) DO UPDATE SET "
-            "payload = EXCLUDED.payload, fetched_at = EXCLUDED.fetched_at",
+            "payload = EXCLUDED.payload, fetched_at = EXCLUDED.fetched_at, retry_after = NULL",
             imdb_id, region, json.dumps(payload), datetime.utcnow(),
         )
 
 
+async def get_watch_providers_cache_many(
+    imdb_ids: list[str], region: str
+) -> dict[str, tuple[dict, datetime]]:
+    """Кэш доступности пачки тайтлов одним запросом: ``{imdb_id: (payload, fetched_at)}``.
+
+    Тайтлов без кэша в ответе нет. TTL решает вызывающий.
+    """
+    async with _pool.acquire() as conn:
+        rows = await conn.fetch(
+            "SELECT imdb_id, payload, fetched_at FROM watch_providers "
+            "WHERE region = $1 AND imdb_id = ANY($2::text[])",
+            region, imdb_ids,
+        )
+    return {
+        r[0]: (json.loads(r[1]), r[2] if isinstance(r[2], datetime) else datetime.utcnow())
+        for r in rows if r[1]
+    }
+
+
+async def upsert_watch_providers_cache_many(region: str, payloads: dict[str, dict]) -> None:
+    """Записать пачку свежей доступности одной транзакцией."""
+    if not payloads:
+        return
+    now = datetime.utcnow()
+    async with _pool.acquire() as conn:
+        await conn.executemany(
+            "INSERT INTO watch_providers (imdb_id, region, payload, fetched_at) "
+            "VALUES ($1, $2, $3, $4) "
+            "ON CONFLICT (imdb_id, region) DO UPDATE SET "
+            "payload = EXCLUDED.payload, fetched_at = EXCLUDED.fetched_at, retry_after = NULL",
+            [(imdb_id, region, json.dumps(p), now) for imdb_id, p in payloads.items()],
+        )
+
+
+async def get_watch_providers_due(
+    fetched_before: datetime, limit: int, now: datetime,
+) -> list[tuple[str, str]]:
+    """Записи кэша доступности, скачанные раньше ``fetched_before``, для
+    тайтлов из чьих-то библиотек: ``[(imdb_id, region)]``. Записи, чей
+    ``retry_after`` ещё не наступил к ``now``, пропускаются.
+
+    Сначала — тайтлы, которые есть у большего числа пользователей, при равенстве
+    — самые старые записи.
+    """
+    async with _pool.acquire() as conn:
+        rows = await conn.fetch(
+            "SELECT w.imdb_id, w.region FROM watch_providers w "
+            "JOIN (SELECT imdb_id, COUNT(*) AS owners FROM movies "
+            "      WHERE imdb_id IS NOT NULL GROUP BY imdb_id) m "
+            "  ON m.imdb_id = w.imdb_id "
+            "WHERE w.fetched_at < $1 AND (w.retry_after IS NULL OR w.retry_after <= $2) "
+            "ORDER BY m.owners DESC, w.fetched_at ASC LIMIT $3",
+            fetched_before, now, limit,
+        )
+    return [(r[0], r[1]) for r in rows]
+
+async def defer_watch_providers_refresh(keys: list[tuple[str, str]], until: datetime) -> None:
+    """Отложить плановое обновление записей ``[(imdb_id, region)]`` до ``until``."""
+    if not keys:
+        return
+    async with _pool.acquire() as conn:
+        await conn.executemany(
+            "UPDATE watch_providers SET retry_after = $1 WHERE imdb_id = $2 AND region = $3",
+            [(until, imdb_id, region) for imdb_id, region in keys],
+        )
+
+
+
+async def get_provider_targets() -> dict[str, set[int]]:
+    """Какие провайдеры в каких регионах выбрали пользователи: ``{region: {id}}``.
+
+    NULL region — 'RU', как в ``get_user_settings``."""
+    async with _pool.acquire() as conn:
+        rows = await conn.fetch(
+            "SELECT COALESCE(region, 'RU'), streaming_services FROM users "
+            "WHERE streaming_services IS NOT NULL AND streaming_services <> '[]'"
+        )
+    targets: dict[str, set[int]] = {}
+    for region, services in rows:
+        targets.setdefault(region.upper(), set()).update(json.loads(services))
+    return targets
+
+
+async def save_availability_index(
+    region: str, provider_id: int, kind: str, bitmap: bytes, titles: int, complete: bool,
+) -> None:
+    """Заменить битсет пары регион+провайдер для вида ``kind``."""
+    async with _pool.acquire() as conn:
+        await conn.execute(
+            "INSERT INTO availability_index "
+            "(region, provider_id, kind, bitmap, titles, complete, built_at) "
+            "VALUES ($1, $2, $3, $4, $5, $6, $7) "
+            "ON CONFLICT (region, provider_id, kind) DO UPDATE SET "
+            "bitmap = EXCLUDED.bitmap, titles = EXCLUDED.titles, "
+            "complete = EXCLUDED.complete, built_at = EXCLUDED.built_at",
+            region, provider_id, kind, bitmap, titles, complete, datetime.utcnow(),
+        )
+
+
+async def get_availability_index() -> list[dict]:
+    """Весь офлайн-индекс доступности (битсеты сжаты, как хранятся)."""
+    async with _pool.acquire() as conn:
+        rows = await conn.fetch(
+            "SELECT region, provider_id, kind, bitmap, titles, complete, built_at "
+            "FROM availability_index"
+        )
+    return [
+        {
+            "region": r[0], "provider_id": r[1], "kind": r[2], "bitmap": bytes(r[3]),
+            "titles": r[4], "complete": r[5], "built_at": r[6],
+        }
+        for r in rows
+    ]
+
+
+# ── title refs (IMDb ↔ TMDb) ─────────────────────────────────────────────────
+
+
+async def get_title_refs(imdb_ids: list[str]) -> dict[str, tuple[str, str]]:
+    """Известные связки ``{imdb_id: (kind, tmdb_id)}``; неизвестных в ответе нет."""
+    async with _pool.acquire() as conn:
+        rows = await conn.fetch(
+            "SELECT imdb_id, kind, tmdb_id FROM title_refs WHERE imdb_id = ANY($1::text[])",
+            imdb_ids,
+        )
+    return {r[0]: (r[1], r[2]) for r in rows}
+
+
+async def get_imdb_ids_by_tmdb(kind: str, tmdb_ids: list[str]) -> dict[str, str]:
+    """Обратная сторона связок: ``{tmdb_id: imdb_id}`` для тайтлов вида ``kind``."""
+    async with _pool.acquire() as conn:
+        rows = await conn.fetch(
+            "SELECT tmdb_id, imdb_id FROM title_refs "
+            "WHERE kind = $1 AND tmdb_id = ANY($2::text[])",
+            kind, tmdb_ids,
+        )
+    return {r[0]: r[1] for r in rows}
+
+
+async def save_title_refs(refs: list[tuple[str, str, str]]) -> None:
+    """Запомнить связки ``(imdb_id, kind, tmdb_id)``. Связка постоянна: уже
+    известный imdb_id не перезаписывается."""
+    if not refs:
+        return
+    async with _pool.acquire() as conn:
+        await conn.executemany(
+            "INSERT INTO title_refs (imdb_id, kind, tmdb_id) VALUES ($1, $2, $3) "
+            "ON CONFLICT (imdb_id) DO NOTHING",
+            refs,
+        )
+
+
 # ── analytics events ─────────────────────────────────────────────────────────
 
 
 async def insert_events(rows: list[dict]) -> None:
-    """Батч-вставка событий. ts ставит сервер (UTC). Best-effort."""
+    """Батч-вставка событий. ts ставит сервер (UTC): ``ts`` из строки (момент
+    приёма в буфер ``event_buffer``) или текущее время. Best-effort."""
     if not rows:
         return
     now = datetime.utcnow()
@@ -348,56 +789,232 @@ async def insert_events(rows: list[dict]) -> None:
                     r["name"],
                     json.dumps(r.get("props") or {}),
                     r.get("source") or "web",
-                    now,
+                    r.get("ts") or now,
                 )
                 for r in rows
             ],
         )
 
 
-async def get_all_movie_imdb_ids() -> list[str]:
-    """Уникальные imdb_id по всем строкам movies (для разовых бэкфиллов)."""
+# ── analytics rollups ───────────────────────────────────────────────────────
+
+# id последнего свёрнутого в агрегаты события (app_meta).
+EVENTS_ROLLUP_HWM_KEY = "events_rollup_hwm"
+_ROLLUP_LOCK_ID = 7_302_416  # сериализует сворачивание между процессами
+
+
+async def get_events_for_rollup(
+    after_id: int, limit: int, settled_before: datetime,
+) -> list[dict]:
+    """Сырые события с ``id > after_id`` в порядке id — до первого новее ``settled_before``.
+
+    Отсечка по времени важна именно здесь: id выдаёт sequence до коммита, и
+    транзакция с меньшим id может закоммититься позже уже свёрнутой большей.
+    Отсечка — точка, а не фильтр: ``ts`` ставится при приёме, а буферы разных
+    процессов сбрасываются в разное время, так что событие с меньшим id может
+    быть новее уже подходящего большего — его пропуск увёл бы high-water mark
+    выше, и событие не попало бы в агрегаты никогда.
+    """
     async with _pool.acquire() as conn:
-        rows = await conn.fetch("SELECT DISTINCT imdb_id FROM movies")
-    return [r[0] for r in rows if r[0]]
+        rows = await conn.fetch(
+            "SELECT id, ts, user_id, anon_id, name, props FROM events "
+            "WHERE id > $1 ORDER BY id LIMIT $2",
+            after_id, limit,
+        )
+    events = []
+    for r in rows:
+        if r[1] > settled_before:
+            break
+        events.append({
+            "id": r[0], "ts": r[1], "user_id": r[2], "anon_id": r[3],
+            "name": r[4], "props": json.loads(r[5]) if r[5] else {},
+        })
+    return events
+
+
+async def get_last_funnel_sessions(actors: list[str]) -> dict[str, dict]:
+    """Последняя сессия каждого актора — её может продолжить новое событие."""
+    async with _pool.acquire() as conn:
+        rows = await conn.fetch(
+            "SELECT DISTINCT ON (actor) actor, started_at, user_id, last_at, stage, "
+            "only_available FROM funnel_sessions WHERE actor = ANY($1::text[]) "
+            "ORDER BY actor, started_at DESC",
+            actors,
+        )
+    return {
+        r[0]: {
+            "actor": r[0], "started_at": r[1], "user_id": r[2], "last_at": r[3],
+            "stage": r[4], "only_available": r[5],
+        }
+        for r in rows
+    }
+
 
+async def apply_event_rollup(
+    daily: list[tuple], sessions: list[dict], after_id: int, high_water_mark: int,
+) -> bool:
+    """Одной транзакцией: прибавить дневные счётчики, записать сессии и
+    сдвинуть high-water mark с ``after_id`` на ``high_water_mark`` — порция
+    событий учитывается ровно один раз. Если mark уже сдвинул другой процесс,
+    ничего не пишем и возвращаем False.
 
-async def set_media_type_by_imdb(imdb_id: str, media_type: str) -> int:
-    """Проставляет media_type всем строкам с этим imdb_id (тип общий для тайтла,
-    так покрываем сразу всех пользователей). Возвращает число изменённых строк."""
+    ``daily`` — кортежи ``(day: date, actor, user_id, name, count)``.
+    """
+    async with _pool.acquire() as conn, conn.transaction():
+        await conn.execute("SELECT pg_advisory_xact_lock($1)", _ROLLUP_LOCK_ID)
+        current = await conn.fetchval(
+            "SELECT value FROM app_meta WHERE key = $1", EVENTS_ROLLUP_HWM_KEY,
+        )
+        if int(current or 0) != after_id:
+            return False
+        await conn.executemany(
+            "INSERT INTO event_daily (day, actor, user_id, name, count) "
+            "VALUES ($1, $2, $3, $4, $5) ON CONFLICT (day, actor, name) "
+            "DO UPDATE SET count = event_daily.count + excluded.count",
+            daily,
+        )
+        await conn.executemany(
+            "INSERT INTO funnel_sessions "
+            "(actor, started_at, user_id, day, last_at, stage, only_available) "
+            "VALUES ($1, $2, $3, $4, $5, $6, $7) ON CONFLICT (actor, started_at) "
+            "DO UPDATE SET last_at = excluded.last_at, stage = excluded.stage, "
+            "only_available = excluded.only_available",
+            [
+                (
+                    s["actor"], s["started_at"], s["user_id"], s["started_at"].date(),
+                    s["last_at"], s["stage"], s["only_available"],
+                )
+                for s in sessions
+            ],
+        )
+        await conn.execute(
+            "INSERT INTO app_meta (key, value) VALUES ($1, $2) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+            EVENTS_ROLLUP_HWM_KEY, str(high_water_mark),
+        )
+    return True
+
+
+async def prune_events(before: datetime, max_id: int) -> int:
+    """Удалить сырые события старше ``before`` — только уже свёрнутые (id ≤ max_id)."""
+    async with _pool.acquire() as conn:
+        status = await conn.execute(
+            "DELETE FROM events WHERE id <= $1 AND ts < $2", max_id, before,
+        )
+    return int(status.split()[-1])
+
+
+async def get_funnel(since: date, user_id: Optional[int] = None) -> list[dict]:
+    """Воронка по дням из агрегатов: запросы → показы → запуски, открывшие
+    приложение, сессии и «решающие» сессии (дошли до запуска)."""
+    requested, viewed, launched = FUNNEL_EVENTS
+    stages = len(FUNNEL_EVENTS)
+    user_filter = " AND user_id = $2" if user_id is not None else ""
+    params: list = [since] + ([user_id] if user_id is not None else [])
+    n = len(params)
     async with _pool.acquire() as conn:
-        res = await conn.execute(
-            "UPDATE movies SET media_type = $1 "
-            "WHERE imdb_id = $2 AND media_type IS DISTINCT FROM $1",
-            media_type, imdb_id,
+        counts = await conn.fetch(
+            "SELECT day, "
+            "COUNT(DISTINCT actor) FILTER (WHERE name IN ('app_open', 'session_start')), "
+            f"COALESCE(SUM(count) FILTER (WHERE name = ${n + 1}), 0), "
+            f"COALESCE(SUM(count) FILTER (WHERE name = ${n + 2}), 0), "
+            f"COALESCE(SUM(count) FILTER (WHERE name = ${n + 3}), 0) "
+            f"FROM event_daily WHERE day >= $1{user_filter} GROUP BY day",
+            *params, requested, viewed, launched,
         )
-    return int(res.split()[-1])
+        sessions = await conn.fetch(
+            f"SELECT day, COUNT(*), COUNT(*) FILTER (WHERE stage >= ${n + 1}), "
+            f"COUNT(*) FILTER (WHERE stage >= ${n + 1} AND only_available) "
+            f"FROM funnel_sessions WHERE day >= $1{user_filter} GROUP BY day",
+            *params, stages,
+        )
+    days: dict[str, dict] = {}
+
+    def _day(d: date) -> dict:
+        return days.setdefault(d.isoformat(), {
+            "day": d.isoformat(), "active": 0, "requested": 0, "viewed": 0,
+            "launched": 0, "sessions": 0, "decisive": 0, "decisive_only_available": 0,
+        })
+
+    for d, active, req, view, launch in counts:
+        _day(d).update(active=active, requested=req, viewed=view, launched=launch)
+    for d, total, decisive, only_available in sessions:
+        _day(d).update(sessions=total, decisive=decisive, decisive_only_available=only_available)
+    return [days[d] for d in sorted(days)]
 
 
-async def get_imdb_ids_missing_runtime(limit: int = 300) -> list[str]:
-    """imdb_id записей без длительности (NULL = ещё не спрашивали у OMDB).
+async def get_backfill_imdb_ids(
+    after: str = "", limit: int = 100, missing_only: bool = False,
+) -> list[str]:
+    """Следующая порция уникальных imdb_id для OMDB-бэкфилла (keyset по imdb_id).
 
-    0 означает «спрашивали, OMDB не знает» — такие не возвращаем, чтобы
-    бэкфилл не дёргал OMDB по ним на каждом старте.
+    ``after`` — курсор: последний обработанный imdb_id. ``missing_only`` —
+    только тайтлы без длительности (NULL = ещё не спрашивали у OMDB; 0 —
+    «спрашивали, OMDB не знает», такие не возвращаем).
     """
+    where = "imdb_id LIKE 'tt%' AND imdb_id > $1"
+    if missing_only:
+        where += " AND runtime IS NULL"
     async with _pool.acquire() as conn:
         rows = await conn.fetch(
-            "SELECT DISTINCT imdb_id FROM movies "
-            "WHERE runtime IS NULL AND imdb_id LIKE 'tt%' LIMIT $1",
-            limit,
+            f"SELECT DISTINCT imdb_id FROM movies WHERE {where} "
+            "ORDER BY imdb_id LIMIT $2",
+            after, limit,
         )
     return [r[0] for r in rows if r[0]]
 
 
-async def set_runtime_by_imdb(imdb_id: str, runtime: int) -> int:
-    """Проставляет runtime всем строкам с этим imdb_id (длительность общая для
-    тайтла — покрываем сразу всех пользователей)."""
-    async with _pool.acquire() as conn:
-        res = await conn.execute(
-            "UPDATE movies SET runtime = $1 WHERE imdb_id = $2 AND runtime IS NULL",
-            runtime, imdb_id,
+async def apply_omdb_patches(patches: list[dict]) -> int:
+    """Пачкой дописывает данные OMDB во все строки с этими imdb_id (данные
+    общие для тайтла — покрываем сразу всех пользователей).
+
+    Один ``UPDATE ... FROM (VALUES ...)`` на порцию вместо UPDATE на тайтл.
+    Заполняются только пустые поля; media_type в патче бывает только
+    'series' — бэкфилл лишь переводит старые записи из дефолтного 'movie'.
+    Возвращает число изменённых строк.
+    """
+    if not patches:
+        return 0
+    rows = []
+    params: list = []
+    for i, p in enumerate(patches):
+        base = i * 5
+        rows.append(
+            f"(${base + 1}::text, ${base + 2}::text, ${base + 3}::int, "
+            f"${base + 4}::text, ${base + 5}::real)"
         )
-    return int(res.split()[-1])
+        params += [p["imdb_id"], p.get("media_type"), p.get("runtime"),
+                   p.get("awards"), p.get("imdb_rating")]
+    async with _pool.acquire() as conn, conn.transaction():
+        changed_rows = await conn.fetch(
+            "UPDATE movies AS m SET "
+            "media_type = COALESCE(v.media_type, m.media_type), "
+            "runtime = COALESCE(m.runtime, v.runtime), "
+            "awards = COALESCE(m.awards, v.awards), "
+            "imdb_rating = COALESCE(m.imdb_rating, v.imdb_rating) "
+            f"FROM (VALUES {', '.join(rows)}) "
+            "AS v(imdb_id, media_type, runtime, awards, imdb_rating) "
+            "WHERE m.imdb_id = v.imdb_id AND ("
+            "(v.media_type IS NOT NULL AND m.media_type IS DISTINCT FROM v.media_type) "
+            "OR (m.runtime IS NULL AND v.runtime IS NOT NULL) "
+            "OR (m.awards IS NULL AND v.awards IS NOT NULL) "
+            "OR (m.imdb_rating IS NULL AND v.imdb_rating IS NOT NULL)) "
+            "RETURNING m.id, m.user_id",
+            *params,
+        )
+        # По ревизии каждому затронутому владельцу — его клиенты заберут
+        # дозаполненные строки через /api/movies/changes.
+        by_owner: dict[int, list[int]] = {}
+        for row in changed_rows:
+            if row["user_id"] is not None:
+                by_owner.setdefault(row["user_id"], []).append(row["id"])
+        for owner, movie_ids in by_owner.items():
+            revision = await _bump_revision(conn, owner)
+            await conn.execute(
+                "UPDATE movies SET revision = $1 WHERE id = ANY($2::int[])",
+                revision, movie_ids,
+            )
+    return len(changed_rows)
 
 
 def _row_to_movie(row) -> Movie:
@@ -407,10 +1024,10 @@ def _row_to_movie(row) -> Movie:
         title=row[2],
         original_title=row[3],
         year=row[4],
-        genres=json.loads(row[5]) if row[5] else [],
+        genres=list(row[5] or []),
         description=row[6],
         plot=row[7],
-        cast=json.loads(row[8]) if row[8] else [],
+        cast=row[8] or [],
         director=row[9],
         poster_url=row[10],
         imdb_rating=row[11],
@@ -526,9 +1143,11 @@ async def merge_telegram_user_into(source_user_id: int, target_user_id: int) ->
                 "(SELECT imdb_id FROM movies WHERE user_id = $2)",
                 source_user_id, target_user_id,
             )
+            # Для клиентов target перевешенные фильмы — новые строки.
+            revision = await _bump_revision(conn, target_user_id)
             await conn.execute(
-                "UPDATE movies SET user_id = $1 WHERE user_id = $2",
-                target_user_id, source_user_id,
+                "UPDATE movies SET user_id = $1, revision = $2 WHERE user_id = $3",
+                target_user_id, revision, source_user_id,
             )
             if source_tg_id is not None:
                 await conn.execute(
@@ -556,15 +1175,20 @@ async def attach_google_sub(
 # ── movies ───────────────────────────────────────────────────────────────────
 
 
-async def get_all_movies(
-    user_id: int,
+def _movie_filters(
+    params: list,
     source: Optional[str] = None,
     is_watched: Optional[bool] = None,
     in_library: Optional[bool] = None,
-) -> list[Movie]:
-    conditions = ["user_id = $1"]
-    params: list = [user_id]
+    genre: Optional[str] = None,
+    actor: Optional[str] = None,
+) -> list[str]:
+    """Условия WHERE для листинга; значения дописываются в ``params``.
 
+    Жанр и актёр — точное совпадение элемента, через GIN-индексы
+    ``idx_movies_genres`` / ``idx_movies_cast``.
+    """
+    conditions = []
     if source:
         params.append(source)
         conditions.append(f"source = ${len(params)}")
@@ -574,7 +1198,27 @@ async def get_all_movies(
     if in_library is not None:
         params.append(in_library)
         conditions.append(f"in_library = ${len(params)}")
+    if genre:
+        params.append(genre)
+        conditions.append(f"genres @> ARRAY[${len(params)}::text]")
+    if actor:
+        params.append([actor])
+        conditions.append(f'"cast" @> ${len(params)}::jsonb')
+    return conditions
+
 
+async def get_all_movies(
+    user_id: int,
+    source: Optional[str] = None,
+    is_watched: Optional[bool] = None,
+    in_library: Optional[bool] = None,
+    genre: Optional[str] = None,
+    actor: Optional[str] = None,
+) -> list[Movie]:
+    params: list = [user_id]
+    conditions = ["user_id = $1", *_movie_filters(
+        params, source, is_watched, in_library, genre, actor,
+    )]
     query = (
         f"SELECT {SELECT_COLUMNS} FROM movies "
         f"WHERE {' AND '.join(conditions)} "
@@ -585,6 +1229,110 @@ async def get_all_movies(
         return [_row_to_movie(r) for r in rows]
 
 
+# Поля Movie в порядке SELECT_COLUMNS — для проекции ``fields=`` в листинге.
+MOVIE_FIELDS = tuple(c.strip().strip('"') for c in SELECT_COLUMNS.split(","))
+
+
+def _project_value(field: str, value):
+    """Значение колонки в том виде, в каком его отдаёт ``_row_to_movie``."""
+    if field in ("genres", "cast"):
+        return list(value or [])
+    if field == "is_watched":
+        return bool(value)
+    if field == "in_library":
+        return bool(value) if value is not None else True
+    if field == "media_type":
+        return value or "movie"
+    return value
+
+
+async def get_movies_page(
+    user_id: int,
+    fields: tuple[str, ...] = MOVIE_FIELDS,
+    source: Optional[str] = None,
+    is_watched: Optional[bool] = None,
+    in_library: Optional[bool] = None,
+    genre: Optional[str] = None,
+    actor: Optional[str] = None,
+    limit: Optional[int] = 100,
+    after: Optional[tuple[str, int]] = None,
+) -> tuple[list[dict], Optional[tuple[str, int]]]:
+    """Страница фильмов пользователя (keyset по ``(added_at, id)``, новые сверху).
+
+    Строки сразу JSON-готовые dict'ы, без pydantic (см. ``backend.responses``);
+    ``limit=None`` — вся библиотека одной «страницей».
+
+    Возвращает только запрошенные поля (``fields`` ⊆ ``MOVIE_FIELDS``) — сетка
+    карточек не тянет plot/plot_ru. ``after`` — ключ последней строки прошлой
+    страницы (added_at в ISO-строке, как в SQLite-бэкенде); в ответе — ключ для
+    следующей или None, если страница последняя. Индекс ``idx_movies_user_lib``
+    покрывает фильтры и порядок.
+    """
+    columns = ", ".join(f'"{f}"' if f == "cast" else f for f in fields)
+    query = f"SELECT added_at, id, {columns} FROM movies WHERE user_id = $1"
+    params: list = [user_id]
+    for condition in _movie_filters(params, source, is_watched, in_library, genre, actor):
+        query += f" AND {condition}"
+    if after is not None:
+        params += [datetime.fromisoformat(after[0]), after[1]]
+        query += f" AND (added_at, id) < (${len(params) - 1}, ${len(params)})"
+    query += " ORDER BY added_at DESC, id DESC"
+    if limit is not None:
+        # +1 строка — узнать, есть ли следующая страница, без COUNT(*).
+        params.append(limit + 1)
+        query += f" LIMIT ${len(params)}"
+
+    async with _pool.acquire() as conn:
+        rows = await conn.fetch(query, *params)
+    next_key = None
+    if limit is not None and len(rows) > limit:
+        next_key = (rows[limit - 1][0].isoformat(), rows[limit - 1][1])
+        rows = rows[:limit]
+    return [
+        {f: _project_value(f, row[i + 2]) for i, f in enumerate(fields)}
+        for row in rows
+    ], next_key
+
+
+def _search_terms(query: str) -> list[str]:
+    """Слова запроса без синтаксиса tsquery (``&``, ``|``, ``!``, скобки)."""
+    return re.findall(r"\w+", query.lower())[:MAX_SEARCH_TERMS]
+
+
+async def search_movies(
+    user_id: int,
+    query: str,
+    fields: tuple[str, ...] = MOVIE_FIELDS,
+    limit: int = 20,
+    offset: int = 0,
+) -> tuple[list[dict], bool]:
+    """Полнотекстовый поиск по библиотеке пользователя, релевантные сверху.
+
+    Каждое слово запроса — префикс (``слово:*``), все слова обязательны; запрос
+    строится в обоих конфигах, ``russian`` и ``simple``. Ранжирование —
+    ``ts_rank_cd`` по весам ``search_tsv``. Второе значение — есть ли ещё
+    результаты после этой страницы.
+    """
+    terms = _search_terms(query)
+    if not terms:
+        return [], False
+    tsquery = " & ".join(f"{t}:*" for t in terms)
+    columns = ", ".join(f'"{f}"' if f == "cast" else f for f in fields)
+    sql = f"""
+        SELECT {columns} FROM movies,
+             (to_tsquery('russian', $2) || to_tsquery('simple', $2)) AS q
+        WHERE user_id = $1 AND search_tsv @@ q
+        ORDER BY ts_rank_cd(search_tsv, q) DESC, id DESC
+        LIMIT $3 OFFSET $4
+    """
+    async with _pool.acquire() as conn:
+        rows = await conn.fetch(sql, user_id, tsquery, limit + 1, offset)
+    return [
+        {f: _project_value(f, row[i]) for i, f in enumerate(fields)}
+        for row in rows[:limit]
+    ], len(rows) > limit
+
+
 async def get_awards(limit: Optional[int] = None) -> list[Movie]:
     query = (
         f"SELECT {SELECT_COLUMNS} FROM movies "
@@ -637,6 +1385,69 @@ async def get_award_by_imdb_id(imdb_id: str) -> Optional[Movie]:
         return _row_to_movie(row) if row else None
 
 
+async def get_award_imdb_ids() -> set[str]:
+    """Все imdb_id каталога наград одним запросом (проверка «уже есть» для синка)."""
+    async with _pool.acquire() as conn:
+        rows = await conn.fetch(
+            "SELECT imdb_id FROM movies WHERE user_id IS NULL AND source = 'awards'"
+        )
+    return {r[0] for r in rows if r[0]}
+
+
+# ----- library revisions -----------------------------------------------------
+
+
+async def _bump_revision(conn, user_id: int) -> int:
+    """+1 к ревизии библиотеки пользователя (в транзакции вызывающего)."""
+    return await conn.fetchval(
+        "INSERT INTO library_revisions (user_id, revision) VALUES ($1, 1) "
+        "ON CONFLICT (user_id) DO UPDATE "
+        "SET revision = library_revisions.revision + 1 "
+        "RETURNING revision",
+        user_id,
+    )
+
+
+class _NothingChanged(Exception):
+    """Откатить транзакцию ``async with conn.transaction()`` без ошибки наружу."""
+
+
+async def _touch_movie(conn, movie_id: int) -> None:
+    """Отметить изменение строки, которую правят по PK без user_id (фоновые
+    описания/переводы): личной записи — новая ревизия владельца."""
+    owner = await conn.fetchval("SELECT user_id FROM movies WHERE id = $1", movie_id)
+    if owner is not None:
+        revision = await _bump_revision(conn, owner)
+        await conn.execute(
+            "UPDATE movies SET revision = $1 WHERE id = $2", revision, movie_id,
+        )
+
+
+async def get_library_revision(user_id: int) -> int:
+    """Текущая ревизия библиотеки; 0 — библиотеку ещё не меняли."""
+    async with _pool.acquire() as conn:
+        revision = await conn.fetchval(
+            "SELECT revision FROM library_revisions WHERE user_id = $1", user_id,
+        )
+    return revision or 0
+
+
+async def get_movie_changes(user_id: int, since: int) -> tuple[list[Movie], list[int]]:
+    """Строки, изменённые после ревизии ``since``, и id удалённых после неё."""
+    async with _pool.acquire() as conn:
+        rows = await conn.fetch(
+            f"SELECT {SELECT_COLUMNS} FROM movies WHERE user_id = $1 AND revision > $2 "
+            "ORDER BY revision",
+            user_id, since,
+        )
+        deleted = await conn.fetch(
+            "SELECT movie_id FROM movie_tombstones WHERE user_id = $1 AND revision > $2 "
+            "ORDER BY revision",
+            user_id, since,
+        )
+    return [_row_to_movie(r) for r in rows], [r[0] for r in deleted]
+
+
 async def add_movie(
     movie: MovieBase,
     user_id: Optional[int],
@@ -648,17 +1459,22 @@ async def add_movie(
     award_year: Optional[int] = None,
     source_url: Optional[str] = None,
 ) -> Movie:
-    async with _pool.acquire() as conn:
+    """Добавить фильм. ``user_id=None`` — глобальная запись (каталог наград).
+
+    Личная запись поднимает ревизию библиотеки владельца.
+    """
+    async with _pool.acquire() as conn, conn.transaction():
+        revision = await _bump_revision(conn, user_id) if user_id is not None else 0
         movie_id = await conn.fetchval(
             """
             INSERT INTO movies (
                 user_id, imdb_id, title, original_title, year, genres, description,
                 plot, "cast", director, poster_url, imdb_rating, awards, source,
                 rec_source, rec_note, in_library, award, award_year, media_type,
-                source_url, runtime
+                source_url, runtime, revision
             ) VALUES (
                 $1, $2, $3, $4, $5, $6, $7, $8, $9, $10,
-                $11, $12, $13, $14, $15, $16, $17, $18, $19, $20, $21, $22
+                $11, $12, $13, $14, $15, $16, $17, $18, $19, $20, $21, $22, $23
             ) RETURNING id
             """,
             user_id,
@@ -666,10 +1482,10 @@ async def add_movie(
             movie.title,
             movie.original_title,
             movie.year,
-            json.dumps(movie.genres),
+            movie.genres,
             movie.description,
             movie.plot,
-            json.dumps(movie.cast),
+            movie.cast,
             movie.director,
             movie.poster_url,
             movie.imdb_rating,
@@ -683,6 +1499,7 @@ async def add_movie(
             movie.media_type,
             source_url,
             movie.runtime,
+            revision,
         )
         row = await conn.fetchrow(
             f"SELECT {SELECT_COLUMNS} FROM movies WHERE id = $1", movie_id
@@ -734,27 +1551,37 @@ async def update_movie(
     n_uid = len(params)
 
     async with _pool.acquire() as conn:
-        await conn.execute(
-            f"UPDATE movies SET {', '.join(sets)} "
-            f"WHERE id = ${n_id} AND user_id = ${n_uid}",
-            *params,
-        )
+        try:
+            async with conn.transaction():
+                revision = await _bump_revision(conn, user_id)
+                params.append(revision)
+                result = await conn.execute(
+                    f"UPDATE movies SET {', '.join(sets)}, revision = ${len(params)} "
+                    f"WHERE id = ${n_id} AND user_id = ${n_uid}",
+                    *params,
+                )
+                if not int(result.split()[-1]):
+                    raise _NothingChanged  # чужой/несуществующий фильм — ревизию не тратим
+        except _NothingChanged:
+            pass
     return await get_user_movie_by_id(movie_id, user_id)
 
 
 async def set_plot_ru(movie_id: int, plot_ru: str) -> None:
-    async with _pool.acquire() as conn:
+    async with _pool.acquire() as conn, conn.transaction():
         await conn.execute(
             "UPDATE movies SET plot_ru = $1 WHERE id = $2", plot_ru, movie_id
         )
+        await _touch_movie(conn, movie_id)
 
 
 async def set_description(movie_id: int, description: str) -> None:
     """Сохранить краткое описание. Догенерация в фоне после сохранения в боте."""
-    async with _pool.acquire() as conn:
+    async with _pool.acquire() as conn, conn.transaction():
         await conn.execute(
             "UPDATE movies SET description = $1 WHERE id = $2", description, movie_id
         )
+        await _touch_movie(conn, movie_id)
 
 
 async def get_movies_missing_plot_ru() -> list[Movie]:
@@ -768,15 +1595,25 @@ async def get_movies_missing_plot_ru() -> list[Movie]:
 
 
 async def delete_movie(movie_id: int, user_id: int) -> bool:
+    """Удалить фильм из библиотеки пользователя (с надгробием для дельта-синка)."""
     async with _pool.acquire() as conn:
-        result = await conn.execute(
-            "DELETE FROM movies WHERE id = $1 AND user_id = $2",
-            movie_id, user_id,
-        )
         try:
-            return int(result.split()[-1]) > 0
-        except Exception:
+            async with conn.transaction():
+                revision = await _bump_revision(conn, user_id)
+                result = await conn.execute(
+                    "DELETE FROM movies WHERE id = $1 AND user_id = $2",
+                    movie_id, user_id,
+                )
+                if not int(result.split()[-1]):
+                    raise _NothingChanged
+                await conn.execute(
+                    "INSERT INTO movie_tombstones (user_id, movie_id, revision) "
+                    "VALUES ($1, $2, $3)",
+                    user_id, movie_id, revision,
+                )
+        except _NothingChanged:
             return False
+        return True
 
 
 async def get_unwatched_movies(user_id: int) -> list[Movie]:
@@ -972,49 +1809,133 @@ async def slug_exists(slug: str) -> bool:
         return row is not None
 
 
+async def _write_share_items(
+    conn, share_id: int, items: list[tuple[str, str]], metadata: dict[str, bytes],
+) -> None:
+    # DO UPDATE, а не DO NOTHING: строка metadata блокируется до коммита, и
+    # сборщик мусора не удалит её, пока этот шэр не сослался на неё.
+    await conn.executemany(
+        "INSERT INTO share_movies (hash, data) VALUES ($1, $2) "
+        "ON CONFLICT (hash) DO UPDATE SET last_used_at = CURRENT_TIMESTAMP",
+        list(metadata.items()),
+    )
+    await conn.executemany(
+        "INSERT INTO share_items (share_id, position, movie_hash, overrides) "
+        "VALUES ($1, $2, $3, $4)",
+        [(share_id, pos, h, overrides) for pos, (h, overrides) in enumerate(items)],
+    )
+
+
 async def create_share(
     slug: str,
     owner_user_id: Optional[int],
     name: str,
     snapshot_json: str,
     expires_at: Optional[datetime],
+    items: Optional[list[tuple[str, str]]] = None,
+    metadata: Optional[dict[str, bytes]] = None,
 ) -> dict:
     async with _pool.acquire() as conn:
-        row = await conn.fetchrow(
-            """
-            INSERT INTO shared_lists (slug, owner_user_id, name, snapshot, expires_at)
-            VALUES ($1, $2, $3, $4, $5)
-            RETURNING id, slug, owner_user_id, name, snapshot, created_at,
-                      expires_at, view_count
-            """,
-            slug, owner_user_id, name, snapshot_json, expires_at,
-        )
+        async with conn.transaction():
+            row = await conn.fetchrow(
+                """
+                INSERT INTO shared_lists (slug, owner_user_id, name, snapshot, expires_at)
+                VALUES ($1, $2, $3, $4, $5)
+                RETURNING id, slug, owner_user_id, name, snapshot, created_at,
+                          expires_at, view_count
+                """,
+                slug, owner_user_id, name, snapshot_json, expires_at,
+            )
+            if items:
+                await _write_share_items(conn, row["id"], items, metadata or {})
         return _row_to_share(row)
 
 
 async def get_share_by_slug(slug: str) -> Optional[dict]:
+    """Read a share. Returns None if missing or expired.
+
+    Read-only: views are counted in memory and flushed via ``add_share_views``.
+    """
     async with _pool.acquire() as conn:
         row = await conn.fetchrow(
             "SELECT id, slug, owner_user_id, name, snapshot, created_at, "
             "expires_at, view_count FROM shared_lists WHERE slug = $1",
             slug,
         )
-        if not row:
-            return None
-        share = _row_to_share(row)
+    if not row:
+        return None
+    share = _row_to_share(row)
+    if share["expires_at"] and share["expires_at"] < datetime.utcnow():
+        return None
+    return share
 
-        if share["expires_at"] and share["expires_at"] < datetime.utcnow():
-            return None
 
-        try:
+async def add_share_views(counts: dict[str, int]) -> None:
+    """Add accumulated view counts, one UPDATE per share, in one transaction."""
+    if not counts:
+        return
+    async with _pool.acquire() as conn:
+        async with conn.transaction():
+            await conn.executemany(
+                "UPDATE shared_lists SET view_count = view_count + $1 WHERE slug = $2",
+                [(n, slug) for slug, n in counts.items()],
+            )
+
+
+async def get_share_items(share_id: int) -> list[tuple[bytes, str]]:
+    """Items of a reference-format share in order: (metadata blob, overrides JSON)."""
+    async with _pool.acquire() as conn:
+        rows = await conn.fetch(
+            "SELECT m.data, i.overrides FROM share_items i "
+            "JOIN share_movies m ON m.hash = i.movie_hash "
+            "WHERE i.share_id = $1 ORDER BY i.position",
+            share_id,
+        )
+    return [(bytes(r["data"]), r["overrides"]) for r in rows]
+
+
+async def get_legacy_shares(limit: int) -> list[tuple[int, str]]:
+    """Shares still holding an inline JSON snapshot: (id, snapshot)."""
+    async with _pool.acquire() as conn:
+        rows = await conn.fetch(
+            "SELECT id, snapshot FROM shared_lists WHERE snapshot != '' "
+            "ORDER BY id LIMIT $1",
+            limit,
+        )
+    return [(r["id"], r["snapshot"]) for r in rows]
+
+
+async def replace_share_snapshot(
+    share_id: int, items: list[tuple[str, str]], metadata: dict[str, bytes],
+) -> None:
+    """Swap an inline JSON snapshot for references, atomically."""
+    async with _pool.acquire() as conn:
+        async with conn.transaction():
+            await conn.execute("DELETE FROM share_items WHERE share_id = $1", share_id)
+            await _write_share_items(conn, share_id, items, metadata)
             await conn.execute(
-                "UPDATE shared_lists SET view_count = view_count + 1 WHERE slug = $1",
-                slug,
+                "UPDATE shared_lists SET snapshot = '' WHERE id = $1", share_id,
             )
-        except Exception:
-            pass
 
-        return share
+
+async def delete_expired_shares(now: datetime) -> int:
+    """Drop shares whose ``expires_at`` has passed; items go by ON DELETE CASCADE."""
+    async with _pool.acquire() as conn:
+        result = await conn.execute(
+            "DELETE FROM shared_lists WHERE expires_at < $1", now,
+        )
+    return int(result.split()[-1])
+
+
+async def delete_orphan_share_movies(used_before: datetime) -> int:
+    """Drop shared metadata no item references, untouched since ``used_before``."""
+    async with _pool.acquire() as conn:
+        result = await conn.execute(
+            "DELETE FROM share_movies WHERE last_used_at < $1 AND NOT EXISTS "
+            "(SELECT 1 FROM share_items i WHERE i.movie_hash = share_movies.hash)",
+            used_before,
+        )
+    return int(result.split()[-1])
 
 
 def _row_to_share(row) -> dict:
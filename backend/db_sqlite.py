@@ -1,10 +1,14 @@
 import aiosqlite
 import json
-from datetime import datetime
+import re
+import time
+from datetime import date, datetime
 from typing import Optional
 from backend.config import DATABASE_PATH
+from backend.migrations import SCHEMA_VERSION_DDL, MigrationSet
 from backend.models.movie import Movie, MovieBase
 from backend.models.book import Book, BookBase
+from backend.models.event import FUNNEL_EVENTS
 
 
 SELECT_COLUMNS = (
@@ -21,6 +25,9 @@ BOOK_SELECT_COLUMNS = (
 )
 
 
+MIGRATIONS = MigrationSet()
+
+
 async def _column_exists(db: aiosqlite.Connection, table: str, column: str) -> bool:
     async with db.execute(f"PRAGMA table_info({table})") as cur:
         cols = {row[1] for row in await cur.fetchall()}
@@ -127,155 +134,412 @@ async def _migrate_movies_add_user_id(db: aiosqlite.Connection) -> None:
     )
 
 
-async def init_db():
-    """Инициализация базы данных"""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        # WAL: читатели не блокируют писателей.
-        await db.execute("PRAGMA journal_mode=WAL")
-        await db.execute("PRAGMA foreign_keys=ON")
+@MIGRATIONS.register(1, "baseline")
+async def _m001_baseline(db: aiosqlite.Connection) -> None:
+    """Схема до появления schema_version — прежний идемпотентный init_db.
 
-        await _ensure_users_table(db)
-
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS movies (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                imdb_id TEXT UNIQUE NOT NULL,
-                title TEXT NOT NULL,
-                original_title TEXT,
-                year INTEGER,
-                genres TEXT DEFAULT '[]',
-                description TEXT,
-                plot TEXT,
-                cast TEXT DEFAULT '[]',
-                director TEXT,
-                poster_url TEXT,
-                imdb_rating REAL,
-                awards TEXT,
-                is_watched BOOLEAN DEFAULT FALSE,
-                source TEXT DEFAULT 'personal',
-                added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        await _ensure_column(db, "movies", "rec_source", "TEXT")
-        await _ensure_column(db, "movies", "rec_note", "TEXT")
-        await _ensure_column(db, "movies", "in_library", "BOOLEAN DEFAULT 1")
-        await _ensure_column(db, "movies", "award", "TEXT")
-        await _ensure_column(db, "movies", "award_year", "INTEGER")
-        await _ensure_column(db, "movies", "plot_ru", "TEXT")
-
-        await _migrate_movies_add_user_id(db)
-
-        # Дневник: личная оценка/заметка/дата просмотра. Ставим ПОСЛЕ миграции
-        # user_id — она пересоздаёт таблицу movies и иначе затёрла бы их.
-        await _ensure_column(db, "movies", "user_rating", "REAL")
-        await _ensure_column(db, "movies", "user_note", "TEXT")
-        await _ensure_column(db, "movies", "watched_at", "TIMESTAMP")
-        # movie / series — для разбивки библиотеки на «Фильмы» и «Сериалы».
-        await _ensure_column(db, "movies", "media_type", "TEXT DEFAULT 'movie'")
-        # Ссылка на оригинал рекомендации (Reel / пост в канале) — по ней можно
-        # перейти из приложения к источнику, где фильм советовали.
-        await _ensure_column(db, "movies", "source_url", "TEXT")
-        # Длительность в минутах из OMDB (0 — OMDB не знает, NULL — не проверяли).
-        await _ensure_column(db, "movies", "runtime", "INTEGER")
-
-        await db.execute("CREATE INDEX IF NOT EXISTS idx_imdb_id ON movies(imdb_id)")
-        await db.execute("CREATE INDEX IF NOT EXISTS idx_source ON movies(source)")
-        await db.execute("CREATE INDEX IF NOT EXISTS idx_user_id ON movies(user_id)")
-        await db.execute(
-            "CREATE UNIQUE INDEX IF NOT EXISTS idx_user_imdb ON movies(user_id, imdb_id)"
+    На пустой БД создаёт всё с нуля, на старой боевой — доводит до текущей
+    схемы пробами ``_ensure_column``. Отрабатывает один раз.
+    """
+    await _ensure_users_table(db)
+
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS movies (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            imdb_id TEXT UNIQUE NOT NULL,
+            title TEXT NOT NULL,
+            original_title TEXT,
+            year INTEGER,
+            genres TEXT DEFAULT '[]',
+            description TEXT,
+            plot TEXT,
+            cast TEXT DEFAULT '[]',
+            director TEXT,
+            poster_url TEXT,
+            imdb_rating REAL,
+            awards TEXT,
+            is_watched BOOLEAN DEFAULT FALSE,
+            source TEXT DEFAULT 'personal',
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS shared_lists (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                slug TEXT UNIQUE NOT NULL,
-                owner_user_id INTEGER REFERENCES users(id) ON DELETE SET NULL,
-                name TEXT NOT NULL,
-                snapshot TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                expires_at TIMESTAMP,
-                view_count INTEGER DEFAULT 0
-            )
-        """)
-        await db.execute(
-            "CREATE INDEX IF NOT EXISTS idx_shared_lists_slug ON shared_lists(slug)"
+    """)
+    await _ensure_column(db, "movies", "rec_source", "TEXT")
+    await _ensure_column(db, "movies", "rec_note", "TEXT")
+    await _ensure_column(db, "movies", "in_library", "BOOLEAN DEFAULT 1")
+    await _ensure_column(db, "movies", "award", "TEXT")
+    await _ensure_column(db, "movies", "award_year", "INTEGER")
+    await _ensure_column(db, "movies", "plot_ru", "TEXT")
+
+    await _migrate_movies_add_user_id(db)
+
+    # Дневник: личная оценка/заметка/дата просмотра. Ставим ПОСЛЕ миграции
+    # user_id — она пересоздаёт таблицу movies и иначе затёрла бы их.
+    await _ensure_column(db, "movies", "user_rating", "REAL")
+    await _ensure_column(db, "movies", "user_note", "TEXT")
+    await _ensure_column(db, "movies", "watched_at", "TIMESTAMP")
+    # movie / series — для разбивки библиотеки на «Фильмы» и «Сериалы».
+    await _ensure_column(db, "movies", "media_type", "TEXT DEFAULT 'movie'")
+    # Ссылка на оригинал рекомендации (Reel / пост в канале) — по ней можно
+    # перейти из приложения к источнику, где фильм советовали.
+    await _ensure_column(db, "movies", "source_url", "TEXT")
+    # Длительность в минутах из OMDB (0 — OMDB не знает, NULL — не проверяли).
+    await _ensure_column(db, "movies", "runtime", "INTEGER")
+
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_imdb_id ON movies(imdb_id)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_source ON movies(source)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_user_id ON movies(user_id)")
+    await db.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_user_imdb ON movies(user_id, imdb_id)"
+    )
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS shared_lists (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            slug TEXT UNIQUE NOT NULL,
+            owner_user_id INTEGER REFERENCES users(id) ON DELETE SET NULL,
+            name TEXT NOT NULL,
+            snapshot TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP,
+            view_count INTEGER DEFAULT 0
         )
-        await db.execute(
-            "CREATE INDEX IF NOT EXISTS idx_shared_lists_expires "
-            "ON shared_lists(expires_at)"
+    """)
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_shared_lists_slug ON shared_lists(slug)"
+    )
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_shared_lists_expires "
+        "ON shared_lists(expires_at)"
+    )
+
+    # books — параллельная фильмам таблица (книги из Open Library).
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS books (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+            work_key TEXT NOT NULL,
+            title TEXT NOT NULL,
+            authors TEXT DEFAULT '[]',
+            year INTEGER,
+            subjects TEXT DEFAULT '[]',
+            description TEXT,
+            cover_url TEXT,
+            rating REAL,
+            is_read BOOLEAN DEFAULT FALSE,
+            source TEXT DEFAULT 'personal',
+            rec_source TEXT,
+            rec_note TEXT,
+            in_library BOOLEAN DEFAULT 1,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
+    """)
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_books_user_id ON books(user_id)")
+    await db.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_books_user_work "
+        "ON books(user_id, work_key)"
+    )
+    # Дневник для книг: личная оценка/заметка/дата прочтения.
+    await _ensure_column(db, "books", "user_rating", "REAL")
+    await _ensure_column(db, "books", "user_note", "TEXT")
+    await _ensure_column(db, "books", "read_at", "TIMESTAMP")
 
-        # books — параллельная фильмам таблица (книги из Open Library).
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS books (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-                work_key TEXT NOT NULL,
-                title TEXT NOT NULL,
-                authors TEXT DEFAULT '[]',
-                year INTEGER,
-                subjects TEXT DEFAULT '[]',
-                description TEXT,
-                cover_url TEXT,
-                rating REAL,
-                is_read BOOLEAN DEFAULT FALSE,
-                source TEXT DEFAULT 'personal',
-                rec_source TEXT,
-                rec_note TEXT,
-                in_library BOOLEAN DEFAULT 1,
-                added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        await db.execute("CREATE INDEX IF NOT EXISTS idx_books_user_id ON books(user_id)")
-        await db.execute(
-            "CREATE UNIQUE INDEX IF NOT EXISTS idx_books_user_work "
-            "ON books(user_id, work_key)"
+    # Маркеры разовых миграций/бэкфиллов (key → value): отрабатывают на старте
+    # один раз и не гоняют OMDB/LLM при каждом деплое.
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS app_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
         )
-        # Дневник для книг: личная оценка/заметка/дата прочтения.
-        await _ensure_column(db, "books", "user_rating", "REAL")
-        await _ensure_column(db, "books", "user_note", "TEXT")
-        await _ensure_column(db, "books", "read_at", "TIMESTAMP")
-
-        # Маркеры разовых миграций/бэкфиллов (key → value): отрабатывают на старте
-        # один раз и не гоняют OMDB/LLM при каждом деплое.
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS app_meta (
-                key TEXT PRIMARY KEY,
-                value TEXT
-            )
-        """)
-
-        # Кэш доступности (watch-providers TMDb/JustWatch) — per-тайтл+регион,
-        # НЕ per-user (movies хранятся по пользователю, доступность общая для
-        # тайтла). fetched_at — для TTL: протухшие перезапрашиваем.
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS watch_providers (
-                imdb_id    TEXT NOT NULL,
-                region     TEXT NOT NULL,
-                payload    TEXT NOT NULL,
-                fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                PRIMARY KEY (imdb_id, region)
-            )
-        """)
-
-        # Событийная аналитика (лёгкий self-hosted трекинг для kill-метрик).
-        # user_id nullable: гость пишется по anon_id, бот — по своему user_id.
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS events (
-                id      INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                anon_id TEXT,
-                name    TEXT NOT NULL,
-                props   TEXT DEFAULT '{}',
-                source  TEXT DEFAULT 'web',
-                ts      TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        await db.execute("CREATE INDEX IF NOT EXISTS idx_events_name_ts ON events(name, ts)")
-        await db.execute("CREATE INDEX IF NOT EXISTS idx_events_user ON events(user_id)")
+    """)
 
-        await _backfill_bot_source(db)
+    # Кэш доступности (watch-providers TMDb/JustWatch) — per-тайтл+регион,
+    # НЕ per-user (movies хранятся по пользователю, доступность общая для
+    # тайтла). fetched_at — для TTL: протухшие перезапрашиваем.
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS watch_providers (
+            imdb_id    TEXT NOT NULL,
+            region     TEXT NOT NULL,
+            payload    TEXT NOT NULL,
+            fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (imdb_id, region)
+        )
+    """)
+
+    # Событийная аналитика (лёгкий self-hosted трекинг для kill-метрик).
+    # user_id nullable: гость пишется по anon_id, бот — по своему user_id.
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS events (
+            id      INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            anon_id TEXT,
+            name    TEXT NOT NULL,
+            props   TEXT DEFAULT '{}',
+            source  TEXT DEFAULT 'web',
+            ts      TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_events_name_ts ON events(name, ts)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_events_user ON events(user_id)")
+
+    await _backfill_bot_source(db)
+
+
+@MIGRATIONS.register(2, "movies_listing_index")
+async def _m002_movies_listing_index(db: aiosqlite.Connection) -> None:
+    """Составной индекс под листинг библиотеки (фильтры + keyset по added_at)."""
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_movies_user_lib "
+        "ON movies(user_id, in_library, is_watched, added_at)"
+    )
+
+
+@MIGRATIONS.register(3, "library_revisions")
+async def _m003_library_revisions(db: aiosqlite.Connection) -> None:
+    """Ревизия библиотеки для ETag и дельта-синка ``/api/movies/changes``.
+
+    ``library_revisions`` — счётчик на пользователя, ``movies.revision`` —
+    ревизия последнего изменения строки, ``movie_tombstones`` — удалённые id.
+    """
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS library_revisions (
+            user_id  INTEGER PRIMARY KEY,
+            revision INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    await _ensure_column(db, "movies", "revision", "INTEGER NOT NULL DEFAULT 0")
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_movies_user_revision ON movies(user_id, revision)"
+    )
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS movie_tombstones (
+            user_id  INTEGER NOT NULL,
+            movie_id INTEGER NOT NULL,
+            revision INTEGER NOT NULL
+        )
+    """)
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_movie_tombstones_user_revision "
+        "ON movie_tombstones(user_id, revision)"
+    )
+
+
+# Поля полнотекстового поиска по библиотеке — в порядке колонок movies_fts
+# и весов bm25 (название важнее сюжета).
+SEARCH_COLUMNS = (
+    "title", "original_title", "director", "cast", "description", "plot_ru", "user_note",
+)
+_SEARCH_WEIGHTS = (10.0, 8.0, 3.0, 3.0, 1.0, 1.0, 2.0)
+MAX_SEARCH_TERMS = 8
+
+
+@MIGRATIONS.register(5, "movies_search")
+async def _m005_movies_search(db: aiosqlite.Connection) -> None:
+    """FTS5-индекс ``movies_fts`` над movies для ``/api/movies/search``.
+
+    External content: текст хранится только в movies, индекс синхронизируют
+    триггеры. ``cast`` индексируется как есть (JSON-строка) — unicode61 режет
+    по кавычкам и запятым. ``rebuild`` индексирует уже существующие строки.
+    (Миграция 4 — только PostgreSQL: в SQLite жанры/актёры остаются JSON.)
+    """
+    cols = ", ".join(f'"{c}"' for c in SEARCH_COLUMNS)
+    new = ", ".join(f'new."{c}"' for c in SEARCH_COLUMNS)
+    old = ", ".join(f'old."{c}"' for c in SEARCH_COLUMNS)
+    await db.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS movies_fts USING fts5(
+            {cols}, content='movies', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+    await db.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS movies_fts_ai AFTER INSERT ON movies BEGIN
+            INSERT INTO movies_fts(rowid, {cols}) VALUES (new.id, {new});
+        END
+    """)
+    await db.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS movies_fts_ad AFTER DELETE ON movies BEGIN
+            INSERT INTO movies_fts(movies_fts, rowid, {cols}) VALUES ('delete', old.id, {old});
+        END
+    """)
+    await db.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS movies_fts_au AFTER UPDATE OF {cols} ON movies BEGIN
+            INSERT INTO movies_fts(movies_fts, rowid, {cols}) VALUES ('delete', old.id, {old});
+            INSERT INTO movies_fts(rowid, {cols}) VALUES (new.id, {new});
+        END
+    """)
+    await db.execute("INSERT INTO movies_fts(movies_fts) VALUES ('rebuild')")
 
-        await db.commit()
+
+@MIGRATIONS.register(6, "event_rollups")
+async def _m006_event_rollups(db: aiosqlite.Connection) -> None:
+    """Агрегаты аналитики (``services.analytics_rollup``) поверх сырых events.
+
+    ``event_daily`` — счётчик событий на (день, актор, имя); ``funnel_sessions``
+    — сессии актора со стадией воронки. Актор — ``u:<user_id>`` или
+    ``a:<anon_id>``.
+    """
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS event_daily (
+            day     TEXT NOT NULL,
+            actor   TEXT NOT NULL,
+            user_id INTEGER,
+            name    TEXT NOT NULL,
+            count   INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, actor, name)
+        )
+    """)
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_event_daily_user_day ON event_daily(user_id, day)"
+    )
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS funnel_sessions (
+            actor          TEXT NOT NULL,
+            started_at     TEXT NOT NULL,
+            user_id        INTEGER,
+            day            TEXT NOT NULL,
+            last_at        TEXT NOT NULL,
+            stage          INTEGER NOT NULL DEFAULT 0,
+            only_available INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (actor, started_at)
+        )
+    """)
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_funnel_sessions_day ON funnel_sessions(day, user_id)"
+    )
+
+
+@MIGRATIONS.register(7, "watch_providers_refresh")
+async def _m007_watch_providers_refresh(db: aiosqlite.Connection) -> None:
+    """Индекс по ``fetched_at``: фоновое обновление выбирает записи, которым
+    скоро истекать (``availability.refresh_due``)."""
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_watch_providers_fetched "
+        "ON watch_providers(fetched_at)"
+    )
+
+
+@MIGRATIONS.register(8, "title_refs")
+async def _m008_title_refs(db: aiosqlite.Connection) -> None:
+    """Постоянные связки IMDb id ↔ TMDb (вид, id): ``/find`` и детальные ручки
+    TMDb для уже известного тайтла больше не нужны (``services.tmdb``)."""
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS title_refs (
+            imdb_id    TEXT PRIMARY KEY,
+            kind       TEXT NOT NULL,
+            tmdb_id    TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_title_refs_tmdb ON title_refs(kind, tmdb_id)"
+    )
+
+
+@MIGRATIONS.register(9, "availability_index")
+async def _m009_availability_index(db: aiosqlite.Connection) -> None:
+    """Офлайн-индекс доступности (``services.availability_index``): для каждой
+    пары регион+провайдер и вида тайтла — битсет TMDb id, доступных по подписке.
+    ``complete`` = 0, если обход ``/discover`` упёрся в лимит страниц."""
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS availability_index (
+            region      TEXT NOT NULL,
+            provider_id INTEGER NOT NULL,
+            kind        TEXT NOT NULL,
+            bitmap      BLOB NOT NULL,
+            titles      INTEGER NOT NULL DEFAULT 0,
+            complete    INTEGER NOT NULL DEFAULT 1,
+            built_at    TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (region, provider_id, kind)
+        )
+    """)
+
+
+@MIGRATIONS.register(10, "share_snapshot_refs")
+async def _m010_share_snapshot_refs(db: aiosqlite.Connection) -> None:
+    """Снимки шэров ссылками (``services.share_snapshot``): общие метаданные
+    фильма — одна сжатая запись на хэш содержимого в ``share_movies``, в
+    ``share_items`` — ссылка и личные поля. ``last_used_at`` защищает свежие
+    метаданные от сборки мусора, пока создающий шэр ещё не закоммитился."""
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS share_movies (
+            hash         TEXT PRIMARY KEY,
+            data         BLOB NOT NULL,
+            last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS share_items (
+            share_id   INTEGER NOT NULL REFERENCES shared_lists(id) ON DELETE CASCADE,
+            position   INTEGER NOT NULL,
+            movie_hash TEXT NOT NULL,
+            overrides  TEXT NOT NULL,
+            PRIMARY KEY (share_id, position)
+        )
+    """)
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_share_items_movie ON share_items(movie_hash)"
+    )
+
+
+@MIGRATIONS.register(11, "watch_providers_retry")
+async def _m011_watch_providers_retry(db: aiosqlite.Connection) -> None:
+    """``retry_after``: не раньше какого момента плановое обновление снова берёт
+    запись после неудачного запроса в TMDb (``availability.refresh_due``) —
+    иначе упавшие записи выбирались бы первыми на каждом прогоне."""
+    await db.execute(
+        "ALTER TABLE watch_providers ADD COLUMN retry_after TIMESTAMP"
+    )
+
+
+async def _schema_version(db: aiosqlite.Connection) -> int:
+    """Текущая версия схемы; 0 — schema_version ещё нет (пустая/старая БД)."""
+    try:
+        async with db.execute("SELECT MAX(version) FROM schema_version") as cur:
+            row = await cur.fetchone()
+    except aiosqlite.OperationalError:
+        return 0
+    return row[0] or 0
+
+
+async def init_db():
+    """Инициализация базы данных: докатывает недостающие миграции.
+
+    В обычном случае (схема актуальна) — одно чтение версии.
+    """
+    started = time.monotonic()
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        # WAL: читатели не блокируют писателей.
+        await db.execute("PRAGMA journal_mode=WAL")
+        await db.execute("PRAGMA foreign_keys=ON")
+
+        version = await _schema_version(db)
+        pending = MIGRATIONS.pending(version)
+        if pending:
+            await db.execute(SCHEMA_VERSION_DDL)
+        for migration in pending:
+            # Миграция и запись её версии — одной транзакцией (DDL в SQLite
+            # транзакционный, BEGIN явный — иначе sqlite3 коммитит DDL сразу):
+            # упавшая миграция откатывается и повторится на следующем старте.
+            # IMMEDIATE сразу берёт блокировку записи: веб и бот могут
+            # стартовать одновременно, и версию перечитываем уже под ней.
+            await db.execute("BEGIN IMMEDIATE")
+            try:
+                if await _schema_version(db) >= migration.version:
+                    await db.rollback()  # уже накатил другой процесс
+                    continue
+                await migration.apply(db)
+                await db.execute(
+                    "INSERT INTO schema_version (version, name) VALUES (?, ?)",
+                    (migration.version, migration.name),
+                )
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+            print(f"[db] migration {migration.version} ({migration.name}) applied", flush=True)
+    print(
+        f"[db] schema v{MIGRATIONS.latest}, init_db "
+        f"{(time.monotonic() - started) * 1000:.1f}ms",
+        flush=True,
+    )
 
 
 async def _backfill_bot_source(db: aiosqlite.Connection) -> None:
@@ -395,10 +659,11 @@ async def merge_telegram_user_into(source_user_id: int, target_user_id: int) ->
                 "(SELECT imdb_id FROM movies WHERE user_id = ?)",
                 (source_user_id, target_user_id),
             )
-            # Перевешиваем оставшиеся на target.
+            # Перевешиваем оставшиеся на target — для его клиентов это новые строки.
+            revision = await _bump_revision(db, target_user_id)
             await db.execute(
-                "UPDATE movies SET user_id = ? WHERE user_id = ?",
-                (target_user_id, source_user_id),
+                "UPDATE movies SET user_id = ?, revision = ? WHERE user_id = ?",
+                (target_user_id, revision, source_user_id),
             )
             # Переезд telegram_id: сначала снимаем UNIQUE с source, потом ставим на target.
             if source_tg_id is not None:
@@ -539,23 +804,202 @@ async def upsert_watch_providers_cache(
             "INSERT INTO watch_providers (imdb_id, region, payload, fetched_at) "
             "VALUES (?, ?, ?, ?) "
             "ON CONFLICT(imdb_id, region) DO UPDATE SET "
-            "payload = excluded.payload, fetched_at = excluded.fetched_at",
+            "payload = excluded.payload, fetched_at = excluded.fetched_at, retry_after = NULL",
             (imdb_id, region, json.dumps(payload), datetime.utcnow().isoformat()),
         )
         await db.commit()
 
 
+async def get_watch_providers_cache_many(
+    imdb_ids: list[str], region: str
+) -> dict[str, tuple[dict, datetime]]:
+    """Кэш доступности пачки тайтлов одним запросом: ``{imdb_id: (payload, fetched_at)}``.
+
+    Тайтлов без кэша в ответе нет. TTL решает вызывающий.
+    """
+    result: dict[str, tuple[dict, datetime]] = {}
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        # Лимит параметров SQLite — режем на куски (батч API и так ≤ 100).
+        for i in range(0, len(imdb_ids), 500):
+            chunk = imdb_ids[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            async with db.execute(
+                "SELECT imdb_id, payload, fetched_at FROM watch_providers "
+                f"WHERE region = ? AND imdb_id IN ({marks})",
+                (region, *chunk),
+            ) as cur:
+                for imdb_id, payload, fetched_at in await cur.fetchall():
+                    if payload:
+                        result[imdb_id] = (
+                            json.loads(payload),
+                            datetime.fromisoformat(fetched_at) if fetched_at else datetime.utcnow(),
+                        )
+    return result
+
+
+async def upsert_watch_providers_cache_many(region: str, payloads: dict[str, dict]) -> None:
+    """Записать пачку свежей доступности одной транзакцией."""
+    if not payloads:
+        return
+    now = datetime.utcnow().isoformat()
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        await db.executemany(
+            "INSERT INTO watch_providers (imdb_id, region, payload, fetched_at) "
+            "VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(imdb_id, region) DO UPDATE SET "
+            "payload = excluded.payload, fetched_at = excluded.fetched_at, retry_after = NULL",
+            [(imdb_id, region, json.dumps(p), now) for imdb_id, p in payloads.items()],
+        )
+        await db.commit()
+
+
+async def get_watch_providers_due(
+    fetched_before: datetime, limit: int, now: datetime,
+) -> list[tuple[str, str]]:
+    """Записи кэша доступности, скачанные раньше ``fetched_before``, для
+    тайтлов из чьих-то библиотек: ``[(imdb_id, region)]``. Записи, чей
+    ``retry_after`` ещё не наступил к ``now``, пропускаются.
+
+    Сначала — тайтлы, которые есть у большего числа пользователей, при равенстве
+    — самые старые записи.
+    """
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        async with db.execute(
+            "SELECT w.imdb_id, w.region FROM watch_providers w "
+            "JOIN (SELECT imdb_id, COUNT(*) AS owners FROM movies "
+            "      WHERE imdb_id IS NOT NULL GROUP BY imdb_id) m "
+            "  ON m.imdb_id = w.imdb_id "
+            "WHERE w.fetched_at < ? AND (w.retry_after IS NULL OR w.retry_after <= ?) "
+            "ORDER BY m.owners DESC, w.fetched_at ASC LIMIT ?",
+            (fetched_before.isoformat(), now.isoformat(), limit),
+        ) as cur:
+            return [(r[0], r[1]) for r in await cur.fetchall()]
+
+async def defer_watch_providers_refresh(keys: list[tuple[str, str]], until: datetime) -> None:
+    """Отложить плановое обновление записей ``[(imdb_id, region)]`` до ``until``."""
+    if not keys:
+        return
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        await db.executemany(
+            "UPDATE watch_providers SET retry_after = ? WHERE imdb_id = ? AND region = ?",
+            [(until.isoformat(), imdb_id, region) for imdb_id, region in keys],
+        )
+        await db.commit()
+
+
+
+async def get_provider_targets() -> dict[str, set[int]]:
+    """Какие провайдеры в каких регионах выбрали пользователи: ``{region: {id}}``.
+
+    NULL region — 'RU', как в ``get_user_settings``."""
+    targets: dict[str, set[int]] = {}
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        async with db.execute(
+            "SELECT COALESCE(region, 'RU'), streaming_services FROM users "
+            "WHERE streaming_services IS NOT NULL AND streaming_services != '[]'"
+        ) as cur:
+            for region, services in await cur.fetchall():
+                targets.setdefault(region.upper(), set()).update(json.loads(services))
+    return targets
+
+
+async def save_availability_index(
+    region: str, provider_id: int, kind: str, bitmap: bytes, titles: int, complete: bool,
+) -> None:
+    """Заменить битсет пары регион+провайдер для вида ``kind``."""
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        await db.execute(
+            "INSERT INTO availability_index "
+            "(region, provider_id, kind, bitmap, titles, complete, built_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(region, provider_id, kind) DO UPDATE SET "
+            "bitmap = excluded.bitmap, titles = excluded.titles, "
+            "complete = excluded.complete, built_at = excluded.built_at",
+            (region, provider_id, kind, bitmap, titles, int(complete),
+             datetime.utcnow().isoformat()),
+        )
+        await db.commit()
+
+
+async def get_availability_index() -> list[dict]:
+    """Весь офлайн-индекс доступности (битсеты сжаты, как хранятся)."""
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        async with db.execute(
+            "SELECT region, provider_id, kind, bitmap, titles, complete, built_at "
+            "FROM availability_index"
+        ) as cur:
+            rows = await cur.fetchall()
+    return [
+        {
+            "region": r[0], "provider_id": r[1], "kind": r[2], "bitmap": bytes(r[3]),
+            "titles": r[4], "complete": bool(r[5]),
+            "built_at": datetime.fromisoformat(r[6]) if r[6] else None,
+        }
+        for r in rows
+    ]
+
+
+# ----- title refs (IMDb ↔ TMDb) --------------------------------------------
+
+
+async def get_title_refs(imdb_ids: list[str]) -> dict[str, tuple[str, str]]:
+    """Известные связки ``{imdb_id: (kind, tmdb_id)}``; неизвестных в ответе нет."""
+    result: dict[str, tuple[str, str]] = {}
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        for i in range(0, len(imdb_ids), 500):
+            chunk = imdb_ids[i:i + 500]
+            async with db.execute(
+                "SELECT imdb_id, kind, tmdb_id FROM title_refs "
+                f"WHERE imdb_id IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ) as cur:
+                for imdb_id, kind, tmdb_id in await cur.fetchall():
+                    result[imdb_id] = (kind, tmdb_id)
+    return result
+
+
+async def get_imdb_ids_by_tmdb(kind: str, tmdb_ids: list[str]) -> dict[str, str]:
+    """Обратная сторона связок: ``{tmdb_id: imdb_id}`` для тайтлов вида ``kind``."""
+    result: dict[str, str] = {}
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        for i in range(0, len(tmdb_ids), 500):
+            chunk = tmdb_ids[i:i + 500]
+            async with db.execute(
+                "SELECT tmdb_id, imdb_id FROM title_refs "
+                f"WHERE kind = ? AND tmdb_id IN ({','.join('?' * len(chunk))})",
+                (kind, *chunk),
+            ) as cur:
+                for tmdb_id, imdb_id in await cur.fetchall():
+                    result[tmdb_id] = imdb_id
+    return result
+
+
+async def save_title_refs(refs: list[tuple[str, str, str]]) -> None:
+    """Запомнить связки ``(imdb_id, kind, tmdb_id)``. Связка постоянна: уже
+    известный imdb_id не перезаписывается."""
+    if not refs:
+        return
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        await db.executemany(
+            "INSERT INTO title_refs (imdb_id, kind, tmdb_id) VALUES (?, ?, ?) "
+            "ON CONFLICT(imdb_id) DO NOTHING",
+            refs,
+        )
+        await db.commit()
+
+
 # ----- analytics events ----------------------------------------------------
 
 
 async def insert_events(rows: list[dict]) -> None:
-    """Батч-вставка событий. ts ставит сервер (UTC), не доверяя часам клиента.
+    """Батч-вставка событий. ts ставит сервер (UTC), не доверяя часам клиента:
+    ``ts`` из строки (момент приёма в буфер ``event_buffer``) или текущее время.
 
     Best-effort: вызывающий оборачивает в try/except — аналитика не должна
     ронять основной поток."""
     if not rows:
         return
-    now = datetime.utcnow().isoformat()
+    now = datetime.utcnow()
     async with aiosqlite.connect(DATABASE_PATH) as db:
         await db.executemany(
             "INSERT INTO events (user_id, anon_id, name, props, source, ts) "
@@ -567,7 +1011,7 @@ async def insert_events(rows: list[dict]) -> None:
                     r["name"],
                     json.dumps(r.get("props") or {}),
                     r.get("source") or "web",
-                    now,
+                    (r.get("ts") or now).isoformat(),
                 )
                 for r in rows
             ],
@@ -575,53 +1019,233 @@ async def insert_events(rows: list[dict]) -> None:
         await db.commit()
 
 
-async def get_all_movie_imdb_ids() -> list[str]:
-    """Уникальные imdb_id по всем строкам movies (для разовых бэкфиллов)."""
+# ----- analytics rollups ---------------------------------------------------
+
+# id последнего свёрнутого в агрегаты события (app_meta).
+EVENTS_ROLLUP_HWM_KEY = "events_rollup_hwm"
+
+
+async def get_events_for_rollup(
+    after_id: int, limit: int, settled_before: datetime,
+) -> list[dict]:
+    """Сырые события с ``id > after_id`` в порядке id — до первого новее ``settled_before``.
+
+    Отсечка — точка, а не фильтр: ``ts`` ставится при приёме, а буферы разных
+    процессов сбрасываются в разное время, так что событие с меньшим id может
+    быть новее уже подходящего большего. Пропусти мы его, high-water mark
+    ушёл бы выше, и оно не попало бы в агрегаты никогда.
+    """
     async with aiosqlite.connect(DATABASE_PATH) as db:
-        async with db.execute("SELECT DISTINCT imdb_id FROM movies") as cur:
+        async with db.execute(
+            "SELECT id, ts, user_id, anon_id, name, props FROM events "
+            "WHERE id > ? ORDER BY id LIMIT ?",
+            (after_id, limit),
+        ) as cur:
             rows = await cur.fetchall()
-    return [r[0] for r in rows if r[0]]
+    events = []
+    for r in rows:
+        ts = datetime.fromisoformat(r[1])
+        if ts > settled_before:
+            break
+        events.append({
+            "id": r[0], "ts": ts, "user_id": r[2],
+            "anon_id": r[3], "name": r[4], "props": json.loads(r[5]) if r[5] else {},
+        })
+    return events
+
+
+async def get_last_funnel_sessions(actors: list[str]) -> dict[str, dict]:
+    """Последняя сессия каждого актора — её может продолжить новое событие."""
+    result: dict[str, dict] = {}
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        for i in range(0, len(actors), 500):
+            chunk = actors[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            async with db.execute(
+                "SELECT actor, started_at, user_id, last_at, stage, only_available "
+                f"FROM funnel_sessions f WHERE actor IN ({marks}) AND started_at = "
+                "(SELECT MAX(started_at) FROM funnel_sessions WHERE actor = f.actor)",
+                chunk,
+            ) as cur:
+                for r in await cur.fetchall():
+                    result[r[0]] = {
+                        "actor": r[0], "started_at": datetime.fromisoformat(r[1]),
+                        "user_id": r[2], "last_at": datetime.fromisoformat(r[3]),
+                        "stage": r[4], "only_available": bool(r[5]),
+                    }
+    return result
+
+
+async def apply_event_rollup(
+    daily: list[tuple], sessions: list[dict], after_id: int, high_water_mark: int,
+) -> bool:
+    """Одной транзакцией: прибавить дневные счётчики, записать сессии и
+    сдвинуть high-water mark с ``after_id`` на ``high_water_mark`` — порция
+    событий учитывается ровно один раз. Если mark уже сдвинул другой процесс,
+    ничего не пишем и возвращаем False.
+
+    ``daily`` — кортежи ``(day: date, actor, user_id, name, count)``.
+    """
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        await db.execute("BEGIN IMMEDIATE")
+        async with db.execute(
+            "SELECT value FROM app_meta WHERE key = ?", (EVENTS_ROLLUP_HWM_KEY,)
+        ) as cur:
+            row = await cur.fetchone()
+        if int(row[0] if row else 0) != after_id:
+            await db.rollback()
+            return False
+        await db.executemany(
+            "INSERT INTO event_daily (day, actor, user_id, name, count) "
+            "VALUES (?, ?, ?, ?, ?) ON CONFLICT (day, actor, name) "
+            "DO UPDATE SET count = count + excluded.count",
+            [(d.isoformat(), actor, uid, name, n) for d, actor, uid, name, n in daily],
+        )
+        await db.executemany(
+            "INSERT INTO funnel_sessions "
+            "(actor, started_at, user_id, day, last_at, stage, only_available) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (actor, started_at) DO UPDATE SET "
+            "last_at = excluded.last_at, stage = excluded.stage, "
+            "only_available = excluded.only_available",
+            [
+                (
+                    s["actor"], s["started_at"].isoformat(), s["user_id"],
+                    s["started_at"].date().isoformat(), s["last_at"].isoformat(),
+                    s["stage"], int(s["only_available"]),
+                )
+                for s in sessions
+            ],
+        )
+        await db.execute(
+            "INSERT INTO app_meta (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (EVENTS_ROLLUP_HWM_KEY, str(high_water_mark)),
+        )
+        await db.commit()
+    return True
 
 
-async def set_media_type_by_imdb(imdb_id: str, media_type: str) -> int:
-    """Проставляет media_type всем строкам с этим imdb_id. Возвращает число
-    изменённых строк."""
+async def prune_events(before: datetime, max_id: int) -> int:
+    """Удалить сырые события старше ``before`` — только уже свёрнутые (id ≤ max_id)."""
     async with aiosqlite.connect(DATABASE_PATH) as db:
         cur = await db.execute(
-            "UPDATE movies SET media_type = ? "
-            "WHERE imdb_id = ? AND (media_type IS NULL OR media_type != ?)",
-            (media_type, imdb_id, media_type),
+            "DELETE FROM events WHERE id <= ? AND julianday(ts) < julianday(?)",
+            (max_id, before.isoformat()),
         )
         await db.commit()
         return cur.rowcount
 
 
-async def get_imdb_ids_missing_runtime(limit: int = 300) -> list[str]:
-    """imdb_id записей без длительности (NULL = ещё не спрашивали у OMDB).
+async def get_funnel(since: date, user_id: Optional[int] = None) -> list[dict]:
+    """Воронка по дням из агрегатов: запросы → показы → запуски, открывшие
+    приложение, сессии и «решающие» сессии (дошли до запуска)."""
+    user_filter = " AND user_id = ?" if user_id is not None else ""
+    params: list = [since.isoformat()] + ([user_id] if user_id is not None else [])
+    requested, viewed, launched = FUNNEL_EVENTS
+    days: dict[str, dict] = {}
 
-    0 означает «спрашивали, OMDB не знает» — такие не возвращаем, чтобы
-    бэкфилл не дёргал OMDB по ним на каждом старте.
+    def _day(d: str) -> dict:
+        return days.setdefault(d, {
+            "day": d, "active": 0, "requested": 0, "viewed": 0, "launched": 0,
+            "sessions": 0, "decisive": 0, "decisive_only_available": 0,
+        })
+
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        async with db.execute(
+            "SELECT day, "
+            "COUNT(DISTINCT CASE WHEN name IN ('app_open', 'session_start') THEN actor END), "
+            "SUM(CASE WHEN name = ? THEN count ELSE 0 END), "
+            "SUM(CASE WHEN name = ? THEN count ELSE 0 END), "
+            "SUM(CASE WHEN name = ? THEN count ELSE 0 END) "
+            f"FROM event_daily WHERE day >= ?{user_filter} GROUP BY day",
+            [requested, viewed, launched, *params],
+        ) as cur:
+            for d, active, req, view, launch in await cur.fetchall():
+                _day(d).update(active=active, requested=req, viewed=view, launched=launch)
+        async with db.execute(
+            "SELECT day, COUNT(*), SUM(stage >= ?), SUM(stage >= ? AND only_available) "
+            f"FROM funnel_sessions WHERE day >= ?{user_filter} GROUP BY day",
+            [len(FUNNEL_EVENTS), len(FUNNEL_EVENTS), *params],
+        ) as cur:
+            for d, total, decisive, only_available in await cur.fetchall():
+                _day(d).update(
+                    sessions=total, decisive=decisive, decisive_only_available=only_available,
+                )
+    return [days[d] for d in sorted(days)]
+
+
+async def get_backfill_imdb_ids(
+    after: str = "", limit: int = 100, missing_only: bool = False,
+) -> list[str]:
+    """Следующая порция уникальных imdb_id для OMDB-бэкфилла (keyset по imdb_id).
+
+    ``after`` — курсор: последний обработанный imdb_id. ``missing_only`` —
+    только тайтлы без длительности (NULL = ещё не спрашивали у OMDB; 0 —
+    «спрашивали, OMDB не знает», такие не возвращаем).
     """
+    where = "imdb_id LIKE 'tt%' AND imdb_id > ?"
+    if missing_only:
+        where += " AND runtime IS NULL"
     async with aiosqlite.connect(DATABASE_PATH) as db:
         async with db.execute(
-            "SELECT DISTINCT imdb_id FROM movies "
-            "WHERE runtime IS NULL AND imdb_id LIKE 'tt%' LIMIT ?",
-            (limit,),
+            f"SELECT DISTINCT imdb_id FROM movies WHERE {where} "
+            "ORDER BY imdb_id LIMIT ?",
+            (after, limit),
         ) as cur:
             rows = await cur.fetchall()
     return [r[0] for r in rows if r[0]]
 
 
-async def set_runtime_by_imdb(imdb_id: str, runtime: int) -> int:
-    """Проставляет runtime всем строкам с этим imdb_id (длительность общая для
-    тайтла — покрываем сразу всех пользователей)."""
+async def apply_omdb_patches(patches: list[dict]) -> int:
+    """Пачкой дописывает данные OMDB во все строки с этими imdb_id.
+
+    Один ``UPDATE ... FROM (VALUES ...)`` на порцию вместо UPDATE на тайтл.
+    Заполняются только пустые поля (ручные правки и данные, пришедшие при
+    добавлении, не перетираем); media_type в патче бывает только 'series' —
+    бэкфилл лишь переводит старые записи из дефолтного 'movie' в сериалы.
+    Возвращает число изменённых строк.
+    """
+    if not patches:
+        return 0
+    values = ", ".join("(?, ?, ?, ?, ?)" for _ in patches)
+    params: list = []
+    for p in patches:
+        params += [p["imdb_id"], p.get("media_type"), p.get("runtime"),
+                   p.get("awards"), p.get("imdb_rating")]
     async with aiosqlite.connect(DATABASE_PATH) as db:
-        cur = await db.execute(
-            "UPDATE movies SET runtime = ? WHERE imdb_id = ? AND runtime IS NULL",
-            (runtime, imdb_id),
-        )
+        # BEGIN явный: запрос начинается с WITH, и sqlite3 сам транзакцию не откроет.
+        await db.execute("BEGIN")
+        async with db.execute(
+            f"WITH v(imdb_id, media_type, runtime, awards, imdb_rating) AS "
+            f"(VALUES {values}) "
+            "UPDATE movies SET "
+            "media_type = COALESCE(v.media_type, movies.media_type), "
+            "runtime = COALESCE(movies.runtime, v.runtime), "
+            "awards = COALESCE(movies.awards, v.awards), "
+            "imdb_rating = COALESCE(movies.imdb_rating, v.imdb_rating) "
+            "FROM v WHERE movies.imdb_id = v.imdb_id AND ("
+            "(v.media_type IS NOT NULL AND movies.media_type IS NOT v.media_type) "
+            "OR (movies.runtime IS NULL AND v.runtime IS NOT NULL) "
+            "OR (movies.awards IS NULL AND v.awards IS NOT NULL) "
+            "OR (movies.imdb_rating IS NULL AND v.imdb_rating IS NOT NULL)) "
+            "RETURNING id, user_id",
+            params,
+        ) as cur:
+            changed_rows = await cur.fetchall()
+        # По ревизии каждому затронутому владельцу — его клиенты заберут
+        # дозаполненные строки через /api/movies/changes.
+        by_owner: dict[int, list[int]] = {}
+        for movie_id, owner in changed_rows:
+            if owner is not None:
+                by_owner.setdefault(owner, []).append(movie_id)
+        for owner, movie_ids in by_owner.items():
+            revision = await _bump_revision(db, owner)
+            await db.execute(
+                f"UPDATE movies SET revision = ? WHERE id IN ({', '.join('?' * len(movie_ids))})",
+                (revision, *movie_ids),
+            )
         await db.commit()
-        return cur.rowcount
+    return len(changed_rows)
 
 
 def _row_to_movie(row: aiosqlite.Row) -> Movie:
@@ -658,27 +1282,51 @@ def _row_to_movie(row: aiosqlite.Row) -> Movie:
     )
 
 
+def _movie_filters(
+    params: list,
+    source: Optional[str] = None,
+    is_watched: Optional[bool] = None,
+    in_library: Optional[bool] = None,
+    genre: Optional[str] = None,
+    actor: Optional[str] = None,
+) -> list[str]:
+    """Условия WHERE для листинга; значения дописываются в ``params``.
+
+    Жанр и актёр — точное совпадение элемента JSON-массива (``json_each``).
+    """
+    conditions = []
+    if source:
+        conditions.append("source = ?")
+        params.append(source)
+    if is_watched is not None:
+        conditions.append("is_watched = ?")
+        params.append(is_watched)
+    if in_library is not None:
+        conditions.append("in_library = ?")
+        params.append(1 if in_library else 0)
+    if genre:
+        conditions.append("EXISTS (SELECT 1 FROM json_each(movies.genres) WHERE value = ?)")
+        params.append(genre)
+    if actor:
+        conditions.append('EXISTS (SELECT 1 FROM json_each(movies."cast") WHERE value = ?)')
+        params.append(actor)
+    return conditions
+
+
 async def get_all_movies(
     user_id: int,
     source: Optional[str] = None,
     is_watched: Optional[bool] = None,
     in_library: Optional[bool] = None,
+    genre: Optional[str] = None,
+    actor: Optional[str] = None,
 ) -> list[Movie]:
     """Фильмы пользователя с опциональной фильтрацией."""
     async with aiosqlite.connect(DATABASE_PATH) as db:
         query = f"SELECT {SELECT_COLUMNS} FROM movies WHERE user_id = ?"
         params: list = [user_id]
-
-        if source:
-            query += " AND source = ?"
-            params.append(source)
-        if is_watched is not None:
-            query += " AND is_watched = ?"
-            params.append(is_watched)
-        if in_library is not None:
-            query += " AND in_library = ?"
-            params.append(1 if in_library else 0)
-
+        for condition in _movie_filters(params, source, is_watched, in_library, genre, actor):
+            query += f" AND {condition}"
         query += " ORDER BY added_at DESC"
 
         async with db.execute(query, params) as cursor:
@@ -686,6 +1334,111 @@ async def get_all_movies(
             return [_row_to_movie(row) for row in rows]
 
 
+# Поля Movie в порядке SELECT_COLUMNS — для проекции ``fields=`` в листинге.
+MOVIE_FIELDS = tuple(c.strip().strip('"') for c in SELECT_COLUMNS.split(","))
+
+
+def _project_value(field: str, value):
+    """Значение колонки в том виде, в каком его отдаёт ``_row_to_movie``."""
+    if field in ("genres", "cast"):
+        return json.loads(value) if value else []
+    if field == "is_watched":
+        return bool(value)
+    if field == "in_library":
+        return bool(value) if value is not None else True
+    if field in ("added_at", "watched_at"):
+        return datetime.fromisoformat(value) if value else None
+    if field == "media_type":
+        return value or "movie"
+    return value
+
+
+async def get_movies_page(
+    user_id: int,
+    fields: tuple[str, ...] = MOVIE_FIELDS,
+    source: Optional[str] = None,
+    is_watched: Optional[bool] = None,
+    in_library: Optional[bool] = None,
+    genre: Optional[str] = None,
+    actor: Optional[str] = None,
+    limit: Optional[int] = 100,
+    after: Optional[tuple[str, int]] = None,
+) -> tuple[list[dict], Optional[tuple[str, int]]]:
+    """Страница фильмов пользователя (keyset по ``(added_at, id)``, новые сверху).
+
+    Строки сразу JSON-готовые dict'ы, без pydantic (см. ``backend.responses``);
+    ``limit=None`` — вся библиотека одной «страницей».
+
+    Возвращает только запрошенные поля (``fields`` ⊆ ``MOVIE_FIELDS``) — сетка
+    карточек не тянет plot/plot_ru. ``after`` — ключ последней строки прошлой
+    страницы; в ответе — ключ для следующей или None, если страница последняя.
+    Индекс ``idx_movies_user_lib`` покрывает фильтры и порядок.
+    """
+    columns = ", ".join(f'"{f}"' if f == "cast" else f for f in fields)
+    query = f"SELECT added_at, id, {columns} FROM movies WHERE user_id = ?"
+    params: list = [user_id]
+    for condition in _movie_filters(params, source, is_watched, in_library, genre, actor):
+        query += f" AND {condition}"
+    if after is not None:
+        query += " AND (added_at, id) < (?, ?)"
+        params += list(after)
+    query += " ORDER BY added_at DESC, id DESC"
+    if limit is not None:
+        # +1 строка — узнать, есть ли следующая страница, без COUNT(*).
+        query += " LIMIT ?"
+        params.append(limit + 1)
+
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        async with db.execute(query, params) as cur:
+            rows = await cur.fetchall()
+    next_key = None
+    if limit is not None and len(rows) > limit:
+        next_key = (rows[limit - 1][0], rows[limit - 1][1])
+        rows = rows[:limit]
+    return [
+        {f: _project_value(f, v) for f, v in zip(fields, row[2:])}
+        for row in rows
+    ], next_key
+
+
+def _search_terms(query: str) -> list[str]:
+    """Слова запроса без синтаксиса FTS (кавычки, операторы, скобки)."""
+    return re.findall(r"\w+", query.lower())[:MAX_SEARCH_TERMS]
+
+
+async def search_movies(
+    user_id: int,
+    query: str,
+    fields: tuple[str, ...] = MOVIE_FIELDS,
+    limit: int = 20,
+    offset: int = 0,
+) -> tuple[list[dict], bool]:
+    """Полнотекстовый поиск по библиотеке пользователя, релевантные сверху.
+
+    Каждое слово запроса — префикс («матр» находит «Матрица»), все слова
+    обязательны. Ранжирование — bm25 с весами ``_SEARCH_WEIGHTS``. Второе
+    значение — есть ли ещё результаты после этой страницы.
+    """
+    terms = _search_terms(query)
+    if not terms:
+        return [], False
+    match = " AND ".join(f'"{t}"*' for t in terms)
+    weights = ", ".join(str(w) for w in _SEARCH_WEIGHTS)
+    columns = ", ".join(f'm."{f}"' for f in fields)
+    sql = (
+        f"SELECT {columns} FROM movies_fts JOIN movies m ON m.id = movies_fts.rowid "
+        "WHERE movies_fts MATCH ? AND m.user_id = ? "
+        f"ORDER BY bm25(movies_fts, {weights}), m.id DESC LIMIT ? OFFSET ?"
+    )
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        async with db.execute(sql, (match, user_id, limit + 1, offset)) as cur:
+            rows = await cur.fetchall()
+    return [
+        {f: _project_value(f, v) for f, v in zip(fields, row)}
+        for row in rows[:limit]
+    ], len(rows) > limit
+
+
 async def get_awards(limit: Optional[int] = None) -> list[Movie]:
     """Каталог лауреатов (глобальный, user_id IS NULL)."""
     async with aiosqlite.connect(DATABASE_PATH) as db:
@@ -746,6 +1499,68 @@ async def get_award_by_imdb_id(imdb_id: str) -> Optional[Movie]:
             return _row_to_movie(row) if row else None
 
 
+async def get_award_imdb_ids() -> set[str]:
+    """Все imdb_id каталога наград одним запросом (проверка «уже есть» для синка)."""
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        async with db.execute(
+            "SELECT imdb_id FROM movies WHERE user_id IS NULL AND source = 'awards'"
+        ) as cur:
+            rows = await cur.fetchall()
+    return {r[0] for r in rows if r[0]}
+
+
+# ----- library revisions -----------------------------------------------------
+
+
+async def _bump_revision(db: aiosqlite.Connection, user_id: int) -> int:
+    """+1 к ревизии библиотеки пользователя (в транзакции вызывающего)."""
+    async with db.execute(
+        "INSERT INTO library_revisions (user_id, revision) VALUES (?, 1) "
+        "ON CONFLICT(user_id) DO UPDATE SET revision = revision + 1 "
+        "RETURNING revision",
+        (user_id,),
+    ) as cur:
+        return (await cur.fetchone())[0]
+
+
+async def _touch_movie(db: aiosqlite.Connection, movie_id: int) -> None:
+    """Отметить изменение строки, которую правят по PK без user_id (фоновые
+    описания/переводы): личной записи — новая ревизия владельца."""
+    async with db.execute("SELECT user_id FROM movies WHERE id = ?", (movie_id,)) as cur:
+        row = await cur.fetchone()
+    if row and row[0] is not None:
+        revision = await _bump_revision(db, row[0])
+        await db.execute("UPDATE movies SET revision = ? WHERE id = ?", (revision, movie_id))
+
+
+async def get_library_revision(user_id: int) -> int:
+    """Текущая ревизия библиотеки; 0 — библиотеку ещё не меняли."""
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        async with db.execute(
+            "SELECT revision FROM library_revisions WHERE user_id = ?", (user_id,),
+        ) as cur:
+            row = await cur.fetchone()
+    return row[0] if row else 0
+
+
+async def get_movie_changes(user_id: int, since: int) -> tuple[list[Movie], list[int]]:
+    """Строки, изменённые после ревизии ``since``, и id удалённых после неё."""
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        async with db.execute(
+            f"SELECT {SELECT_COLUMNS} FROM movies WHERE user_id = ? AND revision > ? "
+            "ORDER BY revision",
+            (user_id, since),
+        ) as cur:
+            movies = [_row_to_movie(row) for row in await cur.fetchall()]
+        async with db.execute(
+            "SELECT movie_id FROM movie_tombstones WHERE user_id = ? AND revision > ? "
+            "ORDER BY revision",
+            (user_id, since),
+        ) as cur:
+            deleted = [row[0] for row in await cur.fetchall()]
+    return movies, deleted
+
+
 async def add_movie(
     movie: MovieBase,
     user_id: Optional[int],
@@ -757,15 +1572,19 @@ async def add_movie(
     award_year: Optional[int] = None,
     source_url: Optional[str] = None,
 ) -> Movie:
-    """Добавить фильм. `user_id=None` — глобальная запись (каталог наград)."""
+    """Добавить фильм. `user_id=None` — глобальная запись (каталог наград).
+
+    Личная запись поднимает ревизию библиотеки владельца.
+    """
     async with aiosqlite.connect(DATABASE_PATH) as db:
+        revision = await _bump_revision(db, user_id) if user_id is not None else 0
         cursor = await db.execute("""
             INSERT INTO movies (
                 user_id, imdb_id, title, original_title, year, genres, description,
                 plot, cast, director, poster_url, imdb_rating, awards, source,
                 rec_source, rec_note, in_library, award, award_year, media_type,
-                source_url, runtime
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                source_url, runtime, revision
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """, (
             user_id,
             movie.imdb_id,
@@ -789,6 +1608,7 @@ async def add_movie(
             movie.media_type,
             source_url,
             movie.runtime,
+            revision,
         ))
         await db.commit()
         movie_id = cursor.lastrowid
@@ -839,11 +1659,16 @@ async def update_movie(
 
     params.extend([movie_id, user_id])
     async with aiosqlite.connect(DATABASE_PATH) as db:
-        await db.execute(
-            f"UPDATE movies SET {', '.join(sets)} WHERE id = ? AND user_id = ?",
-            params,
+        revision = await _bump_revision(db, user_id)
+        cursor = await db.execute(
+            f"UPDATE movies SET {', '.join(sets)}, revision = ? "
+            "WHERE id = ? AND user_id = ?",
+            [*params[:-2], revision, *params[-2:]],
         )
-        await db.commit()
+        if cursor.rowcount:
+            await db.commit()
+        else:
+            await db.rollback()  # чужой/несуществующий фильм — ревизию не тратим
         return await get_user_movie_by_id(movie_id, user_id)
 
 
@@ -851,6 +1676,7 @@ async def set_plot_ru(movie_id: int, plot_ru: str) -> None:
     """Сохранить перевод сюжета. Используется фоновым переводчиком по PK."""
     async with aiosqlite.connect(DATABASE_PATH) as conn:
         await conn.execute("UPDATE movies SET plot_ru = ? WHERE id = ?", (plot_ru, movie_id))
+        await _touch_movie(conn, movie_id)
         await conn.commit()
 
 
@@ -860,6 +1686,7 @@ async def set_description(movie_id: int, description: str) -> None:
         await conn.execute(
             "UPDATE movies SET description = ? WHERE id = ?", (description, movie_id)
         )
+        await _touch_movie(conn, movie_id)
         await conn.commit()
 
 
@@ -877,14 +1704,22 @@ async def get_movies_missing_plot_ru() -> list[Movie]:
 
 
 async def delete_movie(movie_id: int, user_id: int) -> bool:
-    """Удалить фильм из библиотеки пользователя."""
+    """Удалить фильм из библиотеки пользователя (с надгробием для дельта-синка)."""
     async with aiosqlite.connect(DATABASE_PATH) as db:
+        revision = await _bump_revision(db, user_id)
         cursor = await db.execute(
             "DELETE FROM movies WHERE id = ? AND user_id = ?",
             (movie_id, user_id),
         )
+        if not cursor.rowcount:
+            await db.rollback()
+            return False
+        await db.execute(
+            "INSERT INTO movie_tombstones (user_id, movie_id, revision) VALUES (?, ?, ?)",
+            (user_id, movie_id, revision),
+        )
         await db.commit()
-        return cursor.rowcount > 0
+        return True
 
 
 async def get_unwatched_movies(user_id: int) -> list[Movie]:
@@ -1072,18 +1907,42 @@ async def slug_exists(slug: str) -> bool:
             return (await cur.fetchone()) is not None
 
 
+async def _write_share_items(
+    db: aiosqlite.Connection,
+    share_id: int,
+    items: list[tuple[str, str]],
+    metadata: dict[str, bytes],
+) -> None:
+    # DO UPDATE, а не DO NOTHING: свежий last_used_at не даёт сборщику мусора
+    # удалить метаданные, на которые этот шэр вот-вот сошлётся.
+    await db.executemany(
+        "INSERT INTO share_movies (hash, data) VALUES (?, ?) "
+        "ON CONFLICT(hash) DO UPDATE SET last_used_at = CURRENT_TIMESTAMP",
+        list(metadata.items()),
+    )
+    await db.executemany(
+        "INSERT INTO share_items (share_id, position, movie_hash, overrides) "
+        "VALUES (?, ?, ?, ?)",
+        [(share_id, pos, h, overrides) for pos, (h, overrides) in enumerate(items)],
+    )
+
+
 async def create_share(
     slug: str,
     owner_user_id: Optional[int],
     name: str,
     snapshot_json: str,
     expires_at: Optional[datetime],
+    items: Optional[list[tuple[str, str]]] = None,
+    metadata: Optional[dict[str, bytes]] = None,
 ) -> dict:
     """Persist a snapshot of a movie list under ``slug``.
 
     Returns the row as a dict so the router can build SharedListResponse.
-    The snapshot is opaque JSON — callers serialise on the way in and
-    deserialise on the way out.
+    The snapshot is opaque to this layer: either legacy JSON in
+    ``snapshot_json`` or, with ``snapshot_json=""``, ``items`` (metadata hash,
+    overrides JSON) referencing ``metadata`` (hash → compressed blob) — see
+    ``services.share_snapshot``.
     """
     async with aiosqlite.connect(DATABASE_PATH) as db:
         cursor = await db.execute(
@@ -1097,8 +1956,10 @@ async def create_share(
                 expires_at.isoformat() if expires_at else None,
             ),
         )
-        await db.commit()
         share_id = cursor.lastrowid
+        if items:
+            await _write_share_items(db, share_id, items, metadata or {})
+        await db.commit()
         async with db.execute(
             "SELECT id, slug, owner_user_id, name, snapshot, created_at, "
             "expires_at, view_count FROM shared_lists WHERE id = ?",
@@ -1111,8 +1972,7 @@ async def create_share(
 async def get_share_by_slug(slug: str) -> Optional[dict]:
     """Read a share. Returns None if missing or expired.
 
-    Increments view_count opportunistically — failures aren't fatal because
-    we don't want a write hiccup to break the read path.
+    Read-only: views are counted in memory and flushed via ``add_share_views``.
     """
     async with aiosqlite.connect(DATABASE_PATH) as db:
         async with db.execute(
@@ -1121,23 +1981,87 @@ async def get_share_by_slug(slug: str) -> Optional[dict]:
             (slug,),
         ) as cur:
             row = await cur.fetchone()
-            if not row:
-                return None
-            share = _row_to_share(row)
+    if not row:
+        return None
+    share = _row_to_share(row)
+    if share["expires_at"] and share["expires_at"] < datetime.utcnow():
+        return None
+    return share
 
-        if share["expires_at"] and share["expires_at"] < datetime.utcnow():
-            return None
 
-        try:
-            await db.execute(
-                "UPDATE shared_lists SET view_count = view_count + 1 WHERE slug = ?",
-                (slug,),
-            )
-            await db.commit()
-        except Exception:
-            pass
+async def add_share_views(counts: dict[str, int]) -> None:
+    """Add accumulated view counts, one UPDATE per share, in one transaction."""
+    if not counts:
+        return
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        await db.executemany(
+            "UPDATE shared_lists SET view_count = view_count + ? WHERE slug = ?",
+            [(n, slug) for slug, n in counts.items()],
+        )
+        await db.commit()
+
+
+async def get_share_items(share_id: int) -> list[tuple[bytes, str]]:
+    """Items of a reference-format share in order: (metadata blob, overrides JSON)."""
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        async with db.execute(
+            "SELECT m.data, i.overrides FROM share_items i "
+            "JOIN share_movies m ON m.hash = i.movie_hash "
+            "WHERE i.share_id = ? ORDER BY i.position",
+            (share_id,),
+        ) as cur:
+            return [(row[0], row[1]) for row in await cur.fetchall()]
+
 
-        return share
+async def get_legacy_shares(limit: int) -> list[tuple[int, str]]:
+    """Shares still holding an inline JSON snapshot: (id, snapshot)."""
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        async with db.execute(
+            "SELECT id, snapshot FROM shared_lists WHERE snapshot != '' "
+            "ORDER BY id LIMIT ?",
+            (limit,),
+        ) as cur:
+            return [(row[0], row[1]) for row in await cur.fetchall()]
+
+
+async def replace_share_snapshot(
+    share_id: int, items: list[tuple[str, str]], metadata: dict[str, bytes],
+) -> None:
+    """Swap an inline JSON snapshot for references, atomically."""
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        await db.execute("DELETE FROM share_items WHERE share_id = ?", (share_id,))
+        await _write_share_items(db, share_id, items, metadata)
+        await db.execute(
+            "UPDATE shared_lists SET snapshot = '' WHERE id = ?", (share_id,),
+        )
+        await db.commit()
+
+
+async def delete_expired_shares(now: datetime) -> int:
+    """Drop shares whose ``expires_at`` has passed, with their items."""
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        expired = "SELECT id FROM shared_lists WHERE expires_at < ?"
+        await db.execute(
+            f"DELETE FROM share_items WHERE share_id IN ({expired})",
+            (now.isoformat(),),
+        )
+        cursor = await db.execute(
+            "DELETE FROM shared_lists WHERE expires_at < ?", (now.isoformat(),),
+        )
+        await db.commit()
+        return cursor.rowcount
+
+
+async def delete_orphan_share_movies(used_before: datetime) -> int:
+    """Drop shared metadata no item references, untouched since ``used_before``."""
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        cursor = await db.execute(
+            "DELETE FROM share_movies WHERE last_used_at < ? AND NOT EXISTS "
+            "(SELECT 1 FROM share_items i WHERE i.movie_hash = share_movies.hash)",
+            (used_before.strftime("%Y-%m-%d %H:%M:%S"),),
+        )
+        await db.commit()
+        return cursor.rowcount
 
 
 def _row_to_share(row) -> dict:
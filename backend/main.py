@@ -1,4 +1,4 @@
-import asyncio
+import time
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
@@ -27,9 +27,16 @@ if config.SENTRY_DSN:
     )
     print("[sentry] enabled", flush=True)
 from backend.rate_limit import limiter
-from backend.routers import movies, search, recommend, instagram, awards, auth, health, telegram, shares, books, telegram_webhook, availability, settings as settings_router, events
+from backend.routers import movies, search, recommend, instagram, awards, auth, health, telegram, shares, books, telegram_webhook, availability, settings as settings_router, events, metrics
+from backend.services import analytics_rollup, background
+from backend.services import availability as availability_service
+from backend.services import availability_index, google_certs, share_cache, share_snapshot
+from backend.services.event_buffer import buffer as event_buffer
+from backend.services.password_pool import pool as password_pool
+from backend.services.update_queue import queue as update_queue
 from backend.services.awards_seed import (
     sync_awards_catalog,
+    backfill_plot_ru,
     backfill_media_type,
     backfill_runtime,
 )
@@ -37,7 +44,14 @@ from backend.services.awards_seed import (
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Инициализация при запуске приложения"""
+    """Инициализация при запуске приложения.
+
+    Критический путь — только ``init_db``: синк наград, переводы и бэкфиллы
+    уходят в фоновый конвейер (``background.runner``), их статус виден
+    в ``/api/health/full``. Время до первого запроса не зависит от того,
+    сколько работы накопилось в каталоге.
+    """
+    started = time.monotonic()
     # Создаём директорию data если её нет
     data_dir = os.path.join(os.path.dirname(__file__), "data")
     os.makedirs(data_dir, exist_ok=True)
@@ -47,30 +61,58 @@ async def lifespan(app: FastAPI):
     print(f"[db] Using {engine}", flush=True)
     await db.init_db()
     print("[db] init_db OK", flush=True)
+    # Повторный lifespan в том же процессе: снять остановку прошлого stop().
+    event_buffer.start()
 
-    # Догружаем каталог наград (идемпотентно). SKIP_AWARDS_SEED=1 — для тестов.
+    # Каталог наград (идемпотентно), переводы сюжетов, затем разовый бэкфилл
+    # media_type и дозаполнение длительностей — по очереди, они делят квоту
+    # OMDB. SKIP_AWARDS_SEED=1 (тесты) отключает весь конвейер.
     if os.getenv("SKIP_AWARDS_SEED") != "1":
-        try:
-            await sync_awards_catalog()
-        except Exception as exc:
-            print(f"Не удалось синхронизировать каталог наград: {exc}")
+        background.runner.run_pipeline([
+            ("awards_seed", sync_awards_catalog),
+            ("plot_ru", backfill_plot_ru),
+            ("media_type", backfill_media_type),
+            ("runtime", backfill_runtime),
+        ])
+        # Кэш доступности обновляется заранее, до истечения TTL, — первый
+        # зритель после суток не ждёт TMDb.
+        if config.AVAILABILITY_REFRESH_INTERVAL > 0 and config.TMDB_API_KEY:
+            background.runner.run_periodic(
+                "availability_refresh", availability_service.refresh_due,
+                config.AVAILABILITY_REFRESH_INTERVAL,
+            )
+        # Офлайн-индекс доступности по /discover — для фильтра «только
+        # доступное» по всему пулу кандидатов /api/recommend.
+        if config.AVAILABILITY_INDEX_INTERVAL > 0 and config.TMDB_API_KEY:
+            background.runner.run_periodic(
+                "availability_index", availability_index.build_index,
+                config.AVAILABILITY_INDEX_INTERVAL,
+            )
 
-    # Разовый бэкфилл media_type у старых записей (фильм/сериал). Гоняем в фоне,
-    # чтобы не задерживать старт и health-check; внутри гейт по app_meta — пройдёт
-    # один раз. SKIP_AWARDS_SEED=1 заодно отключает и его в тестах.
-    if os.getenv("SKIP_AWARDS_SEED") != "1":
-        async def _run_media_type_backfill():
-            try:
-                await backfill_media_type()
-            except Exception as exc:
-                print(f"[media_type] бэкфилл упал: {exc}", flush=True)
-            # Длительности — после классификации, тем же фоновым проходом.
-            try:
-                await backfill_runtime()
-            except Exception as exc:
-                print(f"[runtime] бэкфилл упал: {exc}", flush=True)
-
-        app.state.media_type_task = asyncio.create_task(_run_media_type_backfill())
+    # Агрегаты аналитики для /api/metrics — локальная работа с БД, без внешних
+    # API, поэтому не под SKIP_AWARDS_SEED.
+    if config.EVENTS_ROLLUP_INTERVAL > 0:
+        background.runner.run_periodic(
+            "events_rollup", analytics_rollup.run_once, config.EVENTS_ROLLUP_INTERVAL,
+        )
+
+    # Просмотры публичных шэров копятся в памяти — сбрасываем пачкой.
+    background.runner.run_periodic(
+        "share_views", share_cache.views.flush, config.SHARE_VIEWS_FLUSH_INTERVAL,
+    )
+
+    # Истёкшие гостевые шэры и перевод старых снимков в компактный формат.
+    if config.SHARE_GC_INTERVAL > 0:
+        background.runner.run_periodic(
+            "share_gc", share_snapshot.collect_garbage, config.SHARE_GC_INTERVAL,
+        )
+
+    # Сертификаты Google для входа — заранее, чтобы первый вход не ждал сети.
+    if config.GOOGLE_CLIENT_ID and config.GOOGLE_CERTS_REFRESH_INTERVAL > 0:
+        background.runner.run_periodic(
+            "google_certs", google_certs.certs.refresh,
+            config.GOOGLE_CERTS_REFRESH_INTERVAL,
+        )
 
     # Telegram-бот через webhook в этом же процессе. Включается только когда
     # заданы токен + публичный URL + секрет. Локально — пусто, бот гоняется
@@ -90,20 +132,32 @@ async def lifespan(app: FastAPI):
                 f"{config.PUBLIC_BASE_URL}/telegram/webhook/"
                 f"{config.TELEGRAM_WEBHOOK_SECRET}"
             )
+            update_queue.start(bot_app.process_update)
             await bot_app.bot.set_webhook(url=webhook_url, drop_pending_updates=True)
             app.state.bot_app = bot_app
             print(f"[bot] webhook set: {webhook_url}", flush=True)
         except Exception as exc:
             print(f"[bot] failed to start webhook bot: {exc}", flush=True)
 
+    background.runner.startup_ms = round((time.monotonic() - started) * 1000, 1)
+    print(f"[startup] готов к запросам за {background.runner.startup_ms}ms", flush=True)
+
     yield
 
+    await background.runner.shutdown()
+    # Сначала дорабатываем принятые апдейты, потом гасим бота.
+    if update_queue.running:
+        await update_queue.stop()
     if getattr(app.state, "bot_app", None) is not None:
         try:
             await app.state.bot_app.stop()
             await app.state.bot_app.shutdown()
         except Exception as exc:
             print(f"[bot] shutdown error: {exc}", flush=True)
+    # После бота: его последние апдейты тоже пишут события.
+    await event_buffer.stop()
+    await share_cache.views.flush()
+    password_pool.shutdown()
     print("Приложение остановлено")
 
 
@@ -127,6 +181,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Курсор пагинации и ревизия библиотеки /api/movies — фронт на другом
+    # origin должен их видеть.
+    expose_headers=["X-Next-Cursor", "X-Next-Offset", "X-Library-Revision", "ETag"],
 )
 
 # Подключаем роутеры API
@@ -143,6 +200,7 @@ app.include_router(telegram_webhook.router)
 app.include_router(availability.router)
 app.include_router(settings_router.router)
 app.include_router(events.router)
+app.include_router(metrics.router)
 app.include_router(health.router)
 
 # Статические файлы frontend (собранный Vite-бандл)
@@ -0,0 +1,60 @@
+"""Версионированные миграции схемы — общий каркас для SQLite и PostgreSQL.
+
+Раньше ``init_db`` на каждом старте заново прогонял всю историю схемы:
+``PRAGMA table_info`` на каждую колонку, ``ALTER TABLE ... IF NOT EXISTS``,
+``CREATE INDEX IF NOT EXISTS`` и проверки разовых бэкфиллов. Теперь версия
+схемы лежит в таблице ``schema_version`` (строка на применённую миграцию), и
+в обычном случае старт — это одно чтение ``max(version)``.
+
+Каждый движок регистрирует свои миграции в ``MigrationSet`` под общими номерами:
+версия N означает одно и то же изменение схемы в обоих движках, отличается
+только SQL-диалект. Миграция 1 — «baseline»: прежний идемпотентный ``init_db``
+целиком; он доводит до текущей схемы и пустую БД, и любую старую боевую
+(у которой ``schema_version`` ещё нет). Новые изменения схемы — только
+следующими номерами, уже применённые миграции не редактируем.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+# Одна строка на применённую миграцию: заодно журнал, когда что накатилось.
+SCHEMA_VERSION_DDL = """
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version    INTEGER PRIMARY KEY,
+        name       TEXT NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+MigrationFunc = Callable[[Any], Awaitable[None]]
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    apply: MigrationFunc  # получает соединение своего движка
+
+
+class MigrationSet:
+    """Упорядоченный набор миграций одного движка."""
+
+    def __init__(self) -> None:
+        self._items: dict[int, Migration] = {}
+
+    def register(self, version: int, name: str) -> Callable[[MigrationFunc], MigrationFunc]:
+        def decorator(func: MigrationFunc) -> MigrationFunc:
+            if version in self._items:
+                raise ValueError(f"migration {version} registered twice")
+            self._items[version] = Migration(version, name, func)
+            return func
+        return decorator
+
+    @property
+    def latest(self) -> int:
+        return max(self._items, default=0)
+
+    def pending(self, current: int) -> list[Migration]:
+        """Миграции новее ``current`` по возрастанию версии."""
+        return [self._items[v] for v in sorted(self._items) if v > current]
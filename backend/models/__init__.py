@@ -3,6 +3,7 @@ from backend.models.movie import (
     MovieBase,
     MovieCreate,
     MovieUpdate,
+    LibraryChanges,
     RecommendationRequest,
     RecommendationResponse,
     OMDBSearchResult,
@@ -11,6 +12,7 @@ from backend.models.movie import (
     BulkImportRequest,
     Provider,
     WatchAvailability,
+    AvailabilityBatchRequest,
 )
 from backend.models.book import (
     Book,
@@ -38,13 +40,20 @@ from backend.models.user import (
     UserSettings,
     UserSettingsUpdate,
 )
-from backend.models.event import EventIn, EventBatch, ALLOWED_EVENTS
+from backend.models.event import (
+    EventIn,
+    EventBatch,
+    ALLOWED_EVENTS,
+    FunnelDay,
+    FunnelReport,
+)
 
 __all__ = [
     "Movie",
     "MovieBase",
     "MovieCreate",
     "MovieUpdate",
+    "LibraryChanges",
     "Book",
     "BookBase",
     "BookCreate",
@@ -63,6 +72,7 @@ __all__ = [
     "BulkImportRequest",
     "Provider",
     "WatchAvailability",
+    "AvailabilityBatchRequest",
     "InstagramImportRequest",
     "TelegramImportRequest",
     "SharedListCreateRequest",
@@ -79,4 +89,6 @@ __all__ = [
     "EventIn",
     "EventBatch",
     "ALLOWED_EVENTS",
+    "FunnelDay",
+    "FunnelReport",
 ]
@@ -1,6 +1,7 @@
 """Модели событийной аналитики (лёгкий self-hosted трекинг).
 
-События пишутся фронтом батчами в ``POST /api/events`` и ботом напрямую в БД.
+События пишутся фронтом батчами в ``POST /api/events`` и ботом через буфер
+``event_buffer``; метрики читаются из агрегатов ``analytics_rollup``.
 Имена строго из ``ALLOWED_EVENTS`` — это и защита от мусора/PII в ``name``, и
 живой список того, что мы вообще меряем для kill-метрик эксперимента.
 """
@@ -26,6 +27,12 @@ ALLOWED_EVENTS: frozenset[str] = frozenset({
     "launch_clicked",            # клик «смотреть» — прокси «пошёл смотреть»
 })
 
+# Стадии «решающей» сессии по порядку (см. docs/metrics.md): событие двигает
+# воронку сессии, только если предыдущая стадия уже пройдена.
+FUNNEL_EVENTS: tuple[str, ...] = (
+    "recommendation_requested", "tonight_pick_viewed", "launch_clicked",
+)
+
 # Защитные лимиты, чтобы аналитика не стала вектором абьюза.
 MAX_EVENTS_PER_BATCH = 50
 MAX_PROPS_KEYS = 20
@@ -44,3 +51,23 @@ class EventIn(BaseModel):
 class EventBatch(BaseModel):
     """Батч событий за один POST (фронт буферизует и шлёт пачкой)."""
     events: list[EventIn] = Field(default_factory=list, max_length=MAX_EVENTS_PER_BATCH)
+
+
+class FunnelDay(BaseModel):
+    """Строка ``GET /api/metrics/funnel`` — день воронки из агрегатов."""
+    day: str
+    active: int = 0                   # уникальные акторы с app_open/session_start
+    requested: int = 0
+    viewed: int = 0
+    launched: int = 0
+    sessions: int = 0
+    decisive: int = 0                 # сессии, дошедшие до launch_clicked по порядку
+    decisive_only_available: int = 0  # из них — с запросом «только доступное»
+
+
+class FunnelReport(BaseModel):
+    since: str
+    user_id: Optional[int] = None
+    rolled_up_to: int                 # id последнего учтённого события
+    days: list[FunnelDay]
+    totals: FunnelDay
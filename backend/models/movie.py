@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import Optional
+from pydantic import BaseModel, Field, StringConstraints
+from typing import Annotated, Optional
 from datetime import datetime
 
 
@@ -62,6 +62,18 @@ class WatchAvailability(BaseModel):
     buy: list[Provider] = []
 
 
+# Сколько тайтлов принимает ``POST /api/availability/batch`` за раз.
+MAX_AVAILABILITY_BATCH = 100
+
+
+class AvailabilityBatchRequest(BaseModel):
+    """Доступность пачки тайтлов в одном регионе (бейджи сетки библиотеки)."""
+    imdb_ids: list[Annotated[str, StringConstraints(pattern=r"^tt\d+$")]] = Field(
+        ..., min_length=1, max_length=MAX_AVAILABILITY_BATCH,
+    )
+    region: str = Field("RU", min_length=2, max_length=2)
+
+
 class MovieCreate(BaseModel):
     """Модель для добавления фильма по названию или IMDb ID"""
     query: str  # Название или IMDb ID (tt1234567)
@@ -78,6 +90,18 @@ class MovieUpdate(BaseModel):
     user_note: Optional[str] = None
 
 
+class LibraryChanges(BaseModel):
+    """Дельта библиотеки после ревизии ``since`` (``GET /api/movies/changes``).
+
+    ``full=True`` — дельту не построить (``since`` 0 или из будущего): в
+    ``movies`` вся библиотека, клиент заменяет свою копию целиком.
+    """
+    revision: int
+    full: bool = False
+    movies: list[Movie] = []
+    deleted: list[int] = []
+
+
 class RecommendationRequest(BaseModel):
     """Запрос на рекомендацию.
 
@@ -5,7 +5,8 @@ Two key functions:
   публичный поиск). Уважает X-Forwarded-For, потому что Railway / любой PaaS
   сидит за прокси и ``request.client.host`` иначе всегда один и тот же.
 - ``user_or_ip_key`` — для эндпоинтов с (опциональной) авторизацией: ключ по
-  user_id из JWT, fallback на IP, если токена нет. Так гость и залогиненный
+  user_id из JWT (декодированного один раз на запрос, ``auth.token_user_id``),
+  fallback на IP, если токена нет. Так гость и залогиненный
   юзер считаются раздельно, а лимит на платные API не обходится разлогином.
 
 Лимитер можно выключить переменной окружения ``RATE_LIMIT_ENABLED=0`` — это
@@ -19,7 +20,7 @@ import os
 from fastapi import Request
 from slowapi import Limiter
 
-from backend.auth import decode_access_token
+from backend.auth import token_user_id
 
 
 def client_ip_key(request: Request) -> str:
@@ -30,12 +31,9 @@ def client_ip_key(request: Request) -> str:
 
 
 def user_or_ip_key(request: Request) -> str:
-    auth = request.headers.get("authorization") or ""
-    if auth.lower().startswith("bearer "):
-        token = auth.split(None, 1)[1].strip()
-        user_id = decode_access_token(token)
-        if user_id is not None:
-            return f"user:{user_id}"
+    user_id = token_user_id(request)
+    if user_id is not None:
+        return f"user:{user_id}"
     return f"ip:{client_ip_key(request)}"
 
 
@@ -0,0 +1,48 @@
+"""Быстрый JSON-ответ для больших списков (библиотека, каталог наград).
+
+Обычный путь FastAPI для ``response_model=list[Movie]``: строка БД →
+``Movie`` (pydantic) → повторная валидация списка по response_model →
+сериализация. На тысячах строк это основное время запроса. Списочные
+эндпоинты вместо этого собирают строки БД сразу в JSON-готовые dict'ы
+(данные из нашей же БД — валидировать их второй раз незачем) и отдают
+``FastJSONResponse``: возврат готового Response FastAPI не валидирует,
+``response_model`` остаётся только для OpenAPI-схемы.
+
+Сериализация — orjson: datetime он сам пишет в ISO 8601, как pydantic.
+
+Приложение целиком на этот класс не переводим (``default_response_class``):
+свежий FastAPI для эндпоинтов с ``response_model`` и ответом по умолчанию сам
+сериализует через pydantic-core в байты, а кастомный класс по умолчанию этот
+путь отключил бы.
+
+Здесь же ``etag_matches`` — общий разбор ``If-None-Match`` для эндпоинтов с
+``ETag`` (библиотека, публичные шэры).
+"""
+from __future__ import annotations
+
+from typing import Any
+
+import orjson
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+
+def dumps(content: Any) -> bytes:
+    """JSON в байтах; datetime — ISO 8601, как у pydantic."""
+    return orjson.dumps(content)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Совпадает ли ``If-None-Match`` запроса с ``etag`` (→ можно отдать 304).
+
+    Заголовок — список тегов через запятую или ``*``; сравнение слабое
+    (RFC 9110): ``W/"x"`` и ``"x"`` равны — прокси со сжатием ослабляют теги.
+    """
+    header = request.headers.get("if-none-match", "")
+    tags = {tag.strip().removeprefix("W/") for tag in header.split(",") if tag.strip()}
+    return "*" in tags or etag.removeprefix("W/") in tags
@@ -8,6 +8,7 @@ from backend.auth import (
     create_access_token,
     get_current_user,
     hash_password,
+    invalidate_user,
     verify_google_id_token,
     verify_password,
     verify_telegram_init_data,
@@ -68,7 +69,7 @@ async def register(request: Request, payload: UserCreate):
         )
     user_row = await db.create_user(
         email=payload.email,
-        password_hash=hash_password(payload.password),
+        password_hash=await hash_password(payload.password),
         name=payload.name,
     )
     return await _issue(user_row)
@@ -88,7 +89,7 @@ async def login(request: Request, payload: UserLogin):
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Этот аккаунт привязан к Google. Нажми «Войти через Google».",
         )
-    if not verify_password(payload.password, user_row["password_hash"]):
+    if not await verify_password(payload.password, user_row["password_hash"]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неверный email или пароль",
@@ -99,7 +100,7 @@ async def login(request: Request, payload: UserLogin):
 @router.post("/google", response_model=AuthResponse)
 @limiter.limit("20/minute")
 async def google_login(request: Request, payload: GoogleLogin):
-    claims = verify_google_id_token(payload.id_token)
+    claims = await verify_google_id_token(payload.id_token)
     google_sub = claims["sub"]
     email = claims.get("email", "").lower()
     name = claims.get("name")
@@ -111,6 +112,7 @@ async def google_login(request: Request, payload: GoogleLogin):
         user_row = await db.get_user_by_email(email)
         if user_row:
             await db.attach_google_sub(user_row["id"], google_sub, picture)
+            invalidate_user(user_row["id"])
             user_row = await db.get_user_by_id(user_row["id"])
 
     if not user_row:
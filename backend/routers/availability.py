@@ -4,15 +4,41 @@
 доступность с кэшем (TTL 24ч внутри сервиса). Всегда 200 с консистентной
 формой: на отсутствие данных возвращаем пустую доступность для региона,
 чтобы фронт не городил спец-обработку null.
+
+``POST /api/availability/batch`` — то же для пачки тайтлов одного региона
+(сетка библиотеки): один запрос к кэшу, в TMDb — только отсутствующие, и не
+больше ``BATCH_MAX_FETCHES`` за запрос. Ручка открыта гостям, так что пачка
+случайных id не превращается в сотню запросов к TMDb.
 """
 from fastapi import APIRouter, Query, Request
 
-from backend.models import WatchAvailability
+from backend.models import AvailabilityBatchRequest, WatchAvailability
 from backend.rate_limit import limiter, user_or_ip_key
-from backend.services.availability import get_availability
+from backend.services.availability import get_availability, get_availability_many
 
 router = APIRouter(prefix="/api/availability", tags=["availability"])
 
+# Сколько тайтлов без кэша batch-запрос тянет из TMDb; остальные — в следующий.
+BATCH_MAX_FETCHES = 10
+
+
+@router.post("/batch", response_model=dict[str, WatchAvailability])
+@limiter.limit("120/hour", key_func=user_or_ip_key)
+async def availability_batch(request: Request, payload: AvailabilityBatchRequest):
+    """Доступность до ``MAX_AVAILABILITY_BATCH`` тайтлов: ``{imdb_id: доступность}``.
+
+    Нет данных — пустая доступность. Id, до которых не дошёл лимит запросов к
+    TMDb, в ответе отсутствуют — клиент запросит их следующей пачкой.
+    """
+    region = payload.region.upper()
+    found = await get_availability_many(
+        payload.imdb_ids, region, max_fetches=BATCH_MAX_FETCHES,
+    )
+    return {
+        imdb_id: data if data is not None else WatchAvailability(region=region)
+        for imdb_id, data in found.items()
+    }
+
 
 @router.get("/{imdb_id}", response_model=WatchAvailability)
 @limiter.limit("180/hour", key_func=user_or_ip_key)
@@ -1,8 +1,9 @@
 from fastapi import APIRouter, Query
 from typing import Optional
 
-from backend import database as db
 from backend.models import Movie
+from backend.responses import FastJSONResponse
+from backend.services import awards_catalog
 
 router = APIRouter(prefix="/api/awards", tags=["awards"])
 
@@ -10,5 +11,6 @@ router = APIRouter(prefix="/api/awards", tags=["awards"])
 @router.get("", response_model=list[Movie])
 async def get_awards_catalog(limit: Optional[int] = Query(None, ge=1, le=500)):
     """Каталог фильмов-лауреатов (Оскар, Золотой глобус, Каннская ветвь…).
-    Отсортирован по году награды — свежие сверху."""
-    return await db.get_awards(limit=limit)
+    Отсортирован по году награды — свежие сверху. Отдаётся из снимка в памяти
+    (``awards_catalog``), без запроса к БД и без повторной валидации строк."""
+    return FastJSONResponse(await awards_catalog.get_award_rows(limit=limit))
@@ -2,18 +2,19 @@
 
 ``POST /api/events`` — фронт буферизует события и шлёт пачкой. Сервер ставит
 ``user_id`` (из токена, если есть), ``source='web'`` и собственный ts. Имена
-вне allowlist отбрасываются. Аналитика best-effort: сбой записи не должен
-ломать клиента, поэтому ошибки глушим и всё равно отвечаем 200.
+вне allowlist отбрасываются. Запись — через ``event_buffer``: ответ не ждёт
+БД, сбой записи клиента не касается. ``accepted`` — сколько событий принято
+в буфер (при переполнении лишние отбрасываются).
 """
 from typing import Optional
 
 from fastapi import APIRouter, Depends, Request
 
-from backend import database as db
 from backend.auth import get_current_user_optional
 from backend.models import EventBatch, User
 from backend.models.event import ALLOWED_EVENTS, MAX_PROPS_KEYS
 from backend.rate_limit import limiter, user_or_ip_key
+from backend.services.event_buffer import buffer
 
 router = APIRouter(prefix="/api/events", tags=["analytics"])
 
@@ -41,10 +42,4 @@ async def post_events(
             "source": "web",
         })
 
-    if rows:
-        try:
-            await db.insert_events(rows)
-        except Exception as exc:  # аналитика не роняет клиента
-            print(f"[events] insert failed: {exc}")
-
-    return {"accepted": len(rows)}
+    return {"accepted": buffer.add(rows)}
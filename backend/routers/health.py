@@ -5,8 +5,14 @@ Reports the state of every external dependency the app needs:
 - Apify token (Instagram parsing)
 - DB engine (SQLite vs PostgreSQL) and a live SELECT 1
 - Required API keys set or missing
-
-Public — no auth — but only exposes booleans / versions, nothing sensitive.
+- Startup time and background tasks (awards seed, backfills): state and progress
+- Analytics event buffer (pending / written / dropped counters)
+
+Public — no auth — and the public part only exposes booleans, versions, task
+states and counters. Exception text of failed background tasks stays in the
+logs. With a valid ``X-Metrics-Token`` (same gate as ``/api/metrics``) the
+response also carries that error text and the in-process internals: auth
+caches, password pool, Google certs, Telegram update queue, share cache.
 Hit it with: curl https://<host>/api/health/full
 """
 
@@ -14,12 +20,17 @@ from __future__ import annotations
 
 import shutil
 import subprocess
-from typing import Any
+from typing import Any, Optional
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Header
 from fastapi.concurrency import run_in_threadpool
 
 from backend import config
+from backend.auth import password_pool, user_cache, verified_cache
+from backend.routers.metrics import token_valid
+from backend.services import background, google_certs, share_cache
+from backend.services.event_buffer import buffer as event_buffer
+from backend.services.update_queue import queue as update_queue
 
 
 router = APIRouter(prefix="/api/health", tags=["health"])
@@ -86,8 +97,10 @@ async def health_quick() -> dict[str, Any]:
 
 
 @router.get("/full")
-async def health_full() -> dict[str, Any]:
-    """Full diagnostic — checks every external dep. Public, but read-only."""
+async def health_full(x_metrics_token: Optional[str] = Header(None)) -> dict[str, Any]:
+    """Full diagnostic — checks every external dep. Public, but read-only;
+    internals only with a valid X-Metrics-Token."""
+    internals = token_valid(x_metrics_token)
     ffmpeg_info = await run_in_threadpool(_bin_version, "ffmpeg", ["-version"])
     ffprobe_info = await run_in_threadpool(_bin_version, "ffprobe", ["-version"])
     db_info = await _db_probe()
@@ -99,7 +112,7 @@ async def health_full() -> dict[str, Any]:
         and bool(config.APIFY_TOKEN)
     )
 
-    return {
+    report: dict[str, Any] = {
         "ok": overall_ok,
         "binaries": {
             "ffmpeg": ffmpeg_info,
@@ -120,4 +133,22 @@ async def health_full() -> dict[str, Any]:
             "actor": config.APIFY_INSTAGRAM_ACTOR,
             "token_set": bool(config.APIFY_TOKEN),
         },
+        "background": background.runner.snapshot(with_errors=internals),
+        "events": event_buffer.snapshot(),
+    }
+    if not internals:
+        return report
+    report["internals"] = {
+        "auth": {
+            "user_cache": user_cache.snapshot(),
+            "password_pool": password_pool.snapshot(),
+            "verified_tokens": verified_cache.snapshot(),
+            "google_certs": google_certs.certs.snapshot(),
+        },
+        "telegram_updates": update_queue.snapshot(),
+        "shares": {
+            "cache": share_cache.cache.snapshot(),
+            "views": share_cache.views.snapshot(),
+        },
     }
+    return report
@@ -0,0 +1,61 @@
+"""Метрики эксперимента для браузера: воронка из агрегатов аналитики.
+
+Читает только ``event_daily`` / ``funnel_sessions`` (``analytics_rollup``),
+сырую ``events`` не трогает — ответ не медленнеет с ростом событий. Данные
+отстают от реальности на период сворачивания (``EVENTS_ROLLUP_INTERVAL``);
+``rolled_up_to`` — id последнего учтённого события.
+
+Доступ — по ``METRICS_TOKEN`` в заголовке ``X-Metrics-Token``; без токена в
+конфиге эндпоинт выключен (404).
+"""
+import hmac
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Query
+
+from backend import config
+from backend import database as db
+from backend.models import FunnelDay, FunnelReport
+from backend.services import analytics_rollup
+
+router = APIRouter(prefix="/api/metrics", tags=["analytics"])
+
+_COUNTERS = tuple(f for f in FunnelDay.model_fields if f != "day")
+
+
+def token_valid(token: Optional[str]) -> bool:
+    """Совпадает ли ``X-Metrics-Token`` с настроенным; без токена в конфиге — нет."""
+    return bool(config.METRICS_TOKEN and token and hmac.compare_digest(token, config.METRICS_TOKEN))
+
+
+def _check_token(token: Optional[str]) -> None:
+    if not config.METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not token_valid(token):
+        raise HTTPException(status_code=401, detail="Неверный X-Metrics-Token")
+
+
+@router.get("/funnel", response_model=FunnelReport)
+async def get_funnel(
+    days: int = Query(21, ge=1, le=366, description="За сколько последних дней"),
+    user_id: Optional[int] = Query(None, description="Только этот пользователь"),
+    x_metrics_token: Optional[str] = Header(None),
+):
+    """Воронка по дням: запросы → показы → запуски и «решающие» сессии."""
+    _check_token(x_metrics_token)
+    since = datetime.utcnow().date() - timedelta(days=days - 1)  # ts событий — UTC
+    rows = [FunnelDay(**r) for r in await db.get_funnel(since, user_id=user_id)]
+    totals = FunnelDay(
+        day=f"{since.isoformat()}..",
+        **{f: sum(getattr(r, f) for r in rows) for f in _COUNTERS},
+    )
+    # «active» по дням не складывается (один актор — в разные дни); в итоге
+    # это сумма дневных уникальных, как в DAU-запросе docs/metrics.md.
+    return FunnelReport(
+        since=since.isoformat(),
+        user_id=user_id,
+        rolled_up_to=await analytics_rollup.get_high_water_mark(),
+        days=rows,
+        totals=totals,
+    )
@@ -1,35 +1,169 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Request
+import base64
+import hashlib
+import json
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from typing import Optional
 from backend import database as db
 from backend.auth import get_current_user
 from backend.models import (
     BulkImportRequest,
+    LibraryChanges,
     Movie,
     MovieCreate,
     MovieUpdate,
     User,
 )
 from backend.rate_limit import limiter, user_or_ip_key
+from backend.responses import FastJSONResponse, etag_matches
 from backend.services import llm_service
 from backend.services.title_search import find_movie_by_query, get_movie_by_key
 
 router = APIRouter(prefix="/api/movies", tags=["movies"])
 
 
+# Колонки карточки в сетке библиотеки — то, что фронту нужно без plot/plot_ru.
+CARD_FIELDS = (
+    "id", "imdb_id", "title", "year", "media_type", "poster_url", "imdb_rating",
+    "is_watched", "user_rating", "runtime", "added_at",
+)
+MAX_PAGE_SIZE = 500
+
+
+def _library_etag(revision: int, query: str) -> str:
+    digest = hashlib.sha1(query.encode()).hexdigest()[:8]
+    return f'W/"{revision}-{digest}"'
+
+
+def _encode_cursor(key: tuple[str, int]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[str, int]:
+    try:
+        added_at, movie_id = json.loads(
+            base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        )
+        # Время уходит в БД как есть — мусор должен стать 400, а не 500 от драйвера.
+        datetime.fromisoformat(added_at)
+        return added_at, int(movie_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Некорректный cursor")
+
+
+def _parse_fields(fields: str) -> tuple[str, ...]:
+    if fields == "card":
+        return CARD_FIELDS
+    requested = tuple(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [f for f in requested if f not in db.MOVIE_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Неизвестные поля: {', '.join(unknown)}"
+        )
+    # id нужен всегда — по нему фронт открывает карточку.
+    return requested if "id" in requested else ("id", *requested)
+
+
 @router.get("", response_model=list[Movie])
 async def get_movies(
+    request: Request,
     source: Optional[str] = Query(None, description="Фильтр по источнику: personal, top100, awards"),
     is_watched: Optional[bool] = Query(None, description="Фильтр по статусу просмотра"),
     in_library: Optional[bool] = Query(None, description="Только фильмы, сохранённые в библиотеке пользователя"),
+    genre: Optional[str] = Query(None, description="Фильтр по жанру (точное совпадение)"),
+    actor: Optional[str] = Query(None, description="Фильтр по актёру (точное совпадение)"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Размер страницы"),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы из X-Next-Cursor"),
+    fields: Optional[str] = Query(
+        None, description="Поля через запятую или 'card' — колонки карточки сетки",
+    ),
     current_user: User = Depends(get_current_user),
 ):
-    """Фильмы текущего пользователя."""
-    return await db.get_all_movies(
+    """Фильмы текущего пользователя, новые сверху.
+
+    Без ``limit``/``cursor``/``fields`` — весь список полными ``Movie`` (как
+    раньше). С ними — страница по ``limit`` (по умолчанию ``MAX_PAGE_SIZE``),
+    только запрошенные поля; курсор следующей страницы — в заголовке
+    ``X-Next-Cursor`` (нет заголовка — страница последняя).
+
+    Ответ несёт ``ETag``; ``If-None-Match`` с тем же значением → 304 без тела.
+    ``X-Library-Revision`` — точка отсчёта для ``/api/movies/changes``.
+    """
+    # ETag = ревизия библиотеки + параметры запроса: любая правка библиотеки
+    # (add/update/delete) поднимает ревизию, и только тогда тело перечитывается.
+    revision = await db.get_library_revision(current_user.id)
+    etag = _library_etag(revision, request.url.query)
+    headers = {"ETag": etag, "X-Library-Revision": str(revision)}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    rows, next_key = await db.get_movies_page(
         user_id=current_user.id,
+        fields=_parse_fields(fields) if fields else db.MOVIE_FIELDS,
         source=source,
         is_watched=is_watched,
         in_library=in_library,
+        genre=genre,
+        actor=actor,
+        # Без пагинации — вся библиотека, как до появления limit/cursor.
+        limit=limit or (MAX_PAGE_SIZE if cursor else None),
+        after=_decode_cursor(cursor) if cursor else None,
+    )
+    # Строки из БД уже JSON-готовые — отдаём мимо повторной валидации по
+    # response_model (он к тому же дописал бы в проекцию дефолты Movie).
+    result = FastJSONResponse(rows, headers=headers)
+    if next_key is not None:
+        result.headers["X-Next-Cursor"] = _encode_cursor(next_key)
+    return result
+
+
+@router.get("/search", response_model=list[Movie])
+async def search_library(
+    q: str = Query(..., min_length=1, max_length=200, description="Слова для поиска"),
+    limit: int = Query(20, ge=1, le=100, description="Размер страницы"),
+    offset: int = Query(0, ge=0, le=10_000, description="Сколько результатов пропустить"),
+    fields: Optional[str] = Query(
+        None, description="Поля через запятую или 'card' — колонки карточки сетки",
+    ),
+    current_user: User = Depends(get_current_user),
+):
+    """Поиск по своей библиотеке: название, оригинальное название, режиссёр,
+    актёры, описание, сюжет, заметка. Релевантные сверху.
+
+    Полнотекстовый индекс в БД (FTS5 в SQLite, tsvector в PostgreSQL) —
+    клиенту не нужно выкачивать библиотеку целиком. Есть следующая страница —
+    в заголовке ``X-Next-Offset`` её ``offset``.
+    """
+    rows, has_more = await db.search_movies(
+        current_user.id,
+        q,
+        fields=_parse_fields(fields) if fields else db.MOVIE_FIELDS,
+        limit=limit,
+        offset=offset,
     )
+    result = FastJSONResponse(rows)
+    if has_more:
+        result.headers["X-Next-Offset"] = str(offset + limit)
+    return result
+
+
+@router.get("/changes", response_model=LibraryChanges)
+async def get_movie_changes(
+    since: int = Query(..., ge=0, description="Ревизия из X-Library-Revision прошлой синхронизации"),
+    current_user: User = Depends(get_current_user),
+):
+    """Дельта библиотеки: фильмы, изменённые после ``since``, и id удалённых.
+
+    ``since=0`` или ревизия новее текущей (клиент от другой БД) — полная
+    выгрузка с ``full=True``.
+    """
+    revision = await db.get_library_revision(current_user.id)
+    if since == 0 or since > revision:
+        movies = await db.get_all_movies(user_id=current_user.id)
+        return LibraryChanges(revision=revision, full=True, movies=movies)
+    movies, deleted = await db.get_movie_changes(current_user.id, since)
+    return LibraryChanges(revision=revision, movies=movies, deleted=deleted)
 
 
 @router.get("/{movie_id}", response_model=Movie)
@@ -1,11 +1,18 @@
 import asyncio
+import json
 from fastapi import APIRouter, Depends, HTTPException, Request, status
-from typing import Optional
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, Optional
 from backend.auth import get_current_user_optional
 from backend.models import RecommendationRequest, RecommendationResponse, User, Movie
 from backend.rate_limit import limiter, user_or_ip_key
-from backend.services import llm_service
-from backend.services.availability import get_availability, is_available_on
+from backend.services import awards_catalog, llm_service
+from backend.services.availability_index import index as availability_index
+from backend.services.availability import (
+    get_availability,
+    get_availability_many,
+    is_available_on,
+)
 from backend import database as db
 
 router = APIRouter(prefix="/api/recommend", tags=["recommendations"])
@@ -20,6 +27,19 @@ MAX_CANDIDATES = 80
 MAX_RECOMMENDATIONS = 3
 MAX_RECOMMENDATIONS_AVAIL = 6
 
+# Сколько кандидатов без индекса и кэша доступности проверяем в TMDb до вызова
+# LLM (параллельно, ``AVAILABILITY_FETCH_CONCURRENCY`` разом) — остальные идут
+# в промпт непроверенными.
+PREFILTER_MAX_FETCHES = 12
+
+NOTHING_AVAILABLE_NOTE = (
+    "Ничего из доступного на твоих сервисах не нашлось — "
+    "вот лучшее из подходящего:"
+)
+EMPTY_LIBRARY_EXPLANATION = (
+    "В вашем списке пока нет фильмов. Сохраните хотя бы один — тогда смогу подобрать."
+)
+
 
 async def _resolve_avail_prefs(
     payload: RecommendationRequest, current_user: Optional[User]
@@ -53,23 +73,12 @@ def _merge_with_awards(saved: list[Movie], awards: list[Movie]) -> list[Movie]:
     return saved + extra[:room]
 
 
-@router.post("", response_model=RecommendationResponse)
-@limiter.limit("30/hour", key_func=user_or_ip_key)
-async def get_recommendations(
-    request: Request,
-    payload: RecommendationRequest,
-    current_user: Optional[User] = Depends(get_current_user_optional),
-):
-    """Рекомендации.
-
-    Источник библиотеки выбирается так:
-    - если в payload передан ``library`` — используем его (guest-режим, auth не нужен);
-    - иначе если есть auth — берём библиотеку пользователя из БД;
-    - иначе возвращаем 401.
+async def _load_candidates(
+    payload: RecommendationRequest, current_user: Optional[User]
+) -> list[Movie]:
+    """Библиотека (inline гостя или из БД) + каталог наград — пул для LLM.
 
-    К кандидатам всегда подмешиваются фильмы-победители премий, чтобы подбор
-    под настроение мог предложить и признанное кино из каталога наград.
-    """
+    Без библиотеки и без auth — 401: подбирать не из чего."""
     if payload.library is not None:
         movies = payload.library
         if not payload.include_watched:
@@ -87,63 +96,160 @@ async def get_recommendations(
 
     # Always mix in award-winning films (Oscar, Cannes, Golden Globe…) so a
     # mood-based pick can surface acclaimed cinema the user hasn't saved yet.
-    awards = await db.get_awards()
-    candidates = _merge_with_awards(movies, awards)
+    # Served from the in-memory snapshot — no DB read per request.
+    awards = await awards_catalog.get_awards()
+    return _merge_with_awards(movies, awards)
 
-    if not candidates:
-        return RecommendationResponse(
-            movies=[],
-            explanation="В вашем списке пока нет фильмов. Сохраните хотя бы один — тогда смогу подобрать."
-        )
 
-    region, services, only_available = await _resolve_avail_prefs(payload, current_user)
+async def _pool_availability(
+    candidates: list[Movie], region: str, services: list[int]
+) -> tuple[dict[int, Optional[bool]], dict[str, Optional[dict]]]:
+    """Доступность всего пула кандидатов до вызова LLM.
+
+    Сначала офлайн-индекс (битсеты, без сети); то, чего он не знает, — кэш
+    ``watch_providers`` одним запросом и не больше ``PREFILTER_MAX_FETCHES``
+    запросов в TMDb. Возвращает ``({movie.id: доступен | None}, {imdb_id:
+    доступность})`` — второе пригодится для бейджей, чтобы не читать кэш снова.
+    """
+    indexed = await availability_index.check_many(
+        [m.imdb_id for m in candidates], region, services,
+    )
+    resolved = await get_availability_many(
+        [m.imdb_id for m in candidates if indexed.get(m.imdb_id) is None],
+        region,
+        max_fetches=PREFILTER_MAX_FETCHES,
+    )
+    verdicts: dict[int, Optional[bool]] = {}
+    for m in candidates:
+        verdict = indexed.get(m.imdb_id)
+        if verdict is None and resolved.get(m.imdb_id) is not None:
+            verdict = is_available_on(resolved[m.imdb_id], services)
+        verdicts[m.id] = verdict
+    return verdicts, resolved
+
+
+def _prefilter(
+    candidates: list[Movie], verdicts: dict[int, Optional[bool]], only_available: bool,
+) -> tuple[list[Movie], list[int]]:
+    """Пул для LLM и id доступных в нём (подсказка «предпочитай» в промпт).
+
+    С ``only_available`` точно недоступное выкидываем до LLM — она выбирает из
+    того, что можно посмотреть. Неизвестное остаётся (его проверит фильтр
+    после LLM); если не осталось ничего — пул как был, дальше честная пометка
+    ``_apply_availability``. Без ``only_available`` недоступное остаётся, но
+    доступное LLM предпочтёт при прочих равных."""
+    pool = candidates
+    if only_available:
+        pool = [m for m in candidates if verdicts.get(m.id) is not False] or candidates
+    return pool, [m.id for m in pool if verdicts.get(m.id)]
+
+
+def _order_by_ids(candidates: list[Movie], recommended_ids: list[int]) -> list[Movie]:
+    """Кандидаты, выбранные LLM, в порядке её ответа."""
+    ordered = [m for m in candidates if m.id in recommended_ids]
+    id_to_order = {id_: idx for idx, id_ in enumerate(recommended_ids)}
+    ordered.sort(key=lambda m: id_to_order.get(m.id, 999))
+    return ordered
+
+
+def _apply_availability(
+    ordered: list[Movie],
+    availability_map: dict[str, dict],
+    services: list[int],
+    only_available: bool,
+) -> tuple[list[Movie], Optional[str]]:
+    """Фильтр/подъём доступного на сервисах юзера.
+
+    Возвращает ``(ordered, note)``; ``note`` — пометка к объяснению, когда
+    фильтр вычистил всё и мы честно показываем лучшее из подходящего."""
+    if not services:
+        return ordered, None
+    available = {
+        m.id: is_available_on(availability_map.get(str(m.id)), services)
+        for m in ordered
+    }
+    if only_available:
+        filtered = [m for m in ordered if available[m.id]]
+        if filtered:
+            return filtered, None
+        # Edge case: фильтр всё вычистил — не отдаём пустой экран,
+        # показываем лучшее из подходящего с честной пометкой.
+        return ordered, NOTHING_AVAILABLE_NOTE
+    # Не фильтруем, но доступное поднимаем выше (стабильно — внутри
+    # групп сохраняется порядок LLM).
+    return sorted(ordered, key=lambda m: 0 if available[m.id] else 1), None
+
+
+
+def _max_recs(
+    region: Optional[str], services: list[int], pool_checked: bool = False,
+) -> int:
     # С запасом просим только когда реально будем фильтровать/переупорядочивать
     # (есть и регион, и сервисы). Если регион есть, а сервисов нет — доступность
     # только для бейджей, выдачу не трогаем, поэтому ровно 3, чтобы объяснение
-    # LLM совпадало с показанными фильмами.
-    max_recs = MAX_RECOMMENDATIONS_AVAIL if (region and services) else MAX_RECOMMENDATIONS
+    # LLM совпадало с показанными фильмами. Если весь пул уже проверен и
+    # доступен (``pool_checked``), фильтровать после LLM нечего — тоже 3.
+    if pool_checked or not (region and services):
+        return MAX_RECOMMENDATIONS
+    return MAX_RECOMMENDATIONS_AVAIL
+
+
+@router.post("", response_model=RecommendationResponse)
+@limiter.limit("30/hour", key_func=user_or_ip_key)
+async def get_recommendations(
+    request: Request,
+    payload: RecommendationRequest,
+    current_user: Optional[User] = Depends(get_current_user_optional),
+):
+    """Рекомендации.
+
+    Источник библиотеки выбирается так:
+    - если в payload передан ``library`` — используем его (guest-режим, auth не нужен);
+    - иначе если есть auth — берём библиотеку пользователя из БД;
+    - иначе возвращаем 401.
+
+    К кандидатам всегда подмешиваются фильмы-победители премий, чтобы подбор
+    под настроение мог предложить и признанное кино из каталога наград.
+    """
+    candidates = await _load_candidates(payload, current_user)
+
+    if not candidates:
+        return RecommendationResponse(movies=[], explanation=EMPTY_LIBRARY_EXPLANATION)
+
+    region, services, only_available = await _resolve_avail_prefs(payload, current_user)
+    pool, preferred = candidates, []
+    resolved: dict[str, Optional[dict]] = {}
+    if region and services:
+        verdicts, resolved = await _pool_availability(candidates, region, services)
+        pool, preferred = _prefilter(candidates, verdicts, only_available)
 
     recommended_ids, explanation = await llm_service.recommend_movies(
         payload.query,
-        candidates,
-        max_recommendations=max_recs,
+        pool,
+        max_recommendations=_max_recs(
+            region, services, only_available and len(preferred) == len(pool),
+        ),
+        preferred_ids=preferred,
     )
 
-    ordered = [m for m in candidates if m.id in recommended_ids]
-    id_to_order = {id_: idx for idx, id_ in enumerate(recommended_ids)}
-    ordered.sort(key=lambda m: id_to_order.get(m.id, 999))
+    ordered = _order_by_ids(pool, recommended_ids)
 
     availability_map: dict[str, dict] = {}
     if region:
-        # Доступность тянем только для рекомендованных (≤6), а не для всех 80
-        # кандидатов — иначе шквал запросов в TMDb. Параллельно, кэш внутри.
-        resolved = await asyncio.gather(
-            *(get_availability(m.imdb_id, region) for m in ordered)
-        )
-        for movie, av in zip(ordered, resolved):
+        # Бейджи — для рекомендованных (≤6): что уже узнали до LLM, не
+        # перечитываем; остальное — кэш одним запросом.
+        unseen = [m.imdb_id for m in ordered if m.imdb_id not in resolved]
+        resolved = {**resolved, **await get_availability_many(unseen, region)}
+        for movie in ordered:
+            av = resolved.get(movie.imdb_id)
             if av is not None:
                 availability_map[str(movie.id)] = av
 
-        if services:
-            available = {
-                m.id: is_available_on(availability_map.get(str(m.id)), services)
-                for m in ordered
-            }
-            if only_available:
-                filtered = [m for m in ordered if available[m.id]]
-                if filtered:
-                    ordered = filtered
-                else:
-                    # Edge case: фильтр всё вычистил — не отдаём пустой экран,
-                    # показываем лучшее из подходящего с честной пометкой.
-                    explanation = (
-                        "Ничего из доступного на твоих сервисах не нашлось — "
-                        "вот лучшее из подходящего:\n\n" + explanation
-                    )
-            else:
-                # Не фильтруем, но доступное поднимаем выше (стабильно — внутри
-                # групп сохраняется порядок LLM).
-                ordered.sort(key=lambda m: 0 if available[m.id] else 1)
+        ordered, note = _apply_availability(
+            ordered, availability_map, services, only_available,
+        )
+        if note:
+            explanation = f"{note}\n\n{explanation}"
 
     ordered = ordered[:MAX_RECOMMENDATIONS]
     returned_ids = {str(m.id) for m in ordered}
@@ -154,3 +260,136 @@ async def get_recommendations(
         explanation=explanation,
         availability=availability_map,
     )
+
+
+def _sse(event: str, data: dict) -> str:
+    """Один кадр server-sent events: ``event: <имя>`` + JSON в ``data``."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _availability_for(movie: Movie, region: str) -> tuple[Movie, Optional[dict]]:
+    """Доступность одного фильма; сбой — None, чтобы не оборвать поток бейджей."""
+    try:
+        return movie, await get_availability(movie.imdb_id, region)
+    except Exception as exc:
+        print(f"[recommend] availability {movie.imdb_id} failed: {type(exc).__name__}: {exc}")
+        return movie, None
+
+
+async def _recommendation_events(
+    query: str,
+    candidates: list[Movie],
+    region: Optional[str],
+    services: list[int],
+    only_available: bool,
+    preferred_ids: Optional[list[int]] = None,
+    pool_checked: bool = False,
+    resolved: Optional[dict[str, Optional[dict]]] = None,
+) -> AsyncIterator[str]:
+    """Поток событий для ``/api/recommend/stream`` (порядок гарантирован):
+
+    1. ``movies`` — выбранные LLM фильмы, как только распарсена строка
+       ``РЕКОМЕНДАЦИИ:``. Доступность для них начинает тянуться сразу же,
+       параллельно с генерацией объяснения;
+    2. ``explanation`` — куски объяснения по мере генерации;
+    3. ``availability`` — бейдж для одного фильма, по мере резолва;
+    4. ``done`` — финальный порядок (после фильтра/подъёма доступного, обрезан
+       до ``MAX_RECOMMENDATIONS``) и ``note`` — пометка к объяснению или null.
+    Ошибка LLM — событие ``error`` вместо остатка потока.
+
+    ``resolved`` — доступность, уже узнанная префильтром пула
+    (``_pool_availability``): для этих фильмов в TMDb/кэш не ходим.
+    """
+    resolved = resolved or {}
+    if not candidates:
+        yield _sse("movies", {"movies": []})
+        yield _sse("explanation", {"text": EMPTY_LIBRARY_EXPLANATION})
+        yield _sse("done", {"movie_ids": [], "note": None})
+        return
+
+    ordered: list[Movie] = []
+    pending: list[asyncio.Task] = []
+    try:
+        try:
+            async for kind, value in llm_service.stream_recommend_movies(
+                query, candidates,
+                max_recommendations=_max_recs(region, services, pool_checked),
+                preferred_ids=preferred_ids,
+            ):
+                if kind == "ids":
+                    ordered = _order_by_ids(candidates, value)
+                    if region:
+                        pending = [
+                            asyncio.create_task(_availability_for(m, region))
+                            for m in ordered if m.imdb_id not in resolved
+                        ]
+                    yield _sse("movies", {
+                        "movies": [m.model_dump(mode="json") for m in ordered],
+                    })
+                else:
+                    yield _sse("explanation", {"text": value})
+        except Exception as exc:
+            print(f"[recommend] stream failed: {type(exc).__name__}: {exc}")
+            yield _sse("error", {"detail": "Не получилось подобрать, попробуй ещё раз"})
+            return
+
+        availability_map: dict[str, dict] = {}
+        if region:
+            for movie in ordered:
+                av = resolved.get(movie.imdb_id)
+                if av is not None:
+                    availability_map[str(movie.id)] = av
+                    yield _sse("availability", {"movie_id": movie.id, "availability": av})
+        for next_done in asyncio.as_completed(pending):
+            movie, av = await next_done
+            if av is None:
+                continue
+            availability_map[str(movie.id)] = av
+            yield _sse("availability", {"movie_id": movie.id, "availability": av})
+
+        note = None
+        if region:
+            ordered, note = _apply_availability(
+                ordered, availability_map, services, only_available,
+            )
+        yield _sse("done", {
+            "movie_ids": [m.id for m in ordered[:MAX_RECOMMENDATIONS]],
+            "note": note,
+        })
+    finally:
+        # Клиент ушёл посреди потока — не оставляем висящие запросы в TMDb.
+        for task in pending:
+            task.cancel()
+
+
+@router.post("/stream")
+@limiter.limit("30/hour", key_func=user_or_ip_key)
+async def stream_recommendations(
+    request: Request,
+    payload: RecommendationRequest,
+    current_user: Optional[User] = Depends(get_current_user_optional),
+):
+    """Потоковые рекомендации (server-sent events), тот же вход, что у ``POST ""``.
+
+    Карточки появляются сразу после строки с ID, объяснение печатается по
+    токенам, бейджи доступности приходят по одному — формат событий см. в
+    ``_recommendation_events``. 401 без библиотеки и auth — до начала потока.
+    """
+    candidates = await _load_candidates(payload, current_user)
+    region, services, only_available = await _resolve_avail_prefs(payload, current_user)
+    preferred: list[int] = []
+    pool_checked = False
+    resolved: dict[str, Optional[dict]] = {}
+    if region and services and candidates:
+        verdicts, resolved = await _pool_availability(candidates, region, services)
+        candidates, preferred = _prefilter(candidates, verdicts, only_available)
+        pool_checked = only_available and len(preferred) == len(candidates)
+    return StreamingResponse(
+        _recommendation_events(
+            payload.query, candidates, region, services, only_available,
+            preferred, pool_checked, resolved,
+        ),
+        media_type="text/event-stream",
+        # Прокси (Railway/nginx) не должны буферизовать поток.
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -6,7 +6,7 @@
 from fastapi import APIRouter, Depends
 
 from backend import database as db
-from backend.auth import get_current_user
+from backend.auth import get_current_user, invalidate_user
 from backend.models import User, UserSettings, UserSettingsUpdate
 
 router = APIRouter(prefix="/api/settings", tags=["settings"])
@@ -27,4 +27,5 @@ async def update_settings(
         region=payload.region.upper() if payload.region else None,
         streaming_services=payload.streaming_services,
     )
+    invalidate_user(current_user.id)
     return UserSettings(**settings)
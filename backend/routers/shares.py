@@ -4,29 +4,36 @@ Two creation modes:
 - Authenticated: snapshot is taken from the user's current DB library at the
   moment of POST. The user's display name is captured for the share header.
 - Guest: client sends ``library`` inline (whatever's in localStorage). The
-  share gets an ``expires_at`` 90 days out so unclaimed guest snapshots don't
-  pile up.
+  share gets an ``expires_at`` 90 days out; expired ones are deleted by the
+  ``share_gc`` background job.
 
-Reads (``GET /api/shares/{slug}``) are public and increment a view counter.
+Snapshots are stored as references into a shared, compressed metadata store
+plus per-user fields (``services.share_snapshot``).
+
+Reads (``GET /api/shares/{slug}``) are public. Snapshots never change, so the
+rendered JSON is cached in-process (``services.share_cache``) and served with
+``ETag``/``Cache-Control``; views are counted in memory and flushed in batches.
 """
 
 from __future__ import annotations
 
-import json
 import secrets
 from datetime import datetime, timedelta
 from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 
+from backend import config
 from backend import database as db
 from backend.auth import get_current_user_optional
 from backend.models import (
-    Movie,
     SharedListCreateRequest,
     SharedListResponse,
     User,
 )
+from backend.responses import dumps, etag_matches
+from backend.services import share_cache, share_snapshot
+from backend.services.share_cache import RenderedShare
 
 
 router = APIRouter(prefix="/api/shares", tags=["shares"])
@@ -61,22 +68,6 @@ def _normalise_name(raw: str) -> str:
     return name[:MAX_NAME_LENGTH]
 
 
-def _movies_to_snapshot(movies: list[Movie]) -> str:
-    # ``user_note`` — личная заметка из дневника; в публичный шэр её не пускаем.
-    # ``user_rating`` оставляем: курируемый список «мои 5★» — это и есть фича.
-    return json.dumps(
-        [m.model_dump(mode="json", exclude={"user_note"}) for m in movies]
-    )
-
-
-def _snapshot_to_movies(snapshot: str) -> list[Movie]:
-    try:
-        raw = json.loads(snapshot)
-    except (TypeError, ValueError):
-        return []
-    return [Movie.model_validate(m) for m in raw if isinstance(m, dict)]
-
-
 @router.post("", response_model=SharedListResponse)
 async def create_shared_list(
     payload: SharedListCreateRequest,
@@ -110,13 +101,15 @@ async def create_shared_list(
         )
 
     slug = await _unique_slug()
-    snapshot_json = _movies_to_snapshot(movies)
+    items, metadata = share_snapshot.encode(movies)
     row = await db.create_share(
         slug=slug,
         owner_user_id=owner_user_id,
         name=name,
-        snapshot_json=snapshot_json,
+        snapshot_json="",
         expires_at=expires_at,
+        items=items,
+        metadata=metadata,
     )
 
     return SharedListResponse(
@@ -128,11 +121,15 @@ async def create_shared_list(
     )
 
 
-@router.get("/{slug}", response_model=SharedListResponse)
-async def get_shared_list(slug: str) -> SharedListResponse:
+async def _render_share(slug: str) -> Optional[RenderedShare]:
+    """Cached rendered response for ``slug``; builds and caches it on a miss."""
+    cached = share_cache.cache.get(slug)
+    if cached is not None:
+        return cached
+
     row = await db.get_share_by_slug(slug)
     if not row:
-        raise HTTPException(status_code=404, detail="Share not found or expired")
+        return None
 
     owner_name: Optional[str] = None
     if row["owner_user_id"]:
@@ -142,10 +139,34 @@ async def get_shared_list(slug: str) -> SharedListResponse:
                 owner_row.get("email", "").split("@")[0] or None
             )
 
-    return SharedListResponse(
+    response = SharedListResponse(
         slug=row["slug"],
         name=row["name"],
         owner_name=owner_name,
         created_at=row["created_at"],
-        movies=_snapshot_to_movies(row["snapshot"]),
+        movies=await share_snapshot.load(row),
+    )
+    return share_cache.cache.put(
+        slug, dumps(response.model_dump(mode="json")), row["expires_at"],
     )
+
+
+def _cache_headers(share: RenderedShare) -> dict[str, str]:
+    max_age = config.SHARE_HTTP_MAX_AGE
+    if share.expires_at is not None:
+        left = (share.expires_at - datetime.utcnow()).total_seconds()
+        max_age = max(0, min(max_age, int(left)))
+    return {"ETag": share.etag, "Cache-Control": f"public, max-age={max_age}"}
+
+
+@router.get("/{slug}", response_model=SharedListResponse)
+async def get_shared_list(slug: str, request: Request) -> Response:
+    share = await _render_share(slug)
+    if share is None:
+        raise HTTPException(status_code=404, detail="Share not found or expired")
+
+    share_cache.views.add(slug)
+    headers = _cache_headers(share)
+    if etag_matches(request, share.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=share.body, media_type="application/json", headers=headers)
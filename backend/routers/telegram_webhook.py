@@ -1,9 +1,13 @@
 """Telegram webhook endpoint — feeds updates into the in-process PTB Application.
 
 The bot runs inside the web process in production (see ``backend.main``
-lifespan): Telegram POSTs updates to ``/telegram/webhook/<secret>`` and we hand
-them to ``Application.process_update``. The secret path segment keeps random
-callers from injecting fake updates.
+lifespan): Telegram POSTs updates to ``/telegram/webhook/<secret>``. We parse
+the update, hand it to ``services.update_queue`` and acknowledge right away;
+workers feed it to ``Application.process_update`` in the background (deduped
+by ``update_id``, in order per chat). Answering before a slow handler (Reels
+wait on Apify for minutes) finishes stops Telegram from redelivering the same
+update. The secret path segment keeps random callers from injecting fake
+updates.
 
 When the bot isn't configured (no token / base URL), ``app.state.bot_app`` is
 None and this route returns 503 — harmless and inert.
@@ -15,6 +19,7 @@ from fastapi import APIRouter, HTTPException, Request
 from telegram import Update
 
 from backend.config import TELEGRAM_WEBHOOK_SECRET
+from backend.services.update_queue import queue as update_queue
 
 router = APIRouter(prefix="/telegram", tags=["telegram-webhook"])
 
@@ -25,7 +30,7 @@ async def telegram_webhook(secret: str, request: Request):
         raise HTTPException(status_code=403, detail="bad webhook secret")
 
     bot_app = getattr(request.app.state, "bot_app", None)
-    if bot_app is None:
+    if bot_app is None or not update_queue.running:
         raise HTTPException(status_code=503, detail="bot not running")
 
     try:
@@ -33,6 +38,14 @@ async def telegram_webhook(secret: str, request: Request):
     except Exception:
         raise HTTPException(status_code=400, detail="invalid JSON")
 
-    update = Update.de_json(data, bot_app.bot)
-    await bot_app.process_update(update)
+    try:
+        update = Update.de_json(data, bot_app.bot)
+    except Exception:
+        update = None
+    if update is None:
+        raise HTTPException(status_code=400, detail="invalid update")
+
+    if not update_queue.enqueue(update):
+        # Очередь полна — не теряем апдейт: Telegram повторит доставку.
+        raise HTTPException(status_code=503, detail="update queue is full")
     return {"ok": True}
@@ -0,0 +1,122 @@
+"""Инкрементальные агрегаты аналитики: дневные счётчики и сессии воронки.
+
+Запросы из ``docs/metrics.md`` (``sum(name = ...) GROUP BY date(ts)``) каждый
+раз проходят сырую таблицу ``events`` и медленнеют с её ростом. Периодическая
+задача сворачивает новые события в две маленькие таблицы:
+
+* ``event_daily`` — сколько событий каждого имени было у актора за день;
+* ``funnel_sessions`` — сессии актора (события с разрывом не больше
+  ``EVENTS_SESSION_GAP_MINUTES``) и докуда сессия дошла по воронке
+  ``FUNNEL_EVENTS``: «решающая» — дошедшая до ``launch_clicked`` по порядку.
+
+Прогресс — high-water mark (id последнего учтённого события) в ``app_meta``;
+он сдвигается в той же транзакции, что и агрегаты, поэтому прогон можно
+прервать в любой момент — событие не посчитается дважды. Свежие события (моложе
+``SETTLE_SECONDS``) ждут следующего прогона — вместе со всеми событиями после
+них по id: в Postgres транзакция с меньшим id может закоммититься позже, а
+буферы разных процессов сбрасывают события с более ранним ``ts`` позже.
+
+После сворачивания сырые события старше ``EVENTS_RETENTION_DAYS`` удаляются —
+но только уже учтённые в агрегатах.
+"""
+from __future__ import annotations
+
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Optional
+
+from backend import config
+from backend import database as db
+from backend.models.event import FUNNEL_EVENTS
+from backend.services import background
+
+BATCH_SIZE = 5000
+SETTLE_SECONDS = 60
+
+
+def _actor(event: dict) -> Optional[str]:
+    if event["user_id"] is not None:
+        return f"u:{event['user_id']}"
+    if event["anon_id"]:
+        return f"a:{event['anon_id']}"
+    return None
+
+
+def _advance(session: dict, event: dict) -> None:
+    """Учесть событие в сессии: продлить её и, если пора, сдвинуть воронку."""
+    session["last_at"] = max(session["last_at"], event["ts"])
+    name = event["name"]
+    if name in FUNNEL_EVENTS and FUNNEL_EVENTS.index(name) == session["stage"]:
+        session["stage"] += 1
+    if name == FUNNEL_EVENTS[0] and event["props"].get("onlyAvailable") is True:
+        session["only_available"] = True
+
+
+async def rollup_batch(
+    after_id: int, now: Optional[datetime] = None, limit: int = BATCH_SIZE,
+) -> int:
+    """Свернуть следующую порцию событий после ``after_id``.
+
+    Возвращает новый high-water mark — равен ``after_id``, если свернуть
+    нечего или порцию уже свернул другой процесс (тогда прогон закончится,
+    а следующий начнёт с актуального mark).
+    """
+    now = now or datetime.utcnow()
+    events = await db.get_events_for_rollup(
+        after_id, limit, now - timedelta(seconds=SETTLE_SECONDS),
+    )
+    if not events:
+        return after_id
+
+    gap = timedelta(minutes=config.EVENTS_SESSION_GAP_MINUTES)
+    daily: Counter = Counter()
+    actors = sorted({a for a in map(_actor, events) if a})
+    sessions = await db.get_last_funnel_sessions(actors) if actors else {}
+    touched: dict[tuple, dict] = {}
+    for event in events:
+        actor = _actor(event)
+        daily[(event["ts"].date(), actor or "", event["user_id"], event["name"])] += 1
+        if actor is None:
+            continue  # без идентичности сессию не собрать
+        session = sessions.get(actor)
+        if session is None or event["ts"] - session["last_at"] > gap:
+            session = sessions[actor] = {
+                "actor": actor, "user_id": event["user_id"],
+                "started_at": event["ts"], "last_at": event["ts"],
+                "stage": 0, "only_available": False,
+            }
+        _advance(session, event)
+        touched[(actor, session["started_at"])] = session
+
+    high_water_mark = events[-1]["id"]
+    applied = await db.apply_event_rollup(
+        [(*key, n) for key, n in daily.items()], list(touched.values()),
+        after_id, high_water_mark,
+    )
+    return high_water_mark if applied else after_id
+
+
+async def get_high_water_mark() -> int:
+    return int(await db.meta_get(db.EVENTS_ROLLUP_HWM_KEY) or 0)
+
+
+async def run_once() -> None:
+    """Свернуть всё накопившееся и подрезать старые сырые события.
+
+    Периодическая задача ``background.runner``.
+    """
+    hwm = await get_high_water_mark()
+    rolled = 0
+    while True:
+        new_hwm = await rollup_batch(hwm)
+        if new_hwm == hwm:
+            break
+        hwm = new_hwm
+        rolled += 1
+        background.report(high_water_mark=hwm)
+
+    pruned = 0
+    if config.EVENTS_RETENTION_DAYS > 0 and hwm:
+        cutoff = datetime.utcnow() - timedelta(days=config.EVENTS_RETENTION_DAYS)
+        pruned = await db.prune_events(cutoff, hwm)
+    background.report(high_water_mark=hwm, batches=rolled, pruned=pruned)
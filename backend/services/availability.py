@@ -3,24 +3,77 @@
 Используется и роутером ``/api/availability``, и подмешиванием доступности в
 ``/api/recommend``. Доступность per-тайтл+регион, поэтому кэш общий для всех
 пользователей (DRY: один запрос в TMDb покрывает всех, у кого этот фильм).
+
+Запрос пользователя в TMDb не ждёт, если в кэше хоть что-то есть:
+протухшая запись отдаётся сразу, а обновляется фоновой задачей
+(stale-while-revalidate). Синхронно в TMDb ходим только за тайтлами, которых в
+кэше нет совсем. Чтобы до протухания доходило поменьше записей, периодическая
+``refresh_due`` заранее обновляет те, что скоро истекут, — для тайтлов из
+библиотек, популярные первыми, с отдельным лимитом частоты.
 """
 from __future__ import annotations
 
+import asyncio
 from datetime import datetime, timedelta
 from typing import Optional
 
+from backend import config
 from backend import database as db
+from backend.services import background
+from backend.services.throttle import TokenBucket
 from backend.services.tmdb import tmdb_service
 
 
 # Провайдеры меняются редко; сутки — разумный компромисс между свежестью и
-# числом обращений к TMDb. Протухший кэш перезапрашиваем, при сбое — отдаём
-# протухшее (лучше слегка устаревшие бейджи, чем пустой экран).
+# числом обращений к TMDb. Протухший кэш отдаём и обновляем в фоне, при сбое
+# обновления остаётся протухшее (лучше слегка устаревшие бейджи, чем пустой экран).
 CACHE_TTL = timedelta(hours=24)
+REFRESH_AHEAD = timedelta(hours=config.AVAILABILITY_REFRESH_AHEAD_HOURS)
+# Фоновое обновление пишет в кэш пачками — прогресс не теряется при остановке.
+REFRESH_WRITE_BATCH = 50
+# Через сколько плановое обновление снова берёт запись, на которой TMDb не
+# ответил, — чтобы такие записи не занимали начало каждой пачки.
+REFRESH_RETRY_DELAY = timedelta(hours=1)
+
+# Общий на процесс лимит одновременных запросов в TMDb из фоновых обновлений
+# по запросу пользователя; у планового обновления — свой лимит частоты.
+_revalidate_slots = asyncio.Semaphore(config.AVAILABILITY_FETCH_CONCURRENCY)
+_revalidating: dict[tuple[str, str], asyncio.Task] = {}
+refresh_limiter = TokenBucket(config.AVAILABILITY_REFRESH_RATE_PER_SECOND)
+
+
+async def _fetch_and_store(imdb_id: str, region: str) -> Optional[dict]:
+    fresh = await tmdb_service.get_watch_providers(imdb_id, region)
+    if fresh is None:
+        return None
+    try:
+        await db.upsert_watch_providers_cache(imdb_id, region, fresh)
+    except Exception as exc:  # кэш — best-effort, не роняем ответ
+        print(f"[availability] cache upsert failed for {imdb_id}/{region}: {exc}")
+    return fresh
+
+
+def _revalidate(imdb_id: str, region: str) -> None:
+    """Обновить запись кэша в фоне; повторный вызов, пока она обновляется, — no-op."""
+    key = (imdb_id, region)
+    if key in _revalidating:
+        return
+
+    async def _run() -> None:
+        try:
+            async with _revalidate_slots:
+                await _fetch_and_store(imdb_id, region)
+        except Exception as exc:
+            print(f"[availability] revalidate failed for {imdb_id}/{region}: {exc}")
+        finally:
+            _revalidating.pop(key, None)
+
+    _revalidating[key] = asyncio.get_running_loop().create_task(_run())
 
 
 async def get_availability(imdb_id: str, region: str) -> Optional[dict]:
-    """Доступность тайтла в регионе: свежий кэш → fetch → upsert.
+    """Доступность тайтла в регионе: кэш (протухший — с обновлением в фоне)
+    или, если записи нет, fetch → upsert.
 
     None только если данных нет совсем (TMDb выключен / ключ нерезолвим /
     сетевая ошибка и пустой кэш). Иначе — нормализованный dict (см. tmdb)."""
@@ -28,19 +81,105 @@ async def get_availability(imdb_id: str, region: str) -> Optional[dict]:
     cached = await db.get_watch_providers_cache(imdb_id, region)
     if cached:
         payload, fetched_at = cached
-        if datetime.utcnow() - fetched_at < CACHE_TTL:
-            return payload
+        if datetime.utcnow() - fetched_at >= CACHE_TTL:
+            _revalidate(imdb_id, region)
+        return payload
+    return await _fetch_and_store(imdb_id, region)
 
-    fresh = await tmdb_service.get_watch_providers(imdb_id, region)
-    if fresh is None:
-        # Запрос не удался — отдаём протухший кэш, если он есть.
-        return cached[0] if cached else None
+
+async def get_availability_many(
+    imdb_ids: list[str], region: str, max_fetches: Optional[int] = None,
+) -> dict[str, Optional[dict]]:
+    """Доступность пачки тайтлов: то же, что ``get_availability`` по каждому,
+    но кэш читается одним запросом, в TMDb синхронно идут только отсутствующие
+    (параллельно, не больше ``AVAILABILITY_FETCH_CONCURRENCY`` разом), а их
+    ответы пишутся в кэш одной транзакцией.
+
+    Ключи ответа — уникальные ``imdb_ids`` в исходном порядке. С
+    ``max_fetches`` в TMDb идут только первые столько отсутствующих, остальных
+    в ответе нет вовсе (не путать с None — «проверили, данных нет»).
+    """
+    region = (region or "RU").upper()
+    imdb_ids = list(dict.fromkeys(imdb_ids))
+    cached = await db.get_watch_providers_cache_many(imdb_ids, region) if imdb_ids else {}
+    now = datetime.utcnow()
+    result: dict[str, Optional[dict]] = {}
+    missing: list[str] = []
+    for imdb_id in imdb_ids:
+        hit = cached.get(imdb_id)
+        if hit is None:
+            missing.append(imdb_id)
+            continue
+        result[imdb_id] = hit[0]
+        if now - hit[1] >= CACHE_TTL:
+            _revalidate(imdb_id, region)
+
+    if max_fetches is not None:
+        skipped = set(missing[max_fetches:])
+        missing = missing[:max_fetches]
+        imdb_ids = [i for i in imdb_ids if i not in skipped]
+
+    semaphore = asyncio.Semaphore(config.AVAILABILITY_FETCH_CONCURRENCY)
+
+    async def _fetch(imdb_id: str) -> Optional[dict]:
+        async with semaphore:
+            return await tmdb_service.get_watch_providers(imdb_id, region)
+
+    fetched = await asyncio.gather(*(_fetch(i) for i in missing))
+    result.update(zip(missing, fetched))
+    fresh = {i: p for i, p in zip(missing, fetched) if p is not None}
 
     try:
-        await db.upsert_watch_providers_cache(imdb_id, region, fresh)
+        await db.upsert_watch_providers_cache_many(region, fresh)
     except Exception as exc:  # кэш — best-effort, не роняем ответ
-        print(f"[availability] cache upsert failed for {imdb_id}/{region}: {exc}")
-    return fresh
+        print(f"[availability] batch cache upsert failed ({len(fresh)}/{region}): {exc}")
+    return {imdb_id: result[imdb_id] for imdb_id in imdb_ids}
+
+
+async def refresh_due() -> None:
+    """Заранее обновить записи кэша, которым меньше ``REFRESH_AHEAD`` до истечения.
+
+    Периодическая задача ``background.runner``. Берёт до
+    ``AVAILABILITY_REFRESH_BATCH`` записей за прогон (популярные в библиотеках
+    первыми), частоту держит ``refresh_limiter``. Неудачный запрос оставляет
+    данные записи как есть (пользователь может обновить её и сам), а плановое
+    обновление откладывает на ``REFRESH_RETRY_DELAY``.
+    """
+    if not tmdb_service.enabled:
+        return
+    now = datetime.utcnow()
+    due = await db.get_watch_providers_due(
+        now - (CACHE_TTL - REFRESH_AHEAD), config.AVAILABILITY_REFRESH_BATCH, now,
+    )
+    refreshed = failed = 0
+    pending: dict[str, dict[str, dict]] = {}  # region → {imdb_id: payload}
+    deferred: list[tuple[str, str]] = []
+
+    async def _write() -> None:
+        for region, payloads in pending.items():
+            await db.upsert_watch_providers_cache_many(region, payloads)
+        pending.clear()
+        await db.defer_watch_providers_refresh(
+            deferred, datetime.utcnow() + REFRESH_RETRY_DELAY,
+        )
+        deferred.clear()
+
+    for n, (imdb_id, region) in enumerate(due, 1):
+        if (imdb_id, region) in _revalidating:
+            continue  # уже обновляется по запросу пользователя
+        await refresh_limiter.acquire()
+        fresh = await tmdb_service.get_watch_providers(imdb_id, region)
+        if fresh is None:
+            deferred.append((imdb_id, region))
+            failed += 1
+        else:
+            pending.setdefault(region, {})[imdb_id] = fresh
+            refreshed += 1
+        if sum(map(len, pending.values())) + len(deferred) >= REFRESH_WRITE_BATCH:
+            await _write()
+            background.report(due=len(due), checked=n, refreshed=refreshed, failed=failed)
+    await _write()
+    background.report(due=len(due), checked=len(due), refreshed=refreshed, failed=failed)
 
 
 def is_available_on(availability: Optional[dict], services: list[int]) -> bool:
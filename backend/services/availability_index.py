@@ -0,0 +1,171 @@
+"""Офлайн-индекс доступности: какие тайтлы есть по подписке у провайдера.
+
+Кэш ``watch_providers`` заполняется по одному тайтлу и только для тех, что
+уже показывали, — фильтр «только доступное» в ``/api/recommend`` поэтому
+работал лишь по горстке рекомендованных фильмов. Индекс строится заранее из
+``/discover/movie|tv?with_watch_providers=…`` TMDb: для каждой пары
+регион+провайдер, выбранной хоть одним пользователем, и каждого вида тайтла —
+битсет по TMDb id (бит ``id`` выставлен — тайтл доступен по подписке).
+Проверка членства — O(1), и её можно прогнать по всему пулу кандидатов до
+вызова LLM.
+
+Битсеты хранятся в ``availability_index`` сжатыми zlib (id разрежены — сжатие
+в десятки раз) и держатся в памяти процесса распакованными; перечитываются
+раз в ``RELOAD_SECONDS`` (индекс строит другой процесс или скрипт). IMDb id
+кандидата переводится в TMDb-ссылку через ``title_refs``.
+
+Ответ проверки — три состояния: True (есть у одного из сервисов), False
+(индекс полон и тайтла в нём нет) и None (не знаем: нет ссылки на TMDb, сервис
+не проиндексирован или обход упёрся в лимит страниц) — такие кандидаты
+фильтром не выкидываются.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+import zlib
+from typing import Iterable, Optional
+
+from backend import config
+from backend import database as db
+from backend.services import background
+from backend.services.throttle import TokenBucket
+from backend.services.tmdb import parse_tmdb_key, tmdb_service
+
+KINDS = ("movie", "tv")
+RELOAD_SECONDS = 600
+
+rate_limiter = TokenBucket(config.AVAILABILITY_INDEX_RATE_PER_SECOND)
+
+
+def pack_ids(ids: Iterable[int]) -> bytes:
+    """Множество TMDb id → сжатый битсет."""
+    ids = list(ids)
+    bits = bytearray((max(ids) >> 3) + 1 if ids else 0)
+    for i in ids:
+        bits[i >> 3] |= 1 << (i & 7)
+    return zlib.compress(bytes(bits), 9)
+
+
+def has_id(bits: bytes, tmdb_id: int) -> bool:
+    """Выставлен ли бит ``tmdb_id`` в распакованном битсете."""
+    byte = tmdb_id >> 3
+    return byte < len(bits) and bool(bits[byte] >> (tmdb_id & 7) & 1)
+
+
+class AvailabilityIndex:
+    def __init__(self) -> None:
+        # (region, provider_id, kind) → (распакованный битсет, complete)
+        self._bitmaps: dict[tuple[str, int, str], tuple[bytes, bool]] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    def invalidate(self) -> None:
+        self._loaded_at = None
+
+    async def _ensure_loaded(self) -> None:
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < RELOAD_SECONDS:
+            return
+        async with self._lock:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at < RELOAD_SECONDS:
+                return
+            rows = await db.get_availability_index()
+            self._bitmaps = {
+                (r["region"], r["provider_id"], r["kind"]): (
+                    zlib.decompress(r["bitmap"]), r["complete"],
+                )
+                for r in rows
+            }
+            self._loaded_at = time.monotonic()
+
+    def _check(
+        self, ref: tuple[str, str], region: str, services: list[int],
+    ) -> Optional[bool]:
+        kind, tmdb_id = ref
+        unknown = False
+        for provider_id in services:
+            entry = self._bitmaps.get((region, provider_id, kind))
+            if entry is None:
+                unknown = True
+                continue
+            bits, complete = entry
+            if has_id(bits, int(tmdb_id)):
+                return True
+            unknown = unknown or not complete
+        return None if unknown else False
+
+    async def check_many(
+        self, imdb_ids: list[str], region: str, services: list[int],
+    ) -> dict[str, Optional[bool]]:
+        """Доступен ли каждый тайтл по подписке на одном из ``services``.
+
+        ``{imdb_id: True | False | None}``; None — индекс не знает (см. модуль).
+        """
+        region = region.upper()
+        if not imdb_ids or not services:
+            return {i: None for i in imdb_ids}
+        try:
+            await self._ensure_loaded()
+            refs = {i: parse_tmdb_key(i) for i in imdb_ids}
+            stored = await db.get_title_refs([i for i, r in refs.items() if r is None])
+        except Exception as exc:  # индекс — ускорение, без него просто «не знаем»
+            print(f"[availability-index] lookup failed: {exc}")
+            return {i: None for i in imdb_ids}
+        refs.update(stored)
+        return {
+            i: self._check(ref, region, services) if ref else None
+            for i, ref in refs.items()
+        }
+
+    def snapshot(self) -> dict[str, int]:
+        return {
+            "bitmaps": len(self._bitmaps),
+            "bytes": sum(len(bits) for bits, _ in self._bitmaps.values()),
+        }
+
+
+async def _crawl(kind: str, region: str, provider_id: int) -> Optional[tuple[list[int], bool]]:
+    """Все TMDb id провайдера постранично; ``(ids, complete)`` или None при сбое."""
+    ids: set[int] = set()
+    page, total = 1, 1
+    while page <= min(total, config.AVAILABILITY_INDEX_MAX_PAGES):
+        await rate_limiter.acquire()
+        result = await tmdb_service.discover_by_provider(kind, region, provider_id, page)
+        if result is None:
+            return None
+        page_ids, total = result
+        ids.update(page_ids)  # страницы по популярности могут сдвинуться
+        page += 1
+    return sorted(ids), total <= config.AVAILABILITY_INDEX_MAX_PAGES
+
+
+async def build_index() -> None:
+    """Перестроить индекс для всех пар регион+провайдер из настроек пользователей.
+
+    Периодическая задача ``background.runner`` и ``scripts/build_availability_index.py``.
+    Пара, обход которой сорвался, сохраняет прежний битсет.
+    """
+    if not tmdb_service.enabled:
+        return
+    targets = await db.get_provider_targets()
+    built = failed = titles = 0
+    for region, providers in sorted(targets.items()):
+        for provider_id in sorted(providers):
+            for kind in KINDS:
+                crawled = await _crawl(kind, region, provider_id)
+                if crawled is None:
+                    failed += 1
+                    continue
+                ids, complete = crawled
+                await db.save_availability_index(
+                    region, provider_id, kind, pack_ids(ids), len(ids), complete,
+                )
+                built += 1
+                titles += len(ids)
+                background.report(built=built, failed=failed, titles=titles)
+    index.invalidate()
+    background.report(regions=len(targets), built=built, failed=failed, titles=titles)
+
+
+# Синглтон для использования в приложении
+index = AvailabilityIndex()
@@ -0,0 +1,116 @@
+"""Каталог наград в памяти — неизменяемый снимок вместо ``db.get_awards()``.
+
+Каталог (``user_id IS NULL AND source='awards'``) меняется только при синке
+(``awards_seed.sync_awards_catalog``) и при дописывании перевода сюжета
+(``set_plot_ru``). Поэтому ``/api/awards`` и ``/api/recommend`` читают готовый
+снимок без обращения к БД: строки уже отсортированы, JSON жанров/актёров уже
+разобран в ``Movie``, строка-кандидат для промпта LLM уже отформатирована,
+JSON-представление строк для ответа ``/api/awards`` уже собрано.
+
+Снимок подменяется целиком (атомарно для asyncio): читатели, получившие старый,
+спокойно дорабатывают со старым. Первый запрос до синка грузит снимок лениво.
+Ленивая загрузка, начатая посреди синка, может закончиться уже после
+``refresh()`` в конце синка — её частичный снимок тогда не ставится: побеждает
+последний начатый ``refresh()``.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping, Optional
+
+from backend import database as db
+from backend.models.movie import Movie
+from backend.services.prompt_lines import movie_prompt_line
+
+
+@dataclass(frozen=True)
+class AwardsSnapshot:
+    """Снимок каталога: фильмы в порядке выдачи + строки для промпта.
+
+    ``prompt_lines`` — по ключу ``(id, imdb_id)``: inline-библиотека гостя может
+    прислать чужой фильм с тем же id, и он не должен получить строку каталога.
+    ``rows`` — те же фильмы в ``model_dump(mode="json")``: эндпоинт отдаёт их
+    напрямую, без повторной валидации и сериализации pydantic.
+    Объекты ``Movie`` и dict'ы общие для всех читателей — их не мутируем.
+    """
+    movies: tuple[Movie, ...]
+    prompt_lines: Mapping[tuple[int, str], str]
+    rows: tuple[dict, ...] = ()
+
+
+_snapshot: Optional[AwardsSnapshot] = None
+_generation = 0  # номер последнего начатого refresh()
+
+
+def _build(movies: list[Movie]) -> AwardsSnapshot:
+    return AwardsSnapshot(
+        movies=tuple(movies),
+        prompt_lines=MappingProxyType(
+            {(m.id, m.imdb_id): movie_prompt_line(m) for m in movies}
+        ),
+        rows=tuple(m.model_dump(mode="json") for m in movies),
+    )
+
+
+async def refresh() -> AwardsSnapshot:
+    """Перечитать каталог из БД и подменить снимок. Зовётся после синка."""
+    global _snapshot, _generation
+    _generation += 1
+    generation = _generation
+    snapshot = _build(await db.get_awards())
+    if generation != _generation:
+        return snapshot  # пока читали, начался refresh посвежее — он и подменит
+    _snapshot = snapshot
+    print(f"[awards_catalog] снимок обновлён: {len(snapshot.movies)} фильмов", flush=True)
+    return snapshot
+
+
+async def get_snapshot() -> AwardsSnapshot:
+    """Текущий снимок; до первого синка — ленивая загрузка (один раз)."""
+    return _snapshot if _snapshot is not None else await refresh()
+
+
+async def get_awards(limit: Optional[int] = None) -> list[Movie]:
+    """Каталог лауреатов, свежие награды сверху — как ``db.get_awards``."""
+    movies = (await get_snapshot()).movies
+    return list(movies[:limit] if limit else movies)
+
+
+async def get_award_rows(limit: Optional[int] = None) -> list[dict]:
+    """То же, что ``get_awards``, но готовыми к JSON dict'ами."""
+    rows = (await get_snapshot()).rows
+    return list(rows[:limit] if limit else rows)
+
+
+def prompt_line(movie: Movie) -> Optional[str]:
+    """Готовая строка-кандидат для фильма каталога или None (не из каталога /
+    снимок ещё не загружен). Синхронно — вызывается из сборки промпта."""
+    if _snapshot is None:
+        return None
+    return _snapshot.prompt_lines.get((movie.id, movie.imdb_id))
+
+
+def apply_plot_ru(translations: Mapping[int, str]) -> None:
+    """Отразить пачку ``db.set_plot_ru`` (``{movie_id: plot_ru}``) в снимке без
+    перечитывания всей таблицы — одной подменой снимка на пачку.
+
+    Фильмы не из каталога (личные записи) пропускаются.
+    """
+    global _snapshot
+    if _snapshot is None or not translations:
+        return
+    if not any(m.id in translations for m in _snapshot.movies):
+        return
+    # plot_ru в строку промпта не входит — строки переиспользуем как есть.
+    _snapshot = AwardsSnapshot(
+        movies=tuple(
+            m.model_copy(update={"plot_ru": translations[m.id]}) if m.id in translations else m
+            for m in _snapshot.movies
+        ),
+        prompt_lines=_snapshot.prompt_lines,
+        rows=tuple(
+            {**r, "plot_ru": translations[r["id"]]} if r["id"] in translations else r
+            for r in _snapshot.rows
+        ),
+    )
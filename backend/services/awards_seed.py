@@ -1,22 +1,38 @@
 import asyncio
+import hashlib
 import json
 import os
+import time
 from typing import Optional
 
 from backend import database as db
+from backend.config import AWARDS_SEED_CONCURRENCY, LLM_TRANSLATE_CONCURRENCY
+from backend.services import awards_catalog, background
 from backend.services.llm import llm_service
+from backend.services.omdb_backfill import MEDIA_TYPE_JOB, RUNTIME_JOB, run_backfill
 from backend.services.omdb import omdb_service
 
 
 CATALOG_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "awards_catalog.json")
 
 
+# Синк идёт чанками: внутри чанка — параллельно (под семафором и общим
+# rate-limit OMDB), после чанка — чекпоинт в app_meta. Перезапуск посреди
+# синка продолжает с последнего чекпоинта, а не перезапрашивает промахи OMDB.
+# Чекпоинт не уходит дальше первой записи, на которой запрос упал (сеть,
+# 5xx): такие записи — не промах, следующий синк повторит их.
+SEED_CHUNK_SIZE = 50
+CHECKPOINT_KEY = "awards_seed_checkpoint"
+# Сколько готовых переводов plot_ru копить перед подменой снимка каталога.
+PLOT_RU_SNAPSHOT_BATCH = 100
+
+
 async def _ingest_one(imdb_id: str, award: str, award_year: Optional[int]) -> bool:
-    """Возвращает True, если фильм добавлен; False — если уже был или не найден в OMDB."""
-    existing = await db.get_award_by_imdb_id(imdb_id)
-    if existing:
-        return False
+    """Возвращает True, если фильм добавлен; False — если OMDB его не знает.
 
+    Проверку «уже есть в каталоге» делает вызывающий — одним запросом на весь
+    каталог (``db.get_award_imdb_ids``), а не по запросу на фильм.
+    """
     movie_base = await omdb_service.get_movie_by_id(imdb_id)
     if not movie_base:
         print(f"[awards_seed] OMDB не вернул данные для {imdb_id}, пропускаю")
@@ -33,40 +49,95 @@ async def _ingest_one(imdb_id: str, award: str, award_year: Optional[int]) -> bo
     return True
 
 
+async def _load_checkpoint(catalog_hash: str) -> int:
+    """Смещение, до которого каталог уже пройден. Другой файл каталога — с нуля."""
+    raw = await db.meta_get(CHECKPOINT_KEY)
+    if not raw:
+        return 0
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        return 0
+    return int(data.get("offset", 0)) if data.get("catalog") == catalog_hash else 0
+
+
 async def sync_awards_catalog() -> None:
     """Идемпотентно подгружает фильмы из awards_catalog.json в БД.
 
     Для каждой записи: если фильма с этим IMDb ID ещё нет — добавляем
     с source='awards', in_library=False. Существующие записи не трогаем.
+
+    Какие фильмы уже есть — один запрос на весь каталог. Недостающие тянем из
+    OMDB параллельно (``AWARDS_SEED_CONCURRENCY``), частоту держат token
+    bucket'ы ``omdb_service`` (фоновый и общий) вместо фиксированных пауз. Прогресс —
+    чекпоинт по чанкам в app_meta.
     """
     if not os.path.exists(CATALOG_PATH):
         print(f"[awards_seed] Файл каталога не найден: {CATALOG_PATH}")
         return
 
-    with open(CATALOG_PATH, "r", encoding="utf-8") as f:
-        entries = json.load(f)
-
-    added = 0
-    for entry in entries:
-        imdb_id = entry.get("imdb_id")
-        if not imdb_id:
-            continue
-        try:
-            ok = await _ingest_one(
-                imdb_id,
-                entry.get("award", ""),
-                entry.get("award_year"),
+    with open(CATALOG_PATH, "rb") as f:
+        raw = f.read()
+    entries = json.loads(raw.decode("utf-8"))
+    catalog_hash = hashlib.sha1(raw).hexdigest()
+
+    existing = await db.get_award_imdb_ids()
+    offset = await _load_checkpoint(catalog_hash)
+    semaphore = asyncio.Semaphore(AWARDS_SEED_CONCURRENCY)
+    started = time.monotonic()
+
+    async def _guarded(entry: dict) -> Optional[bool]:
+        """True — добавлен, False — OMDB его не знает, None — запрос упал."""
+        imdb_id = entry["imdb_id"]
+        async with semaphore:
+            try:
+                return await _ingest_one(
+                    imdb_id,
+                    entry.get("award", ""),
+                    entry.get("award_year"),
+                )
+            except Exception as exc:
+                print(f"[awards_seed] Ошибка при обработке {imdb_id}: {exc}")
+                return None
+
+    added = failed = 0
+    first_failed: Optional[int] = None
+    try:
+        for chunk_start in range(offset, len(entries), SEED_CHUNK_SIZE):
+            chunk = entries[chunk_start:chunk_start + SEED_CHUNK_SIZE]
+            todo: list[tuple[int, dict]] = []
+            for position, entry in enumerate(chunk, start=chunk_start):
+                imdb_id = entry.get("imdb_id")
+                # Дубликаты внутри файла тоже отсекаем: второй add_movie с тем же
+                # imdb_id дал бы вторую строку каталога.
+                if imdb_id and imdb_id not in existing:
+                    existing.add(imdb_id)
+                    todo.append((position, entry))
+            results = await asyncio.gather(*(_guarded(e) for _, e in todo))
+            for (position, _), result in zip(todo, results):
+                if result is None:
+                    failed += 1
+                    if first_failed is None:
+                        first_failed = position
+                elif result:
+                    added += 1
+            background.report(
+                processed=chunk_start + len(chunk), total=len(entries),
+                added=added, failed=failed,
             )
-            if ok:
-                added += 1
-                # маленькая пауза, чтобы не долбить OMDB
-                await asyncio.sleep(0.2)
-        except Exception as exc:
-            print(f"[awards_seed] Ошибка при обработке {imdb_id}: {exc}")
-
-    print(f"[awards_seed] Синк завершён: добавлено {added} из {len(entries)} записей")
-
-    await backfill_plot_ru()
+            await db.meta_set(CHECKPOINT_KEY, json.dumps({
+                "catalog": catalog_hash,
+                "offset": first_failed if first_failed is not None else chunk_start + len(chunk),
+            }))
+    finally:
+        # И при сбое посреди синка: добавленное должно попасть в снимок, а
+        # ленивый снимок, собранный по запросу до конца синка, — замениться.
+        await awards_catalog.refresh()
+
+    print(
+        f"[awards_seed] Синк завершён: добавлено {added} из {len(entries)} записей, "
+        f"ошибок {failed}, за {time.monotonic() - started:.1f}s"
+    )
 
 
 async def backfill_media_type() -> None:
@@ -74,33 +145,17 @@ async def backfill_media_type() -> None:
     Type и проставляет media_type='series' там, где это сериал.
 
     Нужен, потому что распознавание сериалов появилось позже, чем накопилась
-    библиотека — у старых строк media_type лежит дефолтное 'movie'. Гейтим
-    маркером в app_meta, чтобы пройтись один раз и не дёргать OMDB на каждом
-    деплое (для фильмов media_type='movie' — легитимное значение, по нему
-    «непроклассифицированные» не отличить)."""
+    библиотека — у старых строк media_type лежит дефолтное 'movie'. Проход
+    разовый (``MEDIA_TYPE_JOB.once``): для фильмов media_type='movie' —
+    легитимное значение, по нему «непроклассифицированные» не отличить.
+    Тем же запросом к OMDB дозаполняются runtime/awards/рейтинг.
+    """
+    # Маркер из версии до общего движка: там проход уже сделан целиком.
     if await db.meta_get("media_type_backfilled") == "1":
         return
-
-    imdb_ids = await db.get_all_movie_imdb_ids()
-    if not imdb_ids:
+    result = await run_backfill(MEDIA_TYPE_JOB)
+    if result.done:
         await db.meta_set("media_type_backfilled", "1")
-        return
-
-    print(f"[media_type] классифицирую {len(imdb_ids)} тайтлов")
-    changed = 0
-    for imdb_id in imdb_ids:
-        try:
-            movie = await omdb_service.get_movie_by_id(imdb_id)
-            if movie and movie.media_type == "series":
-                changed += await db.set_media_type_by_imdb(imdb_id, "series")
-            await asyncio.sleep(0.2)  # не долбим OMDB
-        except Exception as exc:
-            print(f"[media_type] не удалось обработать {imdb_id}: {exc}")
-
-    # Ставим маркер в любом случае — разовый проход; редкие промахи (OMDB лежал)
-    # всегда можно добить руками через scripts/backfill_media_type.py.
-    await db.meta_set("media_type_backfilled", "1")
-    print(f"[media_type] сериалов проставлено: {changed}")
 
 
 async def backfill_runtime() -> None:
@@ -110,38 +165,49 @@ async def backfill_runtime() -> None:
     OMDB не знает». Каждый старт добивает до 300 непроверенных записей и
     естественно затухает, когда NULL-ов не остаётся.
     """
-    imdb_ids = await db.get_imdb_ids_missing_runtime(limit=300)
-    if not imdb_ids:
-        return
-
-    print(f"[runtime] дозаполняю длительность: {len(imdb_ids)} тайтлов")
-    filled = 0
-    for imdb_id in imdb_ids:
-        try:
-            movie = await omdb_service.get_movie_by_id(imdb_id)
-            # 0 пишем тоже — это маркер «проверено, данных нет».
-            runtime = movie.runtime if movie and movie.runtime is not None else 0
-            filled += await db.set_runtime_by_imdb(imdb_id, runtime)
-            await asyncio.sleep(0.2)  # не долбим OMDB
-        except Exception as exc:
-            print(f"[runtime] не удалось обработать {imdb_id}: {exc}")
-    print(f"[runtime] заполнено строк: {filled}")
+    await run_backfill(RUNTIME_JOB)
 
 
 async def backfill_plot_ru() -> None:
-    """Переводит plot на русский для всех фильмов, где plot_ru ещё пуст."""
+    """Переводит plot на русский для всех фильмов, где plot_ru ещё пуст.
+
+    Переводы идут параллельно, не больше ``LLM_TRANSLATE_CONCURRENCY`` разом.
+    Чекпоинт не нужен: каждый перевод сразу пишется в БД, и перезапуск
+    подхватит только оставшиеся пустые plot_ru. В снимок каталога переводы
+    попадают пачками по ``PLOT_RU_SNAPSHOT_BATCH`` — снимок не пересобирается
+    на каждый фильм.
+    """
     movies = await db.get_movies_missing_plot_ru()
     if not movies:
         return
     print(f"[awards_seed] Перевожу описания на русский: {len(movies)} фильмов")
-    translated = 0
-    for m in movies:
-        try:
-            ru = await llm_service.translate_plot(m.plot or "", m.title)
-            if ru:
+    semaphore = asyncio.Semaphore(LLM_TRANSLATE_CONCURRENCY)
+    done: dict[int, str] = {}  # переведено, но ещё не в снимке
+
+    async def _translate(m) -> bool:
+        async with semaphore:
+            try:
+                ru = await llm_service.translate_plot(m.plot or "", m.title)
+                if not ru:
+                    return False
                 await db.set_plot_ru(m.id, ru)
-                translated += 1
-            await asyncio.sleep(0.2)
-        except Exception as exc:
-            print(f"[awards_seed] Не удалось перевести {m.imdb_id}: {exc}")
+                done[m.id] = ru
+                if len(done) >= PLOT_RU_SNAPSHOT_BATCH:
+                    awards_catalog.apply_plot_ru(done)
+                    done.clear()
+                return True
+            except Exception as exc:
+                print(f"[awards_seed] Не удалось перевести {m.imdb_id}: {exc}")
+                return False
+
+    translated = 0
+
+    async def _counted(m) -> None:
+        nonlocal translated
+        if await _translate(m):
+            translated += 1
+            background.report(translated=translated, total=len(movies))
+
+    await asyncio.gather(*(_counted(m) for m in movies))
+    awards_catalog.apply_plot_ru(done)
     print(f"[awards_seed] Переведено {translated} из {len(movies)}")
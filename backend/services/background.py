@@ -0,0 +1,148 @@
+"""Фоновые задачи старта: синк наград, переводы, бэкфиллы — вне критического пути.
+
+``lifespan`` делает только ``init_db`` и отдаёт приложение в работу; всё, что
+ходит в OMDB/LLM, запускается здесь фоновой задачей и не может задержать
+health-check (на пустой БД синк с переводами идёт минутами, и Railway
+успевал перезапустить контейнер).
+
+Раннер «присматривает» за задачами: ловит и логирует исключения (одна упавшая
+задача не валит остальные), ведёт статус и прогресс для ``/api/health/full``,
+на остановке приложения отменяет незавершённое. Задачи одного конвейера
+(``run_pipeline``) идут строго по очереди — они делят квоту OMDB.
+Периодические (``run_periodic``) повторяются с паузой до остановки; статус —
+последнего прогона.
+
+Прогресс задача сообщает сама через ``report(...)``, не зная своего имени:
+имя текущей задачи лежит в contextvar.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional
+
+_current: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "background_task", default=None,
+)
+
+
+@dataclass
+class TaskStatus:
+    state: str = "pending"  # pending / running / ok / failed / cancelled
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+    progress: dict[str, Any] = field(default_factory=dict)
+
+    def as_dict(self, with_error: bool = True) -> dict[str, Any]:
+        end = self.finished_at or time.monotonic()
+        data = {
+            "state": self.state,
+            "seconds": round(end - self.started_at, 1) if self.started_at else None,
+            "progress": dict(self.progress),
+        }
+        if with_error:
+            data["error"] = self.error
+        return data
+
+
+def current_task() -> Optional[str]:
+    """Имя фоновой задачи, в которой идёт вызов; вне раннера — None."""
+    return _current.get()
+
+
+class BackgroundRunner:
+    def __init__(self) -> None:
+        self.statuses: dict[str, TaskStatus] = {}
+        self._tasks: list[asyncio.Task] = []
+        self.startup_ms: Optional[float] = None
+
+    def report(self, **progress: Any) -> None:
+        """Обновить прогресс текущей задачи (вне раннера — no-op)."""
+        name = _current.get()
+        if name and name in self.statuses:
+            self.statuses[name].progress.update(progress)
+
+    async def _run_one(self, name: str, func: Callable[[], Awaitable[Any]]) -> None:
+        status = self.statuses[name]
+        status.state = "running"
+        status.started_at = time.monotonic()
+        token = _current.set(name)
+        try:
+            await func()
+            status.state = "ok"
+        except asyncio.CancelledError:
+            status.state = "cancelled"
+            raise
+        except Exception as exc:
+            status.state = "failed"
+            status.error = f"{type(exc).__name__}: {exc}"
+            print(f"[background] {name} упал: {status.error}", flush=True)
+        finally:
+            status.finished_at = time.monotonic()
+            _current.reset(token)
+            if status.state != "cancelled":
+                print(
+                    f"[background] {name}: {status.state} за "
+                    f"{status.finished_at - status.started_at:.1f}s",
+                    flush=True,
+                )
+
+    def run_pipeline(
+        self, steps: list[tuple[str, Callable[[], Awaitable[Any]]]],
+    ) -> asyncio.Task:
+        """Запустить шаги по очереди в одной фоновой задаче.
+
+        Упавший шаг помечается failed, следующие всё равно выполняются — они
+        независимы по данным (бэкфиллы не ждут, пока досинкается каталог).
+        """
+        for name, _ in steps:
+            self.statuses[name] = TaskStatus()
+
+        async def _pipeline() -> None:
+            for name, func in steps:
+                await self._run_one(name, func)
+
+        task = asyncio.create_task(_pipeline())
+        self._tasks.append(task)
+        return task
+
+    def run_periodic(
+        self, name: str, func: Callable[[], Awaitable[Any]], interval: float,
+    ) -> asyncio.Task:
+        """Запускать задачу каждые ``interval`` секунд (первый раз — сразу).
+
+        Упавший прогон помечается failed, расписание продолжается.
+        """
+        self.statuses[name] = TaskStatus()
+
+        async def _loop() -> None:
+            while True:
+                await self._run_one(name, func)
+                await asyncio.sleep(interval)
+
+        task = asyncio.create_task(_loop())
+        self._tasks.append(task)
+        return task
+
+    async def shutdown(self) -> None:
+        """Отменить незавершённые задачи и дождаться их (на остановке приложения)."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def snapshot(self, with_errors: bool = True) -> dict[str, Any]:
+        """Состояние задач. ``with_errors=False`` — без текста исключений
+        (он может содержать URL, ключи, пути) для публичных ответов."""
+        return {
+            "startup_ms": self.startup_ms,
+            "tasks": {name: s.as_dict(with_errors) for name, s in self.statuses.items()},
+        }
+
+
+# Синглтон для использования в приложении
+runner = BackgroundRunner()
+report = runner.report
@@ -0,0 +1,116 @@
+"""Буфер аналитических событий: приём без ожидания БД, запись пачками.
+
+Раньше каждое действие в боте (``track_bot``) и каждый ``POST /api/events``
+ждали ``db.insert_events`` прямо в обработчике — на SQLite это новое
+соединение и commit (fsync) на каждое событие. Теперь ``add`` только кладёт
+строки в память и возвращается сразу; фоновая задача сбрасывает их в БД
+одной вставкой — по размеру (``EVENT_FLUSH_BATCH``) или по таймеру
+(``EVENT_FLUSH_INTERVAL``), что наступит раньше.
+
+Память ограничена ``EVENT_BUFFER_MAX``: если БД не успевает (или лежит) и
+буфер полон, новые события отбрасываются со счётчиком ``dropped`` — аналитика
+best-effort и не должна ни тормозить, ни раздувать процесс. Неудачная
+запись пачки тоже теряет её (счётчик ``failed``), повторов нет.
+
+``ts`` ставится в момент приёма, а не записи — задержка сброса не сдвигает
+время событий. На остановке ``lifespan`` зовёт ``stop()``: остаток буфера
+дописывается; на старте — ``start()``, который снимает остановку от
+предыдущего ``lifespan`` того же процесса. Задача сброса стартует и лениво на
+первом событии, так что буфер работает и в long-polling боте (``bot.py``),
+где lifespan нет.
+"""
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime
+from typing import Any, Optional
+
+from backend import config
+from backend import database as db
+
+
+class EventBuffer:
+    def __init__(
+        self,
+        flush_batch: int = config.EVENT_FLUSH_BATCH,
+        flush_interval: float = config.EVENT_FLUSH_INTERVAL,
+        max_pending: int = config.EVENT_BUFFER_MAX,
+    ) -> None:
+        self.flush_batch = flush_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: list[dict] = []
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self._stopping = False
+        self.stats = {"accepted": 0, "dropped": 0, "written": 0, "failed": 0}
+
+    def add(self, rows: list[dict]) -> int:
+        """Принять события; возвращает, сколько поместилось в буфер."""
+        room = max(self.max_pending - len(self._pending), 0)
+        if len(rows) > room:
+            self.stats["dropped"] += len(rows) - room
+            rows = rows[:room]
+        if not rows:
+            return 0
+        now = datetime.utcnow()
+        self._pending.extend({**r, "ts": now} for r in rows)
+        self.stats["accepted"] += len(rows)
+        self._ensure_running()
+        if len(self._pending) >= self.flush_batch:
+            self._wakeup.set()
+        return len(rows)
+
+    def start(self) -> None:
+        """Снять остановку после ``stop()`` и запустить фоновый сброс."""
+        self._stopping = False
+        self._ensure_running()
+
+    def _ensure_running(self) -> None:
+        if not self._stopping and (self._task is None or self._task.done()):
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Записать всё накопленное пачками по ``flush_batch``."""
+        async with self._flush_lock:
+            while self._pending:
+                batch = self._pending[:self.flush_batch]
+                del self._pending[:self.flush_batch]
+                try:
+                    await db.insert_events(batch)
+                    self.stats["written"] += len(batch)
+                except Exception as exc:  # аналитика не роняет процесс
+                    self.stats["failed"] += len(batch)
+                    print(f"[events] flush failed ({len(batch)} dropped): {exc}", flush=True)
+
+    async def stop(self) -> None:
+        """Остановить фоновый сброс и дописать остаток (на shutdown).
+
+        Задачу не отменяем, а будим и ждём: отмена посреди ``insert_events``
+        потеряла бы уже вынутую из буфера пачку. После ``stop`` фоновая задача
+        не перезапускается до ``start()``: поздние события ждут его или явного
+        ``flush``.
+        """
+        self._stopping = True
+        if self._task is not None:
+            self._wakeup.set()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def snapshot(self) -> dict[str, Any]:
+        return {"pending": len(self._pending), **self.stats}
+
+
+# Синглтон для использования в приложении
+buffer = EventBuffer()
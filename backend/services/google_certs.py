@@ -0,0 +1,92 @@
+"""Кэш публичных сертификатов Google для проверки ID-токенов.
+
+``google.oauth2.id_token.verify_oauth2_token`` на каждый вызов синхронно
+скачивает ``/oauth2/v1/certs`` — сетевой запрос прямо в event loop на каждый
+вход через Google. Сертификаты меняются раз в несколько дней, и Google отдаёт
+их с ``Cache-Control: max-age``.
+
+Здесь они держатся в памяти: скачиваются заранее периодической задачей
+(``GOOGLE_CERTS_REFRESH_INTERVAL``) и лениво при первом обращении или по
+истечении ``max-age``. Если токен подписан неизвестным ключом (Google только
+что сменил ключи), набор перечитывается внепланово — не чаще раза в
+``MIN_FORCED_REFRESH`` секунд, чтобы мусорные токены не превращались в запросы
+к Google. Тот же интервал держится после неудачного скачивания: пока Google
+недоступен, а набора нет или он истёк, каждый вход не идёт в сеть заново.
+"""
+from __future__ import annotations
+
+import asyncio
+import re
+import time
+from typing import Any, Optional
+
+import httpx
+
+CERTS_URL = "https://www.googleapis.com/oauth2/v1/certs"
+DEFAULT_MAX_AGE = 3600
+MIN_FORCED_REFRESH = 60
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+
+class GoogleCerts:
+    def __init__(self, url: str = CERTS_URL) -> None:
+        self.url = url
+        self._certs: dict[str, str] = {}
+        self._expires_at = 0.0
+        self._attempted_at: Optional[float] = None  # и при неудаче
+        self._lock = asyncio.Lock()
+        self.stats = {"fetches": 0, "failures": 0}
+
+    async def refresh(self) -> None:
+        """Скачать набор сертификатов; при сбое остаётся прежний."""
+        async with self._lock:
+            await self._fetch()
+
+    async def _fetch(self) -> None:
+        self.stats["fetches"] += 1
+        self._attempted_at = time.monotonic()
+        try:
+            async with httpx.AsyncClient(timeout=10.0) as client:
+                resp = await client.get(self.url)
+                resp.raise_for_status()
+                certs = resp.json()
+        except (httpx.HTTPError, ValueError) as exc:
+            self.stats["failures"] += 1
+            print(f"[google-certs] fetch failed: {exc}")
+            return
+        match = _MAX_AGE_RE.search(resp.headers.get("cache-control", ""))
+        max_age = int(match.group(1)) if match else DEFAULT_MAX_AGE
+        self._certs = {str(k): str(v) for k, v in certs.items()}
+        self._expires_at = time.monotonic() + max_age
+
+    async def get(self, kid: Optional[str] = None) -> dict[str, str]:
+        """Актуальный набор ``{kid: PEM}``; ``kid`` — ключ из заголовка токена."""
+        if self._needs_fetch(kid):
+            async with self._lock:
+                if self._needs_fetch(kid):
+                    await self._fetch()
+        return self._certs
+
+    def _needs_fetch(self, kid: Optional[str]) -> bool:
+        if self._attempted_at is None:
+            return True
+        now = time.monotonic()
+        expired = now >= self._expires_at
+        if self._certs and expired and self._attempted_at < self._expires_at:
+            return True  # плановое обновление по max-age, с истечения не пробовали
+        # Остальное — после неудачной попытки или для неизвестного kid — не
+        # чаще раза в MIN_FORCED_REFRESH.
+        wanted = not self._certs or expired or (kid is not None and kid not in self._certs)
+        return wanted and now - self._attempted_at >= MIN_FORCED_REFRESH
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "keys": len(self._certs),
+            "expires_in": max(0, round(self._expires_at - time.monotonic())) if self._certs else 0,
+            **self.stats,
+        }
+
+
+# Синглтон для использования в приложении
+certs = GoogleCerts()
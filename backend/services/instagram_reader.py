@@ -635,6 +635,26 @@ def transcribe(audio_path: str) -> str:
     return response.text
 
 
+def _log_openai_usage(label: str, response, started: float) -> None:
+    """Логирует токены ответа OpenAI: сколько промпта пришло из кэша префикса.
+
+    Зеркало ``llm.log_usage`` для Anthropic-вызовов — по этим строкам меряем,
+    насколько кэш фиксированного SYSTEM_PROMPT ускоряет ответ. ``usage`` и
+    ``prompt_tokens_details`` в ответе OpenAI опциональны.
+    """
+    usage = response.usage
+    if usage is None:
+        return
+    details = usage.prompt_tokens_details
+    cached = (details.cached_tokens or 0) if details is not None else 0
+    elapsed_ms = int((time.monotonic() - started) * 1000)
+    print(
+        f"[llm] {label}: {elapsed_ms}ms prompt={usage.prompt_tokens} cached={cached} "
+        f"uncached={usage.prompt_tokens - cached} output={usage.completion_tokens}",
+        flush=True,
+    )
+
+
 def extract_movies(
     transcript: str,
     caption: str,
@@ -667,6 +687,10 @@ def extract_movies(
     if not text.strip() and not use_vision_model:
         return []
 
+    # SYSTEM_PROMPT фиксированный и всегда идёт первым сообщением — это и есть
+    # кэшируемый префикс: OpenAI кэширует совпадающие префиксы автоматически,
+    # транскрипт/подпись/кадры — переменный хвост. Токены кэша логируем ниже.
+    started = time.monotonic()
     if use_vision_model:
         prompt_text = text or (
             "No transcript or caption was provided. Identify the movie(s) from "
@@ -699,6 +723,10 @@ def extract_movies(
             ],
         )
 
+    _log_openai_usage(
+        "extract_movies/vision" if use_vision_model else "extract_movies", response, started,
+    )
+
     raw = response.choices[0].message.content or "[]"
     raw = raw.strip()
     if raw.startswith("```"):
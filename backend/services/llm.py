@@ -1,8 +1,88 @@
 import anthropic
-from typing import Optional
+import time
+from typing import AsyncIterator, Optional
 from backend.config import ANTHROPIC_API_KEY
 from backend.models.movie import Movie
 from backend.models.book import Book
+from backend.services import awards_catalog
+from backend.services.prompt_lines import movie_prompt_line
+
+
+# Статичные инструкции рекомендаций. Всё, что зависит от запроса (сам запрос и
+# сколько выбрать), живёт в суффиксе (``_query_suffix``): иначе каждый вызов
+# менял бы префикс и провайдерский кэш промпта никогда бы не срабатывал.
+_MOVIES_INSTRUCTIONS = """Ты — помощник по выбору фильмов. Пользователь хочет посмотреть что-то из своего списка.
+Ниже — фильмы-кандидаты, каждый с пометкой [ID:n]. В конце придёт запрос пользователя.
+
+Отвечай строго в формате:
+РЕКОМЕНДАЦИИ: [ID1, ID2, ID3]
+ОБЪЯСНЕНИЕ: Почему эти фильмы подходят под запрос (2-3 предложения на русском).
+
+Если ни один фильм не подходит, напиши:
+РЕКОМЕНДАЦИИ: []
+ОБЪЯСНЕНИЕ: Причина, почему ничего не подходит."""
+
+_BOOKS_INSTRUCTIONS = """Ты — помощник по выбору книг. Пользователь хочет почитать что-то из своего списка.
+Ниже — книги-кандидаты, каждая с пометкой [ID:n]. В конце придёт запрос пользователя.
+
+Отвечай строго в формате:
+РЕКОМЕНДАЦИИ: [ID1, ID2, ID3]
+ОБЪЯСНЕНИЕ: Почему эти книги подходят под запрос (2-3 предложения на русском).
+
+Если ни одна книга не подходит, напиши:
+РЕКОМЕНДАЦИИ: []
+ОБЪЯСНЕНИЕ: Причина, почему ничего не подходит."""
+
+
+def _cached_block(text: str) -> dict:
+    """Блок system-промпта с точкой кэширования Anthropic (ephemeral, ~5 мин).
+
+    Кэшируется весь префикс до этой точки включительно. Блоки короче минимума
+    модели (~1024 токена) провайдер молча не кэширует — ничего не ломается.
+    """
+    return {"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}
+
+
+def _query_suffix(
+    user_query: str,
+    max_recommendations: int,
+    noun: str,
+    preferred_ids: Optional[list[int]] = None,
+) -> str:
+    """Переменная часть промпта — единственное, что меняется между запросами.
+
+    ``preferred_ids`` — кандидаты, доступные на сервисах пользователя: подсказка
+    идёт сюда, а не в кэшируемый префикс, чтобы не ломать prompt caching."""
+    suffix = (
+        f'Запрос пользователя: "{user_query}"\n\n'
+        f"Выбери от 1 до {max_recommendations} наиболее подходящих {noun}."
+    )
+    if preferred_ids:
+        suffix += (
+            "\nПри прочих равных предпочитай доступные на сервисах пользователя: "
+            + ", ".join(f"ID:{i}" for i in sorted(preferred_ids))
+            + "."
+        )
+    return suffix
+
+
+def log_usage(label: str, message, started: float) -> None:
+    """Логирует токены ответа Anthropic: сколько прочитано из кэша, сколько
+    записано в кэш и сколько пришло некэшированным, плюс время вызова.
+
+    По этим строкам сравниваем латентность до/после кэширования префикса.
+    Счётчики кэша в ``Usage`` опциональны — без кэширования там None.
+    """
+    usage = message.usage
+    elapsed_ms = int((time.monotonic() - started) * 1000)
+    print(
+        f"[llm] {label}: {elapsed_ms}ms "
+        f"input={usage.input_tokens} "
+        f"cache_read={usage.cache_read_input_tokens or 0} "
+        f"cache_write={usage.cache_creation_input_tokens or 0} "
+        f"output={usage.output_tokens}",
+        flush=True,
+    )
 
 
 class LLMService:
@@ -123,56 +203,123 @@ class LLMService:
         self,
         user_query: str,
         movies: list[Movie],
-        max_recommendations: int = 3
+        max_recommendations: int = 3,
+        preferred_ids: Optional[list[int]] = None,
     ) -> tuple[list[int], str]:
         """
         Рекомендация фильмов на основе запроса пользователя.
         Возвращает список ID фильмов и объяснение.
+
+        Промпт разложен на кэшируемый префикс (инструкции → каталог наград →
+        библиотека пользователя, см. ``_candidate_blocks``) и переменный
+        суффикс с запросом — так провайдерский prompt caching переиспользует
+        всё, кроме последней реплики.
         """
         if not movies:
             return [], "В вашем списке пока нет фильмов для рекомендаций."
 
-        # Формируем описание фильмов для промпта
-        movies_info = []
-        for m in movies:
-            info = f"[ID:{m.id}] «{m.title}» ({m.year or 'год неизвестен'})"
-            if m.genres:
-                info += f" — {', '.join(m.genres)}"
-            if m.cast:
-                info += f" | Актёры: {', '.join(m.cast[:3])}"
-            if m.description:
-                info += f" | {m.description}"
-            elif m.plot:
-                info += f" | {m.plot[:200]}..."
-            movies_info.append(info)
-
-        movies_text = "\n".join(movies_info)
-
-        prompt = f"""Ты — помощник по выбору фильмов. Пользователь хочет посмотреть что-то из своего списка.
-
-Запрос пользователя: "{user_query}"
-
-Список фильмов пользователя (непросмотренные):
-{movies_text}
-
-Выбери от 1 до {max_recommendations} наиболее подходящих фильмов.
-Отвечай строго в формате:
-РЕКОМЕНДАЦИИ: [ID1, ID2, ID3]
-ОБЪЯСНЕНИЕ: Почему эти фильмы подходят под запрос (2-3 предложения на русском).
-
-Если ни один фильм не подходит, напиши:
-РЕКОМЕНДАЦИИ: []
-ОБЪЯСНЕНИЕ: Причина, почему ничего не подходит."""
-
+        system, messages = self._movie_prompt(
+            user_query, movies, max_recommendations, preferred_ids,
+        )
+        started = time.monotonic()
         message = await self.client.messages.create(
             model=self.model,
             max_tokens=500,
-            messages=[{"role": "user", "content": prompt}]
+            system=system,
+            messages=messages,
         )
+        log_usage("recommend_movies", message, started)
 
         response_text = message.content[0].text.strip()
         return self._parse_recommendation_response(response_text)
 
+    async def stream_recommend_movies(
+        self,
+        user_query: str,
+        movies: list[Movie],
+        max_recommendations: int = 3,
+        preferred_ids: Optional[list[int]] = None,
+    ) -> AsyncIterator[tuple[str, object]]:
+        """Потоковый вариант ``recommend_movies`` — тот же промпт, тот же формат.
+
+        Отдаёт события по мере прихода токенов:
+        - ``("ids", list[int])`` — ровно один раз, как только дописана строка
+          ``РЕКОМЕНДАЦИИ:`` (обычно первые ~20 токенов ответа);
+        - ``("text", str)`` — куски объяснения, по мере генерации.
+        Пустая библиотека — сразу ``ids=[]`` и готовое объяснение.
+        """
+        if not movies:
+            yield "ids", []
+            yield "text", "В вашем списке пока нет фильмов для рекомендаций."
+            return
+
+        system, messages = self._movie_prompt(
+            user_query, movies, max_recommendations, preferred_ids,
+        )
+        parser = RecommendationStreamParser()
+        started = time.monotonic()
+        async with self.client.messages.stream(
+            model=self.model,
+            max_tokens=500,
+            system=system,
+            messages=messages,
+        ) as stream:
+            async for chunk in stream.text_stream:
+                for event in parser.feed(chunk):
+                    yield event
+            message = await stream.get_final_message()
+        for event in parser.finish():
+            yield event
+        log_usage("stream_recommend_movies", message, started)
+
+    def _movie_prompt(
+        self,
+        user_query: str,
+        movies: list[Movie],
+        max_recommendations: int,
+        preferred_ids: Optional[list[int]] = None,
+    ) -> tuple[list[dict], list[dict]]:
+        """``(system, messages)`` для подбора фильмов — общий для обычного и
+        потокового вызова, чтобы оба попадали в один и тот же кэш префикса."""
+        awards_text, library_text = self._candidate_blocks(movies)
+        system = [{"type": "text", "text": _MOVIES_INSTRUCTIONS}]
+        if awards_text:
+            system.append(_cached_block(
+                "Фильмы-лауреаты из каталога наград (пользователь их ещё не сохранял):\n"
+                + awards_text
+            ))
+        if library_text:
+            system.append(_cached_block(
+                "Список фильмов пользователя (непросмотренные):\n" + library_text
+            ))
+        messages = [{
+            "role": "user",
+            "content": _query_suffix(
+                user_query, max_recommendations, "фильмов", preferred_ids,
+            ),
+        }]
+        return system, messages
+
+    def _candidate_blocks(self, movies: list[Movie]) -> tuple[str, str]:
+        """Делит кандидатов на ``(каталог наград, библиотека)`` в стабильном порядке.
+
+        Каталог меняется только при синке — он идёт первым и кэшируется дольше
+        всего; библиотека меняется при сохранении фильма — она вторая. Внутри
+        блоков сортируем по id, а не по ``added_at``/порядку из роутера: один и
+        тот же набор фильмов всегда даёт байт-в-байт одинаковый текст.
+        Строки фильмов каталога берём готовыми из снимка ``awards_catalog``.
+        """
+        awards = sorted(
+            (m for m in movies if m.source == "awards" and not m.in_library),
+            key=lambda m: m.id,
+        )
+        award_ids = {m.id for m in awards}
+        library = sorted((m for m in movies if m.id not in award_ids), key=lambda m: m.id)
+        return (
+            "\n".join(awards_catalog.prompt_line(m) or movie_prompt_line(m) for m in awards),
+            "\n".join(movie_prompt_line(m) for m in library),
+        )
+
     async def recommend_books(
         self,
         user_query: str,
@@ -181,13 +328,14 @@ class LLMService:
     ) -> tuple[list[int], str]:
         """Подбор книги под настроение. Возвращает список ID книг и объяснение.
 
-        Делит парсер ответа с ``recommend_movies`` — формат вывода идентичный.
+        Делит парсер ответа с ``recommend_movies`` — формат вывода идентичный,
+        раскладка промпта (кэшируемый префикс + суффикс с запросом) тоже.
         """
         if not books:
             return [], "В вашем списке пока нет книг для рекомендаций."
 
         books_info = []
-        for b in books:
+        for b in sorted(books, key=lambda b: b.id):
             info = f"[ID:{b.id}] «{b.title}» ({b.year or 'год неизвестен'})"
             if b.authors:
                 info += f" — {', '.join(b.authors[:2])}"
@@ -199,27 +347,20 @@ class LLMService:
 
         books_text = "\n".join(books_info)
 
-        prompt = f"""Ты — помощник по выбору книг. Пользователь хочет почитать что-то из своего списка.
-
-Запрос пользователя: "{user_query}"
-
-Список книг пользователя (непрочитанные):
-{books_text}
-
-Выбери от 1 до {max_recommendations} наиболее подходящих книг.
-Отвечай строго в формате:
-РЕКОМЕНДАЦИИ: [ID1, ID2, ID3]
-ОБЪЯСНЕНИЕ: Почему эти книги подходят под запрос (2-3 предложения на русском).
-
-Если ни одна книга не подходит, напиши:
-РЕКОМЕНДАЦИИ: []
-ОБЪЯСНЕНИЕ: Причина, почему ничего не подходит."""
-
+        started = time.monotonic()
         message = await self.client.messages.create(
             model=self.model,
             max_tokens=500,
-            messages=[{"role": "user", "content": prompt}]
+            system=[
+                {"type": "text", "text": _BOOKS_INSTRUCTIONS},
+                _cached_block("Список книг пользователя (непрочитанные):\n" + books_text),
+            ],
+            messages=[{
+                "role": "user",
+                "content": _query_suffix(user_query, max_recommendations, "книг"),
+            }],
         )
+        log_usage("recommend_books", message, started)
 
         response_text = message.content[0].text.strip()
         return self._parse_recommendation_response(response_text)
@@ -232,15 +373,7 @@ class LLMService:
         lines = response.split("\n")
         for line in lines:
             if line.startswith("РЕКОМЕНДАЦИИ:"):
-                # Извлекаем список ID
-                ids_part = line.replace("РЕКОМЕНДАЦИИ:", "").strip()
-                # Убираем скобки и парсим числа
-                ids_part = ids_part.strip("[]")
-                if ids_part:
-                    try:
-                        movie_ids = [int(x.strip()) for x in ids_part.split(",") if x.strip()]
-                    except ValueError:
-                        movie_ids = []
+                movie_ids = _parse_ids_line(line)
             elif line.startswith("ОБЪЯСНЕНИЕ:"):
                 explanation = line.replace("ОБЪЯСНЕНИЕ:", "").strip()
 
@@ -254,5 +387,86 @@ class LLMService:
         return movie_ids, explanation
 
 
+def _parse_ids_line(line: str) -> list[int]:
+    """``РЕКОМЕНДАЦИИ: [1, 2, 3]`` → ``[1, 2, 3]``; мусор → ``[]``."""
+    ids_part = line.replace("РЕКОМЕНДАЦИИ:", "").strip()
+    # Убираем скобки и парсим числа
+    ids_part = ids_part.strip("[]")
+    if not ids_part:
+        return []
+    try:
+        return [int(x.strip()) for x in ids_part.split(",") if x.strip()]
+    except ValueError:
+        return []
+
+
+class RecommendationStreamParser:
+    """Инкрементальный разбор ответа в формате ``РЕКОМЕНДАЦИИ:/ОБЪЯСНЕНИЕ:``.
+
+    ``feed`` принимает куски текста из стрима и возвращает готовые события:
+    ``("ids", [...])`` — как только строка с ID дописана до перевода строки,
+    ``("text", "...")`` — всё, что идёт после метки ``ОБЪЯСНЕНИЕ:``.
+    ``finish`` дожимает хвост: ID без завершающего перевода строки и
+    объяснение без метки (тот же фолбэк, что у ``_parse_recommendation_response``).
+    """
+
+    _IDS = "РЕКОМЕНДАЦИИ:"
+    _EXPLANATION = "ОБЪЯСНЕНИЕ:"
+
+    def __init__(self) -> None:
+        self._buffer = ""
+        self._ids_sent = False
+        self._in_explanation = False
+
+    def feed(self, chunk: str) -> list[tuple[str, object]]:
+        if self._in_explanation:
+            return [("text", chunk)] if chunk else []
+        self._buffer += chunk
+        events: list[tuple[str, object]] = []
+        if not self._ids_sent:
+            events.extend(self._take_ids(final=False))
+        if self._ids_sent:
+            events.extend(self._take_explanation())
+        return events
+
+    def finish(self) -> list[tuple[str, object]]:
+        events: list[tuple[str, object]] = []
+        if not self._ids_sent:
+            events.extend(self._take_ids(final=True))
+        if not self._in_explanation:
+            events.extend(self._take_explanation())
+        if not self._in_explanation:
+            rest = self._buffer.strip()
+            self._buffer = ""
+            if rest:
+                events.append(("text", rest))
+        return events
+
+    def _take_ids(self, final: bool) -> list[tuple[str, object]]:
+        pos = self._buffer.find(self._IDS)
+        if pos < 0:
+            if final:
+                self._ids_sent = True
+                return [("ids", [])]
+            return []
+        end = self._buffer.find("\n", pos)
+        if end < 0 and not final:
+            return []  # строка с ID ещё дописывается
+        end = len(self._buffer) if end < 0 else end
+        ids = _parse_ids_line(self._buffer[pos:end])
+        self._buffer = self._buffer[end:]
+        self._ids_sent = True
+        return [("ids", ids)]
+
+    def _take_explanation(self) -> list[tuple[str, object]]:
+        pos = self._buffer.find(self._EXPLANATION)
+        if pos < 0:
+            return []
+        rest = self._buffer[pos + len(self._EXPLANATION):].lstrip()
+        self._buffer = ""
+        self._in_explanation = True
+        return [("text", rest)] if rest else []
+
+
 # Синглтон для использования в приложении
 llm_service = LLMService()
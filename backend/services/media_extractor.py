@@ -15,10 +15,11 @@ from __future__ import annotations
 
 import json
 import re
+import time
 from dataclasses import dataclass
 
 from backend.services.instagram_reader import MovieInfo
-from backend.services.llm import llm_service
+from backend.services.llm import llm_service, log_usage
 
 
 @dataclass
@@ -54,12 +55,20 @@ async def extract_media(text: str) -> tuple[list[MovieInfo], list[BookInfo]]:
     if not text:
         return [], []
 
+    # Системный промпт фиксированный — помечаем его точкой кэширования, пост
+    # идёт переменным суффиксом в user-сообщении.
+    started = time.monotonic()
     message = await llm_service.client.messages.create(
         model=llm_service.model,
         max_tokens=900,
-        system=_SYSTEM_PROMPT,
+        system=[{
+            "type": "text",
+            "text": _SYSTEM_PROMPT,
+            "cache_control": {"type": "ephemeral"},
+        }],
         messages=[{"role": "user", "content": text}],
     )
+    log_usage("extract_media", message, started)
     raw = (message.content[0].text or "").strip()
 
     items = _parse_json_array(raw)
@@ -2,8 +2,15 @@ import re
 import time
 import httpx
 from typing import Optional
-from backend.config import OMDB_API_KEY, OMDB_BASE_URL
+from backend.config import (
+    OMDB_API_KEY,
+    OMDB_BACKGROUND_RATE_PER_SECOND,
+    OMDB_BASE_URL,
+    OMDB_RATE_PER_SECOND,
+)
 from backend.models.movie import MovieBase, OMDBSearchResult
+from backend.services import background
+from backend.services.throttle import TokenBucket
 
 
 class OMDBService:
@@ -23,6 +30,18 @@ class OMDBService:
         self.base_url = OMDB_BASE_URL
         self._by_id_cache: dict[str, tuple[float, MovieBase]] = {}
         self._search_cache: dict[str, tuple[float, list[OMDBSearchResult]]] = {}
+        # Один bucket на все запросы сервиса держит общий лимит OMDB; кэш-хиты
+        # токен не тратят. Фоновые задачи сначала проходят свой, более редкий
+        # bucket: иначе синк с десятком параллельных запросов занимает очередь
+        # общего, и пользовательский поиск ждёт за ним.
+        self.rate_limiter = TokenBucket(OMDB_RATE_PER_SECOND)
+        self.background_limiter = TokenBucket(OMDB_BACKGROUND_RATE_PER_SECOND)
+
+    async def _throttle(self) -> None:
+        """Дождаться права на запрос: фоновые задачи — через свой bucket."""
+        if background.current_task() is not None:
+            await self.background_limiter.acquire()
+        await self.rate_limiter.acquire()
 
     async def search_movies(self, query: str, media_type: str = "movie") -> list[OMDBSearchResult]:
         """Поиск фильмов по названию (с часовым кэшем)."""
@@ -38,6 +57,7 @@ class OMDBService:
         if media_type:
             params["type"] = media_type
 
+        await self._throttle()
         async with httpx.AsyncClient() as client:
             response = await client.get(self.base_url, params=params)
             data = response.json()
@@ -70,6 +90,7 @@ class OMDBService:
         if cached and (time.monotonic() - cached[0]) < self._BY_ID_TTL:
             return cached[1].model_copy(deep=True)
 
+        await self._throttle()
         async with httpx.AsyncClient() as client:
             response = await client.get(
                 self.base_url,
@@ -91,6 +112,7 @@ class OMDBService:
 
     async def get_movie_by_title(self, title: str, year: Optional[int] = None) -> Optional[MovieBase]:
         """Получить детали фильма по названию"""
+        await self._throttle()
         async with httpx.AsyncClient() as client:
             params = {
                 "apikey": self.api_key,
@@ -0,0 +1,196 @@
+"""Общий движок OMDB-бэкфиллов для уже сохранённых записей.
+
+Раньше каждый бэкфилл ходил по своему списку тайтлов сам: media_type — по всем
+imdb_id по одному с паузой 0.2s, потом runtime — ещё раз по тем же тайтлам,
+и оба писали UPDATE на каждый тайтл. Теперь:
+
+- один запрос к OMDB на тайтл заполняет сразу все пустые поля (media_type,
+  runtime, awards, imdb_rating) — любой задаче, что бы она ни добивала;
+- тайтлы идут порциями по ``BATCH_SIZE``, внутри порции — параллельно, не больше
+  ``BACKFILL_CONCURRENCY`` разом (частоту держат фоновый и общий bucket'ы
+  ``omdb_service``);
+- все задачи делят суточный бюджет запросов ``budget``: кончился — задача
+  останавливается и продолжает со следующего запуска;
+- порция пишется одним ``UPDATE ... FROM (VALUES ...)`` (``db.apply_omdb_patches``);
+- курсор (последний обработанный imdb_id) сохраняется в app_meta после каждой
+  порции, так что прерванный проход продолжается, а не начинается заново;
+  на тайтле, где запрос к OMDB упал, курсор останавливается, и запуск
+  прерывается — следующий начнёт с этого тайтла;
+- выборка не различает личные и каталожные строки, поэтому после запуска,
+  который что-то обновил, снимок ``awards_catalog`` перечитывается.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+from dataclasses import dataclass, field
+from typing import Optional
+
+from backend import database as db
+from backend.config import BACKFILL_CONCURRENCY, OMDB_BACKFILL_DAILY_BUDGET
+from backend.models.movie import MovieBase
+from backend.services import awards_catalog, background
+from backend.services.omdb import omdb_service
+from backend.services.throttle import DailyBudget
+
+BATCH_SIZE = 50
+
+# Один бюджет на все бэкфиллы процесса.
+budget = DailyBudget(OMDB_BACKFILL_DAILY_BUDGET)
+
+
+@dataclass(frozen=True)
+class BackfillJob:
+    """Описание прохода: какие тайтлы выбирать и когда считать его законченным.
+
+    ``missing_only`` — только тайтлы без длительности (``runtime IS NULL``);
+    иначе — все тайтлы. ``once`` — после полного прохода больше не запускаться
+    (курсор остаётся в конце); без него законченный проход сбрасывает курсор,
+    и следующий запуск подберёт новые пустые записи. ``max_titles`` — потолок
+    тайтлов за один запуск.
+    """
+    name: str
+    missing_only: bool = False
+    once: bool = False
+    max_titles: Optional[int] = None
+
+    @property
+    def meta_key(self) -> str:
+        return f"backfill:{self.name}"
+
+
+@dataclass
+class BackfillResult:
+    scanned: int = 0
+    updated: int = 0
+    series: list[str] = field(default_factory=list)
+    missing: list[str] = field(default_factory=list)
+    done: bool = False
+    budget_exhausted: bool = False
+    failed: bool = False
+
+
+# Разовая классификация фильм/сериал: прошли все тайтлы — больше не запускаем.
+MEDIA_TYPE_JOB = BackfillJob("media_type", once=True)
+# Длительности: каждый старт добивает до 300 непроверенных тайтлов.
+RUNTIME_JOB = BackfillJob("runtime", missing_only=True, max_titles=300)
+
+
+def omdb_patch(imdb_id: str, movie: Optional[MovieBase]) -> dict:
+    """Патч для ``db.apply_omdb_patches`` из ответа OMDB.
+
+    OMDB не знает тайтл — пишем runtime=0 («проверено, данных нет»), чтобы
+    бэкфилл длительности не спрашивал про него на каждом старте.
+    media_type кладём только 'series': дефолтное 'movie' у строк и так стоит.
+    """
+    if movie is None:
+        return {"imdb_id": imdb_id, "runtime": 0}
+    return {
+        "imdb_id": imdb_id,
+        "media_type": "series" if movie.media_type == "series" else None,
+        "runtime": movie.runtime if movie.runtime is not None else 0,
+        "awards": movie.awards,
+        "imdb_rating": movie.imdb_rating,
+    }
+
+
+async def _load_progress(job: BackfillJob) -> dict:
+    raw = await db.meta_get(job.meta_key)
+    if not raw:
+        return {"cursor": "", "done": False}
+    try:
+        return {"cursor": "", "done": False, **json.loads(raw)}
+    except ValueError:
+        return {"cursor": "", "done": False}
+
+
+async def run_backfill(
+    job: BackfillJob, *, dry_run: bool = False, restart: bool = False,
+) -> BackfillResult:
+    """Прогнать задачу с её чекпоинта (``restart`` — с начала, игнорируя его).
+
+    ``dry_run`` — только спросить OMDB и вернуть найденное, ничего не записывая
+    (ни строки, ни прогресс).
+    """
+    result = BackfillResult()
+    progress = {"cursor": "", "done": False} if restart else await _load_progress(job)
+    if job.once and progress["done"]:
+        result.done = True
+        return result
+
+    cursor = progress["cursor"]
+    semaphore = asyncio.Semaphore(BACKFILL_CONCURRENCY)
+
+    async def _fetch(imdb_id: str) -> Optional[dict]:
+        """Патч для тайтла или None, если OMDB не ответил."""
+        async with semaphore:
+            try:
+                movie = await omdb_service.get_movie_by_id(imdb_id)
+            except Exception as exc:
+                # Сеть/OMDB лежит — ничего не пишем, курсор дальше не пойдёт.
+                print(f"[backfill:{job.name}] не удалось обработать {imdb_id}: {exc}")
+                return None
+        if movie is None:
+            result.missing.append(imdb_id)
+        return omdb_patch(imdb_id, movie)
+
+    while True:
+        limit = BATCH_SIZE
+        if job.max_titles is not None:
+            limit = min(limit, job.max_titles - result.scanned)
+            if limit <= 0:
+                break
+        imdb_ids = await db.get_backfill_imdb_ids(
+            after=cursor, limit=limit, missing_only=job.missing_only,
+        )
+        if not imdb_ids:
+            result.done = True
+            break
+
+        allowed = []
+        for imdb_id in imdb_ids:
+            if not budget.try_spend():
+                result.budget_exhausted = True
+                break
+            allowed.append(imdb_id)
+        if not allowed:
+            break
+
+        fetched = await asyncio.gather(*(_fetch(i) for i in allowed))
+        patches = [p for p in fetched if p]
+        result.scanned += len(allowed)
+        result.series += [p["imdb_id"] for p in patches if p.get("media_type") == "series"]
+        # Курсор — до первого упавшего тайтла: всё после него ещё раз спросим
+        # в следующий запуск (дозаполнение идемпотентно).
+        failed_at = next((n for n, p in enumerate(fetched) if p is None), None)
+        if failed_at is None:
+            cursor = allowed[-1]
+        elif failed_at > 0:
+            cursor = allowed[failed_at - 1]
+        background.report(scanned=result.scanned, cursor=cursor)
+        if not dry_run:
+            result.updated += await db.apply_omdb_patches(patches)
+            await db.meta_set(job.meta_key, json.dumps({"cursor": cursor, "done": False}))
+        if result.budget_exhausted or failed_at is not None:
+            result.failed = failed_at is not None
+            break
+
+    if result.updated:
+        # /api/awards и строки промпта читают снимок, а не БД.
+        await awards_catalog.refresh()
+    if result.done and not dry_run:
+        await db.meta_set(job.meta_key, json.dumps({
+            "cursor": cursor if job.once else "",
+            "done": job.once,
+        }))
+    status = "готово" if result.done else (
+        "бюджет OMDB исчерпан" if result.budget_exhausted
+        else "OMDB не ответил, повтор в следующий запуск" if result.failed
+        else "пауза до следующего запуска"
+    )
+    print(
+        f"[backfill:{job.name}] тайтлов: {result.scanned}, строк обновлено: "
+        f"{result.updated}, сериалов: {len(result.series)} — {status}",
+        flush=True,
+    )
+    return result
@@ -0,0 +1,119 @@
+"""Отдельный ограниченный пул потоков для bcrypt.
+
+``bcrypt`` при стоимости 12 считает хэш ~250 мс. Вызванный прямо в async-ручке
+(``/auth/register``, ``/auth/login``) он держал event loop всё это время:
+пачка логинов подвешивала все остальные запросы, включая webhook бота.
+
+Теперь хэширование и проверка уходят в свой ``ThreadPoolExecutor`` на
+``PASSWORD_HASH_WORKERS`` потоков (bcrypt отпускает GIL, так что loop остаётся
+свободным). Ожидающих задач не больше ``PASSWORD_HASH_QUEUE`` — сверх того
+``submit`` сразу бросает ``PasswordPoolFull``, а не копит очередь, за которую
+клиенты всё равно не дождутся ответа. Общий пул потоков Starlette
+(``run_in_threadpool``) не используем: всплеск логинов не должен отнимать
+потоки у остальных ручек.
+
+Глубина очереди, время ожидания и отказы — в ``snapshot()`` (``/api/health/full``).
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+from backend import config
+
+T = TypeVar("T")
+
+
+class PasswordPoolFull(RuntimeError):
+    """Очередь на хэширование заполнена — запрос надо отклонить."""
+
+
+class PasswordPool:
+    def __init__(
+        self,
+        workers: int = config.PASSWORD_HASH_WORKERS,
+        max_queue: int = config.PASSWORD_HASH_QUEUE,
+    ) -> None:
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._in_flight = 0  # поставлено и ещё не завершено (трогает только loop)
+        self._running = 0    # выполняется в потоке (под _lock, как и статистика)
+        self.stats = {"completed": 0, "rejected": 0, "max_queued": 0}
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="bcrypt",
+            )
+        return self._executor
+
+    @property
+    def queued(self) -> int:
+        with self._lock:
+            return self._in_flight - self._running
+
+    def _release(self, _future: Any) -> None:
+        # Слот освобождается, когда задача реально закончилась (или отменена
+        # до старта), а не когда ожидающий корутин отменили.
+        self._in_flight -= 1
+
+    async def submit(self, func: Callable[..., T], *args: Any) -> T:
+        """Выполнить ``func(*args)`` в пуле; ``PasswordPoolFull``, если очередь полна."""
+        if self._in_flight >= self.workers + self.max_queue:
+            self.stats["rejected"] += 1
+            raise PasswordPoolFull(f"{self._in_flight} password jobs in flight")
+        self._in_flight += 1
+        self.stats["max_queued"] = max(self.stats["max_queued"], self.queued)
+        enqueued = time.monotonic()
+
+        def _run() -> T:
+            waited = time.monotonic() - enqueued
+            with self._lock:
+                self._running += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+            try:
+                return func(*args)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self.stats["completed"] += 1
+
+        loop = asyncio.get_running_loop()
+        future = self._get_executor().submit(_run)
+        future.add_done_callback(
+            lambda f: loop.is_closed() or loop.call_soon_threadsafe(self._release, f)
+        )
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            running, stats = self._running, dict(self.stats)
+            started = stats["completed"] + running
+            avg_wait = self._wait_total / started if started else 0.0
+            max_wait = self._wait_max
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "running": running,
+            "queued": self._in_flight - running,
+            **stats,
+            "avg_wait_ms": round(1000 * avg_wait, 1),
+            "max_wait_ms": round(1000 * max_wait, 1),
+        }
+
+
+# Синглтон для использования в приложении
+pool = PasswordPool()
@@ -0,0 +1,21 @@
+"""Строки фильмов-кандидатов для промптов LLM.
+
+Отдельно от ``llm``: строку собирает и сборка промпта (``llm``), и снимок
+каталога наград (``awards_catalog``), который ``llm`` сам читает, — общий
+модуль без зависимостей избавляет от импортного цикла.
+"""
+from backend.models.movie import Movie
+
+
+def movie_prompt_line(m: Movie) -> str:
+    """Строка кандидата для промпта: ``[ID:..] «Название» (год) — жанры | …``."""
+    info = f"[ID:{m.id}] «{m.title}» ({m.year or 'год неизвестен'})"
+    if m.genres:
+        info += f" — {', '.join(m.genres)}"
+    if m.cast:
+        info += f" | Актёры: {', '.join(m.cast[:3])}"
+    if m.description:
+        info += f" | {m.description}"
+    elif m.plot:
+        info += f" | {m.plot[:200]}..."
+    return info
@@ -0,0 +1,125 @@
+"""Кэш публичных шэров и счётчик просмотров в памяти.
+
+Снимок шэра после создания не меняется, а ``GET /api/shares/{slug}`` раньше
+на каждый просмотр заново разбирал JSON снимка, прогонял каждый ``Movie``
+через pydantic, искал владельца и писал ``view_count += 1``. Популярный шэр
+превращался в горячую строку для записи и жёг CPU.
+
+Теперь готовый JSON ответа (и его ETag) кладётся в LRU-кэш процесса при первом
+просмотре; последующие отдаются байтами как есть. Живёт запись
+``SHARE_CACHE_TTL`` — единственное, что в ответе может поменяться, это имя
+владельца. Гостевой шэр с истёкшим ``expires_at`` из кэша не отдаётся.
+
+Просмотры копятся в памяти и сбрасываются в БД одним ``UPDATE`` на шэр
+периодической задачей (``SHARE_VIEWS_FLUSH_INTERVAL``) и на остановке. Падение
+процесса теряет несброшенные просмотры — для счётчика это приемлемо.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Optional
+
+from backend import config
+from backend import database as db
+
+
+@dataclass(frozen=True)
+class RenderedShare:
+    body: bytes
+    etag: str
+    expires_at: Optional[datetime]
+    rendered_at: float
+
+
+class ShareCache:
+    """LRU готовых ответов по slug, не больше ``max_entries`` записей."""
+
+    def __init__(
+        self,
+        max_entries: int = config.SHARE_CACHE_SIZE,
+        ttl: float = config.SHARE_CACHE_TTL,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, RenderedShare] = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, slug: str) -> Optional[RenderedShare]:
+        entry = self._entries.get(slug)
+        if entry is not None and (
+            time.monotonic() - entry.rendered_at >= self.ttl
+            or (entry.expires_at and entry.expires_at < datetime.utcnow())
+        ):
+            del self._entries[slug]
+            entry = None
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        self._entries.move_to_end(slug)
+        self.stats["hits"] += 1
+        return entry
+
+    def put(self, slug: str, body: bytes, expires_at: Optional[datetime]) -> RenderedShare:
+        entry = RenderedShare(
+            body=body,
+            etag=f'"{hashlib.sha256(body).hexdigest()[:32]}"',
+            expires_at=expires_at,
+            rendered_at=time.monotonic(),
+        )
+        self._entries[slug] = entry
+        self._entries.move_to_end(slug)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, slug: Optional[str] = None) -> None:
+        if slug is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(slug, None)
+
+    def snapshot(self) -> dict[str, Any]:
+        return {"entries": len(self._entries), **self.stats}
+
+
+class ViewCounter:
+    """Просмотры шэров, накопленные с последнего сброса в БД."""
+
+    def __init__(self) -> None:
+        self._pending: Counter = Counter()
+        self._lock = asyncio.Lock()
+        self.stats = {"flushed": 0, "failed": 0}
+
+    def add(self, slug: str) -> None:
+        self._pending[slug] += 1
+
+    async def flush(self) -> None:
+        """Записать накопленное; при сбое или отмене просмотры возвращаются в буфер."""
+        async with self._lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, Counter()
+            try:
+                await db.add_share_views(dict(batch))
+            except asyncio.CancelledError:
+                self._pending.update(batch)
+                raise
+            except Exception as exc:
+                self._pending.update(batch)
+                self.stats["failed"] += 1
+                print(f"[shares] view flush failed ({len(batch)} shares): {exc}", flush=True)
+                return
+            self.stats["flushed"] += sum(batch.values())
+
+    def snapshot(self) -> dict[str, Any]:
+        return {"pending": sum(self._pending.values()), **self.stats}
+
+
+# Синглтоны для использования в приложении
+cache = ShareCache()
+views = ViewCounter()
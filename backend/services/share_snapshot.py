@@ -0,0 +1,116 @@
+"""Компактное хранение снимков публичных шэров.
+
+Раньше ``shared_lists.snapshot`` хранил полный ``model_dump`` каждого фильма
+несжатым JSON — с ``plot``, ``plot_ru`` и ``description``, — и одни и те же
+фильмы (топы, лауреаты) повторялись в каждом шэре.
+
+Теперь фильм делится на две части:
+
+* общие метаданные (поля ``MovieBase``: название, сюжет, каст, постер...) —
+  сжатый zlib JSON в ``share_movies`` под хэшем содержимого, одна запись на
+  все шэры, где фильм совпадает байт в байт;
+* личные поля (``is_watched``, ``user_rating``, ``rec_note``, ``added_at``...)
+  — маленький JSON в ``share_items`` рядом со ссылкой; значения по умолчанию
+  не пишутся.
+
+Старые строки с JSON в ``snapshot`` читаются как раньше и переводятся в новый
+формат фоновой задачей ``collect_garbage`` — она же удаляет истёкшие гостевые
+шэры и метаданные, на которые больше никто не ссылается. Оценка экономии —
+``scripts/bench_share_storage.py``.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import zlib
+from datetime import datetime, timedelta
+from typing import Any
+
+from pydantic import ValidationError
+
+from backend import database as db
+from backend.models import Movie, MovieBase
+from backend.services import background
+
+# ``user_note`` — личная заметка из дневника; в публичный шэр её не пускаем.
+# ``user_rating`` оставляем: курируемый список «мои 5★» — это и есть фича.
+EXCLUDE = {"user_note"}
+SHARED_FIELDS = tuple(MovieBase.model_fields)
+_DEFAULTS = {
+    name: field.default
+    for name, field in Movie.model_fields.items()
+    if name not in SHARED_FIELDS and not field.is_required()
+}
+# Сколько старых снимков переводить за прогон и сколько ждать, прежде чем
+# удалять метаданные без ссылок (создание шэра могло ещё не закоммититься).
+COMPACT_BATCH = 200
+ORPHAN_GRACE = timedelta(hours=1)
+
+
+def _compact_json(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+def encode(movies: list[Movie]) -> tuple[list[tuple[str, str]], dict[str, bytes]]:
+    """Фильмы → (items: [(хэш метаданных, JSON личных полей)], {хэш: zlib-блоб})."""
+    items: list[tuple[str, str]] = []
+    metadata: dict[str, bytes] = {}
+    for movie in movies:
+        data = movie.model_dump(mode="json", exclude=EXCLUDE)
+        shared = _compact_json({k: data.pop(k) for k in SHARED_FIELDS}).encode("utf-8")
+        digest = hashlib.sha256(shared).hexdigest()[:32]
+        if digest not in metadata:
+            metadata[digest] = zlib.compress(shared, 9)
+        overrides = {k: v for k, v in data.items() if k not in _DEFAULTS or v != _DEFAULTS[k]}
+        items.append((digest, _compact_json(overrides)))
+    return items, metadata
+
+
+def decode(rows: list[tuple[bytes, str]]) -> list[Movie]:
+    """Строки ``db.get_share_items`` → фильмы в исходном порядке."""
+    shared: dict[bytes, dict] = {}
+    movies: list[Movie] = []
+    for blob, overrides in rows:
+        if blob not in shared:
+            shared[blob] = json.loads(zlib.decompress(blob))
+        try:
+            movies.append(Movie.model_validate({**shared[blob], **json.loads(overrides)}))
+        except ValidationError:
+            continue
+    return movies
+
+
+def parse_legacy(snapshot: str) -> list[Movie]:
+    """Старый формат: JSON-список полных ``Movie``."""
+    try:
+        raw = json.loads(snapshot)
+    except (TypeError, ValueError):
+        return []
+    movies: list[Movie] = []
+    for item in raw if isinstance(raw, list) else []:
+        try:
+            movies.append(Movie.model_validate(item))
+        except ValidationError:
+            continue
+    return movies
+
+
+async def load(share: dict) -> list[Movie]:
+    """Фильмы шэра из строки ``db.get_share_by_slug`` — в любом из форматов."""
+    if share["snapshot"]:
+        return parse_legacy(share["snapshot"])
+    return decode(await db.get_share_items(share["id"]))
+
+
+async def collect_garbage() -> None:
+    """Периодическая задача: истёкшие шэры, сироты-метаданные, старые снимки."""
+    now = datetime.utcnow()
+    expired = await db.delete_expired_shares(now)
+    compacted = 0
+    for share_id, snapshot in await db.get_legacy_shares(COMPACT_BATCH):
+        items, metadata = encode(parse_legacy(snapshot))
+        await db.replace_share_snapshot(share_id, items, metadata)
+        compacted += 1
+        background.report(expired=expired, compacted=compacted)
+    orphans = await db.delete_orphan_share_movies(now - ORPHAN_GRACE)
+    background.report(expired=expired, compacted=compacted, orphans=orphans)
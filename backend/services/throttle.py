@@ -0,0 +1,85 @@
+"""Ограничение частоты запросов к внешним API — общий token bucket.
+
+Раньше вызывающие разбрасывали ``asyncio.sleep(0.2)`` после каждого запроса:
+это и медленно (паузы не перекрываются с сетью), и не работает при
+параллельных вызовах (две корутины спят одновременно и бьют API вместе).
+Bucket живёт в сервисе (``omdb_service.rate_limiter``), поэтому его делят все
+пути — синк наград, бэкфиллы и пользовательские запросы. Фоновые задачи
+дополнительно проходят свой, более редкий bucket
+(``omdb_service.background_limiter``) и не вытесняют пользовательские.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+
+class TokenBucket:
+    """Классический token bucket: ``rate`` токенов в секунду, запас ``capacity``.
+
+    ``acquire`` ждёт, пока накопится токен; ожидающие обслуживаются по очереди
+    (под локом), так что суммарная частота не превышает ``rate`` при любом
+    числе параллельных корутин. ``rate <= 0`` — без ограничений.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None) -> None:
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            self._refill()
+            while self._tokens < tokens:
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= tokens
+
+
+class DailyBudget:
+    """Суточная квота запросов (сутки по UTC), общая для нескольких задач.
+
+    В отличие от ``TokenBucket`` не ждёт: ``try_spend`` сразу отвечает, можно ли
+    ещё тратить, — фоновая задача при исчерпании бюджета останавливается и
+    продолжает со своего чекпоинта в следующий запуск. ``limit <= 0`` — без
+    ограничения. Счётчик в памяти процесса: после рестарта сутки начинаются
+    заново, для мягкого лимита этого достаточно.
+    """
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self._day = ""
+        self._spent = 0
+
+    def _roll(self) -> None:
+        today = datetime.now(timezone.utc).date().isoformat()
+        if today != self._day:
+            self._day = today
+            self._spent = 0
+
+    @property
+    def remaining(self) -> Optional[int]:
+        if self.limit <= 0:
+            return None
+        self._roll()
+        return max(0, self.limit - self._spent)
+
+    def try_spend(self, n: int = 1) -> bool:
+        if self.limit <= 0:
+            return True
+        self._roll()
+        if self._spent + n > self.limit:
+            return False
+        self._spent += n
+        return True
@@ -21,6 +21,11 @@ OMDB — англоязычный, кириллический запрос та
 Ключ — обобщённый внешний id (как ``work_key`` у книг): ``tt…`` → OMDB/IMDb,
 ``tmdb:…`` → TMDb. Диспетчеризацию делает ``title_search.get_movie_by_key``.
 
+Связка IMDb id ↔ TMDb (вид, id) постоянна, поэтому хранится в БД
+(``title_refs``): её пополняют поиск, ``/find`` и ``get_by_key``, а все пути
+сначала смотрят туда — доступность известного тайтла стоит один HTTP-запрос
+вместо двух, поиск не перезапрашивает imdb_id у уже виденных хитов.
+
 Конфигурация: ``TMDB_API_KEY`` в .env. Если ключа нет — сервис тихо ничего
 не возвращает, и пайплайн откатывается на OMDB+LLM-перевод.
 Ключ бесплатный, выпускается на https://www.themoviedb.org/settings/api.
@@ -33,6 +38,7 @@ from typing import Optional
 
 import httpx
 
+from backend import database as db
 from backend.config import TMDB_API_KEY, TMDB_BASE_URL
 from backend.models.movie import MovieBase, OMDBSearchResult
 from backend.services.text_match import extract_year, title_score
@@ -84,6 +90,30 @@ def parse_tmdb_key(key: str) -> Optional[tuple[str, str]]:
     return parts[1], parts[2]
 
 
+# Связки — ускорение, а не источник истины: сбой БД не должен ломать поиск.
+async def _stored_refs(imdb_ids: list[str]) -> dict[str, tuple[str, str]]:
+    try:
+        return await db.get_title_refs(imdb_ids)
+    except Exception as exc:
+        print(f"[tmdb] title_refs read failed: {exc}")
+        return {}
+
+
+async def _stored_imdb_ids(kind: str, tmdb_ids: list[str]) -> dict[str, str]:
+    try:
+        return await db.get_imdb_ids_by_tmdb(kind, tmdb_ids)
+    except Exception as exc:
+        print(f"[tmdb] title_refs read failed: {exc}")
+        return {}
+
+
+async def _remember_refs(refs: list[tuple[str, str, str]]) -> None:
+    try:
+        await db.save_title_refs(refs)
+    except Exception as exc:
+        print(f"[tmdb] title_refs write failed ({len(refs)}): {exc}")
+
+
 class TMDBService:
     def __init__(self) -> None:
         self.api_key = TMDB_API_KEY
@@ -163,12 +193,23 @@ class TMDBService:
             if not hits:
                 return []
 
-            # Параллельно тянем imdb_id — N маленьких запросов быстрее цепочки.
-            imdb_ids = await asyncio.gather(*[
+            # imdb_id уже виденных хитов — из title_refs; за остальными
+            # параллельно в TMDb — N маленьких запросов быстрее цепочки.
+            known = await _stored_imdb_ids(kind, [str(h["id"]) for h in hits])
+            unknown = [h for h in hits if str(h["id"]) not in known]
+            fetched = await asyncio.gather(*[
                 self._fetch_imdb_id(client, hit["id"], cfg["imdb_path"])
-                for hit in hits
+                for hit in unknown
             ])
 
+        new_refs = [
+            (imdb_id, kind, str(hit["id"]))
+            for hit, imdb_id in zip(unknown, fetched) if imdb_id
+        ]
+        await _remember_refs(new_refs)
+        known.update((tmdb_id, imdb_id) for imdb_id, _, tmdb_id in new_refs)
+        imdb_ids = [known.get(str(hit["id"])) for hit in hits]
+
         results: list[OMDBSearchResult] = []
         for hit, imdb_id in zip(hits, imdb_ids):
             title = next((hit.get(k) for k in cfg["title_keys"] if hit.get(k)), "")
@@ -244,7 +285,7 @@ class TMDBService:
                     params={
                         "api_key": self.api_key,
                         "language": "ru-RU",
-                        "append_to_response": "credits",
+                        "append_to_response": "credits,external_ids",
                     },
                 )
                 resp.raise_for_status()
@@ -253,13 +294,17 @@ class TMDBService:
                 return None
             data = resp.json() or {}
 
+        imdb_id = data.get("imdb_id") or (data.get("external_ids") or {}).get("imdb_id")
+        if imdb_id:
+            await _remember_refs([(imdb_id, kind, tmdb_id)])
         return self._parse_details(kind, key, data, cfg)
 
     async def resolve_tmdb_ref(self, key: str) -> Optional[tuple[str, str]]:
         """``(media_type, tmdb_id)`` для ключа фильма.
 
         Синтетический ключ ``tmdb:movie|tv:<id>`` разбираем напрямую; реальный
-        IMDb id (``tt…``) резолвим через ``/find`` (external_source=imdb_id).
+        IMDb id (``tt…``) — сначала по ``title_refs``, иначе через ``/find``
+        (external_source=imdb_id) с запоминанием связки.
         None, если TMDb выключен / формат чужой / в ``/find`` ничего не нашлось.
         """
         parsed = parse_tmdb_key(key)
@@ -267,6 +312,9 @@ class TMDBService:
             return parsed
         if not self.enabled or not key or not key.startswith("tt"):
             return None
+        stored = await _stored_refs([key])
+        if key in stored:
+            return stored[key]
         async with httpx.AsyncClient(timeout=10.0) as client:
             try:
                 resp = await client.get(
@@ -282,6 +330,7 @@ class TMDBService:
         for kind, results_key in (("movie", "movie_results"), ("tv", "tv_results")):
             results = data.get(results_key) or []
             if results and results[0].get("id"):
+                await _remember_refs([(key, kind, str(results[0]["id"]))])
                 return kind, str(results[0]["id"])
         return None
 
@@ -345,6 +394,39 @@ class TMDBService:
             "buy": self._normalize_providers(entry.get("buy")),
         }
 
+    async def discover_by_provider(
+        self, kind: str, region: str, provider_id: int, page: int = 1,
+    ) -> Optional[tuple[list[int], int]]:
+        """Страница тайтлов вида ``kind``, доступных по подписке у провайдера.
+
+        ``/discover/movie|tv`` c ``with_watch_providers`` — сырьё для офлайн-
+        индекса доступности (``availability_index``). Возвращает
+        ``(tmdb_ids, total_pages)``; None при выключенном TMDb или сетевой ошибке.
+        """
+        if not self.enabled:
+            return None
+        async with httpx.AsyncClient(timeout=10.0) as client:
+            try:
+                resp = await client.get(
+                    f"{self.base_url}/discover/{kind}",
+                    params={
+                        "api_key": self.api_key,
+                        "watch_region": region.upper(),
+                        "with_watch_providers": str(provider_id),
+                        "with_watch_monetization_types": "flatrate",
+                        "include_adult": "false",
+                        "sort_by": "popularity.desc",
+                        "page": page,
+                    },
+                )
+                resp.raise_for_status()
+            except httpx.HTTPError as exc:
+                print(f"[tmdb] discover failed for {kind}/{region}/{provider_id}: {exc}")
+                return None
+            data = resp.json() or {}
+        ids = [int(h["id"]) for h in (data.get("results") or []) if h.get("id")]
+        return ids, int(data.get("total_pages") or 0)
+
     @staticmethod
     def _parse_details(kind: str, key: str, data: dict, cfg: dict) -> Optional[MovieBase]:
         original_key = cfg["title_keys"][1]
@@ -0,0 +1,158 @@
+"""Очередь входящих апдейтов Telegram для webhook-бота.
+
+Раньше ``POST /telegram/webhook/<secret>`` ждал ``bot_app.process_update``
+до ответа. Обработчик Reels ждёт Apify до 240 с — всё это время HTTP-запрос
+Telegram висел открытым, Telegram считал доставку неудачной, слал апдейт
+повторно, и тот же Reel обрабатывался дважды.
+
+Теперь webhook только проверяет апдейт, кладёт его сюда и сразу отвечает 200;
+обрабатывают ``TELEGRAM_UPDATE_WORKERS`` фоновых корутин. Гарантии:
+
+* дубли по ``update_id`` (повторная доставка) отбрасываются — помним
+  последние ``DEDUP_SIZE`` id;
+* апдейты одного чата обрабатываются строго по очереди и по порядку: у чата
+  своя очередь, и в работе у воркеров одновременно не больше одного его
+  апдейта; разные чаты идут параллельно;
+* ждущих апдейтов не больше ``TELEGRAM_UPDATE_QUEUE_MAX`` — сверх того
+  ``enqueue`` возвращает False, webhook отвечает 503, и Telegram повторит
+  доставку позже (апдейт при этом не помечается виденным).
+
+Глубина очереди и задержка от приёма до начала обработки — в ``snapshot()``
+(``/api/health/full``).
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from backend import config
+
+DEDUP_SIZE = 10_000
+
+
+def _chat_key(update: Any) -> Hashable:
+    """Ключ упорядочивания: чат, иначе пользователь, иначе сам апдейт."""
+    chat = getattr(update, "effective_chat", None)
+    if chat is not None:
+        return ("chat", chat.id)
+    user = getattr(update, "effective_user", None)
+    if user is not None:
+        return ("user", user.id)
+    return ("update", update.update_id)
+
+
+class UpdateQueue:
+    def __init__(
+        self,
+        workers: int = config.TELEGRAM_UPDATE_WORKERS,
+        max_pending: int = config.TELEGRAM_UPDATE_QUEUE_MAX,
+    ) -> None:
+        self.workers = workers
+        self.max_pending = max_pending
+        self._process: Optional[Callable[[Any], Awaitable[Any]]] = None
+        # Ключ чата есть в _chats, пока у чата есть апдейты в очереди или в
+        # работе; в _ready — не больше одного раза, и только когда свободен.
+        self._chats: dict[Hashable, deque[tuple[float, Any]]] = {}
+        self._ready: asyncio.Queue[Hashable] = asyncio.Queue()
+        self._seen: OrderedDict[int, None] = OrderedDict()
+        self._tasks: list[asyncio.Task] = []
+        self._pending = 0
+        self._in_progress = 0
+        self._lag_total = 0.0
+        self._lag_max = 0.0
+        self.stats = {
+            "accepted": 0, "duplicates": 0, "rejected": 0,
+            "processed": 0, "failed": 0,
+        }
+
+    def start(self, process: Callable[[Any], Awaitable[Any]]) -> None:
+        """Запустить воркеров; ``process`` — обычно ``bot_app.process_update``."""
+        self._process = process
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def enqueue(self, update: Any) -> bool:
+        """Принять апдейт. False — очередь полна, Telegram должен повторить."""
+        update_id = update.update_id
+        if update_id in self._seen:
+            self.stats["duplicates"] += 1
+            return True
+        if self._pending >= self.max_pending:
+            self.stats["rejected"] += 1
+            return False
+        self._seen[update_id] = None
+        while len(self._seen) > DEDUP_SIZE:
+            self._seen.popitem(last=False)
+
+        key = _chat_key(update)
+        item = (time.monotonic(), update)
+        if key in self._chats:
+            self._chats[key].append(item)
+        else:
+            self._chats[key] = deque([item])
+            self._ready.put_nowait(key)
+        self._pending += 1
+        self.stats["accepted"] += 1
+        return True
+
+    async def _worker(self) -> None:
+        while True:
+            key = await self._ready.get()
+            queued_at, update = self._chats[key].popleft()
+            self._pending -= 1
+            self._in_progress += 1
+            lag = time.monotonic() - queued_at
+            self._lag_total += lag
+            self._lag_max = max(self._lag_max, lag)
+            try:
+                await self._process(update)
+                self.stats["processed"] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:  # один упавший апдейт не стопорит чат
+                self.stats["failed"] += 1
+                print(f"[bot] update {update.update_id} failed: {exc}", flush=True)
+            finally:
+                self._in_progress -= 1
+                if self._chats[key]:
+                    self._ready.put_nowait(key)  # в конец — другие чаты не ждут
+                else:
+                    del self._chats[key]
+
+    async def stop(self, drain_timeout: float = config.TELEGRAM_UPDATE_DRAIN_SECONDS) -> None:
+        """Дать очереди до ``drain_timeout`` секунд доработать, затем отменить воркеров."""
+        deadline = time.monotonic() + drain_timeout
+        while self._chats and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def snapshot(self) -> dict[str, Any]:
+        started = self.stats["processed"] + self.stats["failed"] + self._in_progress
+        oldest = min(
+            (items[0][0] for items in self._chats.values() if items), default=None,
+        )
+        return {
+            "workers": self.workers,
+            "pending": self._pending,
+            "in_progress": self._in_progress,
+            "chats": len(self._chats),
+            **self.stats,
+            "avg_lag_ms": round(1000 * self._lag_total / started, 1) if started else 0.0,
+            "max_lag_ms": round(1000 * self._lag_max, 1),
+            "oldest_pending_ms": (
+                round(1000 * (time.monotonic() - oldest), 1) if oldest is not None else 0.0
+            ),
+        }
+
+
+# Синглтон для использования в приложении
+queue = UpdateQueue()
@@ -8,6 +8,7 @@ Movie Picker — Telegram Bot (локальная разработка, long-pol
 
 from backend.config import TELEGRAM_BOT_TOKEN
 from backend.database import init_db
+from backend.services.event_buffer import buffer as event_buffer
 from bot_setup import build_application
 
 
@@ -17,13 +18,18 @@ async def post_init(application):
     print("База данных инициализирована.")
 
 
+async def post_shutdown(application):
+    """Дописать в БД события, ещё лежащие в буфере аналитики."""
+    await event_buffer.stop()
+
+
 def main():
     if not TELEGRAM_BOT_TOKEN:
         print("Ошибка: TELEGRAM_BOT_TOKEN не указан в .env")
         print("Получите токен у @BotFather в Telegram")
         return
 
-    app = build_application(post_init=post_init)
+    app = build_application(post_init=post_init, post_shutdown=post_shutdown)
 
     print("Бот запущен! Нажми Ctrl+C для остановки.")
     app.run_polling(drop_pending_updates=True)
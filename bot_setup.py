@@ -78,17 +78,20 @@ def register_handlers(app: Application) -> None:
     ))
 
 
-def build_application(post_init=None) -> Application:
+def build_application(post_init=None, post_shutdown=None) -> Application:
     """Build a PTB Application with all handlers registered.
 
     ``concurrent_updates(True)`` lets the long-polling path (``bot.py``) process
     updates in parallel instead of one-at-a-time, so a slow handler no longer
-    blocks every other tap. The webhook path feeds ``process_update`` directly
-    per HTTP request, so it's already concurrent there — the flag is harmless.
+    blocks every other tap. The webhook path feeds ``process_update`` from the
+    worker pool in ``backend.services.update_queue``, which already runs chats
+    in parallel (and each chat in order) — the flag is harmless there.
     """
     builder = ApplicationBuilder().token(TELEGRAM_BOT_TOKEN).concurrent_updates(True)
     if post_init is not None:
         builder = builder.post_init(post_init)
+    if post_shutdown is not None:
+        builder = builder.post_shutdown(post_shutdown)
     app = builder.build()
     register_handlers(app)
     return app
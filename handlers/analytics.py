@@ -1,14 +1,15 @@
 """Лёгкий трекинг событий из бота — пишет в ту же таблицу ``events``.
 
-Зеркало фронтового ``analytics.ts``, но source='bot'. Best-effort: любые
-ошибки глушим, аналитика не должна ронять обработку Telegram-апдейта.
+Зеркало фронтового ``analytics.ts``, но source='bot'. Best-effort: события
+идут через ``event_buffer`` — обработка Telegram-апдейта не ждёт БД, а сбой
+записи её не роняет.
 """
 from __future__ import annotations
 
 from typing import Optional
 
-from backend import database as db
 from backend.models.event import ALLOWED_EVENTS
+from backend.services.event_buffer import buffer
 
 
 async def track_bot(
@@ -17,12 +18,10 @@ async def track_bot(
     """Записать событие из бота. Имена — из общего allowlist (см. модель)."""
     if name not in ALLOWED_EVENTS:
         return
-    try:
-        await db.insert_events([{
-            "name": name,
-            "user_id": user_id,
-            "props": props or {},
-            "source": "bot",
-        }])
-    except Exception as exc:  # аналитика не ломает бота
-        print(f"[analytics] bot track failed: {exc}")
+    # Только в буфер: запись в БД — фоновым сбросом, вне обработки апдейта.
+    buffer.add([{
+        "name": name,
+        "user_id": user_id,
+        "props": props or {},
+        "source": "bot",
+    }])
@@ -1,9 +1,15 @@
+import asyncio
+import time
+
 from telegram import Update
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
 
 from backend import database as db
+from backend.services.availability import get_availability
 from backend.services.llm import llm_service
 from backend.services.title_search import search_title
+from handlers.callbacks import _get_or_create_user
 from handlers.formatting import imdb_suffix
 from handlers.search import send_search_results
 
@@ -52,9 +58,53 @@ async def text_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await _do_recommend(update, query)
 
 
+# Telegram ограничивает частоту правок сообщения — правим не чаще раза в секунду,
+# промежуточные куски объяснения копятся между правками.
+EDIT_INTERVAL_SECONDS = 1.0
+
+
+def _render_recommendation(
+    query: str,
+    movies: list,
+    explanation: str,
+    providers: dict[int, list[str]],
+) -> str:
+    """Текст ответа на любой стадии: карточки → объяснение → где смотреть."""
+    text = f"Под «{query}»:\n\n"
+    for i, movie in enumerate(movies, 1):
+        rating = imdb_suffix(movie.imdb_rating, "  ★ ")
+        year = f" ({movie.year})" if movie.year else ""
+        genres = f" — {', '.join(movie.genres)}" if movie.genres else ""
+        text += f"{i}. *{movie.title}*{year}{rating}{genres}\n"
+        if movie.description:
+            text += f"   _«{movie.description}»_\n"
+        if providers.get(movie.id):
+            text += f"   📺 {', '.join(providers[movie.id])}\n"
+        text += "\n"
+    if explanation:
+        text += f"💡 {explanation}"
+    return text
+
+
+async def _edit(message, text: str, markdown: bool = True) -> None:
+    """Best-effort правка: недописанная разметка и «not modified» не валят
+    подбор. Без ``markdown`` — финальный фолбэк плоским текстом."""
+    try:
+        await message.edit_text(text, parse_mode="Markdown" if markdown else None)
+    except BadRequest as exc:
+        if markdown and "not modified" not in str(exc).lower():
+            await _edit(message, text, markdown=False)
+
+
 async def _do_recommend(update: Update, query: str):
-    """Общая логика рекомендаций"""
-    movies = await db.get_unwatched_movies()
+    """Общая логика рекомендаций — с прогрессивной правкой одного сообщения.
+
+    Те же три стадии, что у ``/api/recommend/stream``: сначала карточки (как
+    только LLM дописала строку с ID), потом объяснение по мере генерации,
+    потом «где смотреть» — по одному фильму, как резолвится доступность.
+    """
+    user_row = await _get_or_create_user(update.effective_user)
+    movies = await db.get_unwatched_movies(user_id=user_row["id"])
 
     if not movies:
         await update.message.reply_text(
@@ -63,43 +113,69 @@ async def _do_recommend(update: Update, query: str):
         )
         return
 
-    await update.message.reply_text(f"Подбираю под «{query}»...")
+    status_message = await update.message.reply_text(f"Подбираю под «{query}»...")
 
+    recommended: list = []
+    explanation = ""
+    last_edit = 0.0
     try:
-        recommended_ids, explanation = await llm_service.recommend_movies(
+        async for kind, value in llm_service.stream_recommend_movies(
             query, movies, max_recommendations=3
-        )
+        ):
+            if kind == "ids":
+                by_id = {m.id: m for m in movies}
+                recommended = [by_id[i] for i in dict.fromkeys(value) if i in by_id]
+                if recommended:
+                    await _edit(status_message, _render_recommendation(query, recommended, "", {}))
+                    last_edit = time.monotonic()
+                continue
+            explanation += value
+            if recommended and time.monotonic() - last_edit >= EDIT_INTERVAL_SECONDS:
+                await _edit(
+                    status_message,
+                    _render_recommendation(query, recommended, explanation, {}),
+                )
+                last_edit = time.monotonic()
     except Exception as e:
         print(f"Ошибка рекомендаций: {type(e).__name__}: {e}")
-        await update.message.reply_text(
-            f"Не получилось: {type(e).__name__}: {e}"
-        )
+        await _edit(status_message, f"Не получилось: {type(e).__name__}: {e}", markdown=False)
         return
 
-    if not recommended_ids:
-        await update.message.reply_text(
-            f"Под «{query}» ничего не нашла в твоём списке.\n\n"
-            f"{explanation}"
+    explanation = explanation.strip()
+    if not recommended:
+        await _edit(
+            status_message,
+            f"Под «{query}» ничего не нашла в твоём списке.\n\n{explanation}",
+            markdown=False,
         )
         return
 
-    # Находим рекомендованные фильмы
-    recommended = [m for m in movies if m.id in recommended_ids]
-    id_to_order = {id_: idx for idx, id_ in enumerate(recommended_ids)}
-    recommended.sort(key=lambda m: id_to_order.get(m.id, 999))
+    await _edit(status_message, _render_recommendation(query, recommended, explanation, {}))
 
-    # Отправляем результат
-    text = f"Под «{query}»:\n\n"
-
-    for i, movie in enumerate(recommended, 1):
-        rating = imdb_suffix(movie.imdb_rating, "  ★ ")
-        year = f" ({movie.year})" if movie.year else ""
-        genres = f" — {', '.join(movie.genres)}" if movie.genres else ""
-        text += f"{i}. *{movie.title}*{year}{rating}{genres}\n"
-        if movie.description:
-            text += f"   _«{movie.description}»_\n"
-        text += "\n"
-
-    text += f"💡 {explanation}"
-
-    await update.message.reply_text(text, parse_mode="Markdown")
+    # Где смотреть: по одному фильму, как только резолвится доступность.
+    settings = await db.get_user_settings(user_row["id"])
+    services = set(settings["streaming_services"])
+    if not services:
+        return
+    providers: dict[int, list[str]] = {}
+
+    async def _one(movie):
+        # Сбой TMDb на одном фильме не должен обрывать бейджи остальных.
+        try:
+            return movie, await get_availability(movie.imdb_id, settings["region"])
+        except Exception as e:
+            print(f"Доступность {movie.imdb_id} не получена: {type(e).__name__}: {e}")
+            return movie, None
+
+    for next_done in asyncio.as_completed([_one(m) for m in recommended]):
+        movie, av = await next_done
+        names = [
+            p["name"] for p in ((av or {}).get("flatrate") or [])
+            if p.get("provider_id") in services
+        ]
+        if names:
+            providers[movie.id] = names
+            await _edit(
+                status_message,
+                _render_recommendation(query, recommended, explanation, providers),
+            )
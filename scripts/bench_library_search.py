@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""Бенчмарк поиска по библиотеке: 50k фильмов у одного пользователя.
+
+Сравнивает ``db.search_movies`` (FTS5) с прежним способом — выкачать
+библиотеку целиком (``get_all_movies``) и искать подстроку в Python, как это
+делал клиент. Заодно меряет время индексации при вставке (триггеры FTS).
+
+Гоняется на временной SQLite-БД, боевую не трогает:
+
+    python scripts/bench_library_search.py [--movies 50000] [--runs 10]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+# Make `backend` importable when run as `python scripts/...`.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Временная БД — до импорта backend.config.
+os.environ["DATABASE_PATH"] = tempfile.mktemp(prefix="bench_search_", suffix=".db")
+os.environ.pop("DATABASE_URL", None)
+os.environ.setdefault("JWT_SECRET", "bench-secret-not-for-production-0123456789")
+
+import aiosqlite  # noqa: E402
+
+from backend import database as db  # noqa: E402
+
+SYLLABLES_RU = "ма три ца ста лкер зер ка ло со ля рис бра т во йна ми р но чь го род".split()
+SYLLABLES_EN = "ma trix stal ker mir ror so la ris bro ther war pea ce nig ht ci ty".split()
+
+
+def _vocabulary(syllables: list[str], size: int, rnd: random.Random) -> list[str]:
+    """Словарь в тысячи слов: запрос, как в жизни, попадает в малую долю строк."""
+    words: set[str] = set()
+    while len(words) < size:
+        words.add("".join(rnd.choices(syllables, k=rnd.randint(2, 4))))
+    return sorted(words)
+
+
+_vocab_rnd = random.Random(7)
+WORDS_RU = _vocabulary(SYLLABLES_RU, 5000, _vocab_rnd)
+WORDS_EN = _vocabulary(SYLLABLES_EN, 5000, _vocab_rnd)
+NAMES = [w.capitalize() for w in _vocabulary(SYLLABLES_EN, 800, _vocab_rnd)]
+QUERIES = (
+    WORDS_RU[100][:4],                      # префикс: много совпадений
+    WORDS_RU[1000],                         # одно слово
+    f"{WORDS_RU[2000]} {WORDS_RU[2001]}",   # два слова — оба обязательны
+    NAMES[10],                              # актёр/режиссёр
+    WORDS_EN[3000],                         # оригинальное название
+)
+
+
+def _row(user_id: int, i: int, rnd: random.Random) -> tuple:
+    title = " ".join(rnd.sample(WORDS_RU, 2)).capitalize()
+    return (
+        user_id, f"tt{i:08d}", title, " ".join(rnd.sample(WORDS_EN, 2)).title(),
+        1950 + i % 70, json.dumps(["Drama"]), " ".join(rnd.sample(WORDS_RU, 12)),
+        json.dumps(rnd.sample(NAMES, 3)), rnd.choice(NAMES),
+        " ".join(rnd.sample(WORDS_RU, 20)),
+    )
+
+
+async def _seed(n: int) -> tuple[int, float]:
+    await db.init_db()
+    user = await db.create_user(email="bench@example.com", name="Bench")
+    rnd = random.Random(42)
+    rows = [_row(user["id"], i, rnd) for i in range(n)]
+    started = time.perf_counter()
+    async with aiosqlite.connect(os.environ["DATABASE_PATH"]) as conn:
+        await conn.executemany(
+            "INSERT INTO movies (user_id, imdb_id, title, original_title, year, genres, "
+            'description, "cast", director, plot_ru) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            rows,
+        )
+        await conn.commit()
+    return user["id"], time.perf_counter() - started
+
+
+def _naive_match(movie, words: list[str]) -> bool:
+    text = " ".join(
+        str(v) for v in (
+            movie.title, movie.original_title, movie.director, movie.cast,
+            movie.description, movie.plot_ru, movie.user_note,
+        ) if v
+    ).lower()
+    return all(w in text for w in words)
+
+
+async def _timed(coro_factory, runs: int) -> tuple[float, object]:
+    timings, result = [], None
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = await coro_factory()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), result
+
+
+async def main(n: int, runs: int) -> None:
+    user_id, insert_s = await _seed(n)
+    print(f"{n} фильмов, вставка с индексацией FTS: {insert_s:.1f}s")
+
+    naive_ms, movies = await _timed(lambda: db.get_all_movies(user_id=user_id), 3)
+    print(f"  выкачать всю библиотеку (get_all_movies): {naive_ms:8.1f}ms")
+    for q in QUERIES:
+        words = q.lower().split()
+        started = time.perf_counter()
+        naive_hits = sum(1 for m in movies if _naive_match(m, words))
+        filter_ms = (time.perf_counter() - started) * 1000
+        fts_ms, (rows, _) = await _timed(
+            lambda: db.search_movies(user_id, q, limit=20), runs,
+        )
+        total_ms, _ = await _timed(
+            lambda: db.search_movies(user_id, q, limit=10_000), max(1, runs // 5),
+        )
+        print(
+            f"  {q!r:<20} FTS top-20 {fts_ms:7.1f}ms | все совпадения {total_ms:7.1f}ms"
+            f" | выкачать+фильтр {naive_ms + filter_ms:7.1f}ms ({naive_hits} совпадений)"
+        )
+    os.unlink(os.environ["DATABASE_PATH"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--movies", type=int, default=50_000)
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args.movies, args.runs))
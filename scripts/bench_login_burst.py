@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Нагрузочный тест: задержка event loop во время пачки логинов.
+
+Поднимает приложение на временной SQLite (через ASGI, без сети), регистрирует
+пользователя и шлёт ``--burst`` одновременных ``POST /auth/login``. Параллельно
+тикер каждые 5 мс замеряет, насколько поздно loop его будит, — это задержка,
+которую в это время получил бы любой другой запрос (включая webhook бота).
+
+Два режима:
+
+* ``pool`` — как в приложении: bcrypt в ``services.password_pool``;
+* ``inline`` — прежнее поведение: bcrypt прямо в корутине.
+
+    python scripts/bench_login_burst.py [--burst 20] [--rounds 12] [--workers 2]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# Make `backend` importable when run as `python scripts/...`.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("JWT_SECRET", "bench-secret-not-for-production-0123456789")
+os.environ["DATABASE_PATH"] = tempfile.NamedTemporaryFile(suffix=".db", delete=False).name
+os.environ.pop("DATABASE_URL", None)
+os.environ["RATE_LIMIT_ENABLED"] = "0"
+
+EMAIL = "burst@example.com"
+PASSWORD = "bench-passw0rd-X"
+
+
+async def _run(client, burst: int) -> tuple[list[float], float, list[int]]:
+    lags: list[float] = []
+    done = asyncio.Event()
+
+    async def _ticker():
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(0.005)
+            lags.append(time.perf_counter() - started - 0.005)
+
+    ticker = asyncio.create_task(_ticker())
+    started = time.perf_counter()
+    responses = await asyncio.gather(*(
+        client.post("/auth/login", json={"email": EMAIL, "password": PASSWORD})
+        for _ in range(burst)
+    ))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await ticker
+    return lags, elapsed, [r.status_code for r in responses]
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--burst", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+    os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+    os.environ["PASSWORD_HASH_WORKERS"] = str(args.workers)
+    os.environ["PASSWORD_HASH_QUEUE"] = str(args.burst)
+
+    from httpx import ASGITransport, AsyncClient
+
+    from backend import auth
+    from backend import database as db
+    from backend.main import app
+
+    await db.init_db()
+    pooled_submit = auth.password_pool.submit
+
+    async def _inline(func, *a):
+        return func(*a)
+
+    print(f"{args.burst} concurrent logins, bcrypt cost {args.rounds}, {args.workers} workers")
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+        r = await client.post(
+            "/auth/register", json={"email": EMAIL, "password": PASSWORD, "name": "B"},
+        )
+        r.raise_for_status()
+        for mode, submit in (("inline", _inline), ("pool", pooled_submit)):
+            auth.password_pool.submit = submit
+            lags, elapsed, codes = await _run(client, args.burst)
+            lags_ms = sorted(1000 * lag for lag in lags)
+            p99 = lags_ms[int(0.99 * (len(lags_ms) - 1))] if lags_ms else 0.0
+            print(
+                f"{mode:7} total {elapsed:6.2f}s  loop lag p50 "
+                f"{statistics.median(lags_ms) if lags_ms else 0.0:7.1f}ms  p99 {p99:7.1f}ms"
+                f"  max {max(lags_ms, default=0.0):7.1f}ms  ticks {len(lags_ms):4}"
+                f"  ok {codes.count(200)}/{len(codes)}"
+            )
+    print("pool stats:", auth.password_pool.snapshot())
+    auth.password_pool.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
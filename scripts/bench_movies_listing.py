@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Бенчмарк листинга библиотеки: ``GET /api/movies`` на 2000 фильмов.
+
+Сравнивает прежний ответ (весь список, все колонки) с первой страницей сетки
+(``limit=60&fields=card``) и полным обходом страницами по курсору: размер
+ответа и латентность через ASGI-клиент, без сети.
+
+Гоняется на временной SQLite-БД, боевую не трогает:
+
+    python scripts/bench_movies_listing.py [--movies 2000] [--runs 20]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# Make `backend` importable when run as `python scripts/...`.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Временная БД и тестовые значения — до импорта backend.config.
+os.environ["DATABASE_PATH"] = tempfile.mktemp(prefix="bench_movies_", suffix=".db")
+os.environ.pop("DATABASE_URL", None)
+os.environ.setdefault("JWT_SECRET", "bench-secret-not-for-production-0123456789")
+os.environ["SKIP_AWARDS_SEED"] = "1"
+os.environ["RATE_LIMIT_ENABLED"] = "0"
+
+from httpx import ASGITransport, AsyncClient  # noqa: E402
+
+from backend import database as db  # noqa: E402
+from backend.auth import create_access_token  # noqa: E402
+from backend.main import app  # noqa: E402
+from backend.models.movie import MovieBase  # noqa: E402
+
+PLOT = "A long plot paragraph describing the film in some detail. " * 12
+
+
+async def _seed(n: int) -> dict:
+    await db.init_db()
+    user = await db.create_user(email="bench@example.com", name="Bench")
+    for i in range(n):
+        await db.add_movie(
+            MovieBase(
+                imdb_id=f"tt{i:07d}", title=f"Film {i}", year=1950 + i % 70,
+                genres=["Drama", "Comedy"], plot=PLOT, plot_ru=PLOT,
+                cast=["Actor One", "Actor Two", "Actor Three"],
+                director="Someone", poster_url=f"https://img.example/{i}.jpg",
+                imdb_rating=7.1, awards="Nominated for 1 Oscar.", runtime=100,
+                description="Короткое описание от LLM.",
+            ),
+            user_id=user["id"],
+        )
+    return user
+
+
+async def _measure(client, url: str, headers: dict, runs: int) -> tuple[float, int]:
+    timings, size = [], 0
+    for _ in range(runs):
+        started = time.perf_counter()
+        r = await client.get(url, headers=headers)
+        timings.append((time.perf_counter() - started) * 1000)
+        size = len(r.content)
+    return statistics.median(timings), size
+
+
+async def _walk_pages(client, headers: dict, limit: int) -> tuple[float, int, int]:
+    started, total, pages, cursor = time.perf_counter(), 0, 0, None
+    while True:
+        url = f"/api/movies?in_library=true&fields=card&limit={limit}"
+        r = await client.get(url + (f"&cursor={cursor}" if cursor else ""), headers=headers)
+        total += len(r.content)
+        pages += 1
+        cursor = r.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    return (time.perf_counter() - started) * 1000, total, pages
+
+
+async def main(n: int, runs: int) -> None:
+    user = await _seed(n)
+    headers = {"Authorization": f"Bearer {create_access_token(user['id'])}"}
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+        full_ms, full_size = await _measure(
+            client, "/api/movies?in_library=true", headers, runs,
+        )
+        page_ms, page_size = await _measure(
+            client, "/api/movies?in_library=true&fields=card&limit=60", headers, runs,
+        )
+        walk_ms, walk_size, pages = await _walk_pages(client, headers, 500)
+
+    print(f"{n} фильмов, медиана по {runs} прогонам")
+    print(f"  весь список, все поля:       {full_ms:8.1f}ms  {full_size / 1024:8.1f} KiB")
+    print(f"  первая страница сетки (60):  {page_ms:8.1f}ms  {page_size / 1024:8.1f} KiB")
+    print(f"  вся сетка по 500 ({pages} стр.):   {walk_ms:8.1f}ms  {walk_size / 1024:8.1f} KiB")
+    os.unlink(os.environ["DATABASE_PATH"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--movies", type=int, default=2000)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.movies, args.runs))
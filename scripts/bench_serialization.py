@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""CPU-бенчмарк сериализации списка фильмов: 1k и 10k строк.
+
+Сравнивает, сколько стоит превратить строки SQLite в тело ответа:
+
+* ``pydantic + encoder`` — прежний путь ``response_model=list[Movie]``:
+  строка → ``Movie`` → FastAPI дампит модели, валидирует список заново,
+  прогоняет через ``jsonable_encoder`` и ``json.dumps`` (так работает FastAPI
+  из нижней границы requirements);
+* ``pydantic dump_json`` — то же, но с сериализацией через pydantic-core
+  (быстрый путь свежего FastAPI), валидация по-прежнему двойная;
+* ``dict + orjson`` — текущий путь листинга: строка сразу в dict
+  (``_project_value``), тело — ``backend.responses.dumps``.
+
+Только CPU, без БД и сети:
+
+    python scripts/bench_serialization.py [--sizes 1000 10000] [--runs 5]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+# Make `backend` importable when run as `python scripts/...`.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("JWT_SECRET", "bench-secret-not-for-production-0123456789")
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+
+from backend import db_sqlite  # noqa: E402
+from backend.models import Movie  # noqa: E402
+from backend.responses import dumps, orjson  # noqa: E402
+
+PLOT = "A long plot paragraph describing the film in some detail. " * 12
+MOVIES = TypeAdapter(list[Movie])
+
+
+def _rows(n: int) -> list[tuple]:
+    """Строки в том виде, в каком их отдаёт aiosqlite (порядок SELECT_COLUMNS)."""
+    return [
+        (
+            i, f"tt{i:07d}", f"Фильм {i}", f"Film {i}", 1950 + i % 70,
+            '["Drama", "Comedy"]', "Короткое описание от LLM.", PLOT,
+            '["Actor One", "Actor Two", "Actor Three"]', "Someone",
+            f"https://img.example/{i}.jpg", 7.1, "Nominated for 1 Oscar.",
+            i % 2, "personal", "2024-05-01T12:00:00", None, None, 1, None, None,
+            PLOT, 4.5 if i % 2 else None, None,
+            "2024-06-01T20:00:00" if i % 2 else None, "movie", None, 100,
+        )
+        for i in range(n)
+    ]
+
+
+def _pydantic_encoder(rows: list[tuple]) -> bytes:
+    movies = [db_sqlite._row_to_movie(r) for r in rows]
+    validated = MOVIES.validate_python([m.model_dump() for m in movies])
+    return json.dumps(jsonable_encoder(validated)).encode("utf-8")
+
+
+def _pydantic_dump_json(rows: list[tuple]) -> bytes:
+    movies = [db_sqlite._row_to_movie(r) for r in rows]
+    return MOVIES.dump_json(MOVIES.validate_python([m.model_dump() for m in movies]))
+
+
+def _dict_fast(rows: list[tuple]) -> bytes:
+    fields = db_sqlite.MOVIE_FIELDS
+    return dumps([
+        {f: db_sqlite._project_value(f, v) for f, v in zip(fields, r)} for r in rows
+    ])
+
+
+def _cpu_ms(func, rows: list[tuple], runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        started = time.process_time()
+        func(rows)
+        timings.append((time.process_time() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main(sizes: list[int], runs: int) -> None:
+    paths = [
+        ("pydantic + encoder", _pydantic_encoder),
+        ("pydantic dump_json", _pydantic_dump_json),
+        ("dict + orjson" if orjson else "dict + json", _dict_fast),
+    ]
+    print(f"CPU-время, медиана по {runs} прогонам")
+    for n in sizes:
+        rows = _rows(n)
+        # Тела должны совпадать по содержимому — иначе сравнение бессмысленно.
+        assert json.loads(_dict_fast(rows)) == json.loads(_pydantic_dump_json(rows))
+        base = None
+        for name, func in paths:
+            ms = _cpu_ms(func, rows, runs)
+            base = base or ms
+            print(f"  {n:>6} фильмов  {name:<20} {ms:9.1f}ms  ×{base / ms:4.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    main(args.sizes, args.runs)
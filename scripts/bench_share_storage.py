@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""Сколько места занимают снимки шэров: старый формат против ссылок.
+
+Синтетический набор: каталог из ``--catalog`` фильмов с длинными сюжетами
+(``plot``/``plot_ru``/``description``), ``--shares`` шэров по ``--size``
+фильмов; популярные фильмы попадают в шэры чаще (распределение Ципфа), как
+топы и лауреаты в реальных списках. Личные поля (оценка, просмотрено, дата
+добавления) у каждого шэра свои.
+
+Считает байты полезной нагрузки, без накладных расходов БД на строку:
+
+* ``legacy`` — полный JSON снимка в ``shared_lists.snapshot``;
+* ``refs`` — ``share_items`` (хэш + личные поля) плюс уникальные сжатые
+  метаданные в ``share_movies`` (``services.share_snapshot``).
+
+Только CPU, без БД и сети:
+
+    python scripts/bench_share_storage.py [--shares 2000] [--size 40] [--catalog 3000]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+# Make `backend` importable when run as `python scripts/...`.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("JWT_SECRET", "bench-secret-not-for-production-0123456789")
+
+from backend.models import Movie  # noqa: E402
+from backend.services import share_snapshot  # noqa: E402
+
+PLOT = "A long plot paragraph describing the film in some detail. "
+PLOT_RU = "Длинный абзац сюжета, подробно пересказывающий фильм. "
+
+
+def _catalog(n: int) -> list[dict]:
+    return [
+        {
+            "imdb_id": f"tt{i:07d}",
+            "title": f"Фильм {i}",
+            "original_title": f"Film {i}",
+            "year": 1950 + i % 70,
+            "genres": ["Drama", "Comedy"],
+            "description": f"Короткое описание фильма {i} от LLM.",
+            "plot": PLOT * (6 + i % 10),
+            "plot_ru": PLOT_RU * (6 + i % 10),
+            "cast": ["Actor One", "Actor Two", "Actor Three"],
+            "director": "Someone",
+            "poster_url": f"https://img.example/{i}.jpg",
+            "imdb_rating": 7.1,
+            "awards": "Nominated for 1 Oscar.",
+            "runtime": 100 + i % 60,
+        }
+        for i in range(n)
+    ]
+
+
+def _shares(catalog: list[dict], shares: int, size: int, rng: random.Random) -> list[list[Movie]]:
+    weights = [1 / (rank + 1) for rank in range(len(catalog))]
+    added = datetime(2025, 1, 1)
+    result = []
+    for s in range(shares):
+        picked = {id(m): m for m in rng.choices(catalog, weights, k=size)}.values()
+        result.append([
+            Movie(
+                **meta,
+                id=s * size + pos,
+                is_watched=rng.random() < 0.5,
+                user_rating=rng.choice([None, None, 3.0, 4.0, 5.0]),
+                rec_source=rng.choice([None, "telegram", "friends"]),
+                added_at=added + timedelta(minutes=s * size + pos),
+            )
+            for pos, meta in enumerate(picked)
+        ])
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--shares", type=int, default=2000)
+    parser.add_argument("--size", type=int, default=40)
+    parser.add_argument("--catalog", type=int, default=3000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    shares = _shares(_catalog(args.catalog), args.shares, args.size, rng)
+
+    legacy = sum(
+        len(json.dumps(
+            [m.model_dump(mode="json", exclude=share_snapshot.EXCLUDE) for m in movies]
+        ).encode("utf-8"))
+        for movies in shares
+    )
+    item_bytes = 0
+    metadata: dict[str, bytes] = {}
+    for movies in shares:
+        items, blobs = share_snapshot.encode(movies)
+        item_bytes += sum(len(h) + len(o.encode("utf-8")) for h, o in items)
+        metadata.update(blobs)
+    meta_bytes = sum(len(h) + len(b) for h, b in metadata.items())
+    refs = item_bytes + meta_bytes
+
+    titles = sum(len(m) for m in shares)
+    print(f"{args.shares} shares, {titles} titles, {len(metadata)} unique metadata rows")
+    print(f"legacy   {legacy / 1e6:9.2f} MB")
+    print(f"refs     {refs / 1e6:9.2f} MB  (items {item_bytes / 1e6:.2f} + metadata {meta_bytes / 1e6:.2f})")
+    print(f"saved    {100 * (1 - refs / legacy):8.1f} %  ({legacy / refs:.1f}x smaller)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""Построить офлайн-индекс доступности (``services.availability_index``) разово.
+
+То же, что периодическая задача ``availability_index`` в приложении, — для
+первого заполнения или при ``AVAILABILITY_INDEX_INTERVAL=0``. Обходит
+``/discover`` TMDb для всех пар регион+провайдер из настроек пользователей.
+
+Хранилище выбирается по ``DATABASE_URL``, как и в приложении. Нужен
+``TMDB_API_KEY``:
+
+    DATABASE_URL='postgresql://...' TMDB_API_KEY='...' \
+        python scripts/build_availability_index.py
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+import time
+
+# Make `backend` importable when run as `python scripts/...`.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend import database as db  # noqa: E402
+from backend.services.availability_index import build_index  # noqa: E402
+
+
+async def main() -> None:
+    await db.init_db()
+    started = time.monotonic()
+    await build_index()
+    rows = await db.get_availability_index()
+    for r in sorted(rows, key=lambda r: (r["region"], r["provider_id"], r["kind"])):
+        print(
+            f"  {r['region']} провайдер {r['provider_id']:>4} {r['kind']:<5} "
+            f"{r['titles']:>6} тайтлов, {len(r['bitmap']) / 1024:7.1f} KiB"
+            f"{'' if r['complete'] else '  (неполный: лимит страниц)'}"
+        )
+    print(f"[index] готово за {time.monotonic() - started:.1f}s, битсетов: {len(rows)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
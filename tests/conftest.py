@@ -34,6 +34,9 @@ os.environ.setdefault("JWT_SECRET", "test-secret-not-for-production-0123456789ab
 # limiter back on for itself.
 os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
 
+# Minimum bcrypt cost: the suite registers many users and doesn't test bcrypt.
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
 
 @pytest.fixture(scope="session")
 def event_loop():
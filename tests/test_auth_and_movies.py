@@ -13,6 +13,7 @@ under test:
 
 from __future__ import annotations
 
+import base64
 from datetime import datetime
 from unittest.mock import AsyncMock, patch
 
@@ -249,7 +250,7 @@ async def test_recommend_with_inline_library_works_for_guest(client):
 
     # Stub the LLM call to avoid hitting Claude. recommend_movies returns
     # (recommended_imdb_ids, explanation).
-    async def _fake_recommend(_movies, _query, max_recommendations=3):
+    async def _fake_recommend(_movies, _query, max_recommendations=3, preferred_ids=None):
         return ([1], "stubbed")
 
     with patch(
@@ -269,3 +270,222 @@ async def test_recommend_with_inline_library_works_for_guest(client):
     # the recommender produces no suggestions — either is acceptable; what we
     # care about is that it didn't 401 or 500.
     assert r.status_code in (200, 422), r.text
+
+
+@pytest.mark.asyncio
+async def test_movies_keyset_pages_with_card_projection(client):
+    from backend import database as db
+
+    token = await _register(client, email="pager@example.com")
+    user = await db.get_user_by_email("pager@example.com")
+    # Добавлены в одну секунду — порядок внутри added_at держит id.
+    ids = [
+        (await db.add_movie(_moviebase(f"tt_page_{i}", f"Page {i}"), user_id=user["id"])).id
+        for i in range(5)
+    ]
+
+    seen, cursor = [], None
+    while True:
+        url = "/api/movies?in_library=true&limit=2&fields=card"
+        r = await client.get(url + (f"&cursor={cursor}" if cursor else ""), headers=_auth(token))
+        assert r.status_code == 200
+        for row in r.json():
+            assert "plot" not in row and "plot_ru" not in row
+            assert set(row) <= set(_CARD_KEYS)
+        seen += [row["id"] for row in r.json()]
+        cursor = r.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    assert seen == sorted(ids, reverse=True)
+
+    r = await client.get("/api/movies?fields=title,bogus", headers=_auth(token))
+    assert r.status_code == 400
+    r = await client.get("/api/movies?fields=title", headers=_auth(token))
+    assert set(r.json()[0]) == {"id", "title"}
+    r = await client.get("/api/movies?cursor=not-a-cursor", headers=_auth(token))
+    assert r.status_code == 400
+    # Well-formed base64 JSON, but the timestamp is garbage.
+    crafted = base64.urlsafe_b64encode(b'["yesterday", 1]').decode().rstrip("=")
+    r = await client.get(f"/api/movies?cursor={crafted}", headers=_auth(token))
+    assert r.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_movies_full_list_matches_model_serialization(client):
+    """The dict+orjson fast path must emit exactly what response_model would."""
+    from backend import database as db
+    from backend.models import Movie
+
+    token = await _register(client, email="fastjson@example.com")
+    user = await db.get_user_by_email("fastjson@example.com")
+    await db.add_movie(_moviebase("tt_fast_1", "Фаст «Один»"), user_id=user["id"])
+    second = await db.add_movie(_moviebase("tt_fast_2", "Fast Two"), user_id=user["id"])
+    await db.update_movie(second.id, user["id"], is_watched=True, user_rating=4.5)
+
+    r = await client.get("/api/movies", headers=_auth(token))
+    assert r.status_code == 200
+    # Порядок листинга — (added_at, id) по убыванию; фильмы добавлены в одну секунду.
+    movies = sorted(await db.get_all_movies(user_id=user["id"]), key=lambda m: -m.id)
+    expected = [Movie.model_validate(m.model_dump()).model_dump(mode="json") for m in movies]
+    assert r.json() == expected
+    assert r.json()[1]["title"] == "Фаст «Один»"
+
+
+@pytest.mark.asyncio
+async def test_movies_filter_by_genre_and_actor(client):
+    from backend import database as db
+
+    token = await _register(client, email="genres@example.com")
+    user = await db.get_user_by_email("genres@example.com")
+    drama = await db.add_movie(_moviebase("tt_genre_1", "Drama One"), user_id=user["id"])
+    comedy = _moviebase("tt_genre_2", "Comedy Two").model_copy(
+        update={"genres": ["Comedy", "Dramedy"], "cast": ["Bill Murray", "Tim Robbins"]}
+    )
+    comedy = await db.add_movie(comedy, user_id=user["id"])
+
+    found = await db.get_all_movies(user_id=user["id"], genre="Drama")
+    assert [m.id for m in found] == [drama.id]  # «Dramedy» — не «Drama»
+    found = await db.get_all_movies(user_id=user["id"], actor="Tim Robbins")
+    assert {m.id for m in found} == {drama.id, comedy.id}
+    found = await db.get_all_movies(user_id=user["id"], genre="Comedy", actor="Bill Murray")
+    assert [m.id for m in found] == [comedy.id]
+
+    r = await client.get("/api/movies?genre=Comedy&fields=card", headers=_auth(token))
+    assert [row["id"] for row in r.json()] == [comedy.id]
+    r = await client.get("/api/movies?actor=Nobody", headers=_auth(token))
+    assert r.json() == []
+
+
+@pytest.mark.asyncio
+async def test_library_full_text_search(client):
+    from backend import database as db
+
+    token = await _register(client, email="fts@example.com")
+    await _register(client, email="fts-other@example.com")
+    user = await db.get_user_by_email("fts@example.com")
+    other = await db.get_user_by_email("fts-other@example.com")
+    matrix = await db.add_movie(
+        _moviebase("tt_fts_1", "Матрица").model_copy(update={"original_title": "The Matrix"}),
+        user_id=user["id"],
+    )
+    noted = await db.add_movie(_moviebase("tt_fts_2", "Solaris"), user_id=user["id"])
+    await db.update_movie(noted.id, user["id"], user_note="пересмотреть после Матрицы")
+    await db.add_movie(_moviebase("tt_fts_1", "Матрица"), user_id=other["id"])  # чужая
+
+    r = await client.get("/api/movies/search?q=матр", headers=_auth(token))
+    assert r.status_code == 200
+    # Совпадение в названии весит больше, чем в заметке.
+    assert [m["id"] for m in r.json()] == [matrix.id, noted.id]
+
+    r = await client.get("/api/movies/search?q=matrix&fields=card", headers=_auth(token))
+    assert [m["id"] for m in r.json()] == [matrix.id]
+    r = await client.get('/api/movies/search?q="robbins)*(', headers=_auth(token))
+    assert {m["id"] for m in r.json()} == {matrix.id, noted.id}  # cast, синтаксис FTS вычищен
+
+    r = await client.get("/api/movies/search?q=матр&limit=1", headers=_auth(token))
+    assert r.headers["X-Next-Offset"] == "1"
+    r = await client.get("/api/movies/search?q=матр&limit=1&offset=1", headers=_auth(token))
+    assert [m["id"] for m in r.json()] == [noted.id] and "X-Next-Offset" not in r.headers
+
+    # Правка и удаление доходят до индекса триггерами.
+    await db.update_movie(noted.id, user["id"], user_note="")
+    await db.delete_movie(matrix.id, user["id"])
+    r = await client.get("/api/movies/search?q=матр", headers=_auth(token))
+    assert r.json() == []
+
+
+_CARD_KEYS = (
+    "id", "imdb_id", "title", "year", "media_type", "poster_url", "imdb_rating",
+    "is_watched", "user_rating", "runtime", "added_at",
+)
+
+
+@pytest.mark.asyncio
+async def test_library_etag_and_delta_sync(client):
+    from backend import database as db
+
+    token = await _register(client, email="delta@example.com")
+    user = await db.get_user_by_email("delta@example.com")
+    first = await db.add_movie(_moviebase("tt_delta_1", "Delta One"), user_id=user["id"])
+
+    r = await client.get("/api/movies", headers=_auth(token))
+    etag, rev = r.headers["ETag"], int(r.headers["X-Library-Revision"])
+    assert r.status_code == 200 and rev >= 1
+
+    # Ничего не менялось — 304 без тела.
+    r = await client.get("/api/movies", headers={**_auth(token), "If-None-Match": etag})
+    assert r.status_code == 304 and not r.content
+    # Другие параметры — другой ETag.
+    r = await client.get("/api/movies?in_library=true", headers={**_auth(token), "If-None-Match": etag})
+    assert r.status_code == 200
+
+    second = await db.add_movie(_moviebase("tt_delta_2", "Delta Two"), user_id=user["id"])
+    await db.update_movie(first.id, user["id"], is_watched=True)
+    assert await db.delete_movie(second.id, user["id"])
+    # Чужой/несуществующий фильм ревизию не двигает.
+    assert await db.delete_movie(first.id, user["id"] + 1000) is False
+
+    r = await client.get("/api/movies", headers={**_auth(token), "If-None-Match": etag})
+    assert r.status_code == 200 and r.headers["ETag"] != etag
+
+    r = await client.get(f"/api/movies/changes?since={rev}", headers=_auth(token))
+    body = r.json()
+    assert body["full"] is False
+    assert body["revision"] == rev + 3
+    assert [m["id"] for m in body["movies"]] == [first.id]
+    assert body["movies"][0]["is_watched"] is True
+    assert body["deleted"] == [second.id]
+
+    r = await client.get("/api/movies/changes?since=0", headers=_auth(token))
+    assert r.json()["full"] is True
+    assert [m["id"] for m in r.json()["movies"]] == [first.id]
+
+
+@pytest.mark.asyncio
+async def test_authenticated_requests_use_user_cache(client, monkeypatch):
+    """The user row is read once and reused until settings change it."""
+    from backend import auth
+
+    token = await _register(client, "cache_user@example.com")
+    auth.user_cache.invalidate()
+
+    calls = []
+    original = auth.db.get_user_by_id
+
+    async def _counting(user_id):
+        calls.append(user_id)
+        return await original(user_id)
+
+    monkeypatch.setattr(auth.db, "get_user_by_id", _counting)
+    for _ in range(3):
+        assert (await client.get("/auth/me", headers=_auth(token))).status_code == 200
+    assert len(calls) == 1
+
+    r = await client.patch("/api/settings", headers=_auth(token), json={"region": "US"})
+    assert r.status_code == 200
+    assert (await client.get("/auth/me", headers=_auth(token))).status_code == 200
+    assert len(calls) == 2  # PATCH served from cache, then invalidated it
+
+
+def test_token_is_decoded_once_per_request(monkeypatch):
+    from starlette.requests import Request
+
+    from backend import auth
+    from backend.rate_limit import user_or_ip_key
+
+    token = auth.create_access_token(4242)
+    request = Request({
+        "type": "http",
+        "headers": [(b"authorization", f"Bearer {token}".encode())],
+        "client": ("10.0.0.1", 1234),
+    })
+    decoded = []
+    original = auth.decode_access_token
+    monkeypatch.setattr(
+        auth, "decode_access_token", lambda t: decoded.append(t) or original(t),
+    )
+
+    assert auth.token_user_id(request) == 4242
+    assert user_or_ip_key(request) == "user:4242"
+    assert len(decoded) == 1
@@ -0,0 +1,160 @@
+"""Tests for cached Google ID-token / Telegram initData verification."""
+
+from __future__ import annotations
+
+import hashlib
+import hmac
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlencode
+
+import jwt
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from fastapi import HTTPException
+
+from backend import auth
+from backend.services import google_certs
+
+BOT_TOKEN = "123456:test-bot-token"
+CLIENT_ID = "client-123.apps.googleusercontent.com"
+
+
+@pytest.fixture(autouse=True)
+def _clean_cache():
+    auth.verified_cache.clear()
+    yield
+    auth.verified_cache.clear()
+
+
+def _init_data(user_id: int, auth_date: int) -> str:
+    fields = {"auth_date": str(auth_date), "user": json.dumps({"id": user_id})}
+    check = "\n".join(f"{k}={fields[k]}" for k in sorted(fields))
+    secret = hmac.new(b"WebAppData", BOT_TOKEN.encode(), hashlib.sha256).digest()
+    fields["hash"] = hmac.new(secret, check.encode(), hashlib.sha256).hexdigest()
+    return urlencode(fields)
+
+
+def test_init_data_is_verified_once(monkeypatch):
+    monkeypatch.setattr(auth, "TELEGRAM_BOT_TOKEN", BOT_TOKEN)
+    checks = []
+    original = auth._check_telegram_init_data
+    monkeypatch.setattr(
+        auth, "_check_telegram_init_data", lambda d: checks.append(d) or original(d),
+    )
+
+    init_data = _init_data(777, int(time.time()))
+    first = auth.verify_telegram_init_data(init_data)
+    second = auth.verify_telegram_init_data(init_data)
+    assert first["user"]["id"] == second["user"]["id"] == 777
+    assert len(checks) == 1
+
+    # Tampered payloads are rejected every time and never cached.
+    tampered = init_data.replace("777", "778")
+    for _ in range(2):
+        with pytest.raises(HTTPException) as exc:
+            auth.verify_telegram_init_data(tampered)
+        assert exc.value.status_code == 401
+    assert auth.verified_cache.snapshot()["entries"] == 1
+
+
+def test_cached_init_data_expires_with_auth_date(monkeypatch):
+    monkeypatch.setattr(auth, "TELEGRAM_BOT_TOKEN", BOT_TOKEN)
+    issued = int(time.time()) - auth.TELEGRAM_INITDATA_MAX_AGE_SECONDS + 60
+    init_data = _init_data(779, issued)
+    auth.verify_telegram_init_data(init_data)
+
+    later = time.time() + 120  # past auth_date + max age
+    monkeypatch.setattr(auth.time, "time", lambda: later)
+    with pytest.raises(HTTPException) as exc:
+        auth.verify_telegram_init_data(init_data)
+    assert "устарел" in exc.value.detail
+
+
+@pytest.fixture
+def google_key(monkeypatch):
+    """RSA key + self-signed cert installed as the current Google certs."""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "test")])
+    now = datetime.now(timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name).issuer_name(name).public_key(key.public_key())
+        .serial_number(1).not_valid_before(now - timedelta(days=1))
+        .not_valid_after(now + timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    pem = cert.public_bytes(serialization.Encoding.PEM).decode()
+
+    certs = google_certs.GoogleCerts()
+    fetches = []
+
+    async def _fetch():
+        fetches.append(time.monotonic())
+        certs._certs = {"kid-1": pem}
+        certs._attempted_at = time.monotonic()
+        certs._expires_at = certs._attempted_at + 3600
+
+    monkeypatch.setattr(certs, "_fetch", _fetch)
+    monkeypatch.setattr(google_certs, "certs", certs)
+    monkeypatch.setattr(auth, "GOOGLE_CLIENT_ID", CLIENT_ID)
+    return key, fetches
+
+
+def _google_token(key, kid: str = "kid-1", **claims) -> str:
+    now = int(time.time())
+    payload = {
+        "iss": "https://accounts.google.com", "aud": CLIENT_ID, "sub": "g-1",
+        "email": "g@example.com", "email_verified": True,
+        "iat": now, "exp": now + 3600, **claims,
+    }
+    return jwt.encode(payload, key, algorithm="RS256", headers={"kid": kid})
+
+
+async def test_google_token_verified_once_with_prefetched_certs(google_key, monkeypatch):
+    key, fetches = google_key
+    decodes = []
+    original = auth.google_jwt.decode
+    monkeypatch.setattr(
+        auth.google_jwt, "decode", lambda *a, **kw: decodes.append(a) or original(*a, **kw),
+    )
+
+    token = _google_token(key)
+    assert (await auth.verify_google_id_token(token))["sub"] == "g-1"
+    assert (await auth.verify_google_id_token(token))["sub"] == "g-1"
+    assert len(decodes) == 1
+    assert len(fetches) == 1  # certs fetched once, then served from memory
+
+    with pytest.raises(HTTPException) as exc:
+        await auth.verify_google_id_token(_google_token(key, aud="someone-else"))
+    assert exc.value.status_code == 401
+    with pytest.raises(HTTPException):
+        await auth.verify_google_id_token(_google_token(key, iss="evil.example.com"))
+
+
+async def test_unknown_kid_forces_a_rate_limited_refresh(google_key):
+    key, fetches = google_key
+    await auth.verify_google_id_token(_google_token(key))
+    assert len(fetches) == 1
+
+    google_certs.certs._attempted_at -= google_certs.MIN_FORCED_REFRESH
+    for _ in range(3):
+        with pytest.raises(HTTPException):
+            await auth.verify_google_id_token(_google_token(key, kid="rotated"))
+    assert len(fetches) == 2  # one forced refresh, not one per bad token
+
+
+async def test_failed_cert_fetch_backs_off():
+    """With Google unreachable and no certs, logins don't each retry the download."""
+    certs = google_certs.GoogleCerts(url="http://127.0.0.1:9/certs")  # refused
+    assert await certs.get("kid-1") == {}
+    assert await certs.get("kid-1") == {}
+    assert certs.stats == {"fetches": 1, "failures": 1}
+
+    certs._attempted_at -= google_certs.MIN_FORCED_REFRESH
+    await certs.get("kid-1")
+    assert certs.stats["fetches"] == 2
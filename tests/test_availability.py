@@ -7,16 +7,24 @@ cache-or-fetch logic against the real (throwaway) SQLite DB.
 
 from __future__ import annotations
 
-from datetime import timedelta
+import asyncio
+from datetime import datetime, timedelta
 
+import aiosqlite
 import pytest
+import pytest_asyncio
 from unittest.mock import AsyncMock
 
 import backend.services.tmdb as tmdb_mod
 from backend.services.tmdb import tmdb_service
 from backend.services import availability as avail_mod
-from backend.services.availability import get_availability, is_available_on
+from backend.services.availability import (
+    get_availability, get_availability_many, is_available_on,
+)
 from backend import database as db
+from backend.config import DATABASE_PATH
+from backend.models import MovieBase
+from backend.models.movie import MAX_AVAILABILITY_BATCH
 
 
 # ── tiny httpx fake (URL-routing handler) ────────────────────────────────────
@@ -47,8 +55,15 @@ class _FakeClient:
         return _Resp(self._handler(url, params or {}))
 
 
-@pytest.fixture
-def patch_tmdb(monkeypatch):
+async def _forget_title_refs() -> None:
+    async with aiosqlite.connect(DATABASE_PATH) as conn:
+        await conn.execute("DELETE FROM title_refs")
+        await conn.commit()
+
+
+@pytest_asyncio.fixture
+async def patch_tmdb(monkeypatch):
+    await _forget_title_refs()  # fakes reuse ids with different mappings
     monkeypatch.setattr(tmdb_service, "api_key", "test-key")
 
     def _install(handler):
@@ -86,6 +101,15 @@ async def test_resolve_ref_tt_via_find(patch_tmdb):
     assert await tmdb_service.resolve_tmdb_ref("tt0111161") == ("movie", "278")
 
 
+async def test_resolve_ref_reads_stored_ref_before_find(patch_tmdb):
+    patch_tmdb(lambda url, _p: {"movie_results": [{"id": 278}], "tv_results": []})
+    assert await tmdb_service.resolve_tmdb_ref("tt0111161") == ("movie", "278")
+
+    patch_tmdb(lambda url, _p: (_ for _ in ()).throw(AssertionError("no http")))
+    assert await tmdb_service.resolve_tmdb_ref("tt0111161") == ("movie", "278")
+    assert await db.get_title_refs(["tt0111161"]) == {"tt0111161": ("movie", "278")}
+
+
 async def test_resolve_ref_tt_tv_result(patch_tmdb):
     def handler(url, _p):
         if "/find/tt999" in url:
@@ -166,19 +190,24 @@ async def test_get_availability_caches_within_ttl(monkeypatch):
     assert calls["n"] == 1  # second served from cache, no refetch
 
 
-async def test_get_availability_refetches_when_stale(monkeypatch):
-    calls = {"n": 0}
+async def _settle_revalidations() -> None:
+    await asyncio.gather(*list(avail_mod._revalidating.values()))
 
-    async def fake(key, region):
-        calls["n"] += 1
-        return dict(_NETFLIX)
 
+async def test_get_availability_serves_stale_and_revalidates(monkeypatch):
+    await db.upsert_watch_providers_cache("tt_cache_b", "RU", {**_NETFLIX, "link": "old"})
+    fake = AsyncMock(return_value={**_NETFLIX, "link": "new"})
     monkeypatch.setattr(avail_mod.tmdb_service, "get_watch_providers", fake)
     monkeypatch.setattr(avail_mod, "CACHE_TTL", timedelta(0))  # everything stale
 
-    await get_availability("tt_cache_b", "RU")
-    await get_availability("tt_cache_b", "RU")
-    assert calls["n"] == 2  # stale → refetch each time
+    first = await get_availability("tt_cache_b", "RU")
+    second = await get_availability("tt_cache_b", "RU")
+    assert first["link"] == second["link"] == "old"  # no TMDb wait on the request
+    await _settle_revalidations()
+    assert fake.await_count == 1  # one background refetch, deduplicated
+
+    cached, _ = await db.get_watch_providers_cache("tt_cache_b", "RU")
+    assert cached["link"] == "new"
 
 
 async def test_get_availability_returns_stale_on_fetch_failure(monkeypatch):
@@ -198,6 +227,103 @@ async def test_get_availability_none_when_no_data(monkeypatch):
     assert await get_availability("tt_never_seen", "RU") is None
 
 
+async def _backdate(imdb_id: str, region: str, age: timedelta) -> None:
+    async with aiosqlite.connect(DATABASE_PATH) as conn:
+        await conn.execute(
+            "UPDATE watch_providers SET fetched_at = ? WHERE imdb_id = ? AND region = ?",
+            ((datetime.utcnow() - age).isoformat(), imdb_id, region),
+        )
+        await conn.commit()
+
+
+async def test_get_availability_many_fetches_only_missing_inline(monkeypatch):
+    await db.upsert_watch_providers_cache("tt_many_fresh", "RU", dict(_NETFLIX))
+    await db.upsert_watch_providers_cache("tt_many_stale", "RU", {**_NETFLIX, "link": "old"})
+    await _backdate("tt_many_stale", "RU", avail_mod.CACHE_TTL + timedelta(hours=1))
+    fake = AsyncMock(return_value={**_NETFLIX, "link": "new"})
+    monkeypatch.setattr(avail_mod.tmdb_service, "get_watch_providers", fake)
+
+    result = await get_availability_many(
+        ["tt_many_fresh", "tt_many_stale", "tt_many_missing", "tt_many_fresh"], "ru",
+    )
+
+    assert list(result) == ["tt_many_fresh", "tt_many_stale", "tt_many_missing"]
+    assert result["tt_many_fresh"]["link"] == _NETFLIX["link"]  # served from cache
+    assert result["tt_many_stale"]["link"] == "old"             # stale, refreshed later
+    assert result["tt_many_missing"]["link"] == "new"
+    await _settle_revalidations()
+    assert sorted(c.args[0] for c in fake.await_args_list) == [
+        "tt_many_missing", "tt_many_stale",
+    ]
+    cached = await db.get_watch_providers_cache_many(
+        ["tt_many_stale", "tt_many_missing"], "RU",
+    )
+    assert {k: v[0]["link"] for k, v in cached.items()} == {
+        "tt_many_stale": "new", "tt_many_missing": "new",
+    }
+
+
+async def test_get_availability_many_keeps_stale_on_fetch_failure(monkeypatch):
+    await db.upsert_watch_providers_cache("tt_many_fail", "RU", dict(_NETFLIX))
+    monkeypatch.setattr(avail_mod, "CACHE_TTL", timedelta(0))  # force stale
+    monkeypatch.setattr(
+        avail_mod.tmdb_service, "get_watch_providers", AsyncMock(return_value=None)
+    )
+    result = await get_availability_many(["tt_many_fail", "tt_many_none"], "RU")
+    await _settle_revalidations()
+    assert result["tt_many_fail"]["flatrate"][0]["provider_id"] == 8
+    assert result["tt_many_none"] is None
+    cached, _ = await db.get_watch_providers_cache("tt_many_fail", "RU")
+    assert cached == _NETFLIX  # failed refresh keeps the old entry
+
+
+async def test_refresh_due_renews_library_titles_before_expiry(monkeypatch):
+    user = await db.create_user(email="refresh@example.com", name="Refresh")
+    await db.add_movie(MovieBase(imdb_id="tt_refresh_lib", title="Lib"), user_id=user["id"])
+    near_expiry = avail_mod.CACHE_TTL - avail_mod.REFRESH_AHEAD + timedelta(minutes=5)
+    for imdb_id in ("tt_refresh_lib", "tt_refresh_orphan"):
+        await db.upsert_watch_providers_cache(imdb_id, "RU", {**_NETFLIX, "link": "old"})
+        await _backdate(imdb_id, "RU", near_expiry)
+    await db.upsert_watch_providers_cache("tt_refresh_lib", "US", {**_NETFLIX, "link": "old"})
+
+    fake = AsyncMock(return_value={**_NETFLIX, "link": "new"})
+    monkeypatch.setattr(avail_mod.tmdb_service, "api_key", "test-key")
+    monkeypatch.setattr(avail_mod.tmdb_service, "get_watch_providers", fake)
+    await avail_mod.refresh_due()
+
+    # only the library title that is close to expiry; fresh US entry and
+    # titles nobody owns are left alone
+    calls = {c.args for c in fake.await_args_list if c.args[0].startswith("tt_refresh")}
+    assert calls == {("tt_refresh_lib", "RU")}
+    renewed, fetched_at = await db.get_watch_providers_cache("tt_refresh_lib", "RU")
+    assert renewed["link"] == "new"
+    assert datetime.utcnow() - fetched_at < timedelta(minutes=1)
+    orphan, _ = await db.get_watch_providers_cache("tt_refresh_orphan", "RU")
+    assert orphan["link"] == "old"
+
+
+async def test_refresh_due_defers_failed_titles(monkeypatch):
+    user = await db.create_user(email="refresh-fail@example.com", name="Refresh")
+    await db.add_movie(MovieBase(imdb_id="tt_refresh_fail", title="Fail"), user_id=user["id"])
+    near_expiry = avail_mod.CACHE_TTL - avail_mod.REFRESH_AHEAD + timedelta(minutes=5)
+    await db.upsert_watch_providers_cache("tt_refresh_fail", "RU", {**_NETFLIX, "link": "old"})
+    await _backdate("tt_refresh_fail", "RU", near_expiry)
+
+    fake = AsyncMock(return_value=None)  # TMDb keeps failing
+    monkeypatch.setattr(avail_mod.tmdb_service, "api_key", "test-key")
+    monkeypatch.setattr(avail_mod.tmdb_service, "get_watch_providers", fake)
+    await avail_mod.refresh_due()
+    await avail_mod.refresh_due()  # the next run doesn't pick it again
+
+    calls = [c.args for c in fake.await_args_list if c.args[0] == "tt_refresh_fail"]
+    assert calls == [("tt_refresh_fail", "RU")]
+    later = datetime.utcnow() + avail_mod.REFRESH_RETRY_DELAY + timedelta(minutes=1)
+    due = await db.get_watch_providers_due(datetime.utcnow(), 10_000, later)
+    assert ("tt_refresh_fail", "RU") in due  # retried once the delay has passed
+    cached, _ = await db.get_watch_providers_cache("tt_refresh_fail", "RU")
+    assert cached["link"] == "old"
+
+
 # ── is_available_on ──────────────────────────────────────────────────────────
 
 
@@ -238,3 +364,45 @@ async def test_availability_endpoint_empty_when_no_data(client, monkeypatch):
     assert r.json() == {
         "region": "US", "link": None, "flatrate": [], "rent": [], "buy": [],
     }
+
+
+async def test_availability_batch_endpoint(client, monkeypatch):
+    async def fake(key, region):
+        return dict(_NETFLIX, region=region) if key == "tt9300001" else None
+
+    monkeypatch.setattr(avail_mod.tmdb_service, "get_watch_providers", fake)
+    r = await client.post(
+        "/api/availability/batch",
+        json={"imdb_ids": ["tt9300001", "tt9300002"], "region": "us"},
+    )
+    assert r.status_code == 200
+    body = r.json()
+    assert body["tt9300001"]["flatrate"][0]["name"] == "Netflix"
+    assert body["tt9300002"] == {
+        "region": "US", "link": None, "flatrate": [], "rent": [], "buy": [],
+    }
+
+
+async def test_availability_batch_endpoint_rejects_oversized(client):
+    ids = [f"tt94{i:05d}" for i in range(MAX_AVAILABILITY_BATCH + 1)]
+    r = await client.post("/api/availability/batch", json={"imdb_ids": ids})
+    assert r.status_code == 422
+
+
+async def test_availability_batch_endpoint_rejects_non_imdb_ids(client):
+    r = await client.post(
+        "/api/availability/batch", json={"imdb_ids": ["tt9300003", "../etc"]},
+    )
+    assert r.status_code == 422
+
+
+async def test_availability_batch_endpoint_caps_tmdb_fetches(client, monkeypatch):
+    from backend.routers import availability as router_mod
+
+    fetch = AsyncMock(return_value=None)
+    monkeypatch.setattr(avail_mod.tmdb_service, "get_watch_providers", fetch)
+    ids = [f"tt95{i:05d}" for i in range(router_mod.BATCH_MAX_FETCHES + 5)]
+    r = await client.post("/api/availability/batch", json={"imdb_ids": ids})
+    assert r.status_code == 200
+    assert fetch.await_count == router_mod.BATCH_MAX_FETCHES
+    assert list(r.json()) == ids[:router_mod.BATCH_MAX_FETCHES]
@@ -0,0 +1,95 @@
+"""Tests for the offline availability index: bitsets, /discover crawl, lookups.
+
+TMDb ``/discover`` is stubbed at the service method; bitsets and title refs go
+through the real (throwaway) SQLite DB.
+"""
+
+from __future__ import annotations
+
+import zlib
+from unittest.mock import AsyncMock
+
+import pytest
+
+from backend import config
+from backend import database as db
+from backend.services import availability_index as index_mod
+from backend.services.availability_index import has_id, pack_ids
+from backend.services.tmdb import tmdb_service
+
+
+def _unpack(packed: bytes) -> bytes:
+    return zlib.decompress(packed)
+
+
+def test_pack_ids_roundtrip():
+    bits = _unpack(pack_ids([0, 7, 8, 603, 1_400_000]))
+    assert all(has_id(bits, i) for i in (0, 7, 8, 603, 1_400_000))
+    assert not any(has_id(bits, i) for i in (1, 9, 602, 1_399_999, 5_000_000))
+    assert _unpack(pack_ids([])) == b""
+
+
+def _discover(pages: dict[tuple[str, int], tuple[list[int], int]]):
+    async def fake(kind, region, provider_id, page=1):
+        return pages.get((kind, page), ([], 1))
+    return fake
+
+
+@pytest.fixture
+async def index_user(monkeypatch, request):
+    monkeypatch.setattr(tmdb_service, "api_key", "test-key")
+    monkeypatch.setattr(index_mod.rate_limiter, "rate", 0)  # no throttling in tests
+    user = await db.create_user(email=f"{request.node.name}@example.com", name="Idx")
+    await db.update_user_settings(user["id"], region="DE", streaming_services=[8])
+    await db.save_title_refs([
+        ("tt_idx_matrix", "movie", "603"), ("tt_idx_other", "movie", "11"),
+    ])
+    return user
+
+
+async def test_build_index_and_check_many(monkeypatch, index_user):
+    monkeypatch.setattr(tmdb_service, "discover_by_provider", _discover({
+        ("movie", 1): ([10, 603], 2), ("movie", 2): ([77], 2), ("tv", 1): ([5], 1),
+    }))
+    await index_mod.build_index()
+
+    rows = {
+        (r["region"], r["provider_id"], r["kind"]): r
+        for r in await db.get_availability_index()
+    }
+    assert rows[("DE", 8, "movie")]["titles"] == 3
+    assert rows[("DE", 8, "movie")]["complete"] is True
+
+    result = await index_mod.index.check_many(
+        ["tt_idx_matrix", "tmdb:tv:5", "tt_idx_other", "tt_idx_unref"], "de", [8],
+    )
+    assert result == {
+        "tt_idx_matrix": True,   # in the movie bitset
+        "tmdb:tv:5": True,       # synthetic key needs no title ref
+        "tt_idx_other": False,   # complete index, not there
+        "tt_idx_unref": None,    # no TMDb ref → unknown
+    }
+    # A service nobody indexed keeps "not found" unknown rather than False.
+    assert (await index_mod.index.check_many(["tt_idx_other"], "DE", [8, 999])) == {
+        "tt_idx_other": None,
+    }
+
+
+async def test_build_index_page_cap_marks_incomplete(monkeypatch, index_user):
+    monkeypatch.setattr(config, "AVAILABILITY_INDEX_MAX_PAGES", 1)
+    fake = AsyncMock(side_effect=_discover({("movie", 1): ([603], 40), ("tv", 1): ([], 1)}))
+    monkeypatch.setattr(tmdb_service, "discover_by_provider", fake)
+    await index_mod.build_index()
+
+    assert all(c.args[3] == 1 for c in fake.await_args_list)  # never past the cap
+    result = await index_mod.index.check_many(["tt_idx_matrix", "tt_idx_other"], "DE", [8])
+    assert result == {"tt_idx_matrix": True, "tt_idx_other": None}
+
+
+async def test_build_index_keeps_old_bitset_when_crawl_fails(monkeypatch, index_user):
+    await db.save_availability_index("DE", 8, "movie", pack_ids([603]), 1, True)
+    monkeypatch.setattr(tmdb_service, "discover_by_provider", AsyncMock(return_value=None))
+    await index_mod.build_index()
+
+    result = await index_mod.index.check_many(["tt_idx_matrix"], "DE", [8])
+    assert result == {"tt_idx_matrix": True}
@@ -0,0 +1,141 @@
+"""In-memory awards catalog snapshot: loaded once, served without DB reads.
+
+Seeds a catalog row into the throwaway SQLite DB, refreshes the snapshot, then
+makes ``db.get_awards`` explode to prove ``/api/awards`` no longer touches it.
+"""
+
+from __future__ import annotations
+
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from backend import database as db
+from backend.models.movie import MovieBase
+from backend.services import awards_catalog
+from backend.services.prompt_lines import movie_prompt_line
+
+
+@pytest.mark.asyncio
+async def test_awards_served_from_snapshot_without_db(client):
+    row = await db.add_movie(
+        MovieBase(imdb_id="tt7770001", title="Snapshot Winner", year=2001,
+                  genres=["Drama"], plot="A plot."),
+        user_id=None, source="awards", in_library=False,
+        award="Palme d'Or", award_year=2001,
+    )
+    await awards_catalog.refresh()
+
+    with patch(
+        "backend.services.awards_catalog.db.get_awards",
+        new=AsyncMock(side_effect=AssertionError("no DB read expected")),
+    ):
+        r = await client.get("/api/awards")
+
+    assert r.status_code == 200
+    assert "tt7770001" in {m["imdb_id"] for m in r.json()}
+    # The prompt line is precomputed and keyed by (id, imdb_id).
+    assert awards_catalog.prompt_line(row) == movie_prompt_line(row)
+    assert awards_catalog.prompt_line(row.model_copy(update={"imdb_id": "ttOther"})) is None
+
+
+@pytest.mark.asyncio
+async def test_apply_plot_ru_updates_snapshot_in_place():
+    row = await db.add_movie(
+        MovieBase(imdb_id="tt7770002", title="Needs Translation", plot="Plot."),
+        user_id=None, source="awards", in_library=False,
+    )
+    before = await awards_catalog.refresh()
+
+    awards_catalog.apply_plot_ru({row.id: "Сюжет.", -1: "не из каталога"})
+
+    after = await awards_catalog.get_snapshot()
+    assert after is not before                       # swapped, not mutated
+    assert next(m for m in before.movies if m.id == row.id).plot_ru is None
+    assert next(m for m in after.movies if m.id == row.id).plot_ru == "Сюжет."
+
+
+@pytest.mark.asyncio
+async def test_lazy_load_started_mid_sync_does_not_overwrite_final_snapshot():
+    """A slow lazy read that finishes after the sync's refresh must not win."""
+    import asyncio
+
+    release = asyncio.Event()
+    real = db.get_awards
+
+    async def slow_partial():
+        await release.wait()
+        return []  # what the catalog looked like when the lazy read started
+
+    with patch.object(awards_catalog.db, "get_awards", new=slow_partial):
+        lazy = asyncio.create_task(awards_catalog.refresh())
+        await asyncio.sleep(0)
+    final = await awards_catalog.refresh()  # end of the sync, full catalog
+    release.set()
+    await lazy
+
+    assert (await awards_catalog.get_snapshot()) is final
+    assert len(final.movies) == len(await real())
+
+
+@pytest.mark.asyncio
+async def test_sync_skips_existing_and_checkpoints(tmp_path, monkeypatch):
+    from backend.services import awards_seed
+
+    await db.add_movie(
+        MovieBase(imdb_id="tt7770010", title="Already Seeded"),
+        user_id=None, source="awards", in_library=False,
+    )
+    catalog = tmp_path / "catalog.json"
+    catalog.write_text(
+        '[{"imdb_id": "tt7770010", "award": "Oscar"},'
+        ' {"imdb_id": "tt7770011", "award": "Oscar", "award_year": 2011},'
+        ' {"imdb_id": "tt7770011", "award": "Oscar", "award_year": 2011}]'
+    )
+    monkeypatch.setattr(awards_seed, "CATALOG_PATH", str(catalog))
+    fetch = AsyncMock(return_value=MovieBase(imdb_id="tt7770011", title="New Winner"))
+
+    with patch.object(awards_seed.omdb_service, "get_movie_by_id", new=fetch), \
+         patch.object(awards_seed, "backfill_plot_ru", new=AsyncMock()):
+        await awards_seed.sync_awards_catalog()
+        # A second run over the same file resumes from the checkpoint: no OMDB.
+        await awards_seed.sync_awards_catalog()
+
+    fetch.assert_awaited_once_with("tt7770011")
+    assert "tt7770011" in await db.get_award_imdb_ids()
+
+
+@pytest.mark.asyncio
+async def test_sync_retries_entries_whose_fetch_failed(tmp_path, monkeypatch):
+    from backend.services import awards_seed
+
+    catalog = tmp_path / "catalog.json"
+    catalog.write_text(
+        '[{"imdb_id": "tt7770020", "award": "Oscar"},'
+        ' {"imdb_id": "tt7770021", "award": "Oscar"},'
+        ' {"imdb_id": "tt7770022", "award": "Oscar"}]'
+    )
+    monkeypatch.setattr(awards_seed, "CATALOG_PATH", str(catalog))
+    calls: list[str] = []
+
+    async def flaky(imdb_id: str):
+        calls.append(imdb_id)
+        if imdb_id == "tt7770021" and calls.count(imdb_id) == 1:
+            raise RuntimeError("OMDB 503")
+        if imdb_id == "tt7770022":
+            return None  # OMDB definitively doesn't know it
+        return MovieBase(imdb_id=imdb_id, title=f"Winner {imdb_id}")
+
+    with patch.object(awards_seed.omdb_service, "get_movie_by_id", new=flaky), \
+         patch.object(awards_seed, "backfill_plot_ru", new=AsyncMock()):
+        await awards_seed.sync_awards_catalog()
+        assert "tt7770021" not in await db.get_award_imdb_ids()
+        # The checkpoint stopped at the failed entry, so the rerun retries it.
+        await awards_seed.sync_awards_catalog()
+        # Everything resolved now: a third run makes no OMDB calls.
+        await awards_seed.sync_awards_catalog()
+
+    assert calls.count("tt7770021") == 2
+    assert calls.count("tt7770020") == 1
+    assert calls.count("tt7770022") == 2  # past the failure, so re-asked once
+    assert {"tt7770020", "tt7770021"} <= await db.get_award_imdb_ids()
@@ -55,8 +55,11 @@ class _FakeContext:
 
 
 def _fake_anthropic_message(text: str):
+    from anthropic.types import Usage
+
     content = type("C", (), {"text": text})()
-    return type("M", (), {"content": [content]})()
+    usage = Usage(input_tokens=120, output_tokens=40)
+    return type("M", (), {"content": [content], "usage": usage})()
 
 
 # ── extract_media ────────────────────────────────────────────────────────────
@@ -0,0 +1,165 @@
+"""Bot recommendation: one status message edited progressively.
+
+``_do_recommend`` mirrors ``/api/recommend/stream``: the message first shows the
+cards (as soon as the LLM has written the ID line), then the explanation as it
+streams, then the «где смотреть» badges one movie at a time. The streamed LLM
+response and the Telegram message are fakes; we assert on the sequence of
+``edit_text`` calls.
+"""
+
+from __future__ import annotations
+
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from telegram.error import BadRequest
+
+from backend import database as db
+from backend.models.movie import MovieBase
+from handlers import recommend
+
+
+# ── fakes ────────────────────────────────────────────────────────────────────
+
+
+class _FakeStatus:
+    """Сообщение «Подбираю…»: записывает каждую правку (текст, parse_mode)."""
+
+    def __init__(self, reject_markdown: bool = False, not_modified: bool = False):
+        self.edits: list[tuple[str, str | None]] = []
+        self.reject_markdown = reject_markdown
+        self.not_modified = not_modified
+
+    async def edit_text(self, text, parse_mode=None, **kw):
+        self.edits.append((text, parse_mode))
+        if self.not_modified:
+            raise BadRequest("Message is not modified")
+        if self.reject_markdown and parse_mode == "Markdown":
+            raise BadRequest("Can't parse entities: can't find end of the entity")
+
+
+class _FakeMessage:
+    def __init__(self, status: _FakeStatus):
+        self.status = status
+        self.replies: list[str] = []
+
+    async def reply_text(self, text, **kw):
+        self.replies.append(text)
+        return self.status
+
+
+def _update(telegram_id: int, status: _FakeStatus) -> SimpleNamespace:
+    return SimpleNamespace(
+        effective_user=SimpleNamespace(
+            id=telegram_id, first_name="Test", last_name=None, username=None,
+        ),
+        message=_FakeMessage(status),
+    )
+
+
+def _stage(text: str) -> int:
+    """0 — только карточки, 1 — с объяснением, 2 — с бейджами."""
+    if "📺" in text:
+        return 2
+    return 1 if "💡" in text else 0
+
+
+# ── progressive message ──────────────────────────────────────────────────────
+
+
+@pytest.mark.asyncio
+async def test_do_recommend_edits_cards_then_explanation_then_badges(monkeypatch):
+    user = await db.create_user(email="botrec1@tg.example.com", telegram_id=940001)
+    first = await db.add_movie(
+        MovieBase(imdb_id="tt_botrec_1", title="First Pick", year=2001), user_id=user["id"],
+    )
+    second = await db.add_movie(
+        MovieBase(imdb_id="tt_botrec_2", title="Second Pick"), user_id=user["id"],
+    )
+    await db.update_user_settings(user["id"], region="US", streaming_services=[8])
+    monkeypatch.setattr(recommend, "EDIT_INTERVAL_SECONDS", 0)
+
+    async def fake_stream(query, movies, max_recommendations=3, preferred_ids=None):
+        yield "ids", [second.id, first.id, second.id]  # duplicates collapse
+        yield "text", "Оба про "
+        yield "text", "дружбу. "
+
+    async def fake_availability(imdb_id, region):
+        if imdb_id == "tt_botrec_1":
+            return {"flatrate": [{"provider_id": 8, "name": "Netflix"},
+                                 {"provider_id": 9, "name": "Other"}]}
+        return None
+
+    status = _FakeStatus()
+    with patch("handlers.recommend.llm_service.stream_recommend_movies", new=fake_stream), \
+         patch("handlers.recommend.get_availability", new=fake_availability):
+        await recommend._do_recommend(_update(940001, status), "про дружбу")
+
+    texts = [text for text, _ in status.edits]
+    stages = [_stage(t) for t in texts]
+    assert stages[0] == 0                      # cards before any explanation
+    assert stages == sorted(stages) and set(stages) == {0, 1, 2}
+    assert texts[0].index("Second Pick") < texts[0].index("First Pick")
+    assert texts[0].count("Second Pick") == 1
+
+    final = texts[-1]
+    assert "💡 Оба про дружбу." in final      # trailing whitespace stripped
+    assert "📺 Netflix" in final and "Other" not in final
+    assert all(mode == "Markdown" for _, mode in status.edits)
+
+
+@pytest.mark.asyncio
+async def test_do_recommend_without_services_stops_after_explanation(monkeypatch):
+    user = await db.create_user(email="botrec2@tg.example.com", telegram_id=940002)
+    movie = await db.add_movie(MovieBase(imdb_id="tt_botrec_3", title="Solo"), user_id=user["id"])
+
+    async def fake_stream(query, movies, max_recommendations=3, preferred_ids=None):
+        yield "ids", [movie.id]
+        yield "text", "Потому что."
+
+    status = _FakeStatus()
+    availability = AsyncMock()
+    with patch("handlers.recommend.llm_service.stream_recommend_movies", new=fake_stream), \
+         patch("handlers.recommend.get_availability", new=availability):
+        await recommend._do_recommend(_update(940002, status), "что-нибудь")
+
+    assert "💡 Потому что." in status.edits[-1][0]
+    availability.assert_not_called()
+
+
+# ── Markdown fallback ────────────────────────────────────────────────────────
+
+
+@pytest.mark.asyncio
+async def test_edit_falls_back_to_plain_text_on_markdown_bad_request():
+    status = _FakeStatus(reject_markdown=True)
+    await recommend._edit(status, "1. *Half_open")
+    assert status.edits == [("1. *Half_open", "Markdown"), ("1. *Half_open", None)]
+
+
+@pytest.mark.asyncio
+async def test_edit_ignores_not_modified():
+    status = _FakeStatus(not_modified=True)
+    await recommend._edit(status, "same text")
+    assert status.edits == [("same text", "Markdown")]  # no plain-text retry
+
+
+@pytest.mark.asyncio
+async def test_do_recommend_with_broken_markdown_still_shows_result(monkeypatch):
+    user = await db.create_user(email="botrec3@tg.example.com", telegram_id=940003)
+    movie = await db.add_movie(
+        MovieBase(imdb_id="tt_botrec_4", title="Snake_case *Title"), user_id=user["id"],
+    )
+
+    async def fake_stream(query, movies, max_recommendations=3, preferred_ids=None):
+        yield "ids", [movie.id]
+        yield "text", "Готово."
+
+    status = _FakeStatus(reject_markdown=True)
+    with patch("handlers.recommend.llm_service.stream_recommend_movies", new=fake_stream):
+        await recommend._do_recommend(_update(940003, status), "тест")
+
+    text, mode = status.edits[-1]
+    assert mode is None
+    assert "Snake_case *Title" in text and "💡 Готово." in text
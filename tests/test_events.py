@@ -1,16 +1,20 @@
 """Tests for the event analytics endpoint + insert helper.
 
 Best-effort semantics matter: unknown event names are dropped, a DB failure
-must NOT surface as a 500, and the bot writes events directly via insert_events.
+must NOT surface as a 500, and both the endpoint and the bot go through the
+in-process event buffer (flushed explicitly here instead of waiting for the timer).
 """
 
 from __future__ import annotations
 
+import asyncio
+
 import aiosqlite
 import pytest
 
 from backend import database as db
 from backend.config import DATABASE_PATH
+from backend.services.event_buffer import EventBuffer, buffer
 
 
 async def _register(client, email: str) -> str:
@@ -27,6 +31,7 @@ def _auth(token: str) -> dict[str, str]:
 
 
 async def _fetchrow(query: str, params: tuple):
+    await buffer.flush()
     async with aiosqlite.connect(DATABASE_PATH) as conn:
         async with conn.execute(query, params) as cur:
             return await cur.fetchone()
@@ -80,9 +85,12 @@ async def test_events_failure_does_not_500(client, monkeypatch):
     async def boom(rows):
         raise RuntimeError("db down")
 
-    monkeypatch.setattr("backend.routers.events.db.insert_events", boom)
+    monkeypatch.setattr("backend.services.event_buffer.db.insert_events", boom)
+    failed = buffer.stats["failed"]
     r = await client.post("/api/events", json={"events": [{"name": "app_open"}]})
     assert r.status_code == 200  # analytics never breaks the client
+    await buffer.flush()  # the write fails in the background, not in the request
+    assert buffer.stats["failed"] == failed + 1
 
 
 async def test_events_batch_cap_rejected(client):
@@ -100,3 +108,138 @@ async def test_insert_events_bot_source(client):
         (4242,),
     )
     assert row is not None and row[0] == "bot"
+
+
+async def test_track_bot_goes_through_buffer(client):
+    from handlers.analytics import track_bot
+
+    await track_bot("app_open", 4343, {"via": "start"})
+    assert buffer.snapshot()["pending"] >= 1  # handler returned before any DB write
+    row = await _fetchrow(
+        "SELECT source FROM events WHERE user_id = ? AND name = 'app_open'", (4343,),
+    )
+    assert row is not None and row[0] == "bot"
+
+
+async def test_event_buffer_flushes_by_size_drops_on_overflow_and_on_stop(monkeypatch):
+    written: list[list[dict]] = []
+
+    async def fake_insert(rows):
+        written.append(rows)
+
+    monkeypatch.setattr("backend.services.event_buffer.db.insert_events", fake_insert)
+    buf = EventBuffer(flush_batch=3, flush_interval=60, max_pending=5)
+
+    assert buf.add([{"name": "app_open"}] * 3) == 3
+    await asyncio.sleep(0.05)  # size threshold woke the flusher, no timer wait
+    assert [len(b) for b in written] == [3] and all(r["ts"] for r in written[0])
+
+    assert buf.add([{"name": "app_open"}] * 2) == 2
+    assert buf.add([{"name": "app_open"}] * 6) == 3  # only 5 may wait
+    assert buf.stats["dropped"] == 3
+
+    await buf.stop()  # leftovers land on shutdown, in batch-sized chunks
+    assert [len(b) for b in written] == [3, 3, 2]
+    assert buf.snapshot()["pending"] == 0
+
+
+async def test_event_buffer_flushes_again_after_stop_and_start(monkeypatch):
+    written: list[list[dict]] = []
+
+    async def fake_insert(rows):
+        written.append(rows)
+
+    monkeypatch.setattr("backend.services.event_buffer.db.insert_events", fake_insert)
+    buf = EventBuffer(flush_batch=2, flush_interval=60, max_pending=10)
+    await buf.stop()
+
+    buf.add([{"name": "app_open"}] * 2)
+    await asyncio.sleep(0.05)
+    assert written == []  # stopped: no background flush until start()
+
+    buf.start()
+    await asyncio.sleep(0.05)
+    assert [len(b) for b in written] == [2]
+    buf.add([{"name": "app_open"}] * 2)  # the restarted loop picks up new events
+    await asyncio.sleep(0.05)
+    assert [len(b) for b in written] == [2, 2]
+    await buf.stop()
+
+
+async def test_rollup_builds_funnel_once_and_prunes_raw_events(client, monkeypatch):
+    from datetime import datetime, timedelta
+
+    from backend.services import analytics_rollup
+
+    # Свежие события других тестов не должны задерживать прогон.
+    monkeypatch.setattr(analytics_rollup, "SETTLE_SECONDS", 0)
+    me, t0 = 5151, datetime.utcnow() - timedelta(days=100)
+
+    def ev(name: str, minutes: int, **props) -> dict:
+        return {"name": name, "user_id": me, "source": "web", "props": props,
+                "ts": t0 + timedelta(minutes=minutes)}
+
+    await db.insert_events([
+        # Сессия 1: полная воронка с фильтром доступности → «решающая».
+        ev("app_open", 0),
+        ev("recommendation_requested", 1, onlyAvailable=True),
+        ev("tonight_pick_viewed", 2),
+        ev("launch_clicked", 3),
+        # Сессия 2 (после разрыва > 30 мин): запуск без показа — не решающая.
+        ev("recommendation_requested", 120),
+        ev("launch_clicked", 121),
+    ])
+    # Всё накопившееся, включая события других тестов.
+    await analytics_rollup.run_once()
+    await analytics_rollup.run_once()  # повторный прогон ничего не удваивает
+
+    report = (await db.get_funnel(t0.date(), user_id=me))
+    assert report == [{
+        "day": t0.date().isoformat(), "active": 1, "requested": 2, "viewed": 1,
+        "launched": 2, "sessions": 2, "decisive": 1, "decisive_only_available": 1,
+    }]
+    # Сырые события старше EVENTS_RETENTION_DAYS удалены — агрегаты остались.
+    assert await _fetchrow("SELECT 1 FROM events WHERE user_id = ?", (me,)) is None
+
+    monkeypatch.setattr("backend.config.METRICS_TOKEN", "s3cret")
+    r = await client.get(f"/api/metrics/funnel?days=120&user_id={me}")
+    assert r.status_code == 401
+    r = await client.get(
+        f"/api/metrics/funnel?days=120&user_id={me}", headers={"X-Metrics-Token": "s3cret"},
+    )
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert body["totals"]["decisive"] == 1 and body["totals"]["launched"] == 2
+    assert body["rolled_up_to"] > 0
+
+
+async def test_rollup_stops_at_first_unsettled_event(monkeypatch):
+    """A lower id with a newer ts (flushed late by another process) isn't skipped."""
+    from datetime import datetime, timedelta
+
+    from backend.services import analytics_rollup
+
+    monkeypatch.setattr(analytics_rollup, "SETTLE_SECONDS", 0)
+    await analytics_rollup.run_once()  # drain everything earlier tests left
+    hwm = await analytics_rollup.get_high_water_mark()
+
+    me, now = 5252, datetime.utcnow()
+    await db.insert_events([
+        {"name": "app_open", "user_id": me, "source": "web", "props": {}, "ts": now},
+        {"name": "launch_clicked", "user_id": me, "source": "web", "props": {},
+         "ts": now - timedelta(days=1)},
+    ])
+    monkeypatch.setattr(analytics_rollup, "SETTLE_SECONDS", 60)
+
+    # The older, higher-id event qualifies, but the lower id isn't settled yet:
+    # nothing may be rolled up past it.
+    assert await analytics_rollup.rollup_batch(hwm, now=now) == hwm
+
+    later = now + timedelta(minutes=2)
+    new_hwm = await analytics_rollup.rollup_batch(hwm, now=later)
+    assert new_hwm > hwm
+    for name in ("app_open", "launch_clicked"):
+        row = await _fetchrow(
+            "SELECT count FROM event_daily WHERE user_id = ? AND name = ?", (me, name),
+        )
+        assert row == (1,), name
@@ -23,3 +23,55 @@ async def test_health_full_reports_database(client):
     assert "OMDB_API_KEY" in body["secrets"]
     assert "APIFY_TOKEN" in body["secrets"]
     assert body["instagram"]["backend"] == "apify"
+
+
+@pytest.mark.asyncio
+async def test_background_pipeline_is_supervised_and_reported(client):
+    from backend.services import background
+
+    runner = background.BackgroundRunner()
+
+    async def failing():
+        background.runner.report(ignored=True)   # другой раннер — no-op
+        raise RuntimeError("omdb down")
+
+    async def progressing():
+        runner.report(processed=3, total=10)
+
+    await runner.run_pipeline([("seed", failing), ("backfill", progressing)])
+
+    snap = runner.snapshot()["tasks"]
+    assert snap["seed"]["state"] == "failed"
+    assert "omdb down" in snap["seed"]["error"]
+    assert snap["backfill"]["state"] == "ok"      # упавший шаг не валит следующий
+    assert snap["backfill"]["progress"] == {"processed": 3, "total": 10}
+
+    r = await client.get("/api/health/full")
+    assert "tasks" in r.json()["background"]
+
+
+@pytest.mark.asyncio
+async def test_health_full_hides_errors_and_internals_without_token(client, monkeypatch):
+    from backend.services import background
+
+    runner = background.BackgroundRunner()
+
+    async def failing():
+        raise RuntimeError("GET https://omdb/?apikey=secret failed")
+
+    await runner.run_pipeline([("seed", failing)])
+    monkeypatch.setattr(background, "runner", runner)
+    monkeypatch.setattr("backend.config.METRICS_TOKEN", "s3cret")
+
+    public = (await client.get("/api/health/full")).json()
+    assert public["background"]["tasks"]["seed"]["state"] == "failed"
+    assert "error" not in public["background"]["tasks"]["seed"]
+    assert "secret" not in str(public["background"])
+    assert "internals" not in public
+
+    wrong = await client.get("/api/health/full", headers={"X-Metrics-Token": "nope"})
+    assert "internals" not in wrong.json()
+
+    full = (await client.get("/api/health/full", headers={"X-Metrics-Token": "s3cret"})).json()
+    assert "apikey=secret" in full["background"]["tasks"]["seed"]["error"]
+    assert {"auth", "telegram_updates", "shares"} <= set(full["internals"])
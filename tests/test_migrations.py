@@ -0,0 +1,91 @@
+"""Versioned schema migrations: applied once, then a single version read."""
+
+from __future__ import annotations
+
+import asyncio
+
+import aiosqlite
+import pytest
+
+from backend import db_sqlite
+from backend.migrations import MigrationSet
+
+
+@pytest.mark.asyncio
+async def test_fresh_db_is_migrated_once_then_only_reads_version(tmp_path, monkeypatch):
+    path = str(tmp_path / "fresh.db")
+    monkeypatch.setattr(db_sqlite, "DATABASE_PATH", path)
+
+    await db_sqlite.init_db()
+    async with aiosqlite.connect(path) as conn:
+        async with conn.execute("SELECT version FROM schema_version") as cur:
+            versions = [r[0] for r in await cur.fetchall()]
+    assert versions == [v.version for v in db_sqlite.MIGRATIONS.pending(0)]
+
+    # Second start: nothing pending, no migration body runs.
+    def _boom(*_args, **_kwargs):
+        raise AssertionError("schema probe on an up-to-date DB")
+
+    monkeypatch.setattr(db_sqlite, "_ensure_column", _boom)
+    await db_sqlite.init_db()
+
+
+@pytest.mark.asyncio
+async def test_legacy_db_without_schema_version_is_upgraded(tmp_path, monkeypatch):
+    """A pre-migrations database (old movies table, no schema_version)."""
+    path = str(tmp_path / "legacy.db")
+    async with aiosqlite.connect(path) as conn:
+        await conn.execute("""
+            CREATE TABLE movies (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                imdb_id TEXT UNIQUE NOT NULL, title TEXT NOT NULL,
+                original_title TEXT, year INTEGER, genres TEXT DEFAULT '[]',
+                description TEXT, plot TEXT, cast TEXT DEFAULT '[]',
+                director TEXT, poster_url TEXT, imdb_rating REAL, awards TEXT,
+                is_watched BOOLEAN DEFAULT FALSE, source TEXT DEFAULT 'personal',
+                added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        await conn.execute(
+            "INSERT INTO movies (imdb_id, title, source) VALUES ('tt1', 'Old', 'telegram')"
+        )
+        await conn.commit()
+    monkeypatch.setattr(db_sqlite, "DATABASE_PATH", path)
+
+    await db_sqlite.init_db()
+
+    async with aiosqlite.connect(path) as conn:
+        async with conn.execute("SELECT user_id, runtime, source FROM movies") as cur:
+            assert await cur.fetchall() == [(None, None, "personal")]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_starts_apply_each_migration_once(tmp_path, monkeypatch):
+    """Web and bot starting together: the loser re-reads the version and skips."""
+    path = str(tmp_path / "race.db")
+    monkeypatch.setattr(db_sqlite, "DATABASE_PATH", path)
+
+    await asyncio.gather(db_sqlite.init_db(), db_sqlite.init_db())
+
+    async with aiosqlite.connect(path) as conn:
+        async with conn.execute("SELECT version FROM schema_version ORDER BY version") as cur:
+            versions = [r[0] for r in await cur.fetchall()]
+    assert versions == [v.version for v in db_sqlite.MIGRATIONS.pending(0)]
+
+
+def test_migration_set_orders_and_rejects_duplicates():
+    ms = MigrationSet()
+
+    @ms.register(2, "second")
+    async def _second(conn):
+        pass
+
+    @ms.register(1, "first")
+    async def _first(conn):
+        pass
+
+    assert [m.name for m in ms.pending(0)] == ["first", "second"]
+    assert [m.name for m in ms.pending(1)] == ["second"]
+    assert ms.latest == 2
+    with pytest.raises(ValueError):
+        ms.register(1, "dup")(_first)
@@ -0,0 +1,94 @@
+"""Tests for the bounded bcrypt executor (backend.services.password_pool)."""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+
+import bcrypt
+import pytest
+
+from backend.services.password_pool import PasswordPool, PasswordPoolFull
+
+
+async def _max_loop_lag(work) -> float:
+    """Run ``work`` while a 5ms ticker measures how late the loop wakes it."""
+    lags: list[float] = []
+    done = asyncio.Event()
+
+    async def _ticker():
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(0.005)
+            lags.append(time.perf_counter() - started - 0.005)
+
+    ticker = asyncio.create_task(_ticker())
+    try:
+        await work
+    finally:
+        done.set()
+        await ticker
+    return max(lags, default=0.0)
+
+
+async def test_login_burst_keeps_event_loop_responsive():
+    """8 real-cost hashes at once: the loop keeps ticking while threads hash."""
+    pool = PasswordPool(workers=2, max_queue=16)
+    salt = bcrypt.gensalt(rounds=10)  # ~60ms per hash; 8 inline would block ~0.5s
+    try:
+        lag = await _max_loop_lag(asyncio.gather(
+            *(pool.submit(bcrypt.hashpw, b"burst-password", salt) for _ in range(8))
+        ))
+    finally:
+        pool.shutdown()
+    assert lag < 0.1
+    stats = pool.snapshot()
+    assert stats["completed"] == 8 and stats["rejected"] == 0
+    assert stats["max_queued"] >= 1  # more jobs than workers → some waited
+
+
+async def test_full_queue_rejects_and_cancelled_jobs_free_slots():
+    pool = PasswordPool(workers=1, max_queue=1)
+    gate = threading.Event()
+    try:
+        running = asyncio.ensure_future(pool.submit(gate.wait, 5))
+        waiting = asyncio.ensure_future(pool.submit(gate.wait, 5))
+        await asyncio.sleep(0.05)
+        assert pool.snapshot()["queued"] == 1
+
+        with pytest.raises(PasswordPoolFull):
+            await pool.submit(gate.wait, 5)
+        assert pool.snapshot()["rejected"] == 1
+
+        waiting.cancel()  # cancelled before it started → slot freed right away
+        await asyncio.sleep(0.05)
+        assert pool.snapshot()["queued"] == 0
+        third = asyncio.ensure_future(pool.submit(lambda: "ok"))
+
+        gate.set()
+        assert await running is True
+        assert await third == "ok"
+    finally:
+        gate.set()
+        pool.shutdown()
+
+
+async def test_login_answers_503_when_pool_is_saturated(client, monkeypatch):
+    from backend import auth
+
+    r = await client.post(
+        "/auth/register",
+        json={"email": "burst@example.com", "password": "test-passw0rd-X", "name": "B"},
+    )
+    assert r.status_code == 200, r.text
+
+    async def _full(func, *args):
+        raise PasswordPoolFull("saturated")
+
+    monkeypatch.setattr(auth.password_pool, "submit", _full)
+    r = await client.post(
+        "/auth/login", json={"email": "burst@example.com", "password": "test-passw0rd-X"},
+    )
+    assert r.status_code == 503
+    assert r.headers["retry-after"] == "5"
@@ -42,14 +42,14 @@ async def test_recommend_merges_award_winners_into_candidate_pool(client):
     """Awards are added to the pool, and the LLM receives (query, movies)."""
     captured: dict = {}
 
-    async def _fake_recommend(query, movies, max_recommendations=3):
+    async def _fake_recommend(query, movies, max_recommendations=3, preferred_ids=None):
         captured["query"] = query
         captured["movies"] = movies
         # Recommend the award winner so we can also assert it round-trips out.
         return ([AWARD.id], "stubbed")
 
     with patch(
-        "backend.routers.recommend.db.get_awards",
+        "backend.routers.recommend.awards_catalog.get_awards",
         new=AsyncMock(return_value=[AWARD]),
     ), patch(
         "backend.routers.recommend.llm_service.recommend_movies",
@@ -82,12 +82,12 @@ async def test_recommend_dedupes_award_already_in_library(client):
 
     captured: dict = {}
 
-    async def _fake_recommend(query, movies, max_recommendations=3):
+    async def _fake_recommend(query, movies, max_recommendations=3, preferred_ids=None):
         captured["movies"] = movies
         return ([], "stubbed")
 
     with patch(
-        "backend.routers.recommend.db.get_awards",
+        "backend.routers.recommend.awards_catalog.get_awards",
         new=AsyncMock(return_value=[AWARD]),
     ), patch(
         "backend.routers.recommend.llm_service.recommend_movies",
@@ -130,18 +130,22 @@ async def _fake_avail(imdb_id, region):
     return _AVAIL_BY_IMDB.get(imdb_id)
 
 
+async def _fake_avail_many(imdb_ids, region, max_fetches=None):
+    return {i: _AVAIL_BY_IMDB.get(i) for i in imdb_ids}
+
+
 def _patches(recommend_fn):
     from unittest.mock import AsyncMock, patch
     return (
-        patch("backend.routers.recommend.db.get_awards", new=AsyncMock(return_value=[])),
+        patch("backend.routers.recommend.awards_catalog.get_awards", new=AsyncMock(return_value=[])),
         patch("backend.routers.recommend.llm_service.recommend_movies", side_effect=recommend_fn),
-        patch("backend.routers.recommend.get_availability", side_effect=_fake_avail),
+        patch("backend.routers.recommend.get_availability_many", side_effect=_fake_avail_many),
     )
 
 
 @pytest.mark.asyncio
 async def test_recommend_only_available_filters_out_unavailable(client):
-    async def rec(query, movies, max_recommendations=3):
+    async def rec(query, movies, max_recommendations=3, preferred_ids=None):
         return ([1, 2], "both")
 
     p1, p2, p3 = _patches(rec)
@@ -161,7 +165,7 @@ async def test_recommend_only_available_filters_out_unavailable(client):
 
 @pytest.mark.asyncio
 async def test_recommend_only_available_empty_falls_back(client):
-    async def rec(query, movies, max_recommendations=3):
+    async def rec(query, movies, max_recommendations=3, preferred_ids=None):
         return ([1, 2], "both")
 
     p1, p2, p3 = _patches(rec)
@@ -179,7 +183,7 @@ async def test_recommend_only_available_empty_falls_back(client):
 @pytest.mark.asyncio
 async def test_recommend_prefers_available_first(client):
     # LLM returns B before A, but only A is on the user's service → A floats up.
-    async def rec(query, movies, max_recommendations=3):
+    async def rec(query, movies, max_recommendations=3, preferred_ids=None):
         return ([2, 1], "both")
 
     p1, p2, p3 = _patches(rec)
@@ -192,3 +196,278 @@ async def test_recommend_prefers_available_first(client):
     body = r.json()
     assert [m["imdb_id"] for m in body["movies"]] == ["ttA", "ttB"]
     assert set(body["availability"].keys()) == {"1", "2"}  # both attached
+
+
+@pytest.mark.asyncio
+async def test_recommend_only_available_prefilters_pool_by_index(client):
+    from backend import database as db
+    from backend.services.availability_index import index, pack_ids
+
+    await db.save_title_refs([("tt_pf_a", "movie", "1001"), ("tt_pf_b", "movie", "1002")])
+    await db.save_availability_index("RU", 8, "movie", pack_ids([1001]), 1, True)
+    index.invalidate()
+    captured: dict = {}
+
+    async def rec(query, movies, max_recommendations=3, preferred_ids=None):
+        captured["pool"] = [m.imdb_id for m in movies]
+        return ([1], "A")
+
+    p1, p2, p3 = _patches(rec)
+    with p1, p2, p3:
+        r = await client.post("/api/recommend", json={
+            "query": "x",
+            "library": [_guest(1, "tt_pf_a"), _guest(2, "tt_pf_b"), _guest(3, "tt_pf_c")],
+            "region": "RU", "services": [8], "only_available": True,
+        })
+
+    assert r.status_code == 200
+    # B is known to be unavailable and never reaches the LLM; C is unknown, kept.
+    assert captured["pool"] == ["tt_pf_a", "tt_pf_c"]
+
+
+@pytest.mark.asyncio
+async def test_recommend_only_available_prefilters_pool_from_cache(client):
+    captured: dict = {}
+
+    async def rec(query, movies, max_recommendations=3, preferred_ids=None):
+        captured.update(
+            pool=[m.imdb_id for m in movies], max=max_recommendations,
+            preferred=preferred_ids,
+        )
+        return ([1], "A")
+
+    p1, p2, p3 = _patches(rec)
+    with p1, p2, p3:
+        r = await client.post("/api/recommend", json={
+            "query": "x", "library": [_guest(1, "ttA"), _guest(2, "ttB")],
+            "region": "RU", "services": [8], "only_available": True,
+        })
+
+    assert r.status_code == 200
+    assert captured["pool"] == ["ttA"]   # B (Disney only) dropped before the LLM
+    assert captured["preferred"] == [1]
+    assert captured["max"] == 3          # whole pool known available → no over-ask
+    assert r.json()["availability"]["1"]["flatrate"][0]["provider_id"] == 8
+
+
+@pytest.mark.asyncio
+async def test_recommend_prefer_mode_keeps_pool_and_hints_available(client):
+    captured: dict = {}
+
+    async def rec(query, movies, max_recommendations=3, preferred_ids=None):
+        captured.update(pool=[m.imdb_id for m in movies], preferred=preferred_ids)
+        return ([2, 1], "both")
+
+    p1, p2, p3 = _patches(rec)
+    with p1, p2, p3:
+        await client.post("/api/recommend", json={
+            "query": "x", "library": [_guest(1, "ttA"), _guest(2, "ttB")],
+            "region": "RU", "services": [8], "only_available": False,
+        })
+
+    assert captured["pool"] == ["ttA", "ttB"]  # nothing dropped without the filter
+    assert captured["preferred"] == [1]
+
+
+@pytest.mark.asyncio
+async def test_recommend_prefilter_bounds_tmdb_fetches(client, monkeypatch):
+    from backend.routers import recommend as recommend_mod
+    from backend.services import availability as avail_mod
+
+    monkeypatch.setattr(recommend_mod, "PREFILTER_MAX_FETCHES", 2)
+    fetch = AsyncMock(return_value=None)
+    monkeypatch.setattr(avail_mod.tmdb_service, "get_watch_providers", fetch)
+
+    async def rec(query, movies, max_recommendations=3, preferred_ids=None):
+        return ([], "none")
+
+    with patch(
+        "backend.routers.recommend.awards_catalog.get_awards", new=AsyncMock(return_value=[]),
+    ), patch("backend.routers.recommend.llm_service.recommend_movies", side_effect=rec):
+        r = await client.post("/api/recommend", json={
+            "query": "x",
+            "library": [_guest(i, f"tt_bound_{i}") for i in range(1, 6)],
+            "region": "RU", "services": [8], "only_available": True,
+        })
+
+    assert r.status_code == 200
+    assert fetch.await_count == 2  # the other three go to the prompt unchecked
+
+
+# ── prompt layout (provider-side prompt caching) ─────────────────────────────
+
+
+class _FakeMessages:
+    def __init__(self):
+        self.calls: list[dict] = []
+
+    async def create(self, **kwargs):
+        from types import SimpleNamespace
+        from anthropic.types import Usage
+        self.calls.append(kwargs)
+        return SimpleNamespace(
+            content=[SimpleNamespace(text="РЕКОМЕНДАЦИИ: [1]\nОБЪЯСНЕНИЕ: ok")],
+            usage=Usage(input_tokens=900, output_tokens=30, cache_read_input_tokens=800),
+        )
+
+
+@pytest.mark.asyncio
+async def test_recommend_prompt_prefix_is_stable_across_queries(monkeypatch):
+    """Candidates live in cached system blocks in id order; only the user
+    message (query + how many to pick) changes between calls."""
+    from types import SimpleNamespace
+    from backend.services.llm import llm_service
+
+    fake = _FakeMessages()
+    monkeypatch.setattr(llm_service, "client", SimpleNamespace(messages=fake))
+
+    own = [Movie.model_validate(_guest(5, "ttB")), Movie.model_validate(_guest(1, "ttA"))]
+    await llm_service.recommend_movies("драма", own + [AWARD], max_recommendations=3)
+    await llm_service.recommend_movies("комедия", [AWARD] + own[::-1], max_recommendations=6)
+
+    first, second = fake.calls
+    assert first["system"] == second["system"]          # byte-identical prefix
+    texts = [b["text"] for b in first["system"]]
+    assert "Award Winner" in texts[1]                    # catalog block before library
+    assert texts[2].index("[ID:1]") < texts[2].index("[ID:5]")
+    assert first["system"][-1]["cache_control"] == {"type": "ephemeral"}
+    assert "драма" in first["messages"][0]["content"]
+    assert "от 1 до 6" in second["messages"][0]["content"]
+
+
+@pytest.mark.asyncio
+async def test_recommend_prompt_availability_hint_stays_in_suffix(monkeypatch):
+    from types import SimpleNamespace
+    from backend.services.llm import llm_service
+
+    fake = _FakeMessages()
+    monkeypatch.setattr(llm_service, "client", SimpleNamespace(messages=fake))
+
+    own = [Movie.model_validate(_guest(1, "ttA")), Movie.model_validate(_guest(5, "ttB"))]
+    await llm_service.recommend_movies("драма", own, max_recommendations=3)
+    await llm_service.recommend_movies("драма", own, max_recommendations=3, preferred_ids=[5])
+
+    plain, hinted = fake.calls
+    assert plain["system"] == hinted["system"]  # cached prefix untouched
+    assert "ID:5" not in plain["messages"][0]["content"]
+    assert "предпочитай доступные" in hinted["messages"][0]["content"]
+    assert "ID:5" in hinted["messages"][0]["content"]
+
+
+# ── streaming (SSE) ──────────────────────────────────────────────────────────
+
+
+def _sse_events(body: str) -> list[tuple[str, dict]]:
+    import json
+    events = []
+    for frame in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in frame.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+@pytest.mark.asyncio
+async def test_recommend_stream_emits_ids_then_text_then_badges(client):
+    async def stream(query, movies, max_recommendations=3, preferred_ids=None):
+        yield "ids", [2, 1]
+        yield "text", "Оба "
+        yield "text", "про побег."
+
+    with patch(
+        "backend.routers.recommend.awards_catalog.get_awards", new=AsyncMock(return_value=[]),
+    ), patch(
+        "backend.routers.recommend.llm_service.stream_recommend_movies", new=stream,
+    ), patch(
+        # Nothing cached and no TMDb budget for the pool: badges come from the stream.
+        "backend.routers.recommend.get_availability_many", new=AsyncMock(return_value={}),
+    ), patch(
+        "backend.routers.recommend.get_availability", side_effect=_fake_avail,
+    ):
+        r = await client.post("/api/recommend/stream", json={
+            "query": "x", "library": [_guest(1, "ttA"), _guest(2, "ttB")],
+            "region": "RU", "services": [8], "only_available": True,
+        })
+
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/event-stream")
+    events = _sse_events(r.text)
+    kinds = [k for k, _ in events]
+    assert kinds[0] == "movies"
+    assert [m["id"] for m in events[0][1]["movies"]] == [2, 1]   # LLM order
+    assert "".join(d["text"] for k, d in events if k == "explanation") == "Оба про побег."
+    assert sorted(d["movie_id"] for k, d in events if k == "availability") == [1, 2]
+    assert kinds[-1] == "done"
+    assert events[-1][1] == {"movie_ids": [1], "note": None}       # B filtered out
+
+
+@pytest.mark.asyncio
+async def test_recommend_stream_reuses_pool_availability(client):
+    """Badges the prefilter already resolved aren't fetched a second time."""
+    async def stream(query, movies, max_recommendations=3, preferred_ids=None):
+        yield "ids", [1, 2]
+        yield "text", "Оба."
+
+    async def partial_many(imdb_ids, region, max_fetches=None):
+        return {i: _AVAIL_BY_IMDB[i] for i in imdb_ids if i == "ttA"}  # B over budget
+
+    single = AsyncMock(side_effect=_fake_avail)
+    with patch(
+        "backend.routers.recommend.awards_catalog.get_awards", new=AsyncMock(return_value=[]),
+    ), patch(
+        "backend.routers.recommend.llm_service.stream_recommend_movies", new=stream,
+    ), patch(
+        "backend.routers.recommend.get_availability_many", side_effect=partial_many,
+    ), patch("backend.routers.recommend.get_availability", new=single):
+        r = await client.post("/api/recommend/stream", json={
+            "query": "x", "library": [_guest(1, "ttA"), _guest(2, "ttB")],
+            "region": "RU", "services": [8],
+        })
+
+    events = _sse_events(r.text)
+    assert [c.args[0] for c in single.await_args_list] == ["ttB"]
+    assert sorted(d["movie_id"] for k, d in events if k == "availability") == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_recommend_stream_survives_one_failed_badge(client):
+    async def stream(query, movies, max_recommendations=3, preferred_ids=None):
+        yield "ids", [1, 2]
+        yield "text", "Оба."
+
+    async def flaky(imdb_id, region):
+        if imdb_id == "ttB":
+            raise RuntimeError("TMDb 502")
+        return await _fake_avail(imdb_id, region)
+
+    with patch(
+        "backend.routers.recommend.awards_catalog.get_awards", new=AsyncMock(return_value=[]),
+    ), patch(
+        "backend.routers.recommend.llm_service.stream_recommend_movies", new=stream,
+    ), patch(
+        "backend.routers.recommend.get_availability_many", new=AsyncMock(return_value={}),
+    ), patch("backend.routers.recommend.get_availability", side_effect=flaky):
+        r = await client.post("/api/recommend/stream", json={
+            "query": "x", "library": [_guest(1, "ttA"), _guest(2, "ttB")],
+            "region": "RU", "services": [8],
+        })
+
+    events = _sse_events(r.text)
+    assert [d["movie_id"] for k, d in events if k == "availability"] == [1]
+    assert events[-1][0] == "done" and events[-1][1]["movie_ids"] == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_recommend_stream_requires_library_or_auth(client):
+    r = await client.post("/api/recommend/stream", json={"query": "x"})
+    assert r.status_code == 401
+
+
+def test_stream_parser_handles_split_markers():
+    from backend.services.llm import RecommendationStreamParser
+
+    parser = RecommendationStreamParser()
+    events = []
+    for chunk in ["РЕКОМ", "ЕНДАЦИИ: [4, ", "7]\nОБЪЯС", "НЕНИЕ: Потому ", "что."]:
+        events += parser.feed(chunk)
+    events += parser.finish()
+    assert events == [("ids", [4, 7]), ("text", "Потому "), ("text", "что.")]
@@ -51,17 +51,146 @@ async def test_runtime_backfill_helpers():
         user_id=user["id"],
     )
 
-    missing = await db.get_imdb_ids_missing_runtime()
+    missing = await db.get_backfill_imdb_ids(limit=1000, missing_only=True)
     assert "tt_rt_missing" in missing
 
-    changed = await db.set_runtime_by_imdb("tt_rt_missing", 95)
+    changed = await db.apply_omdb_patches([{"imdb_id": "tt_rt_missing", "runtime": 95}])
     assert changed == 1
-    assert "tt_rt_missing" not in await db.get_imdb_ids_missing_runtime()
+    assert "tt_rt_missing" not in await db.get_backfill_imdb_ids(
+        limit=1000, missing_only=True,
+    )
 
     saved = await db.get_user_movie_by_imdb_id("tt_rt_missing", user["id"])
     assert saved.runtime == 95
 
 
+@pytest.mark.asyncio
+async def test_backfill_engine_one_fetch_fills_all_fields_and_resumes():
+    """Один запрос к OMDB на тайтл дозаполняет всё пустое; курсор в app_meta."""
+    from backend.services import omdb_backfill
+
+    user = await db.create_user(email="rt3@tg.example.com", telegram_id=930003)
+    for imdb_id in ("tt_bf_1", "tt_bf_2", "tt_bf_3"):
+        await db.add_movie(MovieBase(imdb_id=imdb_id, title=imdb_id), user_id=user["id"])
+
+    async def fake_omdb(imdb_id):
+        if imdb_id == "tt_bf_3":
+            return None
+        return MovieBase(imdb_id=imdb_id, title=imdb_id, runtime=50,
+                         media_type="series", awards="Emmy", imdb_rating=8.1)
+
+    job = omdb_backfill.BackfillJob("test_bf", missing_only=True, max_titles=2)
+    fetch = AsyncMock(side_effect=fake_omdb)
+    with patch.object(omdb_backfill.omdb_service, "get_movie_by_id", new=fetch), \
+         patch.object(omdb_backfill.db, "get_backfill_imdb_ids",
+                      new=_only_prefix(db.get_backfill_imdb_ids, "tt_bf_")):
+        first = await omdb_backfill.run_backfill(job)
+        second = await omdb_backfill.run_backfill(job)
+
+    assert (first.scanned, first.done) == (2, False)
+    assert second.done and second.missing == ["tt_bf_3"]
+    assert fetch.await_count == 3                     # никого не спросили дважды
+    saved = await db.get_user_movie_by_imdb_id("tt_bf_1", user["id"])
+    assert (saved.runtime, saved.media_type, saved.awards, saved.imdb_rating) == (
+        50, "series", "Emmy", 8.1,
+    )
+    unknown = await db.get_user_movie_by_imdb_id("tt_bf_3", user["id"])
+    assert unknown.runtime == 0                       # «проверено, данных нет»
+
+
+@pytest.mark.asyncio
+async def test_backfill_engine_keeps_cursor_before_failed_fetch():
+    """Упавший запрос к OMDB не сдвигает курсор: разовый проход вернётся к тайтлу."""
+    from backend.services import omdb_backfill
+
+    user = await db.create_user(email="rt4@tg.example.com", telegram_id=930004)
+    for imdb_id in ("tt_bff_1", "tt_bff_2", "tt_bff_3"):
+        await db.add_movie(MovieBase(imdb_id=imdb_id, title=imdb_id), user_id=user["id"])
+    revision = await db.get_library_revision(user["id"])
+    calls: list[str] = []
+
+    async def flaky_omdb(imdb_id):
+        calls.append(imdb_id)
+        if imdb_id == "tt_bff_2" and calls.count(imdb_id) == 1:
+            raise RuntimeError("OMDB 503")
+        return MovieBase(imdb_id=imdb_id, title=imdb_id, runtime=90)
+
+    job = omdb_backfill.BackfillJob("test_bff", once=True)
+    with patch.object(omdb_backfill.omdb_service, "get_movie_by_id", new=flaky_omdb), \
+         patch.object(omdb_backfill.db, "get_backfill_imdb_ids",
+                      new=_only_prefix(db.get_backfill_imdb_ids, "tt_bff_")):
+        first = await omdb_backfill.run_backfill(job)
+        second = await omdb_backfill.run_backfill(job)
+
+    assert first.failed and not first.done
+    assert second.done and calls.count("tt_bff_2") == 2
+    assert calls.count("tt_bff_1") == 1               # до сбоя — не переспрашиваем
+    saved = await db.get_user_movie_by_imdb_id("tt_bff_2", user["id"])
+    assert saved.runtime == 90
+    # По ревизии на порцию с изменениями — клиенты увидят дозаполнение.
+    assert await db.get_library_revision(user["id"]) == revision + 2
+
+
+@pytest.mark.asyncio
+async def test_backfill_over_catalog_row_shows_up_in_awards(client):
+    """Каталог отдаётся из снимка — бэкфилл должен его перечитать."""
+    from backend.services import awards_catalog, omdb_backfill
+
+    await db.add_movie(
+        MovieBase(imdb_id="tt_bfa_1", title="Catalog Show"),
+        user_id=None, source="awards", in_library=False, award="Emmy",
+    )
+    await awards_catalog.refresh()
+
+    async def fake_omdb(imdb_id):
+        return MovieBase(imdb_id=imdb_id, title=imdb_id, runtime=42, media_type="series")
+
+    job = omdb_backfill.BackfillJob("test_bfa", missing_only=True)
+    with patch.object(omdb_backfill.omdb_service, "get_movie_by_id", new=fake_omdb), \
+         patch.object(omdb_backfill.db, "get_backfill_imdb_ids",
+                      new=_only_prefix(db.get_backfill_imdb_ids, "tt_bfa_")):
+        await omdb_backfill.run_backfill(job)
+
+    r = await client.get("/api/awards")
+    row = next(m for m in r.json() if m["imdb_id"] == "tt_bfa_1")
+    assert (row["runtime"], row["media_type"]) == (42, "series")
+
+
+@pytest.mark.asyncio
+async def test_background_omdb_requests_go_through_own_bucket():
+    """Фоновые задачи проходят свой bucket, пользовательские — только общий."""
+    from backend.services import background
+
+    calls: list[str] = []
+
+    class _Bucket:
+        def __init__(self, name):
+            self.name = name
+
+        async def acquire(self, tokens=1.0):
+            calls.append(self.name)
+
+    async def job():
+        await omdb_service._throttle()
+
+    with patch.object(omdb_service, "rate_limiter", _Bucket("shared")), \
+         patch.object(omdb_service, "background_limiter", _Bucket("background")):
+        await omdb_service._throttle()
+        assert calls == ["shared"]
+        calls.clear()
+        await background.BackgroundRunner().run_pipeline([("omdb_job", job)])
+
+    assert calls == ["background", "shared"]
+
+
+def _only_prefix(real, prefix):
+    """Оставляет в выборке бэкфилла только тайтлы теста (БД общая на сессию)."""
+    async def wrapper(*, after, limit, missing_only):
+        ids = await real(after=after, limit=10_000, missing_only=missing_only)
+        return [i for i in ids if i.startswith(prefix)][:limit]
+    return wrapper
+
+
 # ── «вставленный пост» в свободном тексте ────────────────────────────────────
 
 
@@ -112,3 +112,167 @@ async def test_two_shares_get_distinct_slugs(client):
     )
     assert r1.status_code == 200 and r2.status_code == 200
     assert r1.json()["slug"] != r2.json()["slug"]
+
+
+async def _create_share(client, name: str = "Cached") -> str:
+    r = await client.post("/api/shares", json={"name": name, "library": [_sample_movie()]})
+    assert r.status_code == 200, r.text
+    return r.json()["slug"]
+
+
+@pytest.mark.asyncio
+async def test_repeat_reads_are_served_from_cache(client, monkeypatch):
+    """Second GET doesn't touch the DB — the rendered body is cached."""
+    from backend.routers import shares
+
+    slug = await _create_share(client)
+    first = await client.get(f"/api/shares/{slug}")
+    assert first.status_code == 200
+
+    async def _boom(_slug):
+        raise AssertionError("share read hit the DB")
+
+    monkeypatch.setattr(shares.db, "get_share_by_slug", _boom)
+    second = await client.get(f"/api/shares/{slug}")
+    assert second.status_code == 200
+    assert second.content == first.content
+    assert second.headers["etag"] == first.headers["etag"]
+
+
+@pytest.mark.asyncio
+async def test_if_none_match_returns_304(client):
+    slug = await _create_share(client)
+    r = await client.get(f"/api/shares/{slug}")
+    etag = r.headers["etag"]
+    assert r.headers["cache-control"].startswith("public, max-age=")
+
+    r2 = await client.get(f"/api/shares/{slug}", headers={"If-None-Match": etag})
+    assert r2.status_code == 304
+    assert r2.content == b""
+    assert r2.headers["etag"] == etag
+
+    # A list, and a tag weakened by a compressing proxy, still match.
+    r3 = await client.get(
+        f"/api/shares/{slug}", headers={"If-None-Match": f'"stale", W/{etag}'},
+    )
+    assert r3.status_code == 304
+    r4 = await client.get(f"/api/shares/{slug}", headers={"If-None-Match": '"stale"'})
+    assert r4.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_views_are_buffered_and_flushed(client):
+    import aiosqlite
+
+    from backend.config import DATABASE_PATH
+    from backend.services import share_cache
+
+    slug = await _create_share(client)
+    for _ in range(3):
+        assert (await client.get(f"/api/shares/{slug}")).status_code == 200
+
+    async def _count() -> int:
+        async with aiosqlite.connect(DATABASE_PATH) as conn:
+            cur = await conn.execute(
+                "SELECT view_count FROM shared_lists WHERE slug = ?", (slug,),
+            )
+            return (await cur.fetchone())[0]
+
+    assert await _count() == 0  # nothing written per request
+    await share_cache.views.flush()
+    assert await _count() == 3
+
+
+@pytest.mark.asyncio
+async def test_expired_share_is_not_served_from_cache(client, monkeypatch):
+    from datetime import datetime, timedelta
+
+    from backend.routers import shares
+    from backend.services import share_cache
+
+    slug = await _create_share(client)
+    assert (await client.get(f"/api/shares/{slug}")).status_code == 200
+    cached = share_cache.cache.get(slug)
+    share_cache.cache.put(slug, cached.body, datetime.utcnow() - timedelta(seconds=1))
+
+    async def _gone(_slug):
+        return None  # the DB filters out expired shares
+
+    monkeypatch.setattr(shares.db, "get_share_by_slug", _gone)
+    r = await client.get(f"/api/shares/{slug}")
+    assert r.status_code == 404
+
+
+async def _fetchall(sql: str, *params) -> list[tuple]:
+    import aiosqlite
+
+    from backend.config import DATABASE_PATH
+
+    async with aiosqlite.connect(DATABASE_PATH) as conn:
+        cur = await conn.execute(sql, params)
+        rows = await cur.fetchall()
+        await conn.commit()
+        return rows
+
+
+@pytest.mark.asyncio
+async def test_snapshot_is_stored_as_shared_references(client):
+    """Same movie in two shares → one metadata row; per-share fields survive."""
+    rated = {**_sample_movie("tt7700001", "Dedup"), "user_rating": 5.0, "user_note": "secret"}
+    plain = {**_sample_movie("tt7700001", "Dedup"), "is_watched": True}
+    r1 = await client.post("/api/shares", json={"name": "A", "library": [rated]})
+    r2 = await client.post("/api/shares", json={"name": "B", "library": [plain]})
+    slug1, slug2 = r1.json()["slug"], r2.json()["slug"]
+
+    rows = await _fetchall(
+        "SELECT s.snapshot, i.movie_hash FROM shared_lists s "
+        "JOIN share_items i ON i.share_id = s.id WHERE s.slug IN (?, ?)",
+        slug1, slug2,
+    )
+    assert [snapshot for snapshot, _ in rows] == ["", ""]
+    assert len({h for _, h in rows}) == 1
+
+    got1 = (await client.get(f"/api/shares/{slug1}")).json()["movies"][0]
+    got2 = (await client.get(f"/api/shares/{slug2}")).json()["movies"][0]
+    assert got1["title"] == got2["title"] == "Dedup"
+    assert got1["plot"] == rated["plot"]
+    assert got1["user_rating"] == 5.0 and got1["user_note"] is None
+    assert got2["user_rating"] is None and got2["is_watched"] is True
+
+
+@pytest.mark.asyncio
+async def test_gc_drops_expired_shares_and_compacts_legacy(client):
+    import json
+    from datetime import datetime
+
+    from backend import database as db
+    from backend.services import share_snapshot
+
+    expired_slug = await _create_share(client, "Expired")
+    await _fetchall(
+        "UPDATE shared_lists SET expires_at = ? WHERE slug = ?",
+        "2000-01-01T00:00:00", expired_slug,
+    )
+    legacy = await db.create_share(
+        slug="legacy01", owner_user_id=None, name="Old",
+        snapshot_json=json.dumps([_sample_movie("tt7700002", "Legacy")]),
+        expires_at=None,
+    )
+    await _fetchall(
+        "INSERT INTO share_movies (hash, data, last_used_at) "
+        "VALUES ('orphan', x'00', '2000-01-01 00:00:00')"
+    )
+
+    await share_snapshot.collect_garbage()
+
+    assert await db.get_share_by_slug(expired_slug) is None
+    assert await _fetchall(
+        "SELECT 1 FROM share_items WHERE share_id NOT IN (SELECT id FROM shared_lists)"
+    ) == []
+    assert await _fetchall("SELECT 1 FROM share_movies WHERE hash = 'orphan'") == []
+
+    row = await db.get_share_by_slug("legacy01")
+    assert row["id"] == legacy["id"] and row["snapshot"] == ""
+    movies = await share_snapshot.load(row)
+    assert [m.title for m in movies] == ["Legacy"]
+    assert movies[0].added_at == datetime(2026, 4, 30, 12, 0)
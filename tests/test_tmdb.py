@@ -6,9 +6,12 @@ exercise the real parsing/merging logic without touching TMDb.
 
 from __future__ import annotations
 
+import aiosqlite
 import pytest
+import pytest_asyncio
 
 import backend.services.tmdb as tmdb_mod
+from backend.config import DATABASE_PATH
 from backend.services.tmdb import tmdb_service
 
 
@@ -39,9 +42,20 @@ class _FakeClient:
         return _Resp(self._handler(url, params or {}))
 
 
-@pytest.fixture
-def patch_tmdb(monkeypatch):
-    """Install a fake httpx client + a non-empty api key (so ``enabled``)."""
+async def _forget_title_refs() -> None:
+    async with aiosqlite.connect(DATABASE_PATH) as conn:
+        await conn.execute("DELETE FROM title_refs")
+        await conn.commit()
+
+
+@pytest_asyncio.fixture
+async def patch_tmdb(monkeypatch):
+    """Install a fake httpx client + a non-empty api key (so ``enabled``).
+
+    Forgets stored IMDb↔TMDb refs first: the fakes reuse TMDb ids with
+    different IMDb ids from test to test.
+    """
+    await _forget_title_refs()
     monkeypatch.setattr(tmdb_service, "api_key", "test-key")
 
     def _install(handler):
@@ -226,6 +240,42 @@ async def test_search_extracts_year_qualifier_and_boosts(patch_tmdb):
     assert results[0].imdb_id == "tt-1975"
 
 
+# ── title_refs (persistent IMDb ↔ TMDb mapping) ─────────────────────────────
+
+
+async def test_search_reuses_stored_imdb_ids(patch_tmdb):
+    seen: list[str] = []
+
+    def handler(url, params):
+        seen.append(url)
+        return _rerank_handler(url, params)
+
+    patch_tmdb(handler)
+    first = await tmdb_service.search("Ирония судьбы, или С лёгким паром!")
+    assert sum("/movie/" in u for u in seen) == 2
+
+    seen.clear()
+    second = await tmdb_service.search("Ирония судьбы, или С лёгким паром!")
+    assert [r.imdb_id for r in second] == [r.imdb_id for r in first]
+    assert not any("/movie/" in u for u in seen)  # only /search, ids from title_refs
+
+
+async def test_get_by_key_remembers_imdb_link(patch_tmdb):
+    def handler(url, params):
+        if url.endswith("/tv/7"):
+            return {
+                "name": "Семнадцать мгновений весны", "first_air_date": "1973-08-11",
+                "external_ids": {"imdb_id": "tt0071054"},
+            }
+        raise AssertionError(f"unexpected {url}")
+
+    patch_tmdb(handler)
+    series = await tmdb_service.get_by_key("tmdb:tv:7")
+    assert series.imdb_id == "tmdb:tv:7"  # key stays as requested
+    # …but the IMDb id now resolves without /find
+    assert await tmdb_service.resolve_tmdb_ref("tt0071054") == ("tv", "7")
+
+
 # ── get_by_key (TMDb-only metadata) ──────────────────────────────────────────
 
 
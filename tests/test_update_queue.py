@@ -0,0 +1,146 @@
+"""Tests for the webhook update queue (backend.services.update_queue)."""
+
+from __future__ import annotations
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from telegram import Update
+
+from backend.services.update_queue import UpdateQueue
+
+SECRET = "hook-secret"
+
+
+def _message(update_id: int, chat_id: int, text: str = "hi") -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 1700000000,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "T"},
+            "text": text,
+        },
+    }
+
+
+def _update(update_id: int, chat_id: int) -> Update:
+    return Update.de_json(_message(update_id, chat_id), None)
+
+
+@pytest.fixture
+async def webhook(monkeypatch):
+    """Webhook route wired to a fresh queue and a fake bot; yields (queue, gate, seen)."""
+    from backend.main import app
+    from backend.routers import telegram_webhook
+
+    seen: list[int] = []
+    gate = asyncio.Event()
+
+    async def _process(update):
+        await gate.wait()  # a slow handler (think: Apify polling)
+        seen.append(update.update_id)
+
+    queue = UpdateQueue(workers=2, max_pending=3)
+    queue.start(_process)
+    monkeypatch.setattr(telegram_webhook, "TELEGRAM_WEBHOOK_SECRET", SECRET)
+    monkeypatch.setattr(telegram_webhook, "update_queue", queue)
+    monkeypatch.setattr(app.state, "bot_app", SimpleNamespace(bot=None), raising=False)
+    yield queue, gate, seen
+    gate.set()
+    await queue.stop(drain_timeout=1)
+
+
+async def test_webhook_acks_before_processing_and_drops_redeliveries(client, webhook):
+    queue, gate, seen = webhook
+    url = f"/telegram/webhook/{SECRET}"
+
+    r = await asyncio.wait_for(client.post(url, json=_message(501, 1)), timeout=1)
+    assert r.status_code == 200 and r.json() == {"ok": True}
+    assert seen == []  # handler is still blocked, the request is done
+
+    assert (await client.post(url, json=_message(501, 1))).status_code == 200
+    gate.set()
+    await asyncio.sleep(0.05)
+    assert seen == [501]
+    assert queue.snapshot()["duplicates"] == 1
+
+
+async def test_webhook_answers_503_when_queue_is_full(client, webhook):
+    queue, gate, seen = webhook
+    url = f"/telegram/webhook/{SECRET}"
+    # 2 workers pick up one update each; 3 more may wait.
+    for update_id in range(600, 605):
+        assert (await client.post(url, json=_message(update_id, update_id))).status_code == 200
+    await asyncio.sleep(0.01)
+    r = await client.post(url, json=_message(605, 605))
+    assert r.status_code == 503
+    assert queue.snapshot()["pending"] == 3
+
+    gate.set()
+    await asyncio.sleep(0.05)
+    # The rejected update wasn't marked as seen: Telegram's retry goes through.
+    assert (await client.post(url, json=_message(605, 605))).status_code == 200
+    await asyncio.sleep(0.05)
+    assert sorted(seen) == list(range(600, 606))
+
+
+async def test_webhook_rejects_bad_secret_and_payload(client, webhook):
+    assert (await client.post("/telegram/webhook/nope", json=_message(1, 1))).status_code == 403
+    r = await client.post(f"/telegram/webhook/{SECRET}", content=b"not json")
+    assert r.status_code == 400
+
+
+async def test_updates_are_ordered_per_chat_and_parallel_across_chats():
+    log: list[tuple[str, int]] = []
+    release_first = asyncio.Event()
+
+    async def _process(update):
+        log.append(("start", update.update_id))
+        if update.update_id == 1:
+            await release_first.wait()
+        log.append(("end", update.update_id))
+
+    queue = UpdateQueue(workers=4, max_pending=100)
+    queue.start(_process)
+    try:
+        for update_id, chat in [(1, 10), (2, 10), (3, 20), (4, 10)]:
+            assert queue.enqueue(_update(update_id, chat))
+        await asyncio.sleep(0.05)
+        # Chat 20 isn't held up by chat 10's slow first update...
+        assert ("end", 3) in log
+        # ...but chat 10's later updates wait for it.
+        assert ("start", 2) not in log and ("start", 4) not in log
+        assert queue.snapshot()["pending"] == 2
+
+        release_first.set()
+        await asyncio.sleep(0.05)
+        chat10 = [u for event, u in log if event == "start" and u != 3]
+        assert chat10 == [1, 2, 4]
+        stats = queue.snapshot()
+        assert stats["processed"] == 4 and stats["pending"] == 0 and stats["chats"] == 0
+        assert stats["max_lag_ms"] >= 40  # updates 2 and 4 waited behind update 1
+    finally:
+        await queue.stop(drain_timeout=0)
+
+
+async def test_failing_update_does_not_block_its_chat():
+    done: list[int] = []
+
+    async def _process(update):
+        if update.update_id == 1:
+            raise RuntimeError("handler crashed")
+        done.append(update.update_id)
+
+    queue = UpdateQueue(workers=1, max_pending=10)
+    queue.start(_process)
+    try:
+        queue.enqueue(_update(1, 30))
+        queue.enqueue(_update(2, 30))
+        await asyncio.sleep(0.05)
+        assert done == [2]
+        assert queue.snapshot()["failed"] == 1
+    finally:
+        await queue.stop(drain_timeout=0)